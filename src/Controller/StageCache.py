@@ -0,0 +1,244 @@
+'''
+Content-addressed cache for the stages of the PSID pipeline.
+
+Each stage declares what it reads (files, as glob patterns), the parameters it depends on, and the modules holding its code.
+We hash all of that together; if a stage has already run with the same hash, and the outputs it wrote then are still on disk, unchanged,
+there's no need to run it again.  Stages that work on one year of data at a time can be cached per year, so only the changed years rerun.
+
+Records are kept as small JSON files in cacheDir, one per stage (or stage-year) and hash.
+'''
+
+import os
+import glob
+import json
+import hashlib
+import sys
+import inspect
+import types
+
+# Only our own code counts towards a stage's code version - not pandas etc.
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def getSourceFiles(codeModules):
+    '''
+    Find the source files for these modules, plus those of any modules (or functions, classes) they import from SRC_DIR
+    :return: the sorted source file paths
+    :rtype: list
+    '''
+    sourceFiles = set()
+    toVisit = list(codeModules)
+    visited = set()
+    while len(toVisit) > 0:
+        module = toVisit.pop()
+        if module.__name__ in visited:
+            continue
+        visited.add(module.__name__)
+        try:
+            sourceFile = os.path.abspath(inspect.getsourcefile(module))
+        except TypeError:
+            continue
+        if not sourceFile.startswith(SRC_DIR):
+            continue
+        sourceFiles.add(sourceFile)
+
+        for value in list(vars(module).values()):
+            if isinstance(value, types.ModuleType):
+                toVisit.append(value)
+            elif hasattr(value, '__module__') and (value.__module__ in sys.modules):
+                toVisit.append(sys.modules[value.__module__])
+    return sorted(sourceFiles)
+
+
+def formatForYear(patterns, year):
+    return [pattern.replace("{year}", str(year)) for pattern in patterns]
+
+
+class StageCache:
+
+    def __init__(self, cacheDir, enabled = True):
+        '''
+        :param cacheDir: where to keep the cache records
+        :type cacheDir: str
+        :param enabled: if False, every stage is always run (and nothing is recorded)
+        :type enabled: bool
+        '''
+        self.cacheDir = cacheDir
+        self.enabled = enabled
+
+        # File hashes are memoized by path, size and modification time, so unchanged files aren't reread on every run
+        self.fileHashMemoPath = os.path.join(self.cacheDir, "fileHashes.json")
+        self.fileHashMemo = {}
+        if self.enabled and os.path.exists(self.fileHashMemoPath):
+            with open(self.fileHashMemoPath) as f:
+                self.fileHashMemo = json.load(f)
+
+    def saveFileHashMemo(self):
+        # Stages may run in parallel processes, so merge with what's on disk, and replace the file in one go
+        os.makedirs(self.cacheDir, exist_ok=True)
+        if os.path.exists(self.fileHashMemoPath):
+            try:
+                with open(self.fileHashMemoPath) as f:
+                    onDisk = json.load(f)
+                onDisk.update(self.fileHashMemo)
+                self.fileHashMemo = onDisk
+            except ValueError:
+                pass
+        tempPath = self.fileHashMemoPath + "." + str(os.getpid())
+        with open(tempPath, 'w') as f:
+            json.dump(self.fileHashMemo, f)
+        os.replace(tempPath, self.fileHashMemoPath)
+
+    def hashFile(self, path):
+        stats = os.stat(path)
+        memoKey = os.path.abspath(path)
+        memo = self.fileHashMemo.get(memoKey)
+        if (memo is not None) and (memo['size'] == stats.st_size) and (memo['mtime'] == stats.st_mtime_ns):
+            return memo['hash']
+
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                hasher.update(block)
+        self.fileHashMemo[memoKey] = {'size': stats.st_size, 'mtime': stats.st_mtime_ns, 'hash': hasher.hexdigest()}
+        return hasher.hexdigest()
+
+    def hashFiles(self, patterns):
+        '''
+        :param patterns: glob patterns (or plain file names)
+        :type patterns: list
+        :return: {file path: content hash} for every file matching any of the patterns
+        :rtype: dict
+        '''
+        hashes = {}
+        for pattern in patterns:
+            for path in sorted(glob.glob(pattern)):
+                if os.path.isfile(path):
+                    hashes[os.path.normpath(path)] = self.hashFile(path)
+        return hashes
+
+    def hashCode(self, codeModules):
+        '''
+        Hash the source of the given modules, and of every module of ours (under SRC_DIR) that they use, directly or indirectly
+        '''
+        hasher = hashlib.sha256()
+        for sourceFile in getSourceFiles(codeModules):
+            with open(sourceFile, 'rb') as f:
+                hasher.update(f.read())
+        return hasher.hexdigest()
+
+    def getStageHash(self, stageName, inputs, paramValues, codeModules):
+        '''
+        :param stageName: the stage (or stage and year) name
+        :type stageName: str
+        :param inputs: glob patterns for the files the stage reads
+        :type inputs: list
+        :param paramValues: the parameters the stage depends on; must be JSON-able (other values are hashed as strings)
+        :type paramValues: dict
+        :param codeModules: the modules holding the stage's code
+        :type codeModules: list
+        :return: the hash of all of the above
+        :rtype: str
+        '''
+        contents = {
+            'stage': stageName,
+            'inputs': self.hashFiles(inputs),
+            'params': paramValues,
+            'code': self.hashCode(codeModules),
+        }
+        return hashlib.sha256(json.dumps(contents, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def getRecordPath(self, stageName, stageHash):
+        return os.path.join(self.cacheDir, stageName, stageHash + ".json")
+
+    def isUpToDate(self, stageName, stageHash, outputs):
+        '''
+        A stage is up to date if it's been run with this hash, and the files it wrote then are all still there, unchanged
+        '''
+        if not self.enabled:
+            return False
+        recordPath = self.getRecordPath(stageName, stageHash)
+        if not os.path.exists(recordPath):
+            return False
+        with open(recordPath) as f:
+            record = json.load(f)
+
+        if (len(outputs) > 0) and (len(record['outputs']) == 0):
+            return False
+        for path, fileHash in record['outputs'].items():
+            if (not os.path.exists(path)) or (self.hashFile(path) != fileHash):
+                return False
+        return True
+
+    def recordRun(self, stageName, stageHash, outputs):
+        if not self.enabled:
+            return
+        recordPath = self.getRecordPath(stageName, stageHash)
+        os.makedirs(os.path.dirname(recordPath), exist_ok=True)
+        with open(recordPath, 'w') as f:
+            json.dump({'stage': stageName, 'outputs': self.hashFiles(outputs)}, f, indent=1)
+        self.saveFileHashMemo()
+
+    def runStage(self, stageName, func, params, inputs, paramKeys, codeModules, outputs):
+        '''
+        Run func(params), unless it's already been run with the same inputs, params and code
+        :param paramKeys: the keys of params this stage depends on
+        :type paramKeys: list
+        :return: True if the stage was run
+        :rtype: bool
+        '''
+        if not self.enabled:
+            func(params)
+            return True
+
+        stageHash = self.getStageHash(stageName, inputs, {k: params.get(k) for k in paramKeys}, codeModules)
+        if self.isUpToDate(stageName, stageHash, outputs):
+            print("Skipping " + stageName + ": nothing has changed since it was last run.")
+            return False
+
+        func(params)
+        self.recordRun(stageName, stageHash, outputs)
+        return True
+
+    def runYearlyStage(self, stageName, func, params, inputsForYear, sharedInputs, paramKeys, codeModules, outputsForYear):
+        '''
+        Like runStage, but for stages that handle each year of params.yearsToInclude separately.
+        func is called once, with a copy of params whose yearsToInclude holds only the years that need rerunning.
+        Years without any input files are skipped.
+        :param inputsForYear: glob patterns for each year's input files, with {year} where the year goes
+        :type inputsForYear: list
+        :param sharedInputs: glob patterns for the input files all years use
+        :type sharedInputs: list
+        :param outputsForYear: glob patterns for each year's output files, with {year} where the year goes
+        :type outputsForYear: list
+        :return: the years that were run
+        :rtype: list
+        '''
+        if not self.enabled:
+            func(params)
+            return list(params.yearsToInclude)
+
+        paramValues = {k: params.get(k) for k in paramKeys if k != 'yearsToInclude'}
+
+        yearHashes = {}
+        for year in params.yearsToInclude:
+            yearInputs = formatForYear(inputsForYear, year)
+            if len(self.hashFiles(yearInputs)) == 0:
+                continue
+            yearStageName = stageName + "_" + str(year)
+            yearHash = self.getStageHash(yearStageName, yearInputs + sharedInputs, paramValues, codeModules)
+            if not self.isUpToDate(yearStageName, yearHash, formatForYear(outputsForYear, year)):
+                yearHashes[year] = yearHash
+
+        if len(yearHashes) == 0:
+            print("Skipping " + stageName + ": nothing has changed since it was last run.")
+            return []
+
+        yearsToRun = sorted(yearHashes.keys())
+        paramsForYears = type(params)(params)
+        paramsForYears['yearsToInclude'] = yearsToRun
+        func(paramsForYears)
+
+        for year in yearsToRun:
+            self.recordRun(stageName + "_" + str(year), yearHashes[year], formatForYear(outputsForYear, year))
+        return yearsToRun
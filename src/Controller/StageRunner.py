@@ -0,0 +1,202 @@
+'''
+Runs the stages of the PSID pipeline as a dependency graph.
+
+Each stage lists the stages it depends on; as soon as those are done, it's started. With more than one worker,
+each stage runs in its own process, so independent stages (e.g. the analyses and replications that only read the savings data)
+run at the same time, and the whole thing takes about as long as its longest chain of dependent stages.
+Each stage still goes through the StageCache, so unchanged stages are skipped.
+
+At the end, we report each stage's wall time and peak memory use.
+'''
+
+import os
+import sys
+import time
+import queue
+import traceback
+import multiprocessing
+import pandas as pd
+import Controller.StageCache as StageCache
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; we just won't report memory use
+    resource = None
+
+# How often to check on the stage processes while waiting for one to finish, in seconds
+POLL_SECONDS = 5
+
+
+class Stage:
+    '''
+    One step of the pipeline: func(params) does the work.
+    cacheArgs are passed on to StageCache.runStage (or runYearlyStage, for yearly stages): inputs, paramKeys, codeModules, outputs etc.
+    '''
+    def __init__(self, name, func, dependsOn, yearly, cacheArgs):
+        self.name = name
+        self.func = func
+        self.dependsOn = dependsOn
+        self.yearly = yearly
+        self.cacheArgs = cacheArgs
+
+    def getOutputPatterns(self):
+        if self.yearly:
+            return StageCache.formatForYear(self.cacheArgs['outputsForYear'], 0)
+        return self.cacheArgs['outputs']
+
+
+def getPeakMemoryMB():
+    '''
+    :return: the peak memory use of this process so far, in MB (None if we can't tell)
+    :rtype: float
+    '''
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / (1024.0 * 1024.0)  # bytes on Mac, KB elsewhere
+    return peak / 1024.0
+
+
+def runStage(stage, params, cacheDir, useCache):
+    startTime = time.time()
+    stageCache = StageCache.StageCache(cacheDir, enabled = useCache)
+    if stage.yearly:
+        ran = len(stageCache.runYearlyStage(stage.name, stage.func, params, **stage.cacheArgs)) > 0
+    else:
+        ran = stageCache.runStage(stage.name, stage.func, params, **stage.cacheArgs)
+    return {'stage': stage.name, 'ran': ran, 'seconds': time.time() - startTime, 'peakMemoryMB': getPeakMemoryMB()}
+
+
+def runStageInProcess(resultQueue, stage, params, cacheDir, useCache):
+    try:
+        result = runStage(stage, params, cacheDir, useCache)
+    except Exception:
+        result = {'stage': stage.name, 'error': traceback.format_exc()}
+    resultQueue.put(result)
+
+
+def collectDeadStages(resultQueue, running):
+    '''
+    Check for stage processes that have ended. A stage that was killed (out of memory etc) never reports back, so it's
+    counted as failed, rather than waiting for it forever.
+    :param running: {stage name: process}
+    :type running: dict
+    :return: the results of the stages that have ended
+    :rtype: list
+    '''
+    # Anything a process put on the queue is there by the time it exits, so look for dead processes first, then empty the queue
+    dead = [name for name in running if not running[name].is_alive()]
+    finished = []
+    while True:
+        try:
+            finished.append(resultQueue.get_nowait())
+        except queue.Empty:
+            break
+
+    reported = [result['stage'] for result in finished]
+    for name in dead:
+        if name not in reported:
+            finished.append({'stage': name, 'error': "The process for " + name + " ended (exit code " + str(running[name].exitcode) + ") without reporting back"})
+    return finished
+
+
+class StageRunner:
+
+    def __init__(self, cacheDir, useCache = True):
+        '''
+        :param cacheDir: where the StageCache keeps its records
+        :type cacheDir: str
+        :param useCache: if False, every stage is run
+        :type useCache: bool
+        '''
+        self.cacheDir = cacheDir
+        self.useCache = useCache
+        self.stages = {}
+
+    def addStage(self, name, func, dependsOn = [], yearly = False, **cacheArgs):
+        '''
+        :param name: unique name for the stage
+        :type name: str
+        :param func: the function to run, with params as its only argument; must be defined at module level, so it can be sent to another process
+        :type func: function
+        :param dependsOn: names of the stages that must finish first. Stages that aren't part of this run are ignored
+        :type dependsOn: list
+        :param yearly: cache the stage year by year (see StageCache.runYearlyStage)
+        :type yearly: bool
+        '''
+        if name in self.stages:
+            raise Exception("There's already a stage called " + name)
+        self.stages[name] = Stage(name, func, dependsOn, yearly, cacheArgs)
+
+    def getReadyStages(self, waiting, done):
+        return [name for name in waiting if all([(dep in done) or (dep not in self.stages) for dep in self.stages[name].dependsOn])]
+
+    def run(self, params, numWorkers = None):
+        '''
+        Run every stage, in dependency order, up to numWorkers at a time
+        :return: per-stage results: whether it ran (or was skipped by the cache), wall time and peak memory
+        :rtype: DataFrame
+        '''
+        startTime = time.time()
+        waiting = list(self.stages.keys())
+        done = []
+        results = []
+
+        if (numWorkers is None) or (numWorkers <= 1):
+            # One at a time, in this process.  Peak memory is for the whole run so far.
+            while len(waiting) > 0:
+                ready = self.getReadyStages(waiting, done)
+                if len(ready) == 0:
+                    raise Exception("These stages depend on each other in a circle: " + str(waiting))
+                stage = self.stages[ready[0]]
+                waiting.remove(stage.name)
+                self.makeOutputDirs(stage)
+                results.append(runStage(stage, params, self.cacheDir, self.useCache))
+                done.append(stage.name)
+        else:
+            # Each stage gets its own process, so they can start their own worker pools and we get each one's peak memory
+            resultQueue = multiprocessing.Queue()
+            running = {}
+            errors = []
+            while (len(waiting) > 0 or len(running) > 0):
+                if len(errors) == 0:
+                    for name in self.getReadyStages(waiting, done):
+                        if len(running) >= numWorkers:
+                            break
+                        waiting.remove(name)
+                        self.makeOutputDirs(self.stages[name])
+                        process = multiprocessing.Process(target = runStageInProcess, args = (resultQueue, self.stages[name], params, self.cacheDir, self.useCache))
+                        process.start()
+                        running[name] = process
+
+                if len(running) == 0:
+                    if len(errors) > 0:
+                        break
+                    raise Exception("These stages depend on each other in a circle: " + str(waiting))
+
+                try:
+                    finished = [resultQueue.get(timeout = POLL_SECONDS)]
+                except queue.Empty:
+                    finished = collectDeadStages(resultQueue, running)
+                for result in finished:
+                    running.pop(result['stage']).join()
+                    if 'error' in result:
+                        errors.append(result)
+                    else:
+                        results.append(result)
+                        done.append(result['stage'])
+
+            if len(errors) > 0:
+                raise Exception("Stage(s) failed: " + ", ".join([x['stage'] for x in errors]) + "\n" + "\n".join([x['error'] for x in errors]))
+
+        report = pd.DataFrame(results, columns = ['stage', 'ran', 'seconds', 'peakMemoryMB'])
+        print("\nStage timings (total wall time " + str(round(time.time() - startTime, 1)) + "s):")
+        print(report.to_string(index = False))
+        return report
+
+    def makeOutputDirs(self, stage):
+        # Parallel stages may share output directories; create them up front rather than racing to
+        for pattern in stage.getOutputPatterns():
+            os.makedirs(os.path.dirname(pattern), exist_ok = True)
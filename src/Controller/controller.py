@@ -2,6 +2,7 @@
 This is the central controller for the PSID Financial Inequality Project. It controls the laoding, processing, and analysis of PSID family and wealth data from 1984 to 2019.
 It uses an imported parameter file to selectively switch on and off steps of this process.
 Each step can be run separately (provided the necessary input files), to make analysis and debugging more efficient.
+Steps whose input files, params and code haven't changed since they last ran are skipped (see StageCache), and steps that don't depend on each other run in parallel (see StageRunner).
 '''
 
 import PSIDProcessing.Extractor as Extractor
@@ -9,16 +10,24 @@ import PSIDProcessing.FamilyDataRecoder as FamilyDataRecoder
 import PSIDProcessing.IndividualDataRecoder as IndividualDataRecoder
 import PSIDProcessing.RawLoader as RawLoader
 import Taxsim.TaxSimFormatter as TaxSimFormatter
+import Taxsim.TaxSimBackends as TaxSimBackends
+import Taxsim.TaxSimCache as TaxSimCache
+import Taxsim.TaxSimSubmitter as TaxSimSubmitter
 import SavingsRates.InequalityDataPrep as InequalityDataPrep
 import SavingsRates.CalcSavingsRates as CalcSavingsRates
 import DataQuality.LongitudinalDescriber as LongitudinalDescriber
 import DataQuality.CrossSectionalDescriber as CrossSectionalDescriber
 import MStarReport.SWAnalysisPerPeriod as SWAnalysisPerPeriod
 import MStarReport.SWAnalysisLongTerm as SWAnalysisLongTerm
+import MStarReport.InequalityAnalysisBase as InequalityAnalysisBase
 import Replication.DynanAnalysis as DynanAnalysis
 import Replication.ZewdeAnalysis as ZewdeAnalysis
 import Replication.GittlemanAnalysis as GittlemanAnalysis
+import PSIDProcessing.CrosswalkHelper as CrosswalkHelper
+import Inflation.CPI_InflationReader as CPI_InflationReader
+import Controller.StageRunner as StageRunner
 import os
+import functools
 import pandas as pd
 
 ###
@@ -30,33 +39,200 @@ from Controller.params_AllInequalityAnalyses_EnrichedPop import params as params
 # from Controller.params_AllInequalityAnalyses_ConstantPop import params as params
 
 
-def main():
+'''
+The work done in each step, as functions of the params.
+'''
+def extractData(params):
+    Extractor.extractAndSave(params)
 
-    # Step 1: Read PSID SAS file and Converts to CSV (forceReload ignores CSV if already there)
-    if (params.reloadRawData):
-        loader = RawLoader.RawLoader(params.PSID_DATA_DIR, params.yearsToInclude)
-        # loader.loadRawPSID_FamilyOnly()
-        loader.loadRawPSID_All()
+def recodeData(params):
+    FamilyDataRecoder.recodeAndSave(params, None, None)
 
-    # Step 2: Read Raw PSID CSV files and extract relevant variables.
-    # This must be rerun each time the VarsWeNeed are changed
-    if params.extractData:
-        (famExtractor, indExtractor) = Extractor.extractAndSave(params)
+def callTaxsim(params):
+    TaxSimFormatter.calcTaxAndSave(params, None, None)
+
+def addTaxFiles(params):
+    TaxSimFormatter.combineFiles(params, None)
+
+def extractAndCombineInequalityData(params):
+    prepper = InequalityDataPrep.InequalityDataPrep(
+        baseDir = params.BASE_OUTPUT_DIR,
+        familyInputSubDir = params.FINAL_PSID_OUTPUT_SUBDIR,
+        familyBaseName = "extractedPSID_withMRTax_",
+        individualInputSubDir = params.MAPPED_OUTPUT_SUBDIR,
+        individualBaseName = "extractedPSID_Individual_Mapped_Recoded",
+        outputSubDir = params.CLEAN_INEQUALITY_DATA,
+        inputBaseName = "",
+        outputBaseName = "",
+        useOriginalSampleOnly = params.dropAllNon1968Families,
+        )
+    prepper.doIt()
+
+def calcSavingsRates(params):
+    if 'excludeRetirementSavings' in params:
+        excludeRetirementSavings = params.excludeRetirementSavings  # Retirement data was only added in 1999. To remove the effect this might have on long-term time series, this flag removes it.
     else:
-        famExtractor = None
-        indExtractor= None
-        
+        excludeRetirementSavings = False
+    batchMode = params.savingsBatchMode if 'savingsBatchMode' in params else False  # One dataset for all timespans, instead of a CSV each
+
+    calcer = CalcSavingsRates.CalcSavingsRates(
+        baseDir = params.BASE_OUTPUT_DIR,
+        familyInputSubDir = params.CLEAN_INEQUALITY_DATA,
+        inputBaseName = "",
+        outputBaseName = "WithSavings_",
+        outputSubDir = params.INEQUALITY_OUTPUT,
+        )
+    # Create savings rates for everyone -- we'll subset who we want to analyze later
+    calcer.doIt(useCleanedDataOnly = False, excludeRetirementSavings = excludeRetirementSavings, batchMode = batchMode)
+
+def describeCrossSections(params):
+    describer = CrossSectionalDescriber.CrossSectionalDescriber(
+        baseDir = params.BASE_OUTPUT_DIR,
+        inputSubDir = params.CLEAN_INEQUALITY_DATA,
+        inputBaseName = "",
+        outputBaseName = "",
+        outputSubDir = params.CLEAN_INEQUALITY_DATA + '/descriptives'
+        )
+    describer.doIt(useCleanedDataOnly = True)
+
+def describeTimeSeries(params):
+    describer = LongitudinalDescriber.LongitudinalDescriber(
+        baseDir = params.BASE_OUTPUT_DIR,
+        inputSubDir = params.INEQUALITY_OUTPUT,
+        inputBaseName = "WithSavings_",
+        outputBaseName = "WithSavings_",
+        outputSubDir = params.INEQUALITY_OUTPUT + '/descriptives',
+        includeChangeAnalysis=params.includeExtremeChangeAnalysis
+        )
+    describer.doIt(useCleanedDataOnly = True)
+
+def runSW_UnpackingSavingsReport(params):
+    print("##########################################\r\n Starting Per-Period Analyis\r\n")
+    analyzer = SWAnalysisPerPeriod.SWAnalysisPerPeriod(
+        baseDir = params.BASE_OUTPUT_DIR,
+        inputSubDir = params.INEQUALITY_OUTPUT,
+        inputBaseName = "WithSavings_",
+        outputBaseName = "WithSavings_",
+        outputSubDir = params.INEQUALITY_OUTPUT + '/analyses',
+        useOriginalSampleOnly = params.dropAllNon1968Families,
+        )
+    analyzer.doIt(useCleanedDataOnly = True)
+
+# The long-term windows are independent of each other, so each is its own stage
+LONG_TERM_WINDOWS = [(1994, 2007), (2009, 2019), (1999, 2019), (1984, 2019)]  # (2007, 2019) left out for now
+
+def runSW_AccumulatedWealthOverTimeWindow(params, startYear, endYear):
+    print("##########################################\r\n Starting Long term Analyis " + str(startYear) + "-" + str(endYear) + "\r\n")
+    analyzer = SWAnalysisLongTerm.SWAnalysisLongTerm(
+        baseDir = params.BASE_OUTPUT_DIR,
+        inputSubDir = params.INEQUALITY_OUTPUT,
+        inputBaseName = 'WithSavings_',
+        outputSubDir = params.INEQUALITY_OUTPUT + '/analyses',
+        outputBaseName = 'wealthChangeAcrossTime'
+    )
+    analyzer.doIt(startYear, endYear, 2019)
+
+def runDynanReplication(params):
+    analyzer = DynanAnalysis.DynanAnalysis(
+        baseDir = params.BASE_OUTPUT_DIR,
+        familyInputSubDir = params.FINAL_PSID_OUTPUT_SUBDIR,
+        familyBaseName = "extractedPSID_withMRTax_",
+        individualInputSubDir = params.MAPPED_OUTPUT_SUBDIR,
+        individualBaseName = "extractedPSID_Individual_Mapped_Recoded",
+        outputSubDir = params.DYNAN_OUTPUT_SUBDIR
+    )
+    analyzer.doIt()
+
+def runGittlemanReplication(params):
+    analyzer = GittlemanAnalysis.GittlemanAnalysis(
+        baseDir = params.BASE_OUTPUT_DIR,
+        familyInputSubDir = params.FINAL_PSID_OUTPUT_SUBDIR,
+        familyBaseName = "extractedPSID_withMRTax_",
+        individualInputSubDir = params.MAPPED_OUTPUT_SUBDIR,
+        individualBaseName = "extractedPSID_Individual_Mapped_Recoded",
+        outputSubDir = params.GITTLEMAN_OUTPUT_SUBDIR
+        )
+    analyzer.doIt()
+
+def runZewdeReplication(params):
+    analyzer = ZewdeAnalysis.ZewdeAnalysis(
+        baseDir = params.BASE_OUTPUT_DIR,
+        familyInputSubDir = params.MAPPED_OUTPUT_SUBDIR,
+        familyBaseName = "extractedPSID_Mapped_Recoded_",
+        individualInputSubDir = params.MAPPED_OUTPUT_SUBDIR,
+        individualBaseName = "extractedPSID_Individual_Mapped_Recoded",
+        outputSubDir = params.ZEWEDE_OUTPUT_SUBDIR
+        )
+    analyzer.doIt()
+
+
+def buildStageGraph(params):
+    '''
+    Lay out the steps switched on in params as a graph of stages: what each reads, writes, and which steps must run before it.
+    Each stage is skipped if it has already been run with the same input files, params and code (unless useStageCache is off)
+    :return: the runner, ready to go
+    :rtype: StageRunner
+    '''
+    runner = StageRunner.StageRunner(os.path.join(params.BASE_OUTPUT_DIR, 'stageCache'), useCache = (params.useStageCache == True))
+
+    mappedDir = os.path.join(params.BASE_OUTPUT_DIR, params.MAPPED_OUTPUT_SUBDIR)
+    taxsimDir = os.path.join(params.BASE_OUTPUT_DIR, params.TAXSIM_OUTPUT_SUBDIR)
+    finalDir = os.path.join(params.BASE_OUTPUT_DIR, params.FINAL_PSID_OUTPUT_SUBDIR)
+    cleanDir = os.path.join(params.BASE_OUTPUT_DIR, params.CLEAN_INEQUALITY_DATA)
+    inequalityDir = os.path.join(params.BASE_OUTPUT_DIR, params.INEQUALITY_OUTPUT)
+    # The savings data: a CSV per timespan, or (in batch mode) one dataset with a folder per timespan
+    savingsFiles = [os.path.join(inequalityDir, "TwoPeriod_WithSavings_*.csv"),
+                    os.path.join(inequalityDir, InequalityAnalysisBase.formatTwoPeriodDatasetName("WithSavings_"), "*", "*.parquet")]
+    individualRecodedFile = os.path.join(mappedDir, "extractedPSID_Individual_Mapped_Recoded.csv")
+    stateCodesFile = os.path.join(params.PSID_DATA_DIR, "StateCodes_PSID_To_SOI.csv")
+    cpiFile = os.path.join(CPI_InflationReader.DEFAULT_CPI_DIR, CPI_InflationReader.DEFAULT_CPI_FILE)
+    # The raw PSID files (PSID_DATA_DIR/<data set>/<file>/<FILE>.txt and .sas). Not the Parquet copies RawLoader makes of them:
+    # the stage writes those itself, and they only change when these do
+    rawDataFiles = [os.path.join(params.PSID_DATA_DIR, "*", "*", "*." + extension) for extension in ["txt", "sas"]]
+
+    # Step 2: Read Raw PSID files and extract relevant variables.
+    # This reruns each time the VarsWeNeed are changed
+    if params.extractData:
+        runner.addStage('extractData', extractData,
+            inputs = [os.path.join(params.PSID_DATA_DIR, CrosswalkHelper.CROSSWALK_FILE_ORIG)] + rawDataFiles,
+            paramKeys = ['yearsToInclude', 'PSID_DATA_DIR', 'familyWealthVarsWeNeed2019', 'individualVarsWeNeed2019', 'individualVars_LoadRegardlessOfYear'],
+            codeModules = [Extractor],
+            outputs = [os.path.join(mappedDir, "extractedPSID_Mapped_" + str(year) + ".csv") for year in params.yearsToInclude] +
+                      [os.path.join(mappedDir, "extractedPSID_Mapped_VariableStatus.csv"),
+                       os.path.join(mappedDir, "extractedPSID_Individual_Mapped.csv"),
+                       os.path.join(mappedDir, "extractedPSID_Individual_MappedVariableStatus.csv")])
+
     # Step 3: Map the extracted variables into standard names
     if (params.recodeData):
-        FamilyDataRecoder.recodeAndSave(params, famExtractor, indExtractor)
+        runner.addStage('recodeData', recodeData, dependsOn = ['extractData'], yearly = True,
+            inputsForYear = [os.path.join(mappedDir, "extractedPSID_Mapped_{year}.csv")],
+            sharedInputs = [os.path.join(mappedDir, "extractedPSID_Mapped_VariableStatus.csv"),
+                            os.path.join(mappedDir, "extractedPSID_Individual_Mapped.csv"),
+                            os.path.join(mappedDir, "extractedPSID_Individual_MappedVariableStatus.csv"),
+                            stateCodesFile],
+            paramKeys = [],
+            codeModules = [FamilyDataRecoder],
+            # Every run also rewrites the individual file, which is the same for all years
+            outputsForYear = [os.path.join(mappedDir, "extractedPSID_Mapped_Recoded_{year}.csv"), individualRecodedFile])
 
     # Step 4a: Calculate Taxes by calling the NBER TaxSim
     if (params.callTaxsim):
-        TaxSimFormatter.calcTaxAndSave(params, famExtractor, indExtractor)
+        runner.addStage('callTaxsim', callTaxsim, dependsOn = ['recodeData'], yearly = True,
+            inputsForYear = [os.path.join(mappedDir, "extractedPSID_Mapped_Recoded_{year}.csv")],
+            sharedInputs = [individualRecodedFile, stateCodesFile],
+            paramKeys = ['taxSimBackend', 'taxSimCommand'],
+            codeModules = [TaxSimFormatter, TaxSimBackends, TaxSimCache, TaxSimSubmitter],
+            outputsForYear = [os.path.join(taxsimDir, "taxsim_{year}.csv")])
 
     # Step 4b: Combine the TaxSim data with our PSID data
     if (params.addTaxFilesIgnoringMissing):
-        TaxSimFormatter.combineFiles(params, famExtractor)
+        runner.addStage('addTaxFiles', addTaxFiles, dependsOn = ['recodeData', 'callTaxsim'], yearly = True,
+            inputsForYear = [os.path.join(mappedDir, "extractedPSID_Mapped_Recoded_{year}.csv"),
+                             os.path.join(taxsimDir, "taxsim_{year}.csv")],
+            sharedInputs = [],
+            paramKeys = [],
+            codeModules = [TaxSimFormatter],
+            outputsForYear = [os.path.join(finalDir, "extractedPSID_withMRTax_{year}.csv")])
 
     # Step *: Here is where you can do extra processing, imputation etc - usng information across the timespan to fill in data
     '''
@@ -77,121 +253,87 @@ def main():
     # Step 5: Extract the data we need specifically for savings rates analyses, then create Two-Period Time Series Files, across each year with wealth data
     # The resulting Two-Period Time Series files are the basis for our savings analysis - they provide stock and flow data by asset class
     if (params.extractAndCombineInequalityData):
-        prepper = InequalityDataPrep.InequalityDataPrep(
-            baseDir = params.BASE_OUTPUT_DIR,
-            familyInputSubDir = params.FINAL_PSID_OUTPUT_SUBDIR,
-            familyBaseName = "extractedPSID_withMRTax_",
-            individualInputSubDir = params.MAPPED_OUTPUT_SUBDIR,
-            individualBaseName = "extractedPSID_Individual_Mapped_Recoded",
-            outputSubDir = params.CLEAN_INEQUALITY_DATA,
-            inputBaseName = "",
-            outputBaseName = "",
-            useOriginalSampleOnly = params.dropAllNon1968Families,
-            )
-        prepper.doIt()
+        runner.addStage('extractAndCombineInequalityData', extractAndCombineInequalityData, dependsOn = ['addTaxFiles', 'recodeData'],
+            inputs = [os.path.join(finalDir, "extractedPSID_withMRTax_*.csv"), individualRecodedFile, cpiFile],
+            paramKeys = ['dropAllNon1968Families'],
+            codeModules = [InequalityDataPrep],
+            outputs = [os.path.join(cleanDir, "YearData_*.csv"), os.path.join(cleanDir, "TwoPeriod_*.csv")])
 
     # Step 6: Calculate Savings Rates and Capital Gains - First at an household-by-asset level, then at the household level
     if (params.calcSavingsRates):
-        if 'excludeRetirementSavings' in params:
-            excludeRetirementSavings = params.excludeRetirementSavings  # Retirement data was only added in 1999. To remove the effect this might have on long-term time series, this flag removes it.
-        else:
-            excludeRetirementSavings = False
-
-        calcer = CalcSavingsRates.CalcSavingsRates(
-            baseDir = params.BASE_OUTPUT_DIR,
-            familyInputSubDir = params.CLEAN_INEQUALITY_DATA,
-            inputBaseName = "",
-            outputBaseName = "WithSavings_",
-            outputSubDir = params.INEQUALITY_OUTPUT,
-            )
-        # Create savings rates for everyone -- we'll subset who we want to analyze later
-        calcer.doIt(useCleanedDataOnly = False, excludeRetirementSavings = excludeRetirementSavings)
+        runner.addStage('calcSavingsRates', calcSavingsRates, dependsOn = ['extractAndCombineInequalityData'],
+            inputs = [os.path.join(cleanDir, "TwoPeriod_*.csv"), os.path.join(params.BASE_OUTPUT_DIR, "otherInput", "annualReturns_Mstar.csv"), cpiFile],
+            paramKeys = ['excludeRetirementSavings', 'savingsBatchMode'],
+            codeModules = [CalcSavingsRates],
+            outputs = savingsFiles + [os.path.join(inequalityDir, "WithSavings__VarStatusCounts.csv")])
 
     # Step 7: Run some descriptive stats & Check Quality of the Data
     if (params.describeTimesSeries):
+        runner.addStage('describeCrossSections', describeCrossSections, dependsOn = ['extractAndCombineInequalityData'],
+            inputs = [os.path.join(cleanDir, "YearData_*.csv")],
+            paramKeys = [],
+            codeModules = [CrossSectionalDescriber],
+            outputs = [os.path.join(cleanDir, "descriptives", "*")])
+        runner.addStage('describeTimeSeries', describeTimeSeries, dependsOn = ['calcSavingsRates'],
+            inputs = savingsFiles,
+            paramKeys = ['includeExtremeChangeAnalysis'],
+            codeModules = [LongitudinalDescriber],
+            outputs = [os.path.join(inequalityDir, "descriptives", "*")])
 
-        describer = CrossSectionalDescriber.CrossSectionalDescriber(
-            baseDir = params.BASE_OUTPUT_DIR,
-            inputSubDir = params.CLEAN_INEQUALITY_DATA,
-            inputBaseName = "",
-            outputBaseName = "",
-            outputSubDir = params.CLEAN_INEQUALITY_DATA + '/descriptives'
-            )
-        describer.doIt(useCleanedDataOnly = True)
-
-        describer = LongitudinalDescriber.LongitudinalDescriber(
-            baseDir = params.BASE_OUTPUT_DIR,
-            inputSubDir = params.INEQUALITY_OUTPUT,
-            inputBaseName = "WithSavings_",
-            outputBaseName = "WithSavings_",
-            outputSubDir = params.INEQUALITY_OUTPUT + '/descriptives',
-            includeChangeAnalysis=params.includeExtremeChangeAnalysis
-            )
-        describer.doIt(useCleanedDataOnly = True)
-
-        
     # Step 8: Conduct Regressions for Morningstars Report, Summarize Results
     if (params.runSW_UnpackingSavingsReport):
-        print("##########################################\r\n Starting Per-Period Analyis\r\n")
-        analyzer = SWAnalysisPerPeriod.SWAnalysisPerPeriod(
-            baseDir = params.BASE_OUTPUT_DIR,
-            inputSubDir = params.INEQUALITY_OUTPUT,
-            inputBaseName = "WithSavings_",
-            outputBaseName = "WithSavings_",
-            outputSubDir = params.INEQUALITY_OUTPUT + '/analyses',
-            useOriginalSampleOnly = params.dropAllNon1968Families,
-            )
-        analyzer.doIt(useCleanedDataOnly = True)
+        runner.addStage('runSW_UnpackingSavingsReport', runSW_UnpackingSavingsReport, dependsOn = ['calcSavingsRates'],
+            inputs = savingsFiles,
+            paramKeys = ['dropAllNon1968Families'],
+            codeModules = [SWAnalysisPerPeriod],
+            outputs = [os.path.join(inequalityDir, "analyses", x) for x in InequalityAnalysisBase.PER_PERIOD_ANALYSIS_FILES])
 
     if (params.runSW_AccumulatedWealthOverTime):
-        print("##########################################\r\n Starting Long term Analyis\r\n")
-        analyzer = SWAnalysisLongTerm.SWAnalysisLongTerm(
-            baseDir = params.BASE_OUTPUT_DIR,
-            inputSubDir = params.INEQUALITY_OUTPUT,
-            inputBaseName = 'WithSavings_',
-            outputSubDir = params.INEQUALITY_OUTPUT + '/analyses',
-            outputBaseName = 'wealthChangeAcrossTime'
-        )
-        analyzer.doIt(1994, 2007, 2019)
-        # analyzer.doIt(2007, 2019, 2019)
-        analyzer.doIt(2009, 2019, 2019)
-        analyzer.doIt(1999, 2019, 2019)
-        analyzer.doIt(1984, 2019, 2019)
+        for (startYear, endYear) in LONG_TERM_WINDOWS:
+            timespan = InequalityAnalysisBase.formatInflatedTimeSpanSuffix(startYear, endYear, 2019)
+            runner.addStage('runSW_AccumulatedWealthOverTime_' + timespan, functools.partial(runSW_AccumulatedWealthOverTimeWindow, startYear = startYear, endYear = endYear),
+                dependsOn = ['calcSavingsRates'],
+                inputs = savingsFiles,
+                paramKeys = [],
+                codeModules = [SWAnalysisLongTerm],
+                outputs = [os.path.join(inequalityDir, "analyses", "wealthChangeAcrossTimeFP_" + timespan + ".csv"),
+                           os.path.join(inequalityDir, "analyses", "Agg_FullPeriod_" + timespan + ".csv")])
 
     # Step 9: Replicate Prior Reserch in the Field
     if params.runDynanReplication:
-        analyzer = DynanAnalysis.DynanAnalysis(
-            baseDir = params.BASE_OUTPUT_DIR,
-            familyInputSubDir = params.FINAL_PSID_OUTPUT_SUBDIR,
-            familyBaseName = "extractedPSID_withMRTax_",
-            individualInputSubDir = params.MAPPED_OUTPUT_SUBDIR,
-            individualBaseName = "extractedPSID_Individual_Mapped_Recoded",
-            outputSubDir = params.DYNAN_OUTPUT_SUBDIR
-        )
-        analyzer.doIt()
+        runner.addStage('runDynanReplication', runDynanReplication, dependsOn = ['addTaxFiles', 'recodeData'],
+            inputs = [os.path.join(finalDir, "extractedPSID_withMRTax_*.csv"), individualRecodedFile],
+            paramKeys = [],
+            codeModules = [DynanAnalysis],
+            outputs = [os.path.join(params.BASE_OUTPUT_DIR, params.DYNAN_OUTPUT_SUBDIR, "*")])
 
     if params.runGittlemanReplication:
-        analyzer = GittlemanAnalysis.GittlemanAnalysis(
-            baseDir = params.BASE_OUTPUT_DIR,
-            familyInputSubDir = params.FINAL_PSID_OUTPUT_SUBDIR,
-            familyBaseName = "extractedPSID_withMRTax_",
-            individualInputSubDir = params.MAPPED_OUTPUT_SUBDIR,
-            individualBaseName = "extractedPSID_Individual_Mapped_Recoded",
-            outputSubDir = params.GITTLEMAN_OUTPUT_SUBDIR
-            )
-        analyzer.doIt()
+        runner.addStage('runGittlemanReplication', runGittlemanReplication, dependsOn = ['addTaxFiles', 'recodeData'],
+            inputs = [os.path.join(finalDir, "extractedPSID_withMRTax_*.csv"), individualRecodedFile, cpiFile],
+            paramKeys = [],
+            codeModules = [GittlemanAnalysis],
+            outputs = [os.path.join(params.BASE_OUTPUT_DIR, params.GITTLEMAN_OUTPUT_SUBDIR, "*")])
 
     if params.runZewdeReplication:
-        analyzer = ZewdeAnalysis.ZewdeAnalysis(
-            baseDir = params.BASE_OUTPUT_DIR,
-            familyInputSubDir = params.MAPPED_OUTPUT_SUBDIR,
-            familyBaseName = "extractedPSID_Mapped_Recoded_",
-            individualInputSubDir = params.MAPPED_OUTPUT_SUBDIR,
-            individualBaseName = "extractedPSID_Individual_Mapped_Recoded",
-            outputSubDir = params.ZEWEDE_OUTPUT_SUBDIR
-            )
-        analyzer.doIt()
+        runner.addStage('runZewdeReplication', runZewdeReplication, dependsOn = ['recodeData'],
+            inputs = [os.path.join(mappedDir, "extractedPSID_Mapped_Recoded_*.csv"), individualRecodedFile, cpiFile],
+            paramKeys = [],
+            codeModules = [ZewdeAnalysis],
+            outputs = [os.path.join(params.BASE_OUTPUT_DIR, params.ZEWEDE_OUTPUT_SUBDIR, "*")])
+
+    return runner
+
+
+def main():
+    # Step 1: Read PSID SAS file and Converts to Parquet (forceReload ignores Parquet if already there)
+    if (params.reloadRawData):
+        loader = RawLoader.RawLoader(params.PSID_DATA_DIR, params.yearsToInclude, chunkSize = params.rawDataChunkSize, numWorkers = params.numWorkers)
+        # loader.loadRawPSID_FamilyOnly()
+        loader.loadRawPSID_All()
 
+    # Steps 2 on: stages that don't depend on each other (e.g. the analyses and replications) run in parallel, up to numStageWorkers at a time
+    runner = buildStageGraph(params)
+    runner.run(params, params.numStageWorkers)
 
 
 
@@ -33,6 +33,25 @@ params = {
     'ZEWEDE_OUTPUT_SUBDIR': 'zewedeOutput',
 
     'PSID_DATA_DIR': ProjectDirectory + '/inputData',
+    # Decode the raw SAS files this many records at a time, to bound memory use (None reads each file in one go)
+    'rawDataChunkSize': 20000,
+    # Number of steps to run at once, each in its own process (None or 1 runs them one at a time)
+    'numStageWorkers': 2,
+    # Number of worker processes within each of those steps, for the ones that can work on several years at once (None or 1 runs them one at a time).
+    # Up to numStageWorkers x numWorkers processes run at once
+    'numWorkers': 4,
+    # How to reach TaxSim: 'ftp' for NBER's FTP server, 'local' to run a local TaxSim (executable, WASM build or stand-in) given by taxSimCommand,
+    # or 'fake' for a flat-tax stand-in, to try out the pipeline offline
+    'taxSimBackend': 'ftp',
+    'taxSimCommand': None,  # e.g. ['taxsim35'] or ['node', 'taxsim.js']; reads TaxSim CSV on stdin and writes it to stdout
+    'taxSimBatchSize': 2000,  # Records per TaxSim call
+    'taxSimMaxConnections': 2,  # Most TaxSim calls at once, across all years. Keep this small for NBER's public server
+    'taxSimMaxRetries': 3,  # Resend a batch that fails or comes back short this many times before stopping
+    # Keep TaxSim results here, so reruns only send the households whose tax inputs changed (None to always send everything)
+    'taxSimCacheFile': ProjectDirectory + '/outputData/intermediateStages/taxsim/taxsimCache.sqlite',
+
+    # Skip any selected step whose input files, params and code haven't changed since it last ran
+    'useStageCache': True,
 
     # What steps of the data preparation do we want to run?  Select these as needed
     'reloadRawData': False,
@@ -42,6 +61,7 @@ params = {
     'addTaxFilesIgnoringMissing': False,
     'extractAndCombineInequalityData': False,
     'calcSavingsRates':False,
+        'savingsBatchMode': False,  # Write all timespans to one parquet dataset (TwoPeriod_WithSavings_AllTimespans) instead of a CSV each
     'describeTimesSeries': False,
         'includeExtremeChangeAnalysis': False,
 
@@ -1,16 +1,22 @@
 import os
 import pandas as pd
+import Inflation.InflationReaderBase as InflationReaderBase
 
 # Todo -- this should be in the main param file
 DEFAULT_CPI_DIR = "C:/Dev/src/MorningstarGithub/PSID/inputData/CPI_Inflation/"
 DEFAULT_CPI_FILE = "CPI.csv"
 
-class CPIInflationReader:
+class CPIInflationReader(InflationReaderBase.InflationReaderBase):
 
     def __init__(self, cpiDirectory = DEFAULT_CPI_DIR,
                  cpiFileName = DEFAULT_CPI_FILE):
-        self.dta = pd.read_csv(os.path.join(cpiDirectory, cpiFileName))
-        self.dta.rename(columns={'YEAR':'year', 'AVE': 'priceLevel'}, inplace=True)
+        # The CPI file is read once per process; see InflationReaderBase
+        self.loadSharedTables(os.path.join(cpiDirectory, cpiFileName))
+
+    def readPriceData(self, filePath):
+        dta = pd.read_csv(filePath)
+        dta.rename(columns={'YEAR':'year', 'AVE': 'priceLevel'}, inplace=True)
+        return dta
         
     def getInflationDF(self):
         return self.dta[['year', 'priceLevel']]
@@ -18,19 +24,3 @@ class CPIInflationReader:
     def getPriceSeriesBetweenTwoYears(self, startYearInclusive, endYearInclusive):
         vals = self.dta.loc[(self.dta.year <= endYearInclusive) & (self.dta.year >= startYearInclusive), ['year','priceLevel']]
         return vals
-     
-    ''' Get relative change in prices:  a multiplier for prices to show change over time.
-    1 = no change
-    2 = twice as expensive
-    '''
-    def getInflationFactorBetweenTwoYears(self, startYearInclusive, endYearInclusive):
-        startingCPI = self.dta.loc[(self.dta.year == startYearInclusive), 'priceLevel']
-        endingCPI = self.dta.loc[(self.dta.year == endYearInclusive), 'priceLevel']
-        if ((len(startingCPI) > 1) or  (len(endingCPI) > 1)):
-            raise Exception("We have more than one row of inflation information for a given year")
-        else:
-            startingCPI = startingCPI.iloc[0]
-            endingCPI = endingCPI.iloc[0]
-            
-        return (endingCPI) /startingCPI
-    
\ No newline at end of file
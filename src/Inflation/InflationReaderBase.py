@@ -0,0 +1,84 @@
+import os
+import abc
+import numpy as np
+
+'''
+What the inflation readers (CPI, NIPA) have in common: given a table of price levels by year,
+look up the inflation factor between any two years.
+
+Each price file is read once per process, and turned into a year x year matrix of factors at the same time;
+every reader made from the same file after that shares them. So making a reader is cheap, and a lookup is one array index.
+'''
+
+
+class InflationReaderBase(abc.ABC):
+
+    # {(reader class, price file): (price data, year x year factors, first year, duplicated years)} -- shared by every reader in the process
+    sharedTables = {}
+
+    @abc.abstractmethod
+    def readPriceData(self, filePath):
+        '''
+        Read the price file. Implemented by each reader
+        :return: at least 'year' and 'priceLevel'
+        :rtype: DataFrame
+        '''
+
+    def loadSharedTables(self, filePath):
+        key = (type(self).__name__, os.path.abspath(filePath))
+        if key not in InflationReaderBase.sharedTables:
+            dta = self.readPriceData(filePath)
+            InflationReaderBase.sharedTables[key] = (dta,) + buildFactorMatrix(dta)
+        self.dta, self.factors, self.firstYear, self.duplicatedYears = InflationReaderBase.sharedTables[key]
+
+    def getYearIndexes(self, years):
+        '''
+        :return: the position of each year in the factor matrix
+        :rtype: ndarray
+        '''
+        years = np.asarray(years)
+        if np.isin(years, self.duplicatedYears).any():
+            raise Exception("We have more than one row of inflation information for a given year")
+        indexes = years.astype(np.int64) - self.firstYear
+        isKnown = (indexes >= 0) & (indexes < len(self.factors))
+        isKnown[isKnown] = ~np.isnan(np.diagonal(self.factors)[indexes[isKnown]])
+        if not isKnown.all():
+            raise Exception("We have no inflation information for " + str(np.unique(years[~isKnown]).tolist()))
+        return indexes
+
+    ''' Get relative change in prices:  a multiplier for prices to show change over time.
+    1 = no change
+    2 = twice as expensive
+    '''
+    def getInflationFactorBetweenTwoYears(self, startYearInclusive, endYearInclusive):
+        indexes = self.getYearIndexes([startYearInclusive, endYearInclusive])
+        return self.factors[indexes[0], indexes[1]]
+
+    def getInflationFactors(self, startYears, endYears):
+        '''
+        The inflation factor for each pair of years, as in getInflationFactorBetweenTwoYears
+        :param startYears: the year each value is in
+        :type startYears: array-like
+        :param endYears: the year to inflate each value to (or a single year, for all of them)
+        :type endYears: array-like or int
+        :rtype: ndarray
+        '''
+        startIndexes = self.getYearIndexes(startYears)
+        endIndexes = self.getYearIndexes(np.broadcast_to(endYears, startIndexes.shape))
+        return self.factors[startIndexes, endIndexes]
+
+
+def buildFactorMatrix(dta):
+    '''
+    :param dta: price levels by year
+    :type dta: DataFrame
+    :return: factors[i, j] = priceLevel(firstYear + j) / priceLevel(firstYear + i) -- NaN for years we don't have -- firstYear,
+        and the years with more than one row (which we can't look up, but don't stop us using the others)
+    :rtype: tuple
+    '''
+    duplicatedYears = np.unique(dta.year[dta.year.duplicated()].to_numpy(dtype=np.int64))
+    years = dta.year.to_numpy(dtype=np.int64)
+    firstYear = int(years.min())
+    priceLevels = np.full(int(years.max()) - firstYear + 1, np.NaN)
+    priceLevels[years - firstYear] = dta.priceLevel.to_numpy(dtype=float)
+    return (priceLevels[np.newaxis, :] / priceLevels[:, np.newaxis], firstYear, duplicatedYears)
@@ -1,4 +1,6 @@
 import os
+import shutil
+import numbers
 import pandas as pd
 import numpy as np
 
@@ -87,14 +89,52 @@ class InequalityAnalysisBase():
             os.makedirs(os.path.join(self.baseDir, self.outputSubDir))
         self.dta.to_csv(os.path.join(self.baseDir, self.outputSubDir, 'TwoPeriod_' + self.outputBaseName +  self.inflatedTimespan + ".csv"), index=False)
 
+        # An older partition for this timespan would be read instead (see loadLongitudinalData)
+        partitionDir = os.path.join(self.baseDir, self.outputSubDir, formatTwoPeriodDatasetName(self.outputBaseName), 'timespan=' + self.inflatedTimespan)
+        if os.path.exists(partitionDir):
+            shutil.rmtree(partitionDir)
+
+    def saveLongitudinalDataToDataset(self, dta, inflatedTimespan):
+        '''
+        Save one timespan as a partition of a single dataset (parquet, one folder per timespan), instead of its own CSV.
+        Readers find it through loadLongitudinalData. Takes the data explicitly, so it can be written in the background.
+        '''
+        partitionDir = os.path.join(self.baseDir, self.outputSubDir, formatTwoPeriodDatasetName(self.outputBaseName), 'timespan=' + inflatedTimespan)
+        if not os.path.exists(partitionDir):
+            os.makedirs(partitionDir)
+
+        # Write under a temporary name, so a failed write doesn't leave half a partition behind
+        partFile = os.path.join(partitionDir, 'part-0.parquet')
+        coerceForDataset(dta).to_parquet(partFile + '.tmp', index=False)
+        os.replace(partFile + '.tmp', partFile)
+
+        # Only now that the partition is there, drop the older CSV for this timespan
+        oldFile = os.path.join(self.baseDir, self.outputSubDir, 'TwoPeriod_' + self.outputBaseName + inflatedTimespan + ".csv")
+        if os.path.exists(oldFile):
+            os.remove(oldFile)
+
     # When we're reading, it's input!
     def readCrossSectionalData(self, year):
         self.dta = pd.read_csv(os.path.join(self.baseDir, self.inputSubDir, 'YearData_' + self.inputBaseName + self.getInflatedYearSuffix(year) +'.csv'))
         if self.useCleanedDataOnly:
             self.dta = self.dta[self.dta["cleaningStatus_" + str(year)] == "Keep"].copy()
 
-    def readLongitudinalData(self):
-        self.dta = pd.read_csv(os.path.join(self.baseDir, self.inputSubDir, 'TwoPeriod_' + self.inputBaseName + self.inflatedTimespan +'.csv'))
+    def loadLongitudinalData(self, inflatedTimespan):
+        '''
+        Read the data for one timespan: its partition of the combined dataset (see saveLongitudinalDataToDataset), or else its own CSV
+        :rtype: DataFrame
+        '''
+        partitionDir = os.path.join(self.baseDir, self.inputSubDir, formatTwoPeriodDatasetName(self.inputBaseName), 'timespan=' + inflatedTimespan)
+        if os.path.exists(os.path.join(partitionDir, 'part-0.parquet')):
+            return pd.read_parquet(os.path.join(partitionDir, 'part-0.parquet'))
+        return pd.read_csv(os.path.join(self.baseDir, self.inputSubDir, 'TwoPeriod_' + self.inputBaseName + inflatedTimespan +'.csv'))
+
+    def readLongitudinalData(self, dta = None):
+        '''
+        :param dta: the data for this timespan, if it's already been loaded
+        :type dta: DataFrame
+        '''
+        self.dta = self.loadLongitudinalData(self.inflatedTimespan) if dta is None else dta
         if self.useCleanedDataOnly:
             self.dta = self.dta[(self.dta["cleaningStatus_" + self.timespan] == "Keep") &
                                 (self.dta["cleaningStatus_" + self.syStr] == "Keep") &
@@ -117,11 +157,32 @@ def selectiveReorder(dta, colsToPutFirst, alphabetizeTheOthers = False):
     new_columns = colsToPutFirst + remainingColumns
     return dta[new_columns]
  
+# Parquet needs one type per column: the calcs leave object columns of None, NaN, floats and flags mixed together
+def coerceForDataset(dta):
+    dta = dta.copy()
+    for col in dta.columns[dta.dtypes == object]:
+        values = dta[col].dropna()
+        if len(values) > 0 and values.map(lambda x: isinstance(x, (bool, np.bool_))).all():
+            dta[col] = dta[col].astype('boolean')
+        elif values.map(lambda x: isinstance(x, numbers.Number)).all():
+            dta[col] = dta[col].astype(float)
+        else:
+            dta[col] = dta[col].where(dta[col].isna(), dta[col].astype(str))
+    return dta
+
 def formatInflatedYearSuffix(fromYr, toYear):
     return str(fromYr) + '_as_' + str(toYear)
 
 def formatInflatedTimeSpanSuffix(startYear, endYear, toYear):
     return str(startYear) + '_' + str(endYear) + '_as_' + str(toYear)
 
+def formatTwoPeriodDatasetName(baseName):
+    return 'TwoPeriod_' + baseName + 'AllTimespans'
+
 def formatTimeSpanSuffix(startYear, endYear):
     return str(startYear) + '_' + str(endYear)
+
+# The files SWAnalysisPerPeriod writes to its output folder, including those of the AggregatePopulationAnalyzer it runs for each timespan
+PER_PERIOD_ANALYSIS_FILES = ["SW_*.csv", "FiguresForPaper_*.xlsx",
+                             "AssetLevelResults_Weighted_*.csv", "SavingsRates_Weighted_*.csv", "WealthChange_*.csv", "Analysis_Regressions_*.csv",
+                             "SavingsRates_Means_*.png", "F6_WealthChange_Median_*.png"]
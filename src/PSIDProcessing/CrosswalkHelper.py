@@ -1,16 +1,22 @@
 import pandas as pd
+import numpy as np
 import os
-import copy
 
 # CROSSWALK_FILE_ORIG = "PSIDCrosswalk_AsOf2020.xlsx"
 # CROSSWALK_FILE_PROCESSED = "PSIDCrosswalk_AsOf2020_clean.csv"
 
 CROSSWALK_FILE_ORIG = "PSIDCrosswalk_AsOf2021.xlsx"
 CROSSWALK_FILE_PROCESSED = "PSIDCrosswalk_AsOf2021_clean.csv"
+CROSSWALK_FILE_INDEX = "PSIDCrosswalk_AsOf2021_index.csv"
 
 ''' 
 This class takes a cleanedup PSID Cross-year crosswalk file (showing the names of different variables, by year) 
 and helps process it. For example, by finding the names of other equivalent variables in other years 
+
+Lookups go through two indexes, built once when the crosswalk is read:
+ - varIndex: PSID variable name -> [(crosswalk row, year), ..]
+ - categoryIndex: category path (C0, C1, ..) -> [crosswalk rows]
+The variable locations are saved next to the crosswalk (CROSSWALK_FILE_INDEX), and rebuilt when the crosswalk is newer.
 '''
 
 class PSIDCrosswalkHelper:
@@ -39,16 +45,53 @@ class PSIDCrosswalkHelper:
             vardata.to_csv(os.path.join(self.rootDataDir, CROSSWALK_FILE_PROCESSED))
             
             self.dta = vardata
+
+        self.buildIndex(forceRebuild = forceReload)
         return self.dta
 
+    def getYearColumns(self):
+        return [x for x in self.dta.columns if x.startswith('Y')]
+
+    def getCategoryColumns(self):
+        return [x for x in self.dta.columns if x.startswith('C') and x[1:].isdigit()]
+
+    def buildIndex(self, forceRebuild = False):
+        '''
+        Index the crosswalk by variable name and by category path. Saves the variable locations, for next time.
+        '''
+        indexFile = os.path.join(self.rootDataDir, CROSSWALK_FILE_INDEX)
+        crosswalkFile = os.path.join(self.rootDataDir, CROSSWALK_FILE_PROCESSED)
+        if (not forceRebuild) and os.path.exists(indexFile) and os.path.exists(crosswalkFile) and \
+                (os.path.getmtime(indexFile) >= os.path.getmtime(crosswalkFile)):
+            self.varLocations = pd.read_csv(indexFile, dtype={'varName': str})
+        else:
+            # One row per (variable, year) in the crosswalk: stack skips the empty cells
+            stacked = self.dta[self.getYearColumns()].stack()
+            self.varLocations = pd.DataFrame({'varName': stacked.to_numpy().astype(str),
+                                              'row': stacked.index.get_level_values(0),
+                                              'year': stacked.index.get_level_values(1).str.replace("Y", "").astype(int)})
+            self.varLocations.to_csv(indexFile, index=False)
+
+        self.varIndex = {}
+        for varName, row, year in zip(self.varLocations.varName, self.varLocations.row, self.varLocations.year):
+            self.varIndex.setdefault(varName, []).append((row, year))
+
+        self.categoryIndex = {}
+        categoryPaths = self.dta[self.getCategoryColumns()].astype(object).where(self.dta[self.getCategoryColumns()].notna(), None)
+        for row, path in zip(self.dta.index, categoryPaths.itertuples(index=False, name=None)):
+            self.categoryIndex.setdefault(path, []).append(row)
+
+    def getRowsForVar(self, varname):
+        '''
+        :return: the crosswalk rows (index labels) where varname appears, in order
+        :rtype: list
+        '''
+        return sorted(set(row for row, year in self.varIndex.get(varname, [])))
+
     # get_cat_from_varname
     def getDetailsForVar(self, varname):
-        subset = copy.deepcopy(self.dta)
-        yearColumns = [x for x in self.dta.columns if x.startswith('Y')]
-        df= self.dta[yearColumns]
-        assert varname in df.values
-        subset = subset[df.values == varname]
-        return subset
+        assert varname in self.varIndex
+        return self.dta.loc[self.getRowsForVar(varname)]
 
     def getVariablesInSameSeries(self, varname):
         row = self.getDetailsForVar(varname)
@@ -59,21 +102,20 @@ class PSIDCrosswalkHelper:
         
     # findseries
     def findCategoryDetailsForVariable(self, varname):
-        yearColumns = [x for x in self.dta.columns if x.startswith('Y')]
-        df= self.dta[yearColumns]
         catagoryColumns = [x for x in self.dta.columns if x.startswith('C')]
-        return self.dta[df.values == varname][catagoryColumns]
+        return self.dta.loc[self.getRowsForVar(varname), catagoryColumns]
 
 
     # clist = ['individual', 'demographic', 'age']  A list following category levels in the crosswalk file: 0:Type;1:Major Category; 2:VariableType; 3:Qualifier1; 4:Qualifier2 
     def getCategoriesMatchingCriteria(self, categoryCriteriaList):
-        subset = copy.deepcopy(self.dta)
-        for i in range(0, len(categoryCriteriaList)):
-            lowercase = subset['C' + str(i)].str.lower()
-            cond = lowercase.str.startswith(categoryCriteriaList[i].str.lower())
-            subset = copy.deepcopy(subset[cond])
-        assert len(subset) > 0
-        return subset
+        # Check each distinct category path once, rather than every row
+        criteria = [x.lower() for x in categoryCriteriaList]
+        rows = []
+        for path, pathRows in self.categoryIndex.items():
+            if all((path[i] is not None) and str(path[i]).lower().startswith(criteria[i]) for i in range(len(criteria))):
+                rows.extend(pathRows)
+        assert len(rows) > 0
+        return self.dta.loc[sorted(rows)]
 
  
     def getAvailableYearsForVarsMatchingCriteria(self, categoryCriteriaList, minyear = 1968, maxyear = 2019):
@@ -99,45 +141,62 @@ class PSIDCrosswalkHelper:
     '''
     
     def getVariableSeriesesGivenSample(self, varDictOrList, yearsToInclude):
-        subset = copy.deepcopy(self.dta)
-        
-        yearColumns = [x for x in subset.columns if x.startswith('Y')]
+        yearColumns = self.getYearColumns()
         categoryColumns = ['C0', 'C1','C2']
 
         if (isinstance(varDictOrList, dict)):
-            isDict = True
+            varLabels = varDictOrList
         else:
-            isDict = False
-            
-        dfNew = None
-        
-        for varName in varDictOrList: 
-            if isDict:
-                varLabel = varDictOrList[varName]
-            else:
-                varLabel = varName
+            varLabels = {varName: varName for varName in varDictOrList}
+        if len(varLabels) == 0:
+            return None
 
-            if (varName not in subset[yearColumns].values):
+        for varName in varLabels:
+            if (varName not in self.varIndex):
                 raise Exception('This variable was not found in the crosswalk file:' + varName)
-            
-            indexVal = subset.index[subset[yearColumns].isin([varName]).any(axis=1)]
-            row = subset.loc[indexVal, yearColumns + categoryColumns].copy()
-            yearColumnsInt = [c.replace("Y", "") for c in yearColumns]
-            yearColumnsIntToKeep = [c for c in yearColumnsInt if ((int(c) in yearsToInclude))]
-            row.columns = row.columns.str.replace("Y", "")
-            colsToKeep = yearColumnsIntToKeep + categoryColumns
-            row=row[colsToKeep]
-            row.rename(columns={'C0':'sourcefile', 'C1': 'category', 'C2': 'subcategory'}, inplace=True)
-            
-            row['count'] = (~row.isna()).sum(axis=1)
-            
-            row['label'] = varLabel
-                
-            if dfNew is None:
-                dfNew = row
-            else:
-                dfNew = pd.concat([dfNew, row], ignore_index=True) 
-
-        return dfNew        
-        
-        
\ No newline at end of file
+
+        # Every crosswalk row for every variable, picked out in one go
+        rowsPerVar = [self.getRowsForVar(varName) for varName in varLabels]
+        yearColumnsToKeep = [c for c in yearColumns if int(c.replace("Y", "")) in yearsToInclude]
+        dfNew = self.dta.loc[[row for rows in rowsPerVar for row in rows], yearColumnsToKeep + categoryColumns].reset_index(drop=True)
+        dfNew.columns = dfNew.columns.str.replace("Y", "")
+        dfNew.rename(columns={'C0':'sourcefile', 'C1': 'category', 'C2': 'subcategory'}, inplace=True)
+
+        dfNew['count'] = (~dfNew.isna()).sum(axis=1)
+        dfNew['label'] = np.repeat(list(varLabels.values()), [len(rows) for rows in rowsPerVar])
+        return dfNew
+
+    def getVariableStatusLongForm(self, varDictOrList, yearsToInclude, alwaysLoadTheseVars = None):
+        '''
+        The PSID variable to load for each of our variables in each year, one row per variable-year.
+        :param varDictOrList: our variables, as for getVariableSeriesesGivenSample
+        :type varDictOrList: dict or list
+        :param yearsToInclude: the years we want
+        :type yearsToInclude: list
+        :param alwaysLoadTheseVars: {'PSID_VariableName':'HumanReadableName',..} to load in the year they come from, whatever the years
+        :type alwaysLoadTheseVars: dict
+        :return: sourcefile, category, subcategory, label, count, year, varName
+        :rtype: DataFrame
+        '''
+        varStatus = self.getVariableSeriesesGivenSample(varDictOrList = varDictOrList, yearsToInclude = yearsToInclude)
+        longFormatStatus = pd.melt(varStatus, id_vars=['sourcefile', 'category', 'subcategory', 'label', 'count'], var_name='year', value_name='varName')
+        if alwaysLoadTheseVars is None:
+            return longFormatStatus
+
+        varsToAdd = [varName for varName in alwaysLoadTheseVars.keys() if varName not in set(longFormatStatus.varName)]
+        if len(varsToAdd) == 0:
+            return longFormatStatus
+
+        # The first row and year each variable appears in
+        locations = self.varLocations[self.varLocations.varName.isin(varsToAdd)].groupby('varName').agg({'row': 'min', 'year': 'min'})
+        locations = locations.reindex(varsToAdd)
+        if locations.row.isna().any():
+            raise Exception('This variable was not found in the crosswalk file:' + locations.index[locations.row.isna()][0])
+        categories = self.dta.loc[locations.row, ['C0', 'C1', 'C2']]
+        extraStatus = pd.DataFrame({'sourcefile': categories.C0.to_numpy(),
+                                    'category': categories.C1.to_numpy(), 'subcategory': categories.C2.to_numpy(),
+                                    'label': [alwaysLoadTheseVars[varName] for varName in varsToAdd],
+                                    'count': None,
+                                    'varName': varsToAdd,
+                                    'year': locations.year.astype(str).to_numpy()})
+        return pd.concat([longFormatStatus, extraStatus], ignore_index=True)
@@ -0,0 +1,109 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+
+'''
+Compact in-memory types for PSID data frames.
+
+After recoding, most of our columns are labels ('Working', 'Married', race...), True/False/None flags, ids, small codes, or
+dollar amounts - held as Python objects, int64 and float64.  The policy here picks a smaller type for the columns that are never
+used in arithmetic:
+ - Labels (strings, few distinct values) -> category
+ - Flags (True/False, with or without missing) -> nullable boolean
+ - Ids (familyInterviewId, constantIndividualID, familyId1968_2019 etc) -> int32, or nullable Int32 with missing values
+Everything else - amounts, rates, and codes that get added up or combined - keeps its int64 / float64 type, so sums, inflation
+adjustments etc. can't overflow or lose precision.
+
+CSV doesn't keep types, so saveCsv writes the chosen types next to the data (<file>_Dtypes.csv) and readCsv reads them back.
+Files without one are compacted after loading, so either way you get the same types.
+'''
+
+MAX_LABEL_SHARE = 0.5  # A string column is a label if no more than this share of its values are distinct
+DTYPES_FILE_SUFFIX = "_Dtypes"
+# An id column's name ends in Id or ID, optionally followed by a year (familyId1968) and/or a year suffix (_2019)
+ID_COLUMN_PATTERN = re.compile(r'(Id|ID)(\d{4})?(_\d{4})?$')
+
+
+def isIdColumn(name):
+    return isinstance(name, str) and (ID_COLUMN_PATTERN.search(name) is not None)
+
+
+def getCompactDtype(series):
+    '''
+    :param series: a column of data
+    :type series: Series
+    :return: the compact type for this column, or None if it should be left as is
+    :rtype: str
+    '''
+    values = series.dropna()
+    dtype = series.dtype
+
+    if dtype == object:
+        if len(values) == 0:
+            return None
+        if values.map(lambda x: isinstance(x, (bool, np.bool_))).all():
+            return 'boolean'
+        if values.map(lambda x: isinstance(x, str)).all() and (values.nunique() <= MAX_LABEL_SHARE * len(values)):
+            return 'category'
+        return None
+
+    if (not isinstance(dtype, np.dtype)) or (dtype.kind not in 'iuf') or (len(values) == 0) or (not isIdColumn(series.name)):
+        return None  # Already compact (category, boolean etc), nothing to go on, or not an id
+
+    asFloat = values.to_numpy(dtype=float)
+    if (not np.array_equal(asFloat, np.round(asFloat))) or (asFloat.min() < np.iinfo('int32').min) or (asFloat.max() > np.iinfo('int32').max):
+        return None
+    if dtype.kind in 'iu':
+        return None if dtype.itemsize <= 4 else 'int32'
+    return 'Int32' if len(values) < len(series) else 'int32'
+
+
+def getCompactDtypes(dta):
+    '''
+    :return: {column: compact type}, for the columns that have one
+    :rtype: dict
+    '''
+    compactTypes = {}
+    for column in dta.columns:
+        compactType = getCompactDtype(dta[column])
+        if compactType is not None:
+            compactTypes[column] = compactType
+    return compactTypes
+
+
+def compactFrame(dta):
+    '''
+    Convert each column of dta to its compact type, in place
+    :rtype: DataFrame
+    '''
+    for column, compactType in getCompactDtypes(dta).items():
+        dta[column] = dta[column].astype(compactType)
+    return dta
+
+
+def saveCsv(dta, fileNameWithPathNoExtension):
+    '''
+    Save dta as CSV, with the compact type of each column alongside it.  dta itself isn't changed.
+    '''
+    dta.to_csv(fileNameWithPathNoExtension + ".csv", index=False)
+
+    types = {column: str(dta[column].dtype) for column in dta.columns}
+    types.update(getCompactDtypes(dta))
+    pd.DataFrame({'column': list(types.keys()), 'dtype': list(types.values())}). \
+        to_csv(fileNameWithPathNoExtension + DTYPES_FILE_SUFFIX + ".csv", index=False)
+
+
+def readCsv(fileNameWithPathNoExtension):
+    '''
+    Read a CSV saved with saveCsv, in its compact types. Files without saved types are compacted after loading.
+    :rtype: DataFrame
+    '''
+    typesFile = fileNameWithPathNoExtension + DTYPES_FILE_SUFFIX + ".csv"
+    if not os.path.exists(typesFile):
+        return compactFrame(pd.read_csv(fileNameWithPathNoExtension + ".csv", low_memory=False))
+
+    types = pd.read_csv(typesFile)
+    # Columns of all-missing values were saved as object; leave those for pandas to decide
+    typeMap = {column: dtype for column, dtype in zip(types.column, types.dtype) if dtype != 'object'}
+    return pd.read_csv(fileNameWithPathNoExtension + ".csv", dtype=typeMap, low_memory=False)
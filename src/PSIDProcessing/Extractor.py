@@ -4,8 +4,25 @@ import pandas as pd
 import numpy as np
 import PSIDProcessing.RawLoader as RawLoader
 import PSIDProcessing.CrosswalkHelper as CrosswalkHelper
+import PSIDProcessing.DtypePolicy as DtypePolicy
 import os 
 
+# What identifies a row when new variables are added to previously extracted data: the family interview number for that year
+# (by its label in our variable list), or the 1968 interview number and person number for the individual file
+FAMILY_ID_LABEL = 'familyInterviewId'
+INDIVIDUAL_ID_VARS = ['ER30001', 'ER30002']
+
+def getNullableDtype(dtype):
+    '''
+    A type like dtype that can hold missing values: numpy ints and bools become pandas' nullable ones
+    '''
+    if isinstance(dtype, np.dtype) and (dtype.kind in 'iu'):
+        return dtype.name.replace('uint', 'UInt').replace('int', 'Int')
+    if isinstance(dtype, np.dtype) and (dtype.kind == 'b'):
+        return 'boolean'
+    return dtype
+
+
 class Extractor:
     '''
     This class helps you extract data from the PSID -
@@ -14,7 +31,7 @@ class Extractor:
 
     '''
 
-    def __init__(self, rootDir, yearsToInclude, variablesWeWantAnyYear, alwaysLoadTheseVars, source='family'):
+    def __init__(self, rootDir, yearsToInclude, variablesWeWantAnyYear, alwaysLoadTheseVars, source='family', chunkSize = None, numWorkers = None):
         '''
         :param rootDir: where we find the data
         :type rootDir: str
@@ -26,6 +43,10 @@ class Extractor:
         :type alwaysLoadTheseVars: list
         :param source: 'Family' or 'Individual' file
         :type source: str
+        :param chunkSize: if set, raw SAS files are decoded this many records at a time
+        :type chunkSize: int
+        :param numWorkers: if more than 1, years are loaded in parallel in this many processes
+        :type numWorkers: int
         '''
         self.yearsToInclude = yearsToInclude
         self.variablesWeWant_SampleForAYear = variablesWeWantAnyYear
@@ -33,7 +54,7 @@ class Extractor:
         self.rootDir = rootDir
 
         self.crosswalkHelper = CrosswalkHelper.PSIDCrosswalkHelper(rootDir)        
-        self.loader = RawLoader.RawLoader(rootDir, yearsToInclude)
+        self.loader = RawLoader.RawLoader(rootDir, yearsToInclude, chunkSize = chunkSize, numWorkers = numWorkers)
         self.source = source  
 
 
@@ -47,6 +68,9 @@ class Extractor:
         and calls the PSID Loader to load the relevant years of data, subset to thus variables,
         and return it all in a big honkin' data set
 
+        If we're saving, and the same years were extracted to filePath before from the same raw files, only the variables that
+        aren't there yet are loaded from the raw data -- see extractIncrementally.
+
         :param forceReload: force reloading of the data from the original PSID SAS file; otherwise use our temp CSV
         :type forceReload: bool
         :param saveIt: save the resulting files to  disk
@@ -56,31 +80,19 @@ class Extractor:
         '''
         self.crosswalkHelper.readCrossWalk(forceReload)
 
-        varStatus = self.crosswalkHelper.getVariableSeriesesGivenSample(varDictOrList = self.variablesWeWant_SampleForAYear, yearsToInclude = self.yearsToInclude)
-
-        longFormatStatus = pd.melt(varStatus,id_vars=['sourcefile', 'category', 'subcategory', 'label', 'count'],var_name='year', value_name='varName')
-
-        if self.alwaysLoadTheseVars is not None:
-            for varToLoad in self.alwaysLoadTheseVars.keys():
-                if varToLoad not in longFormatStatus.varName.unique().tolist():
-                    tmp = self.crosswalkHelper.getDetailsForVar(varToLoad)
-                    theYear = tmp.columns[tmp.isin([varToLoad]).any()].tolist()[0].replace("Y", "")
-                    row = pd.DataFrame({'sourcefile':tmp.C0.iloc[0],
-                                    'category':tmp.C1.iloc[0], 'subcategory':tmp.C2.iloc[0],
-                                    'label': self.alwaysLoadTheseVars[varToLoad],
-                                    'count': None,
-                                    'varName': varToLoad,
-                                    'year':theYear
-                                    }, index=[len(longFormatStatus)])
-                    longFormatStatus = pd.concat([longFormatStatus, row], ignore_index=True)
+        # Our variables, and the ones to always load, matched to PSID variable names in one pass over the crosswalk index
+        longFormatStatus = self.crosswalkHelper.getVariableStatusLongForm(self.variablesWeWant_SampleForAYear, self.yearsToInclude,
+                                                                          alwaysLoadTheseVars = self.alwaysLoadTheseVars)
 
         varsToKeep = longFormatStatus.varName.tolist()
+        rawFileStamps = self.getRawFileStamps()
 
+        theDataDict = None
+        if saveIt and (not forceReload):
+            theDataDict = self.extractIncrementally(varsToKeep, filePath, fileNameBase, rawFileStamps, longFormatStatus)
 
-        if self.source == 'family':
-            theDataDict = self.loader.loadRawPSID_FamilyOnly(varsToKeep, forceReload)
-        elif self.source == 'individual':
-            theDataDict = {0: self.loader.readIndividualData(varsToKeep, forceReload)}
+        if theDataDict is None:
+            theDataDict = self.loadRawData(varsToKeep, forceReload)
 
         self.dataDict = theDataDict
         self.variableStatusLongForm = longFormatStatus
@@ -90,13 +102,163 @@ class Extractor:
                 self.saveExtractedFamilyData(filePath, fileNameBase)
             elif self.source == 'individual':
                 self.saveExtractedIndividualData(filePath, fileNameBase)
+            self.saveManifest(varsToKeep, filePath, fileNameBase, rawFileStamps)
 
         return self.dataDict
 
+    def loadRawData(self, varsToKeep, forceReload = False, keys = None):
+        '''
+        :param keys: the years to load (None for all of them); ignored for individual data
+        :type keys: list
+        :return: the given variables from the raw PSID files: {year: DataFrame} for family data, {0: DataFrame} for individual data
+        :rtype: Dict
+        '''
+        if self.source == 'family':
+            return self.loader.loadRawPSID_FamilyOnly(varsToKeep, forceReload, years = keys)
+        elif self.source == 'individual':
+            return {0: self.loader.readIndividualData(varsToKeep, forceReload)}
+
+    def getExtractedKeys(self):
+        '''
+        The keys of the data dictionary we extract: years for family data, 0 for the one individual file
+        '''
+        if self.source == 'family':
+            return self.loader.getFamilyYears()
+        return [0]
+
+    def getExtractedFileName(self, filePath, fileNameBase, key):
+        if self.source == 'family':
+            return os.path.join(filePath, fileNameBase + str(key))
+        return os.path.join(filePath, fileNameBase)
+
+    def getRawFileStamps(self):
+        '''
+        :return: {key: size and modification time of the raw files that key is extracted from} -- see RawLoader.getRawFileStamp
+        :rtype: Dict
+        '''
+        if self.source == 'family':
+            filesByKey = self.loader.getFamilyFiles()
+        else:
+            filesByKey = {0: [self.loader.getIndividualFile()]}
+        return {key: "|".join([str(self.loader.getRawFileStamp(x)) for x in filesByKey[key]]) for key in filesByKey}
+
+    def saveManifest(self, varsToKeep, filePath, fileNameBase, rawFileStamps):
+        '''
+        Record which PSID variables were extracted into each saved file, and from which raw files, so the next extraction
+        can add just the new ones -- unless the raw files have changed since
+        '''
+        varNames = sorted(set([x for x in varsToKeep if isinstance(x, str)]))
+        if len(varNames) == 0:
+            varNames = [None]  # Still record the raw files
+        keys = list(self.dataDict.keys())
+        pd.DataFrame({'year': np.repeat(keys, len(varNames)), 'varName': varNames * len(keys),
+                      'rawFiles': np.repeat([rawFileStamps.get(key) for key in keys], len(varNames))}). \
+            to_csv(os.path.join(filePath, fileNameBase + "Manifest.csv"), index=False)
+
+    def readManifest(self, filePath, fileNameBase):
+        '''
+        :return: {key: (set of PSID variables in that file, stamp of the raw files they came from)}, or None if there's no manifest.
+            Manifests from before we kept the stamp have None for it.
+        :rtype: Dict
+        '''
+        manifestFile = os.path.join(filePath, fileNameBase + "Manifest.csv")
+        if not os.path.exists(manifestFile):
+            return None
+        manifest = pd.read_csv(manifestFile, dtype={'varName': str, 'rawFiles': str})
+        if 'rawFiles' not in manifest.columns:
+            manifest['rawFiles'] = None
+        return {key: (set(group.varName.dropna()), group.rawFiles.iloc[0] if group.rawFiles.notnull().all() else None)
+                for key, group in manifest.groupby('year')}
+
+    def getIdVars(self, key, longFormatStatus):
+        '''
+        :return: the PSID variables that identify a row of the data for this key
+        :rtype: list
+        '''
+        if self.source == 'individual':
+            return INDIVIDUAL_ID_VARS
+        ids = longFormatStatus.loc[(longFormatStatus.label == FAMILY_ID_LABEL) & (longFormatStatus.year.astype(int) == key), 'varName']
+        return [x for x in ids if isinstance(x, str)]
+
+    def addNewColumns(self, dta, newDta, idVars):
+        '''
+        Add the columns of newDta that dta doesn't have yet, matching rows on idVars
+        :return: the combined data, in dta's row order; or None if the rows can't be matched: no id variables, or not the same ids
+        :rtype: DataFrame
+        '''
+        if (len(idVars) == 0) or any([(x not in dta.columns) or (x not in newDta.columns) for x in idVars]):
+            return None
+        oldIds = pd.MultiIndex.from_frame(dta[idVars].astype(float))
+        newIds = pd.MultiIndex.from_frame(newDta[idVars].astype(float))
+        if oldIds.has_duplicates or newIds.has_duplicates or (len(oldIds) != len(newIds)) or (not oldIds.isin(newIds).all()):
+            return None
+
+        newColumns = [x for x in newDta.columns if x not in dta.columns]
+        aligned = newDta[newColumns].set_index(newIds).reindex(oldIds)
+        return pd.concat([dta.reset_index(drop=True), aligned.reset_index(drop=True)], axis=1)
+
+    def extractIncrementally(self, varsToKeep, filePath, fileNameBase, rawFileStamps, longFormatStatus):
+        '''
+        Update previously extracted files to hold varsToKeep: load just the variables they don't have yet from the raw data,
+        add them as new columns (matching rows on their ids), and drop the variables we no longer want.
+        Years whose raw files have changed since (a new PSID release), that we extracted nothing for, or whose rows don't match up
+        with the raw data, are extracted again in full.
+        :return: the updated data dictionary, or None if it has to be extracted from scratch (no manifest etc)
+        :rtype: Dict
+        '''
+        manifest = self.readManifest(filePath, fileNameBase)
+        keys = self.getExtractedKeys()
+        if (manifest is None) or (len(keys) == 0):
+            return None
+
+        varsWanted = set([x for x in varsToKeep if isinstance(x, str)])
+        theDataDict = {}
+        fullKeys = []
+        for key in keys:
+            fileName = self.getExtractedFileName(filePath, fileNameBase, key)
+            if (key not in manifest) or (manifest[key][1] is None) or (manifest[key][1] != rawFileStamps.get(key)) or \
+                    (len(manifest[key][0]) == 0) or (not os.path.exists(fileName + ".csv")):
+                fullKeys.append(key)
+                continue
+            dta = DtypePolicy.readCsv(fileName)
+            dta = dta[[x for x in dta.columns if x in varsWanted]]
+            if len(dta.columns) == 0:
+                # None of the variables we extracted were in this year's data: nothing to add to
+                fullKeys.append(key)
+            else:
+                theDataDict[key] = dta
+
+        newVars = set()
+        idVars = set()
+        for key in theDataDict:
+            newVars = newVars | (varsWanted - manifest[key][0])
+            idVars = idVars | set(self.getIdVars(key, longFormatStatus))
+        print("Already extracted " + str(len(theDataDict)) + " file(s) from the same raw data; loading " + str(len(newVars)) +
+              " new variables for them, and extracting " + str(len(fullKeys)) + " file(s) in full")
+
+        if len(newVars) > 0:
+            newData = self.loadRawData(sorted(newVars | idVars), keys = list(theDataDict.keys()))
+            for key in list(theDataDict.keys()):
+                newDta = newData.get(key)
+                if (newDta is None) or (len(set(newDta.columns) - set(theDataDict[key].columns)) == 0):
+                    continue
+                dta = self.addNewColumns(theDataDict[key], newDta, self.getIdVars(key, longFormatStatus))
+                if dta is None:
+                    print("The raw data for " + str(key) + " doesn't line up with the extracted file; extracting it again")
+                    del theDataDict[key]
+                    fullKeys.append(key)
+                else:
+                    theDataDict[key] = dta[[x for x in dta.columns if x in varsWanted]]
+
+        if len(fullKeys) > 0:
+            theDataDict.update(self.loadRawData(sorted(varsWanted), keys = fullKeys))
+        return {key: theDataDict[key] for key in keys if key in theDataDict}
+
     def fillMissingVarsWithNones(self):
         '''
         Looks in the previously created VariableStatus table for any variable-years that werent mapped,
-        and creates new variables, filled with NOnes, for those missing variable-years
+        and creates new variables, filled with NOnes, for those missing variable-years.
+        Each new column gets the type the variable has in the years where we do have it (nullable, so it can hold the missing values)
         :return: None
         :rtype: None
         '''
@@ -106,29 +268,43 @@ class Extractor:
         elif self.source == 'individual':
             soureFileName = 'INDIVIDUAL'
 
+        # The unmapped variable-years, for all years at once
+        status = self.variableStatusLongForm
+        unmapped = status[status.varName.isna()]
+        # The status table's years come from the crosswalk's column headers, so they're strings; dataDict's are ints
+        missingByYear = {year: group for year, group in unmapped.groupby(unmapped.year.astype(int))}
+
+        # The type of each variable, from the years that have it
+        targetDtypes = {}
         for year in self.dataDict:
-            yearData = self.dataDict[year]
-            varsMissing = self.variableStatusLongForm['label'][
-                (self.variableStatusLongForm.sourcefile == soureFileName) &
-                (self.variableStatusLongForm.varName.isna()) &
-                (self.variableStatusLongForm.year == year)]
+            for column, dtype in self.dataDict[year].dtypes.items():
+                if (column not in targetDtypes) or (targetDtypes[column] == object):
+                    targetDtypes[column] = dtype
+
+        for year in self.dataDict:
+            yearMissing = missingByYear.get(year, unmapped.iloc[0:0])
+            varsMissing = yearMissing['label'][yearMissing.sourcefile == soureFileName]
 
             # warn about restricted data we don't have
             if self.source == 'family':
-                restrictedMissing = self.variableStatusLongForm['label'][
-                    (self.variableStatusLongForm.sourcefile == "FAMILY RESTRICTED") &
-                    (self.variableStatusLongForm.varName.isna()) &
-                    (self.variableStatusLongForm.year == year)]
+                restrictedMissing = yearMissing['label'][yearMissing.sourcefile == "FAMILY RESTRICTED"]
                 if len(restrictedMissing) > 0:
                     warnings.warn("You've asked for data that isnt available in " + str(year) + " - it's from the restricted file." + str(restrictedMissing))
                     varsMissing = pd.concat([varsMissing, restrictedMissing])
 
-            emptyDf = pd.DataFrame(columns=varsMissing)
-            yearData = pd.concat([yearData,emptyDf], ignore_index=True, sort=False)
+            yearData = self.dataDict[year]
+            newColumns = [x for x in pd.unique(varsMissing) if x not in yearData.columns]
+            if len(newColumns) == 0:
+                continue
+
+            # One new frame, with every column in place
+            yearData = yearData.reindex(columns = list(yearData.columns) + newColumns)
+            for column in newColumns:
+                if column in targetDtypes:
+                    yearData[column] = yearData[column].astype(getNullableDtype(targetDtypes[column]))
             self.dataDict[year] = yearData
 
 
-
     def saveExtractedFamilyData(self, filePath, fileNameBase):
         '''
         Save each year of extracted PSID data  and the status of each variable
@@ -146,7 +322,7 @@ class Extractor:
         for year in self.dataDict:
             yearData = self.dataDict[year]
             yearData = yearData.reindex(sorted(yearData.columns), axis=1)
-            yearData.to_csv(os.path.join(filePath, fileNameBase + str(year) + ".csv"), index=False)
+            DtypePolicy.saveCsv(yearData, os.path.join(filePath, fileNameBase + str(year)))
         self.variableStatusLongForm.to_csv(os.path.join(filePath, fileNameBase + "VariableStatus.csv"), index=False)
 
     def saveExtractedIndividualData(self, filePath, fileNameBase):
@@ -168,11 +344,11 @@ class Extractor:
             os.makedirs(filePath)
 
         individualData = self.dataDict[0]
-        individualData.to_csv(os.path.join(filePath, fileNameBase + ".csv"), index=False)
+        DtypePolicy.saveCsv(individualData, os.path.join(filePath, fileNameBase))
         self.variableStatusLongForm.to_csv(os.path.join(filePath, fileNameBase + "VariableStatus.csv"), index=False)
 
 
-    def readExtractedData(self, yearsToInclude, filePath, fileNameBase):
+    def readExtractedData(self, yearsToInclude, filePath, fileNameBase, compactTypes = False):
         '''
         Read previously extracted data into memory
         :param yearsToInclude:
@@ -181,20 +357,27 @@ class Extractor:
         :type filePath: String
         :param fileNameBase:  Base (Prefix) File name for our data.
         :type fileNameBase: String
+        :param compactTypes: Read in the compact types from DtypePolicy (categories, flags, ids). Leave off if the data is going to be recoded - the recoders expect the original codes
+        :type compactTypes: bool
         :return: None
         :rtype: None
         '''
+        if compactTypes:
+            readCsv = DtypePolicy.readCsv
+        else:
+            readCsv = lambda fileNameNoExtension: pd.read_csv(fileNameNoExtension + ".csv", low_memory=False)
+
         self.dataDict = {}
         if self.source == 'family':
             for year in yearsToInclude:
                 if (os.path.exists(os.path.join(filePath, fileNameBase + str(year) + ".csv"))):
-                    yearData = pd.read_csv(os.path.join(filePath, fileNameBase + str(year) + ".csv"), low_memory=False)
+                    yearData = readCsv(os.path.join(filePath, fileNameBase + str(year)))
                     self.dataDict[year] = yearData
                 else:
                     print("Skipping year " + str(year) + ". No data file found." )
         elif self.source == 'individual':
             if (os.path.exists(os.path.join(filePath, fileNameBase + ".csv"))):
-                dta = pd.read_csv(os.path.join(filePath, fileNameBase + ".csv"), low_memory=False)
+                dta = readCsv(os.path.join(filePath, fileNameBase))
                 self.dataDict[0] = dta
             else:
                 raise Exception("Unable to find individual data file." )
@@ -319,17 +502,17 @@ def extractAndSave(params):
     # Get the family level data - runs for each year of data we need
     # params.yearsToInclude = [1984]
 
-    famExtractor = Extractor(params.PSID_DATA_DIR, params.yearsToInclude, params.familyWealthVarsWeNeed2019, None, source='family')
+    famExtractor = Extractor(params.PSID_DATA_DIR, params.yearsToInclude, params.familyWealthVarsWeNeed2019, None, source='family', chunkSize = params.rawDataChunkSize, numWorkers = params.numWorkers)
     famExtractor.getDataForSelectedVars(forceReload = False, saveIt = True, filePath = os.path.join(params.BASE_OUTPUT_DIR, params.EXTRACTED_OUTPUT_SUBDIR), fileNameBase= "extractedPSID_")
-    famExtractor.readExtractedData(params.yearsToInclude, filePath = os.path.join(params.BASE_OUTPUT_DIR, params.EXTRACTED_OUTPUT_SUBDIR), fileNameBase= "extractedPSID_")
+    famExtractor.readExtractedData(params.yearsToInclude, filePath = os.path.join(params.BASE_OUTPUT_DIR, params.EXTRACTED_OUTPUT_SUBDIR), fileNameBase= "extractedPSID_", compactTypes = True)
     famExtractor.mapVariableNames()
     famExtractor.fillMissingVarsWithNones()
     famExtractor.saveExtractedFamilyData(filePath = os.path.join(params.BASE_OUTPUT_DIR, params.MAPPED_OUTPUT_SUBDIR), fileNameBase= "extractedPSID_Mapped_")
 
     # Do it again for individual level data
-    indExtractor = Extractor(params.PSID_DATA_DIR, params.yearsToInclude, params.individualVarsWeNeed2019, params.individualVars_LoadRegardlessOfYear, source='individual')
+    indExtractor = Extractor(params.PSID_DATA_DIR, params.yearsToInclude, params.individualVarsWeNeed2019, params.individualVars_LoadRegardlessOfYear, source='individual', chunkSize = params.rawDataChunkSize)
     indExtractor.getDataForSelectedVars(forceReload = False, saveIt = True, filePath = os.path.join(params.BASE_OUTPUT_DIR, params.EXTRACTED_OUTPUT_SUBDIR), fileNameBase= "extractedPSID_Individual")
-    indExtractor.readExtractedData(params.yearsToInclude, filePath = os.path.join(params.BASE_OUTPUT_DIR, params.EXTRACTED_OUTPUT_SUBDIR), fileNameBase="extractedPSID_Individual")
+    indExtractor.readExtractedData(params.yearsToInclude, filePath = os.path.join(params.BASE_OUTPUT_DIR, params.EXTRACTED_OUTPUT_SUBDIR), fileNameBase="extractedPSID_Individual", compactTypes = True)
     indExtractor.mapVariableNames()
     indExtractor.fillMissingVarsWithNones()
     indExtractor.saveExtractedIndividualData(filePath = os.path.join(params.BASE_OUTPUT_DIR, params.MAPPED_OUTPUT_SUBDIR), fileNameBase=  "extractedPSID_Individual_Mapped")
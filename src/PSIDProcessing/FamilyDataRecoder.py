@@ -1,8 +1,12 @@
 import pandas as pd
 import numpy as np
 import os
+import concurrent.futures
 
 from PSIDProcessing import Extractor, IndividualDataRecoder
+import PSIDProcessing.RecodeEngine as RecodeEngine
+import PSIDProcessing.FamilyRecodeSpec as FamilyRecodeSpec
+import PSIDProcessing.DtypePolicy as DtypePolicy
 from Survey.SurveyFunctions import *
 
 import DataQuality.CrossSectionalTester as DataQualityTester
@@ -11,6 +15,9 @@ import matplotlib.pyplot as plt
 
 DEBUG_EDA = False
 
+# The straightforward code -> value recodes, compiled once per process. See FamilyRecodeSpec
+familyRecodeSpec = RecodeEngine.RecodeSpec(FamilyRecodeSpec.FAMILY_RECODE_RULES)
+
 
 ''' --------------------
  Recodes the PSID
@@ -22,6 +29,7 @@ DEBUG_EDA = False
  
  This happens in three ways:
  1) Recode common values like NA and DK that have changed coding over time (early on, many of these were 9999s; later they become 999999s for example 
+    These simple recodes are listed, by year, in FamilyRecodeSpec, and applied in a step at a time (applyRecodeStep)
  2) Combine and standardize vars that have changed somewhat over time: like the handling of Race or the fields for Other Debts
  3) Do heavy processing to extract meaningful data from a range of var and combine - like calculating Retirement Contribution Rates
  
@@ -35,16 +43,20 @@ DEBUG_EDA = False
 
 class FamilyDataRecoder:
 
-    def __init__(self, dta, year, varStatus, psidDataDir):
+    def __init__(self, dta, year, varStatus, psidDataDir, stateCodes = None):
         '''
         Instanciate the recorder
         :param dta: dataset with PSID family data
         :param year: year of the PSID data
         :param varStatus:
+        :param stateCodes: the PSID to SOI/FIPS state code table, if already loaded. Otherwise it's read from psidDataDir
+        :type stateCodes: DataFrame
         '''
         if dta is not None:
             self.setData(dta, year)
-        self.stateCodes = pd.read_csv(os.path.join(psidDataDir, "StateCodes_PSID_To_SOI.csv"))
+        if stateCodes is None:
+            stateCodes = pd.read_csv(os.path.join(psidDataDir, "StateCodes_PSID_To_SOI.csv"))
+        self.stateCodes = stateCodes
 
         self.dta = None
         self.year = None
@@ -58,6 +70,10 @@ class FamilyDataRecoder:
         self.varStatus = varStatus
         self.fields = list(dta.columns)
 
+    def applyRecodeStep(self, step):
+        ''' Apply this step's rules for our year from the recode spec (see FamilyRecodeSpec) '''
+        familyRecodeSpec.apply(self.dta, step, self.year)
+
     def addState(self):
         ''' Use our external mapping of state codes to convert from PSID's code to more a more standard FIPS code '''
         self.dta = pd.merge(self.dta, self.stateCodes, left_on = "stateH", right_on = "PSID", how="left")
@@ -83,9 +99,9 @@ class FamilyDataRecoder:
         :return:
         :rtype:
         '''
-        self.dta[amountNoUnitField].replace({0:np.NaN, 9999998:np.NaN, 9999999: np.NaN}, inplace=True)
-        self.dta[timeUnitField].replace({0:None, 3: 'Week', 4: 'TwoWeeks', 5: 'Month', 6: 'Year', 7:None, 8: None, 9:None}, inplace=True)
-        self.dta[percentField].replace({0: np.NaN, 98.0: np.NaN, 99.0: np.NaN, 998.0: np.NaN, 999.0: np.NaN}, inplace=True)
+        self.dta[amountNoUnitField] = FamilyRecodeSpec.RETIREMENT_CONTRIB_AMOUNT.apply(self.dta[amountNoUnitField])
+        self.dta[timeUnitField] = FamilyRecodeSpec.RETIREMENT_CONTRIB_PERIOD.apply(self.dta[timeUnitField])
+        self.dta[percentField] = FamilyRecodeSpec.RETIREMENT_CONTRIB_PERCENT.apply(self.dta[percentField])
                 
         # The most common is the amount - start with that
         self.dta[newAmountField] = self.dta[annualIncomeField] * self.dta[percentField] / 100.0
@@ -122,8 +138,8 @@ class FamilyDataRecoder:
         '''
         self.recodeRetirementContrib(annualIncomeField, amountNoUnitField, timeUnitField, percentField, newAmountField)
         
-        self.dta[contribAsMatchPercentField].replace({0: np.NaN, 98.0: np.NaN, 99.0: np.NaN, 998.0: np.NaN, 999.0: np.NaN}, inplace=True)
-        self.dta[employeeContribPercentField].replace({0: np.NaN, 98.0: np.NaN, 99.0: np.NaN, 998.0: np.NaN, 999.0: np.NaN}, inplace=True)
+        self.dta[contribAsMatchPercentField] = FamilyRecodeSpec.RETIREMENT_CONTRIB_PERCENT.apply(self.dta[contribAsMatchPercentField])
+        self.dta[employeeContribPercentField] = FamilyRecodeSpec.RETIREMENT_CONTRIB_PERCENT.apply(self.dta[employeeContribPercentField])
         
         mask = ((self.dta[newAmountField].isna()) & (~self.dta[contribAsMatchPercentField].isna()))
         self.dta.loc[mask, newAmountField] = self.dta[employeeContribPercentField][mask] * self.dta[annualIncomeField][mask] * self.dta[contribAsMatchPercentField][mask] / 100.0 
@@ -136,13 +152,12 @@ class FamilyDataRecoder:
         :rtype: None
         '''
 
+        # Retirement plan participation, eligibility, type etc, for Respondent & Spouse
+        self.applyRecodeStep('retirementPlans')
+
         # Retirement plan contribution rates
-        self.dta.RetPlan_IsParticipatingR.replace({1:True, 5:False, 8: None, 9: None, 0: None}, inplace=True) 
-        self.dta.RetPlan_IsEligibleR.replace({1:True, 5:False, 8: None, 9: None, 0: None}, inplace=True) 
         self.dta.loc[(~(self.dta.RetPlan_IsParticipatingR.isna())) & self.dta.RetPlan_IsParticipatingR, 'RetPlan_IsEligibleR'] = True # The original field is only asked of those who ARENT participating. To get eligibility generally, add those who are participating
         # self.dta.RetPlan_IsEmployeeContributingR.value_counts(dropna=False)
-        self.dta.RetPlan_IsEmployeeContributingR.replace({1:True, 5:False, 8: None, 9: None, 0: None}, inplace=True) 
-        self.dta.RetPlan_TypeR.replace({1:'DB', 5:'DC', 7: 'Both', 8: None, 9: None, 0: None}, inplace=True) 
     
         # if (self.year == 1999):
         #    print("Stop here")
@@ -157,7 +172,6 @@ class FamilyDataRecoder:
                                          percentField = 'RetPlan_VolEmployeeContrib_PercentR', newAmountField = 'RetPlan_VolEmployeeContrib_CalcedAnnualAmountR')
         
         # Employer Contrib 
-        self.dta.RetPlan_EmployerContrib_YesNoR.replace({1:True, 5:False, 8: None, 9: None, 0:False}, inplace=True) 
         self.recodeEmployerRetirementContrib(annualIncomeField = 'wageIncomeR', 
                                          amountNoUnitField = 'RetPlan_EmployerContrib_AmountR', timeUnitField = 'RetPlan_EmployerContrib_PeriodR', 
                                          percentField = 'RetPlan_EmployerContrib_PercentContribedR', 
@@ -167,8 +181,6 @@ class FamilyDataRecoder:
                                          newAmountField = 'RetPlan_EmployerContrib_CalcedAnnualAmountR')
     
         # Current Employer: Plan 2
-        self.dta.RetPlan2_HasR.replace({1:True, 5:False, 8: None, 9: None, 0:False}, inplace=True) 
-        self.dta.RetPlan2_EmployerContrib_YesNoR.replace({1:True, 5:False, 8: None, 9: None, 0:False}, inplace=True) 
         self.recodeEmployerRetirementContrib(annualIncomeField = 'wageIncomeR', 
                                          amountNoUnitField = 'RetPlan2_EmployerContrib_AmountR', timeUnitField = 'RetPlan2_EmployerContrib_PeriodR', 
                                          percentField = 'RetPlan2_EmployerContrib_PercentContribedR', 
@@ -180,11 +192,7 @@ class FamilyDataRecoder:
         # Spouse Retirement Plans 
         ##############
         # Spouse: Plan 1
-        self.dta.RetPlan_IsParticipatingS.replace({1:True, 5:False, 8: None, 9: None, 0: None}, inplace=True) 
-        self.dta.RetPlan_IsEligibleS.replace({1:True, 5:False, 8: None, 9: None, 0: None}, inplace=True) 
         self.dta.loc[(~(self.dta.RetPlan_IsParticipatingS.isna())) & self.dta.RetPlan_IsParticipatingS, 'RetPlan_IsEligibleS'] = True # The original field is only asked of those who ARENT participating. To get eligibility generally, add those who are participating
-        self.dta.RetPlan_IsEmployeeContributingS.replace({1:True, 5:False, 8: None, 9: None, 0: None}, inplace=True) 
-        self.dta.RetPlan_TypeS.replace({1:'DB', 5:'DC', 7: 'Both', 8: None, 9: None, 0: None}, inplace=True) 
     
         # Required Employee Contribs
         self.recodeRetirementContrib(annualIncomeField = 'wageIncomeS', 
@@ -205,8 +213,6 @@ class FamilyDataRecoder:
                                          newAmountField = 'RetPlan_EmployerContrib_CalcedAnnualAmountS')
        
         # Plan 2
-        self.dta.RetPlan2_HasS.replace({1:True, 5:False, 8: None, 9: None, 0:False}, inplace=True) 
-        self.dta.RetPlan2_EmployerContrib_YesNoS.replace({1:True, 5:False, 8: None, 9: None, 0:False}, inplace=True) 
         self.recodeEmployerRetirementContrib(annualIncomeField = 'wageIncomeS', 
                                          amountNoUnitField = 'RetPlan2_EmployerContrib_AmountS', timeUnitField = 'RetPlan2_EmployerContrib_PeriodS', 
                                          percentField = 'RetPlan2_EmployerContrib_PercentContribedS', 
@@ -261,29 +267,7 @@ class FamilyDataRecoder:
         :rtype:  None
         '''
 
-        if self.year < 1994:
-            self.dta.IsWorkingR = self.dta.IsWorkingR_Pre1994.replace({1:'Working', 2: 'OnLeave', 3: 'Unemployed_Looking', 4: 'Retired', 5: 'Unemployed_Disabled', 6: 'Unemployed_Homemaker', 7: 'Unemployed_Student', 8: None}, inplace=False)
-        else:
-            self.dta.IsWorkingR.replace({1:'Working', 2: 'OnLeave', 3: 'Unemployed_Looking', 4: 'Retired', 5: 'Unemployed_Disabled', 6: 'Unemployed_Homemaker', 7: 'Unemployed_Student', 8: 'Prison', 99: None}, inplace=True)
-
-        self.dta.IsWorking_SecondMentionR.replace({1:'Working', 2: 'OnLeave', 3: 'Unemployed_Looking', 4: 'Retired', 5: 'Unemployed_Disabled', 6: 'Unemployed_Homemaker', 7: 'Unemployed_Student', 8: 'Prison', 99: None}, inplace=True)
-        self.dta.IsWorking_Test2R.replace({1:'Working', 2: 'NeverWorked', 3: 'NotEmployed'}, inplace=True)
-
-        self.dta.IsWorkingS.replace({1:'Working', 2: 'OnLeave', 3: 'Unemployed_Looking', 4: 'Retired', 5: 'Unemployed_Disabled', 6: 'Unemployed_Homemaker', 7: 'Unemployed_Student', 8: 'Prison', 99: None}, inplace=True)
-        self.dta.IsWorking_SecondMentionS.replace({1:'Working', 2: 'OnLeave', 3: 'Unemployed_Looking', 4: 'Retired', 5: 'Unemployed_Disabled', 6: 'Unemployed_Homemaker', 7: 'Unemployed_Student', 8: 'Prison', 99: None}, inplace=True)
-        self.dta.IsWorking_Test2S.replace({1:'Working', 2: 'NeverWorked', 3: 'NotEmployed'}, inplace=True)
-
-        self.dta.dateStarted_Job1_Month_R.replace({21: 1, 22: 4, 23: 7, 24: 10, 0:np.NaN, 98: np.NaN, 99: np.NaN}, inplace=True) # "ER66179": "dateStarted_Job1_Month_R", #  "BC6 BEGINNING MONTH--JOB 1" NUM(2.0)
-        self.dta.dateStarted_Job1_Year_R.replace({0:np.NaN, 9996: np.NaN, 9997: np.NaN, 9998: np.NaN, 9999: np.NaN}, inplace=True) # "ER66180": "dateStarted_Job1_Year_R", # "BC6 BEGINNING YEAR--JOB 1" NUM(4.0)
-        self.dta.dateStarted_Job1_Month_S.replace({21: 1, 22: 4, 23: 7, 24: 10, 0:np.NaN, 98: np.NaN, 99: np.NaN}, inplace=True)
-        self.dta.dateStarted_Job1_Year_S.replace({0:np.NaN, 9996: np.NaN, 9997: np.NaN, 9998: np.NaN, 9999: np.NaN}, inplace=True)
-        self.dta.dateEnded_Job1_Month_R.replace({21: 1, 22: 4, 23: 7, 24: 10, 0:np.NaN, 98: np.NaN, 99: np.NaN}, inplace=True) # 'ER66181': "dateEnded_Job1_Month_R", # "BC6 ENDING MONTH--JOB 1
-        self.dta.dateEnded_Job1_Year_R.replace({0:np.NaN, 9996: np.NaN, 9997: np.NaN, 9998: np.NaN, 9999: np.NaN}, inplace=True) # 'ER66182': "dateEnded_Job1_Year_R", # "BC6 ENDING YEAR--JOB 1"
-        self.dta.dateEnded_Job1_Month_S.replace({21: 1, 22: 4, 23: 7, 24: 10, 0:np.NaN, 98: np.NaN, 99: np.NaN}, inplace=True) # 'ER66456': "dateEnded_Job1_Month_S", # "DE6 ENDING MONTH--JOB 1"
-        self.dta.dateEnded_Job1_Year_S.replace({0:np.NaN, 9996: np.NaN, 9997: np.NaN, 9998: np.NaN, 9999: np.NaN}, inplace=True) # 'ER66457': "dateEnded_Job1_Year_S", # "DE6 ENDING YEAR--JOB 1"
-
-        self.dta.reasonLeftLastJobR.replace({1: 'CompanyClosed', 2: 'Strike', 3: 'LaidOff', 4: 'Quit', 7:'Transfer', 8:'Completed', 0:None, 9: None}, inplace=True) #     "ER66242": 'reasonLeftLastJobR', # "BC51 WHY LAST JOB END (RP-U)"  # from 1988 on is CHANGE EMPLOYER only; before included promotions
-        self.dta.reasonLeftLastJobS.replace({1: 'CompanyClosed', 2: 'Strike', 3: 'LaidOff', 4: 'Quit', 7:'Transfer', 8:'Completed', 0:None, 9: None}, inplace=True) #     "ER66242": 'reasonLeftLastJobR', # "ER66517": 'reasonLeftLastJobS', # "DE51 WHY LAST JOB END (SP-U)" NUM(1.0)  # from 1988 on is CHANGE EMPLOYER only; before included promotions
+        self.applyRecodeStep('jobStatus')
 
 
     def recodeIncome(self):
@@ -292,34 +276,10 @@ class FamilyDataRecoder:
         :return: None
         :rtype: None
         '''
-        self.dta.YearRetiredR.replace({9998:np.NaN, 9999: np.NaN, 0: np.NaN}, inplace=True)
-        self.dta.AgePlanToRetireR.replace({996:np.NaN, 997:np.NaN, 998: np.NaN, 999: np.NaN, 0:np.NaN}, inplace=True)
-
-        # Except for 1994, No processing needed:  These are actual values, topcoded, so dont drop big numbers
-        if self.year == 1994: # Yes, all of these were recoded for 1994
-            self.dta.totalIncomeHH.replace({0:np.NaN, 9999999: np.NaN}, inplace=True) #'ER71426': 'totalIncomeHH', # "TOTAL FAMILY INCOME-2016"  #  40 obs
-            self.dta.taxableIncomeRandS.replace({0:np.NaN, 9999999: np.NaN}, inplace=True) #'ER71330': 'taxableIncomeRandS',# Reference Person and Spouse/Partner Taxable Income-2016  #  40 obs
-            self.dta.taxableIncomeO.replace({0:np.NaN, 9999999: np.NaN}, inplace=True) #'ER71398': 'taxableIncomeO', # Taxable Income of Other FU Members-2016   #  40 obs
-            self.dta.transferIncomeRandS.replace({0:np.NaN, 9999999: np.NaN}, inplace=True)
-            self.dta.transferIncomeO.replace({0:np.NaN, 999999: np.NaN}, inplace=True)
-        else: 
-            self.dta.totalIncomeHH.replace({0:np.NaN}, inplace=True) #'ER71426': 'totalIncomeHH', # "TOTAL FAMILY INCOME-2016"  #  40 obs
-            self.dta.taxableIncomeRandS.replace({0:np.NaN}, inplace=True) #'ER71330': 'taxableIncomeRandS',# Reference Person and Spouse/Partner Taxable Income-2016  #  40 obs
-            self.dta.taxableIncomeO.replace({0:np.NaN}, inplace=True) #'ER71398': 'taxableIncomeO', # Taxable Income of Other FU Members-2016   #  40 obs
-            self.dta.transferIncomeRandS.replace({0:np.NaN}, inplace=True)
-            self.dta.transferIncomeO.replace({0:np.NaN}, inplace=True)
-            
-        # Wage income - needed for interpreting retirement contribution rates, below
-        self.dta.hasWageIncomeR.replace({1:True, 5: False, 8: None, 9: None, 0:None}, inplace=True)
-        self.dta.wageIncomeR.replace({0:np.NaN, 9999998:np.NaN, 9999999: np.NaN, -9999999: np.NaN}, inplace=True)
-
-        if (self.year >= 1994):
-            self.dta['wageIncomeS'] = self.dta.wageIncomeS_Post1993 
-            self.dta.wageIncomeS.replace({0:np.NaN, 9999998:np.NaN, 9999999: np.NaN, -9999999: np.NaN}, inplace=True)
-            self.dta.hasWageIncomeS.replace({1:True, 5: False, 8: None, 9: None, 0:None}, inplace=True)
-        else:
-            self.dta['wageIncomeS'] = self.dta.laborIncomeS_1993AndPre  # No 'wage only' income from pre 1994, only total labor 
-            self.dta.wageIncomeS.replace({0:np.NaN, 9999998:np.NaN, 9999999: np.NaN, -9999999: np.NaN}, inplace=True)
+        # Retirement, income totals and wages
+        self.applyRecodeStep('income')
+
+        if (self.year < 1994):
             self.dta['hasWageIncomeS'] = (~(self.dta.wageIncomeS.isna())) & (self.dta.wageIncomeS > 0)
 
             self.dta['hasWageIncomeR'] = (~(self.dta.wageIncomeR.isna())) & (self.dta.wageIncomeR > 0)  
@@ -365,21 +325,8 @@ class FamilyDataRecoder:
             self.dta['InterestIncomeS'] = 0
 
 
-        varsWith6DigitMaxValueCoding = ['RentIncomeR', 'RentIncomeS', 
-                                   'UnemploymentIncomeR', 'UnemploymentIncomeS', 
-                                   'VAPensionIncomeR', 'OtherRetirementIncomeR',
-                                   'VAPensionIncomeS',  'AnnuityIncomeS', 'IRAIncomeR', 'IRAIncomeS','OtherRetirementIncomeS'
-                                   ]
-        for var in varsWith6DigitMaxValueCoding:
-            self.dta[var].replace({0:np.NaN, 999999: np.NaN}, inplace=True)
-        
-        if self.year == 1991:  # In other years, 999999 is an actual values
-            self.dta.FederalIncomeTaxesRS.replace({0:np.NaN, 999999: np.NaN}, inplace=True)
-            self.dta.FederalIncomeTaxesO.replace({0:np.NaN, 999999: np.NaN}, inplace=True)
-
-
-        # only used in certain years, but doesnt seem to harm other years
-        self.dta.PovertyThreshold.replace({99999:np.NaN}, inplace=True)
+        # Amounts where 999999 is DK/NA, rather than a top-coded value
+        self.applyRecodeStep('incomeTopCoded')
         
         # summary stats on income
         # self.dta.summaryWageIncomeR.replace({0:np.NaN}, inplace=True)
@@ -409,57 +356,19 @@ class FamilyDataRecoder:
             net of debt value (ER71431, ER71441, ER71459, ER71463, ER71467, ER71471, ER71475, ER71479).
         '''
     
-        self.dta.hasBrokerageStocks.replace({1:True, 0: False}, inplace=True) # 'ER71443': 'hasStocks', #  "IMP WTR STOCKS (W15) 2017"  # Does anyone in HH have stocks beyond Ret plan
-        # self.dta.hasBrokerageStocks.fillna(False, inplace=True)
-        # Don't clear out the Value Field -- rather, a value indicates the person DOES have it; we use this value later
-        # self.dta.loc[(~self.dta.hasBrokerageStocks), 'valueOfBrokerageStocks_Net'] = np.NaN# 'ER71445': 'valueOfStocks', #  "IMP VALUE STOCKS (W16) 2017" # How much
-        # self.dta.valueOfBrokerageStocks.value_counts(dropna=False)
-
-        self.dta.hasPrivateRetirePlan.replace({1:True, 0: False}, inplace=True) # 'ER71453': 'hasPrivateRetirePlan', #  "IMP WTR ANNUITY/IRA (W21) 2017" # Wherther have private annuities or IRAs
-        # self.dta.hasPrivateRetirePlan.fillna(False, inplace=True)
-        # Don't clear out the Value Field -- rather, a value indicates the person DOES have it; we use this value later
-        # self.dta.loc[(~self.dta.hasPrivateRetirePlan), 'valueOfPrivateRetirePlan_Gross'] = np.NaN # 'ER71455': 'valueOfPrivateRetirePlan_Gross', #  "IMP VALUE ANNUITY/IRA (W22) 2017" # How much
-
-        self.dta['hasEmployerRetirePlanR'] = self.dta.RetPlan_IsParticipatingR.replace({1:True, 5:False, 8: None, 9: None, 0: None})
-        self.dta.valueOfEmployerRetirePlanR_Gross.replace({0:np.NaN, 999998: np.NaN, 999999: np.NaN, 999999998:np.NaN, 999999999: np.NaN}, inplace=True) # 'ER68010': 'valueOfEmployerRetirePlanR_Gross', #  "P20 AMT IN PENSION ACCT NOW - RP"         # Current Value of Employer Retirement Account
-        self.dta['hasEmployerRetirePlanS'] = self.dta.RetPlan_IsParticipatingS.replace({1:True, 5:False, 8: None, 9: None, 0: None})
-        self.dta.valueOfEmployerRetirePlanS_Gross.replace({0:np.NaN, 999998: np.NaN, 999999: np.NaN, 999999998:np.NaN, 999999999: np.NaN}, inplace=True) # 'ER68227': 'valueOfEmployerRetirePlanS_Gross', #  "P20 AMT IN PENSION ACCT NOW - SP"
-        self.dta['valueOfEmployerRetirePlan_Gross'] = self.dta.valueOfEmployerRetirePlanR_Gross.add(self.dta.valueOfEmployerRetirePlanS_Gross, fill_value=0)
-        self.dta['hasEmployerRetirePlan'] = (self.dta.hasEmployerRetirePlanR==True) | (self.dta.hasEmployerRetirePlanS == True)
-        self.dta.hasEmployerRetirePlan = self.dta.hasEmployerRetirePlan.astype('bool')
-
-        # self.dta.valueOfEmployerRetirePlanS_Gross.describe()  value_counts(dropna=False)
-
-        # 'ER66030': 'hasHouse', # "A19 OWN/RENT OR WHAT"
-        self.dta.hasHouse.replace({1:True, 5:False, 8: None, 9:None}, inplace=True) # For our purposes, someone who 'neither owns nor rents' isn't included in a home-based savings calc
-        self.dta.hasHouse = self.dta.hasHouse.astype('bool')
-        self.dta.valueOfHouse_Gross.replace({0:np.NaN, 9999998:np.NaN, 9999999: np.NaN}, inplace=True) # 'ER66031': 'valueOfHouse_Gross' # ' ER66031 "A20 HOUSE VALUE" NUM(7.0)
-
         # To make the data parallel in structure, we create a Vehicle var when there isn't one
         self.dta['hasVehicle'] = self.dta.valueOfVehicle_Net.ne(0)
-        self.dta.valueOfVehicle_Net.replace({0:np.NaN}, inplace=True)  #     'ER71447': 'valueOfVehicle_Net',  # IMP VALUE VEHICLES (W6) 2017
 
-        self.dta.hasOtherAssets.replace({1:True, 0:False}, inplace=True) # For our purposes, someone who 'neither owns nor rents' isn't included in a home-based savings calc
-        self.dta.valueOfOtherAssets_Net.replace({0:np.NaN}, inplace=True) #     'ER71451': 'valueOfOtherAssets_Net', # IMP VALUE OTH ASSETS (W34) 2017
+        # Don't clear out the Value Fields for Stocks and Private Retirement Plans -- rather, a value indicates the person DOES have it; we use this value later
+        self.applyRecodeStep('wealth')
 
-        if self.year >= 2019:
-            self.dta['hasCheckingAndSavings'] = self.dta.hasChecking_2019on_NoCDsOrGvtBonds.replace({0:False, 1:True})
-            self.dta.valueOfCheckingAndSavings_Net_2019on_NoCDsOrGvtBonds.replace({0:np.NaN}, inplace=True) # 'ER71435':  "IMP VAL CHECKING/SAVING (W28) 2017"
-            self.dta.valueOfCDsOrGvtBonds_2019on.replace({0:np.NaN}, inplace=True) # 'ER71435':  "IMP VAL CHECKING/SAVING (W28) 2017"
+        self.dta['valueOfEmployerRetirePlan_Gross'] = self.dta.valueOfEmployerRetirePlanR_Gross.add(self.dta.valueOfEmployerRetirePlanS_Gross, fill_value=0)
+        self.dta['hasEmployerRetirePlan'] = (self.dta.hasEmployerRetirePlanR==True) | (self.dta.hasEmployerRetirePlanS == True)
+        self.dta.hasEmployerRetirePlan = self.dta.hasEmployerRetirePlan.astype('bool')
 
+        if self.year >= 2019:
             self.dta['valueOfCheckingAndSavings_Net'] = self.dta.valueOfCheckingAndSavings_Net_2019on_NoCDsOrGvtBonds.add(self.dta.valueOfCDsOrGvtBonds_2019on.fillna(0))
             # self.dta.loc[ self.dta.valueOfCheckingAndSavings_Net_2019on_NoCDsOrGvtBonds.isna() & self.dta.valueOfCDsOrGvtBonds_2019on.isna(), 'valueOfCheckingAndSavings_Net'] = np.NaN
-        else:
-            self.dta['hasCheckingAndSavings'] = self.dta.hasCheckingAndSavings_to2017.replace({0:False, 1:True})
-            self.dta['valueOfCheckingAndSavings_Net'] = self.dta.valueOfCheckingAndSavings_Net_to2017.replace({0:np.NaN})
-
-
-        self.dta.valueOfDebt_CreditCards_2011on.replace({0:np.NaN,  9999998:np.NaN, 9999999: np.NaN}, inplace=True) # "W39A AMOUNT OF CREDIT/STORE CARD DEBT"
-        self.dta.valueOfDebt_StudentLoans_2011on.replace({0:np.NaN, 9999998:np.NaN, 9999999: np.NaN}, inplace=True)  # "W39B1 AMOUNT OF STUDENT LOANS"
-        self.dta.valueOfDebt_MedicalBills_2011on.replace({0:np.NaN, 9999998:np.NaN, 9999999: np.NaN}, inplace=True) # "W39B2 AMOUNT OF MEDICAL BILLS"
-        self.dta.valueOfDebt_LegalBills_2011on.replace({0:np.NaN, 9999998:np.NaN, 9999999: np.NaN}, inplace=True) # "W39B3 AMOUNT OF LEGAL BILLS"
-        self.dta.valueOfDebt_FamilyLoan_2011on.replace({0:np.NaN, 9999998:np.NaN, 9999999: np.NaN}, inplace=True) # "W39B4 AMOUNT OF LOANS FROM RELATIVES"
-        self.dta.valueOfDebt_Other_2013on.replace({0:np.NaN, 9999998:np.NaN, 9999999: np.NaN}, inplace=True) 
 
         if self.year >= 2013:
             self.dta['valueOfAllOtherDebts_Net'] = self.dta.valueOfDebt_CreditCards_2011on.add(
@@ -485,42 +394,16 @@ class FamilyDataRecoder:
                 (self.dta.hasStudentLoans_2011on == 1) | (self.dta.hasMedicalBills_2011on == 1) |
                 (self.dta.hasLegalBills_2011on == 1) | (self.dta.hasFamilyLoan_2011on == 1))
 
-        else:
-            self.dta['valueOfAllOtherDebts_Net'] = self.dta.valueOfAllOtherDebts_pre2011.replace({0:np.NaN}, inplace= False)
-            self.dta['hasAllOtherDebts'] = self.dta.hasOtherDebt_pre2011.replace({1:True, 0:False}, inplace=False)
-
         # Handle the change from NET to GROSS+DEBT tracking on Other Real Estate and Business
-        self.dta.hasOtherRealEstate.replace({1:True, 0:False}, inplace=True)
-        self.dta.hasBusiness.replace({1:True, 0:False}, inplace=True)
-
         if self.year >=2013:
-            # 'ER71439': 'valueOfOtherRealEstate_Gross_2013on', # "IMP VAL OTH REAL ESTATE ASSET (W2A) 2017"
-            # 'ER71441': 'valueOfOtherRealEstate_Debt_2013on', # 'ER71441 "IMP VAL OTH REAL ESTATE DEBT (W2B) 2017"
-            self.dta.valueOfOtherRealEstate_Gross_2013on.replace({0:np.NaN}, inplace= True) 
-            self.dta.valueOfOtherRealEstate_Debt_2013on.replace({0:np.NaN}, inplace= True) 
             self.dta['valueOfOtherRealEstate_Net'] = self.dta.valueOfOtherRealEstate_Gross_2013on.sub(self.dta.valueOfOtherRealEstate_Debt_2013on, fill_value=0) 
-
-            # 'ER71429': 'valueOfBusiness_Gross_2013on', # ER71429 "IMP VALUE FARM/BUS ASSET (W11A) 2017" NUM(9.0)
-            # 'ER71431': 'valueOfBusiness_Debt_2013on', # ER71431 "IMP VALUE FARM/BUS DEBT (W11B) 2017"
-            self.dta.valueOfBusiness_Gross_2013on.replace({0:np.NaN}, inplace= True) 
-            self.dta.valueOfBusiness_Debt_2013on.replace({0:np.NaN}, inplace= True) 
             self.dta['valueOfBusiness_Net'] = self.dta.valueOfBusiness_Gross_2013on.sub(self.dta.valueOfBusiness_Debt_2013on, fill_value=0) 
 
-        else:
-            # WARNING -- these fields are mapped in the Crosswalk to Wealth File variables (S209, for example) but the data itself conforms
-            # To the rules in the Family Data file.   -  Ie different codes for "Max value".
-            # 'ER52354': 'valueOfOtherRealEstate_Net_pre2013',  # S309 "IMP VAL OTH REAL ESTATE (G116) 94" NUM(9.0)
-            self.dta['valueOfOtherRealEstate_Net'] = self.dta.valueOfOtherRealEstate_Net_pre2013.replace({0:np.NaN}, inplace= False) 
-            # 'ER52346': 'valueOfBusiness_Net_pre2013',  # S303 "IMP VALUE FARM/BUS (G125) 94" NUM(9.0)
-            self.dta['valueOfBusiness_Net'] = self.dta.valueOfBusiness_Net_pre2013.replace({0:np.NaN}, inplace= False) 
-
-        self.dta['valueOfHouse_Debt'] = self.dta.MortgagePrincipal_1.replace({9999998:np.NaN, 9999999: np.NaN}, inplace=False).add(self.dta.MortgagePrincipal_2.replace({9999998:np.NaN, 9999999: np.NaN}, inplace=False), fill_value=0)
+        mortgageDebtCodes = {9999998:np.NaN, 9999999: np.NaN}
+        self.dta['valueOfHouse_Debt'] = RecodeEngine.recode(self.dta.MortgagePrincipal_1, mortgageDebtCodes).add(RecodeEngine.recode(self.dta.MortgagePrincipal_2, mortgageDebtCodes), fill_value=0)
         # 'ER66051': 'MortgagePrinciple_1', # "A24 REM PRINCIPAL MOR 1"
         # 'ER66072': 'MortgagePrinciple_2', # "A24 REM PRINCIPAL MOR 2"
 
-        # The PSID calculates its own 'Active Savings' amount -- but only for one year.
-        self.dta.ActiveSavings_PSID1989.replace({99999999: np.NaN}, inplace=True) # V17610 "ACTIVE SAVING 1984-89"
-
         ''' various versions of NetWorth '''        
         if self.year < 1999:
             self.dta['NetWorthWithHomeRecalc'] = self.dta.valueOfHouse_Net. \
@@ -553,62 +436,8 @@ class FamilyDataRecoder:
         :rtype:
         '''
     
-        # Handle LARGE Gifts and Inheritance
-        if (self.year < 1989):
-            skipFlowRecoding = True
-            self.dta['LargeGift_1_AmountHH'].replace({0:np.NaN, 9999997: np.NaN, 9999998:np.NaN, 9999999: np.NaN}, inplace=True) # ER67967 VALUE 1ST INHERT
-            self.dta['LargeGift_AllBut1_AmountHH_1989AndBefore'].replace({0:np.NaN, 9999997: np.NaN, 9999998:np.NaN, 9999999: np.NaN}, inplace=True) 
-        elif (self.year == 1989):
-            skipFlowRecoding = False
-            self.dta['LargeGift_1_AmountHH'].replace({0:np.NaN}, inplace=True) # ER67967 VALUE 1ST INHERT
-            self.dta['LargeGift_AllBut1_AmountHH_1989AndBefore'].replace({0:np.NaN}, inplace=True) 
-            dontKnowValue = 9999998 # 9,999,998
-            naValue =  9999999 # 9,999,999
-            lossDKValue = np.NaN
-        elif (self.year == 1994):
-            skipFlowRecoding = False
-            dontKnowValue = 9999998 # 9,999,998
-            naValue =  9999999 # 9,999,999
-            lossDKValue = np.NaN
-        else:
-            skipFlowRecoding = False
-            dontKnowValue = 999999998 # 999,999,998
-            naValue =  999999999 # 999,999,999
-            lossDKValue = -99999999
-
-        if (not skipFlowRecoding):
-            # Note for 1984-1994, these are 5 year values (since last Wealth supplement) 
-            # self.dta.PersonMovedOut_SinceLastQYr_WithAssetsYesNo.replace({0:False, 1:True, 5: False, 8: None, 9:None}, inplace=True) # 'ER67941': 'PersonMovedOut_2Yr_WithAssetsYesNo', # "W102 WTR MOVER OUT W/ ASSETS OR DEBITS"
-            self.dta.PersonMovedOut_SinceLastQYr_AssetsMovedOut.replace({0:np.NaN, dontKnowValue:np.NaN, naValue: np.NaN, lossDKValue: np.NaN}, inplace=True) # 'ER67942': 'PersonMovedOut_2Yr_AssetsMovedOut', # "W103 VALUE ASSETS MOVED OUT"
-            self.dta.PersonMovedOut_SinceLastQYr_DebtsMovedOut.replace({0:np.NaN, dontKnowValue:np.NaN, naValue: np.NaN, lossDKValue: np.NaN}, inplace=True) # 'ER67947': 'PersonMovedOut_2Yr_DebtsMovedOut', # "W108 VALUE DEBTS MOVED OUT"
-    
-            # self.dta.PersonMovedIn_SinceLastQYr_WithAssetsYesNo.replace({0:False, 1:True, 5: False, 8: None, 9:None}, inplace=True) # 'ER67952': 'PersonMovedIn_2Yr_WithAssetsYesNo', # "W113 WTR MOVER IN W/ ASSETS OR DEBITS"
-            self.dta.PersonMovedIn_SinceLastQYr_AssetsMovedIn.replace({0:np.NaN, dontKnowValue:np.NaN, naValue: np.NaN, lossDKValue: np.NaN}, inplace=True) # 'ER67953': 'PersonMovedIn_2Yr_AssetsMovedIn', # "W114 VALUE ASSETS MOVED IN"
-            self.dta.PersonMovedIn_SinceLastQYr_DebtsMovedIn.replace({0:np.NaN, dontKnowValue:np.NaN, naValue: np.NaN, lossDKValue: np.NaN}, inplace=True) # 'ER67958': 'PersonMovedIn_2Yr_DebtsMovedIn', # "W119 VALUE DEBTS MOVE IN"
-        
-            # self.dta.PrivateRetirePlan_SinceLastQYr_MovedMoneyInYesNo.replace({0:False, 1:True, 5: False, 8: None, 9:None}, inplace=True) # 'ER67952': 'PersonMovedIn_2Yr_WithAssetsYesNo', # "W113 WTR MOVER IN W/ ASSETS OR DEBITS"
-            # self.dta.PrivateRetirePlan_SinceLastQYr_MovedMoneyInYesNo = self.dta.PrivateRetirePlan_SinceLastQYr_MovedMoneyInYesNo.astype("boolean")
-            # self.dta.PrivateRetirePlan_SinceLastQYr_MovedOutYesNo.replace({0:False, 1:True, 5: False, 8: None, 9:None}, inplace=True) # 'ER67952': 'PersonMovedIn_2Yr_WithAssetsYesNo', # "W113 WTR MOVER IN W/ ASSETS OR DEBITS"
-            # self.dta.PrivateRetirePlan_SinceLastQYr_MovedOutYesNo = self.dta.PrivateRetirePlan_SinceLastQYr_MovedOutYesNo.astype("boolean")
-            self.dta.PrivateRetirePlan_SinceLastQYr_AmountMovedIn.replace({0:np.NaN, dontKnowValue:np.NaN, naValue: np.NaN, lossDKValue: np.NaN}, inplace=True) # 'ER67953': 'PersonMovedIn_2Yr_AssetsMovedIn', # "W114 VALUE ASSETS MOVED IN"
-            self.dta.PrivateRetirePlan_SinceLastQYr_AmountMovedOut.replace({0:np.NaN, dontKnowValue:np.NaN, naValue: np.NaN, lossDKValue: np.NaN}, inplace=True) # 'ER67953': 'PersonMovedIn_2Yr_AssetsMovedIn', # "W114 VALUE ASSETS MOVED IN"
-    
-            # self.dta.OtherRealEstate_SinceLastQYr_BoughtOrSold.replace({0:False, 1:True, 5: False, 8: None, 9:None}, inplace=True) # 'ER67952': 'PersonMovedIn_2Yr_WithAssetsYesNo', # "W113 WTR MOVER IN W/ ASSETS OR DEBITS"
-            self.dta.OtherRealEstate_SinceLastQYr_AmountBought.replace({0:np.NaN, dontKnowValue:np.NaN, naValue: np.NaN, lossDKValue: np.NaN}, inplace=True) # 'ER67953': 'PersonMovedIn_2Yr_AssetsMovedIn', # "W114 VALUE ASSETS MOVED IN"
-            self.dta.OtherRealEstate_SinceLastQYr_AmountSold.replace({0:np.NaN, dontKnowValue:np.NaN, naValue: np.NaN, lossDKValue: np.NaN}, inplace=True) # 'ER67958': 'PersonMovedIn_2Yr_DebtsMovedIn', # "W119 VALUE DEBTS MOVE IN"
-    
-            # self.dta.Business_SinceLastQYr_BoughtOrSold.replace({0:False, 1:True, 5: False, 8: np.NaN, 9:np.NaN}, inplace=True) # 'ER67952': 'PersonMovedIn_2Yr_WithAssetsYesNo', # "W113 WTR MOVER IN W/ ASSETS OR DEBITS"
-            self.dta.Business_SinceLastQYr_AmountBought.replace({0:np.NaN, dontKnowValue:np.NaN, naValue: np.NaN, lossDKValue: np.NaN}, inplace=True) # 'ER67953': 'PersonMovedIn_2Yr_AssetsMovedIn', # "W114 VALUE ASSETS MOVED IN"
-            self.dta.Business_SinceLastQYr_AmountSold.replace({0:np.NaN, dontKnowValue:np.NaN, naValue: np.NaN, lossDKValue: np.NaN}, inplace=True) # 'ER67958': 'PersonMovedIn_2Yr_DebtsMovedIn', # "W119 VALUE DEBTS MOVE IN"
-    
-            # self.dta.BrokerageStock_SinceLastQYr_BoughtOrSold.replace({0:False, 1:True, 5: False, 8: np.NaN, 9:np.NaN}, inplace=True) # 'ER67952': 'PersonMovedIn_2Yr_WithAssetsYesNo', # "W113 WTR MOVER IN W/ ASSETS OR DEBITS"
-            self.dta.BrokerageStocks_SinceLastQYr_AmountBought.replace({0:np.NaN, dontKnowValue:np.NaN, naValue: np.NaN, lossDKValue: np.NaN}, inplace=True) # 'ER67953': 'PersonMovedIn_2Yr_AssetsMovedIn', # "W114 VALUE ASSETS MOVED IN"
-            self.dta.BrokerageStocks_SinceLastQYr_AmountSold.replace({0:np.NaN, dontKnowValue:np.NaN, naValue: np.NaN, lossDKValue: np.NaN}, inplace=True) # 'ER67958': 'PersonMovedIn_2Yr_DebtsMovedIn', # "W119 VALUE DEBTS MOVE IN"
-
-        # A mess -- this var's DK value is 9.9 million for some years, then 999 million, then back down to 9 million
-        self.dta['LargeGift_1_AmountHH'].replace({0:np.NaN, 9999998:np.NaN, 9999999: np.NaN, 999999998: np.NaN, 999999999: np.NaN}, inplace=True) # ER67967 VALUE 1ST INHERT
-        self.dta['LargeGift_2_AmountHH_1994AndAfter'].replace({0:np.NaN, 9999998:np.NaN, 9999999: np.NaN, 999999998: np.NaN, 999999999: np.NaN}, inplace=True) 
-        self.dta['LargeGift_3_AmountHH_1994AndAfter'].replace({0:np.NaN, 9999998:np.NaN, 9999999: np.NaN, 999999998: np.NaN, 999999999: np.NaN}, inplace=True) 
+        # Handle LARGE Gifts and Inheritance, and the amounts moved in & out of each asset class. The DK & NA codes change over time
+        self.applyRecodeStep('assetFlow')
 
         # Q: should these be inflation adjusted for 1/2 the time span, since we don't know when they happened?
         if (self.year <= 1989):
@@ -622,17 +451,12 @@ class FamilyDataRecoder:
             self.dta['largeGift_All_AmountHH'] = np.NaN
 
 
-        ''' Help From Family and Friends; overlaps with Large Gift'''
+        ''' Help From Family and Friends; overlaps with Large Gift. Other years are handled in the recode spec'''
         if ((self.year >= 1994) and (self.year <= 2003)):
             self.createAnnualAmountFieldFromUnitAndBase('helpFromFamilyRP_1993On', 'helpFromFamilyRP', 999998, 999999)
             self.createAnnualAmountFieldFromUnitAndBase('helpFromOthersRP_1993On', 'helpFromOthersRP', 999998, 999999)
             self.createAnnualAmountFieldFromUnitAndBase('helpFromFamilySP_1993On', 'helpFromFamilySP', 999998, 999999)
             self.createAnnualAmountFieldFromUnitAndBase('helpFromOthersSP_1993On', 'helpFromOthersSP', 999998, 999999)
-        else:
-            self.dta['helpFromFamilyRP'] = self.dta.helpFromFamilyRP_1975to1993andAfter2003.replace({0:np.NaN}, inplace= False)
-            self.dta['helpFromOthersRP'] = self.dta.helpFromOthersRP_1993andAfter2003.replace({0:np.NaN}, inplace= False)
-            self.dta['helpFromFamilySP'] = self.dta.helpFromFamilySP_1985to1993andAfter2003.replace({0:np.NaN}, inplace= False)
-            self.dta['helpFromOthersSP'] = self.dta.helpFromOthersSP_1993andAfter2003.replace({0:np.NaN}, inplace= False)
         
         # Calculate Remaining Amount AFTER Large gifts -- as additional form of Transfer
         self.dta['HelpAndGifts_All_AmountHH'] = self.dta.helpFromFamilyRP. \
@@ -652,13 +476,9 @@ class FamilyDataRecoder:
 
         if self.year >= 1993:
             self.dta['FarmIncomeRandS'] = self.dta.FarmIncomeRandS_1993On 
-            if self.year == 1994:
-                self.dta['FarmIncomeRandS'].replace({999999:np.NaN, -999999:np.NaN}, inplace= True)
-            else:
-                None # no recoding needed 'ER71272':
-
         else:
             self.dta['FarmIncomeRandS'] = self.dta.FarmIncomeR_Before1993 # NO coding needed 'V21733
+        self.applyRecodeStep('miscExpenses') # Only 1994 needs recoding
 
         if self.year >= 1993:
             self.dta['BusinessAssetIncomeRandS'] = self.dta.BusinessAssetIncomeR_1993On.add(self.dta.BusinessAssetIncomeS_1993On, fill_value= 0)   # No coding needed 'ER71275':      'ER71303': 
@@ -667,12 +487,8 @@ class FamilyDataRecoder:
 
 
     def recodeMovingAndRenting(self):
-        self.dta.MovedR.replace({1:True, 2: False, 5:False, 8: None, 9:None}, inplace=True) # For our purposes, someone who 'neither owns nor rents' isn't included in a home-based savings calc
-        self.dta.MovedR = self.dta.MovedR.astype('bool')
-
-        # 'ER66030': 'hasHouse', # "A19 OWN/RENT OR WHAT"
-        self.dta.hasHouse.replace({1:True, 5:False, 8: None, 9:None}, inplace=True) # For our purposes, someone who 'neither owns nor rents' isn't included in a home-based savings calc
-        self.dta.hasHouse = self.dta.hasHouse.astype('bool')
+        # For our purposes, someone who 'neither owns nor rents' isn't included in a home-based savings calc
+        self.applyRecodeStep('movingAndRenting')
 
 
     def recodeImmigration(self):
@@ -682,29 +498,13 @@ class FamilyDataRecoder:
         :return:
         :rtype:
         '''
-        self.dta.firstYearInUS_R.replace({9997:None, 9999: None, 0:None}, inplace=True)
-        self.dta.firstYearInUS_S.replace({9997:None, 9999: None, 0:None}, inplace=True)
-
-        self.dta.englishSpokenMostOftenR.replace({8:None, 9: None, 0:None}, inplace=True)  # "IMM8 WTR ENGLISH/OTR LANG MOST OFTEN-RP" # 2017 & 2019 only
-        self.dta.understandEnglishR.replace({8:None, 9: None, 0:None}, inplace=True) # 2017-2019 only "IMM9 HOW WELL UNDERSTAND ENGLISH-RP"
-        self.dta.speakEnglishR.replace({8:None, 9: None, 0:None}, inplace=True) # 2017-2019 only "IMM10 HOW WELL SPEAK ENGLISH-RP"
-        self.dta.readEnglishR.replace({8:None, 9: None, 0:None}, inplace=True) # 2017-2019 only "IMM11 HOW WELL READ ENGLISH-RP""
-        self.dta.writeEnglishR.replace({8:None, 9: None, 0:None}, inplace=True) # # 2017-2019 only "IMM12 HOW WELL WRITE ENGLISH-RP"
-
-        self.dta.immigrantStatusIn2016_HH.replace({0:None}, inplace=True) # # 2017-2019 only "IMM 2016 SCREENING STATUS FOR THIS FU";
+        self.applyRecodeStep('immigration')
 
     def recodeHelpToOthers(self):
         '''
         Handle fields on OUTGOING funds from this HH to others
         '''
-        self.dta.helpsOthersFinancially.replace({1:True, 5: False, 8:None, 9:None}, inplace=True) # All years  "G103 WTR HELP OTRS"
-        self.dta.numberOtherHelpedFinancially.replace({98:None, 99:None, 0:None}, inplace=True) # All years "G104 # OTRS SUPPORTED"
-        self.dta.amountOtherHelpedFinancially.replace({9999998:None, 9999999:None, 0:None}, inplace=True) # All years "G106 TOTAL SUPP OF OTRS"
-
-        self.dta.providesChildSupport.replace({1:True, 5: False, 8:None, 9:None, 0:None}, inplace=True) # Since 1985 "G107 ANY CHILD SUPPORT"
-        self.dta.amountChildSupport.replace({9999998:None, 9999999:None, 0:None}, inplace=True)  # Since 1985 "AMT OF CHLD SUPPRT GIVEN"
-        self.dta.providesAlimony.replace({1:True, 5: False, 8:None, 9:None, 0:None}, inplace=True) # "G109 ANY ALIMONY"
-        self.dta.amountAlimony.replace({9999998:None, 9999999:None, 0:None}, inplace=True) # "AMT OF ALIMONY GIVEN"
+        self.applyRecodeStep('helpToOthers')
 
     def createWeightVar(self):
         if (self.year >= 1997):
@@ -729,23 +529,11 @@ class FamilyDataRecoder:
         ##########
         ## Basics for Family Unit
         ##########
-        if (self.year < 1994):
-            self.dta['SpouseInFU'] = self.dta.WifeInFU_Pre94.replace({1:True, 2: False, 3: False}, inplace=False) # 2 - No Wife in FU; 3: Head is female
-        else:
-            self.dta.SpouseInFU.replace({1:True, 5: False, 0:False}, inplace=True)
-        # self.dta.SpouseInFU.value_counts(dropna=False)    
-
-        # Gender
-        self.dta.genderR.replace({1:'Male', 2: 'Female', 0: None}, inplace=True)
+        # Spouse in FU, Gender & Martial Status
+        self.applyRecodeStep('familyUnit')
         if (self.year < 2015):
             self.dta['genderS'] = None
             self.dta.loc[self.dta.SpouseInFU, 'genderS'] = 'Female'  # Pre 2015, the only H of House always defaulted to male, and gender of Spouse only recorded as Female
-        else:
-            self.dta.genderS.replace({1:'Male', 2: 'Female', 0: None}, inplace=True)
-
-        # Martial Status
-        self.dta.martialStatusR.replace({1:'Married', 2: 'Never Married', 3: 'Widowed', 4: 'Divorced/Annulled', 5: 'Separated',8: None, 9: None}, inplace=True)
-        self.dta.martialStatusGenR.replace({1:'MarriedOrCohabit', 2: 'Never Married', 3: 'Widowed', 4: 'Divorced/Annulled', 5: 'Separated',8: None, 9: None}, inplace=True)
 
         # Sexual Orientation of Partnership
         self.dta['genderOfPartners'] = 'Unknown'
@@ -801,34 +589,18 @@ class FamilyDataRecoder:
         self.addState()
         if (self.year < 1994):
             self.dta['isMetroH'] = None
-        elif (self.year < 2015):
-            self.dta['isMetroH'] = self.dta.bealeCollapse_1994to2013.replace({1:1, 2:1, 3:1, 4:2, 5:2, 6:2, 7:2, 8:2, 9:2, 99:None,0:None})
         else:
-            self.dta['isMetroH'] = self.dta.isMetroH_2015on.replace({9:None,  0: None})
+            self.applyRecodeStep('metro')
 
 
         ##########
         ## Other basic demographics 
         ##########
 
-        # Age
-        self.dta.ageR.replace({999:np.NaN}, inplace=True)
-        self.dta.ageS.replace({999:np.NaN}, inplace=True)
-        
-        # Is the ENTIRE FU In an institution? -- RARE
-        if (self.year >= 1994 and self.year <= 1997):  # Wasnt asked these years
+        # Age, Institution & Education. For 1985-1990, we only have ranges for some education values; the spec uses the midpoint
+        self.applyRecodeStep('demographics')
+        if (self.year >= 1994 and self.year <= 1997):  # Is the ENTIRE FU In an institution? -- RARE.  Wasnt asked these years
             self.dta['institutionLocationHH'] = None
-        else:
-            self.dta.institutionLocationHH.replace({1:'Military', 2: 'Prison', 3: 'Healthcare', 4: 'College', 7: 'Other',0:None}, inplace=True) # RARE
-    
-        # Education    
-        if (self.year >= 1985 and self.year <= 1990):
-            # For these years, we only have ranges for some values. Use the midpoint 
-            self.dta.educationYearsR = self.dta.educationYearsR_85to90.replace({1: (5-0)/2, 2: 7, 3: 10, 4: 12, 5: 12, 6: 14, 7: 16, 8: 20, 9:np.NaN })
-            self.dta.educationYearsS = self.dta.educationYearsS_85to90.replace({1: (5-0)/2, 2: 7, 3: 10, 4: 12, 5: 12, 6: 14, 7: 16, 8: 20, 9:np.NaN })
-        else:
-            self.dta.educationYearsR.replace({99: np.NaN}, inplace=True)
-            self.dta.educationYearsS.replace({99: np.NaN}, inplace=True)
         
         self.dta.loc[((self.dta.educationYearsS == 0) | (self.dta.educationYearsS == 0.0)) & (~self.dta.SpouseInFU), 'educationYearsS'] = np.NaN
         # self.dta.educationYearsS.value_counts(dropna=False)
@@ -870,13 +642,9 @@ class FamilyDataRecoder:
         else:
             self.dta['MortgagePaymentAnnualHH'] = np.NaN
 
-        # 'ER66045': 'HomePropertyTaxAnnualHH',  #"A21 ANNUAL PROPERTY TAX"
-        if (self.year >= 1994):
-            self.dta.HomePropertyTaxAnnualHH.replace({99998:np.NaN, 99999: np.NaN}, inplace=True)
+        # Property Tax & Home Insurance
+        self.applyRecodeStep('homeCosts')
         self.dta.loc[~(self.dta.hasHouse), 'HomePropertyTaxAnnualHH'] = np.NaN
-    
-        # 'ER66047': 'HomeInsuranceAnnualHH', # A22 ANNUAL OWNR INSURANC"
-        self.dta.HomeInsuranceAnnualHH.replace({9998:np.NaN, 9999: np.NaN}, inplace=True)
         self.dta.loc[~(self.dta.hasHouse), 'HomeInsuranceAnnualHH'] = np.NaN
 
         ############
@@ -889,9 +657,7 @@ class FamilyDataRecoder:
         # Gifts & Inheritances 
         ##############
         # Inheritance / Gift    
-        self.dta.LargeGift_HadInLast2YearsHH.replace({1:True, 5:False, 8: None, 9: None}, inplace=True) 
-        self.dta.LargeGift_1_TypeHH.replace({1:'Gift', 5:'Inheritance', 8: None, 9: None, 0:None}, inplace=True) 
-        self.dta.LargeGift_1_AmountHH.replace({0:np.NaN, 9999998:np.NaN, 9999999: np.NaN}, inplace=True)
+        self.applyRecodeStep('gifts')
         # Build out as needed, if not covered in summary measures below
 
         ##################
@@ -903,17 +669,7 @@ class FamilyDataRecoder:
         # Misc
         ##################
         # In the PSID, many Variables have 0 = Invalid, especially spousal questions where there is no spouse.  Here are ones we haven't covered already
-        for varName in [# 'SampleErrorStratum', 'SampleErrorCluster', 
-                         'ageS', 'genderS', 
-                         ]:
-                if (varName in self.dta.columns):
-                    self.dta[varName].replace({0: None}, inplace=True)
-        for varName in [# 'SampleErrorStratum', 'SampleErrorCluster', 
-                         'valueOfHouse_Net',
-                        'valueOfEmployerRetirePlanR_Gross', 'valueOfEmployerRetirePlanS_Gross', 
-                         ]:
-                if (varName in self.dta.columns):
-                    self.dta[varName].replace({0: np.NaN}, inplace=True)
+        self.applyRecodeStep('zeroIsInvalid')
     
         # dta.LongitudinalWeightHH_1997to2017.value_counts(dropna=False)
         # dta.SampleErrorStratum.value_counts(dropna=False)
@@ -969,17 +725,7 @@ class FamilyDataRecoder:
         # self.dta.MadeMajorHomeRenovations.replace({1:True, 5:False, 8: None, 9: None}, inplace=True) 
 
         # 'ER67915': 'CostOfMajorHomeRenovations', # "W70 COST OF ADDITION/REPAIRS"
-        if self.year >= 2001:
-            self.dta['CostOfMajorHomeRenovations'] = self.dta.CostOfMajorHomeRenovations_2001to2017.replace({0:np.NaN, 999999998:np.NaN, 999999999: np.NaN}, inplace=False)
-        elif self.year == 1999:
-            self.dta['CostOfMajorHomeRenovations'] = self.dta.CostOfMajorHomeRenovations_to1999.replace({0:np.NaN, 999999998:np.NaN, 999999999: np.NaN}, inplace=False)
-        elif self.year < 1994:
-            self.dta['CostOfMajorHomeRenovations'] = self.dta.CostOfMajorHomeRenovations_to1999.replace({0:np.NaN}, inplace=False)
-        else:  
-            self.dta['CostOfMajorHomeRenovations'] = self.dta.CostOfMajorHomeRenovations_to1999.replace({0:np.NaN, 9999998:np.NaN, 9999999: np.NaN}, inplace=False)
-
-        self.dta.Home_SinceLastQYr_SoldPrice.replace({9999998:np.NaN, 9999999: np.NaN, 999999998: np.NaN, 999999999: np.NaN}, inplace=True)
-        
+        self.applyRecodeStep('homeRenovations')
 
         
     def createRetirementSavingsVars(self):
@@ -1015,8 +761,8 @@ class FamilyDataRecoder:
     
 
     def createAnnualAmountFieldFromUnitAndBase(self, existingBaseName, resultFieldName, dkVal, naVal):
-        self.dta[existingBaseName + '_Multiplier'] = self.dta[existingBaseName + '_Unit'].replace({2:365, 3: 52, 4:26, 5: 12, 6:1, 8: np.NaN, 9:np.NaN, 0: np.NaN}, inplace=False) 
-        self.dta[existingBaseName + '_AmountNoUnit'].replace({0:np.NaN, dkVal: np.NaN, naVal: np.NaN}, inplace=True)
+        self.dta[existingBaseName + '_Multiplier'] = FamilyRecodeSpec.AMOUNT_UNIT_MULTIPLIER.apply(self.dta[existingBaseName + '_Unit'])
+        self.dta[existingBaseName + '_AmountNoUnit'] = RecodeEngine.recode(self.dta[existingBaseName + '_AmountNoUnit'], naCodes = [0, dkVal, naVal])
         self.dta[resultFieldName] = self.dta[existingBaseName + '_Multiplier'] * self.dta[existingBaseName + '_AmountNoUnit']
 
 
@@ -1133,7 +879,7 @@ class FamilyDataRecoder:
 
         if save:
             self.dta = self.dta.reindex(sorted(self.dta.columns), axis=1)
-            self.dta.to_csv(fileNameWithPathNoExtension + ".csv", index=False)
+            DtypePolicy.saveCsv(self.dta, fileNameWithPathNoExtension)
 
         '''
         Check the quality of the resulting data.  This output needs to be manually reviewed 
@@ -1156,17 +902,62 @@ class FamilyDataRecoder:
 ''''
 Helper Function to run our primary use case: 
 '''
+# Each worker process keeps its own recoder, set up once with the tables shared by all years
+workerRecoder = None
+
+def initRecodeWorker(stateCodes, varStatus):
+    global workerRecoder
+    workerRecoder = FamilyDataRecoder(None, None, None, None, stateCodes = stateCodes)
+    workerRecoder.varStatus = varStatus
+
+def recodeYearInWorker(year, inputFile, outputFileNoExtension):
+    # Not DtypePolicy.readCsv: the recode rules work on the original PSID codes, as plain numpy columns
+    yearData = pd.read_csv(inputFile, low_memory=False)
+    workerRecoder.setData(yearData, year, workerRecoder.varStatus)
+    workerRecoder.doIt(outputFileNoExtension, save=True)
+    return year
+
+def recodeFamilyYearsInParallel(params, numWorkers):
+    '''
+    Recode each year of family data in its own worker process. Each worker reads its year from disk and writes the recoded file as soon as it's done,
+    so the years are never all in memory at once. The state codes and variable status are read once here and handed to each worker when it starts.
+    '''
+    mappedDir = os.path.join(params.BASE_OUTPUT_DIR, params.MAPPED_OUTPUT_SUBDIR)
+    stateCodes = pd.read_csv(os.path.join(params.PSID_DATA_DIR, "StateCodes_PSID_To_SOI.csv"))
+    varStatus = None
+    if os.path.exists(os.path.join(mappedDir, "extractedPSID_Mapped_VariableStatus.csv")):
+        varStatus = pd.read_csv(os.path.join(mappedDir, "extractedPSID_Mapped_VariableStatus.csv"))
+
+    filesByYear = {}
+    for year in params.yearsToInclude:
+        inputFile = os.path.join(mappedDir, "extractedPSID_Mapped_" + str(year) + ".csv")
+        if os.path.exists(inputFile):
+            filesByYear[year] = inputFile
+        else:
+            print("Skipping year " + str(year) + ". No data file found." )
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers = numWorkers, initializer = initRecodeWorker, initargs = (stateCodes, varStatus)) as executor:
+        futures = [executor.submit(recodeYearInWorker, year, filesByYear[year], os.path.join(mappedDir, "extractedPSID_Mapped_Recoded_" + str(year)))
+                   for year in filesByYear]
+        for future in concurrent.futures.as_completed(futures):
+            print("Finished recoding " + str(future.result()))
+
+
 def recodeAndSave(params, famExtractor, indExtractor):
-    if famExtractor is None:
-        famExtractor = Extractor.Extractor(params.PSID_DATA_DIR, params.yearsToInclude, params.familyWealthVarsWeNeed2019, None, source='family')
-    famExtractor.readExtractedData(params.yearsToInclude, filePath = os.path.join(params.BASE_OUTPUT_DIR, params.MAPPED_OUTPUT_SUBDIR), fileNameBase= "extractedPSID_Mapped_")
-    varStatus = famExtractor.variableStatusLongForm
-
-    famRecoder = FamilyDataRecoder(None, None, None, params.PSID_DATA_DIR)
-    for year in famExtractor.dataDict:
-        yearData = famExtractor.dataDict[year]
-        famRecoder.setData(yearData, year, varStatus)
-        famRecoder.doIt(os.path.join(params.BASE_OUTPUT_DIR, params.MAPPED_OUTPUT_SUBDIR,"extractedPSID_Mapped_Recoded_" + str(year)), save=True)
+    if (params.numWorkers is not None) and (params.numWorkers > 1) and (len(params.yearsToInclude) > 1):
+        # The years are independent of each other, so spread them across processes
+        recodeFamilyYearsInParallel(params, params.numWorkers)
+    else:
+        if famExtractor is None:
+            famExtractor = Extractor.Extractor(params.PSID_DATA_DIR, params.yearsToInclude, params.familyWealthVarsWeNeed2019, None, source='family')
+        famExtractor.readExtractedData(params.yearsToInclude, filePath = os.path.join(params.BASE_OUTPUT_DIR, params.MAPPED_OUTPUT_SUBDIR), fileNameBase= "extractedPSID_Mapped_")
+        varStatus = famExtractor.variableStatusLongForm
+
+        famRecoder = FamilyDataRecoder(None, None, None, params.PSID_DATA_DIR)
+        for year in famExtractor.dataDict:
+            yearData = famExtractor.dataDict[year]
+            famRecoder.setData(yearData, year, varStatus)
+            famRecoder.doIt(os.path.join(params.BASE_OUTPUT_DIR, params.MAPPED_OUTPUT_SUBDIR,"extractedPSID_Mapped_Recoded_" + str(year)), save=True)
 
     if indExtractor is None:
         indExtractor = Extractor.Extractor(params.PSID_DATA_DIR, params.yearsToInclude, params.individualVarsWeNeed2019, params.individualVars_LoadRegardlessOfYear, source='individual')
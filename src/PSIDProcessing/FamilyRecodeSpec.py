@@ -0,0 +1,310 @@
+from PSIDProcessing.RecodeEngine import recodeRule, compileValueMap
+
+'''
+The recode rules for the PSID family data, as used by FamilyDataRecoder.
+
+Each rule is one variable, for a range of years: see RecodeEngine.recodeRule.  The rules are grouped into steps,
+which FamilyDataRecoder applies at the matching points of its recoding process (applyRecodeStep); within a step, they're applied in order.
+Anything beyond a straight code -> value mapping (combining variables, calculations) stays in FamilyDataRecoder itself.
+'''
+
+# Common PSID codings
+YES_NO = {1: True, 5: False}
+ZERO_ONE = {1: True, 0: False}
+WORK_STATUS = {1: 'Working', 2: 'OnLeave', 3: 'Unemployed_Looking', 4: 'Retired', 5: 'Unemployed_Disabled', 6: 'Unemployed_Homemaker', 7: 'Unemployed_Student', 8: 'Prison'}
+WORK_TEST = {1: 'Working', 2: 'NeverWorked', 3: 'NotEmployed'}
+JOB_MONTH = {21: 1, 22: 4, 23: 7, 24: 10}  # Seasons: Winter, Spring etc, as the first month of each
+REASON_LEFT_JOB = {1: 'CompanyClosed', 2: 'Strike', 3: 'LaidOff', 4: 'Quit', 7: 'Transfer', 8: 'Completed'}
+GENDER = {1: 'Male', 2: 'Female'}
+MARITAL_STATUS = {1: 'Married', 2: 'Never Married', 3: 'Widowed', 4: 'Divorced/Annulled', 5: 'Separated'}
+RETIREMENT_PLAN_TYPE = {1: 'DB', 5: 'DC', 7: 'Both'}
+
+# DK / NA codes for dollar amounts
+DK_NA_7DIGIT = [9999998, 9999999]
+DK_NA_9DIGIT = [999999998, 999999999]
+
+# Used for several fields at once, by FamilyDataRecoder's helper functions
+RETIREMENT_CONTRIB_AMOUNT = compileValueMap(naCodes = [0] + DK_NA_7DIGIT)
+RETIREMENT_CONTRIB_PERIOD = compileValueMap({3: 'Week', 4: 'TwoWeeks', 5: 'Month', 6: 'Year'}, naCodes = [0, 7, 8, 9], naValue = None)
+RETIREMENT_CONTRIB_PERCENT = compileValueMap(naCodes = [0, 98.0, 99.0, 998.0, 999.0])
+AMOUNT_UNIT_MULTIPLIER = compileValueMap({2: 365, 3: 52, 4: 26, 5: 12, 6: 1}, naCodes = [8, 9, 0])
+
+
+FAMILY_RECODE_RULES = []
+
+##########
+## Basics for Family Unit
+##########
+FAMILY_RECODE_RULES += [
+    recodeRule('familyUnit', 'SpouseInFU', {1: True, 2: False, 3: False}, source = 'WifeInFU_Pre94', toYear = 1993), # 2 - No Wife in FU; 3: Head is female
+    recodeRule('familyUnit', 'SpouseInFU', {1: True, 5: False, 0: False}, fromYear = 1994),
+    recodeRule('familyUnit', 'genderR', GENDER, naCodes = [0], naValue = None),
+    recodeRule('familyUnit', 'genderS', GENDER, naCodes = [0], naValue = None, fromYear = 2015), # Before then, FamilyDataRecoder fills it in
+    recodeRule('familyUnit', 'martialStatusR', MARITAL_STATUS, naCodes = [8, 9], naValue = None),
+    recodeRule('familyUnit', 'martialStatusGenR', {**MARITAL_STATUS, 1: 'MarriedOrCohabit'}, naCodes = [8, 9], naValue = None),
+]
+
+##########
+## State of Residence
+##########
+FAMILY_RECODE_RULES += [
+    recodeRule('metro', 'isMetroH', {1: 1, 2: 1, 3: 1, 4: 2, 5: 2, 6: 2, 7: 2, 8: 2, 9: 2}, naCodes = [99, 0], naValue = None, source = 'bealeCollapse_1994to2013', fromYear = 1994, toYear = 2014),
+    recodeRule('metro', 'isMetroH', naCodes = [9, 0], naValue = None, source = 'isMetroH_2015on', fromYear = 2015),
+]
+
+##########
+## Other basic demographics
+##########
+EDUCATION_RANGE_MIDPOINTS = {1: (5-0)/2, 2: 7, 3: 10, 4: 12, 5: 12, 6: 14, 7: 16, 8: 20}
+FAMILY_RECODE_RULES += [
+    recodeRule('demographics', 'ageR', naCodes = [999]),
+    recodeRule('demographics', 'ageS', naCodes = [999]),
+    # Wasnt asked 1994-1997
+    recodeRule('demographics', 'institutionLocationHH', {1: 'Military', 2: 'Prison', 3: 'Healthcare', 4: 'College', 7: 'Other'}, naCodes = [0], naValue = None, toYear = 1993), # RARE
+    recodeRule('demographics', 'institutionLocationHH', {1: 'Military', 2: 'Prison', 3: 'Healthcare', 4: 'College', 7: 'Other'}, naCodes = [0], naValue = None, fromYear = 1998),
+]
+for person in ['R', 'S']:
+    FAMILY_RECODE_RULES += [
+        # For these years, we only have ranges for some values. Use the midpoint
+        recodeRule('demographics', 'educationYears' + person, EDUCATION_RANGE_MIDPOINTS, naCodes = [9], source = 'educationYears' + person + '_85to90', fromYear = 1985, toYear = 1990),
+        # 99 is DK/NA for both Head and Spouse in every other year
+        recodeRule('demographics', 'educationYears' + person, naCodes = [99], toYear = 1984),
+        recodeRule('demographics', 'educationYears' + person, naCodes = [99], fromYear = 1991),
+    ]
+
+##########
+## Home costs
+##########
+FAMILY_RECODE_RULES += [
+    recodeRule('homeCosts', 'HomePropertyTaxAnnualHH', naCodes = [99998, 99999], fromYear = 1994), # 'ER66045': 'HomePropertyTaxAnnualHH',  #"A21 ANNUAL PROPERTY TAX"
+    recodeRule('homeCosts', 'HomeInsuranceAnnualHH', naCodes = [9998, 9999]), # 'ER66047': 'HomeInsuranceAnnualHH', # A22 ANNUAL OWNR INSURANC"
+]
+
+##############
+# Gifts & Inheritances
+##############
+FAMILY_RECODE_RULES += [
+    recodeRule('gifts', 'LargeGift_HadInLast2YearsHH', YES_NO, naCodes = [8, 9], naValue = None),
+    recodeRule('gifts', 'LargeGift_1_TypeHH', {1: 'Gift', 5: 'Inheritance'}, naCodes = [8, 9, 0], naValue = None),
+    recodeRule('gifts', 'LargeGift_1_AmountHH', naCodes = [0] + DK_NA_7DIGIT),
+]
+
+##################
+# Misc
+##################
+# In the PSID, many Variables have 0 = Invalid, especially spousal questions where there is no spouse.  Here are ones we haven't covered already
+FAMILY_RECODE_RULES += [recodeRule('zeroIsInvalid', varName, naCodes = [0], naValue = None, optional = True) for varName in ['ageS', 'genderS']]
+FAMILY_RECODE_RULES += [recodeRule('zeroIsInvalid', varName, naCodes = [0], optional = True) for varName in
+                        ['valueOfHouse_Net', 'valueOfEmployerRetirePlanR_Gross', 'valueOfEmployerRetirePlanS_Gross']]
+
+##############
+# Retirement plans, for Respondent and Spouse
+##############
+for person in ['R', 'S']:
+    FAMILY_RECODE_RULES += [
+        recodeRule('retirementPlans', 'RetPlan_IsParticipating' + person, YES_NO, naCodes = [8, 9, 0], naValue = None),
+        recodeRule('retirementPlans', 'RetPlan_IsEligible' + person, YES_NO, naCodes = [8, 9, 0], naValue = None),
+        recodeRule('retirementPlans', 'RetPlan_IsEmployeeContributing' + person, YES_NO, naCodes = [8, 9, 0], naValue = None),
+        recodeRule('retirementPlans', 'RetPlan_Type' + person, RETIREMENT_PLAN_TYPE, naCodes = [8, 9, 0], naValue = None),
+        recodeRule('retirementPlans', 'RetPlan2_Has' + person, {**YES_NO, 0: False}, naCodes = [8, 9], naValue = None),
+        recodeRule('retirementPlans', 'RetPlan2_EmployerContrib_YesNo' + person, {**YES_NO, 0: False}, naCodes = [8, 9], naValue = None),
+    ]
+FAMILY_RECODE_RULES += [
+    recodeRule('retirementPlans', 'RetPlan_EmployerContrib_YesNoR', {**YES_NO, 0: False}, naCodes = [8, 9], naValue = None),
+]
+
+##########
+## Job Status
+##########
+FAMILY_RECODE_RULES += [
+    recodeRule('jobStatus', 'IsWorkingR', {k: v for k, v in WORK_STATUS.items() if k != 8}, naCodes = [8], naValue = None, source = 'IsWorkingR_Pre1994', toYear = 1993),
+    recodeRule('jobStatus', 'IsWorkingR', WORK_STATUS, naCodes = [99], naValue = None, fromYear = 1994),
+    recodeRule('jobStatus', 'IsWorking_SecondMentionR', WORK_STATUS, naCodes = [99], naValue = None),
+    recodeRule('jobStatus', 'IsWorking_Test2R', WORK_TEST),
+    recodeRule('jobStatus', 'IsWorkingS', WORK_STATUS, naCodes = [99], naValue = None),
+    recodeRule('jobStatus', 'IsWorking_SecondMentionS', WORK_STATUS, naCodes = [99], naValue = None),
+    recodeRule('jobStatus', 'IsWorking_Test2S', WORK_TEST),
+]
+for person in ['R', 'S']:
+    FAMILY_RECODE_RULES += [
+        recodeRule('jobStatus', 'dateStarted_Job1_Month_' + person, JOB_MONTH, naCodes = [0, 98, 99]), # "ER66179": "dateStarted_Job1_Month_R", #  "BC6 BEGINNING MONTH--JOB 1" NUM(2.0)
+        recodeRule('jobStatus', 'dateStarted_Job1_Year_' + person, naCodes = [0, 9996, 9997, 9998, 9999]), # "ER66180": "dateStarted_Job1_Year_R", # "BC6 BEGINNING YEAR--JOB 1" NUM(4.0)
+    ]
+for person in ['R', 'S']:
+    FAMILY_RECODE_RULES += [
+        recodeRule('jobStatus', 'dateEnded_Job1_Month_' + person, JOB_MONTH, naCodes = [0, 98, 99]), # 'ER66181': "dateEnded_Job1_Month_R", # "BC6 ENDING MONTH--JOB 1
+        recodeRule('jobStatus', 'dateEnded_Job1_Year_' + person, naCodes = [0, 9996, 9997, 9998, 9999]), # 'ER66182': "dateEnded_Job1_Year_R", # "BC6 ENDING YEAR--JOB 1"
+    ]
+# from 1988 on is CHANGE EMPLOYER only; before included promotions
+FAMILY_RECODE_RULES += [
+    recodeRule('jobStatus', 'reasonLeftLastJobR', REASON_LEFT_JOB, naCodes = [0, 9], naValue = None), # "ER66242": 'reasonLeftLastJobR', # "BC51 WHY LAST JOB END (RP-U)"
+    recodeRule('jobStatus', 'reasonLeftLastJobS', REASON_LEFT_JOB, naCodes = [0, 9], naValue = None), # "ER66517": 'reasonLeftLastJobS', # "DE51 WHY LAST JOB END (SP-U)" NUM(1.0)
+]
+
+############
+## Income
+############
+FAMILY_RECODE_RULES += [
+    recodeRule('income', 'YearRetiredR', naCodes = [9998, 9999, 0]),
+    recodeRule('income', 'AgePlanToRetireR', naCodes = [996, 997, 998, 999, 0]),
+]
+# Except for 1994, No processing needed:  These are actual values, topcoded, so dont drop big numbers
+for varName, naCode1994 in [('totalIncomeHH', 9999999), # 'ER71426': 'totalIncomeHH', # "TOTAL FAMILY INCOME-2016"
+                            ('taxableIncomeRandS', 9999999), # 'ER71330': 'taxableIncomeRandS',# Reference Person and Spouse/Partner Taxable Income-2016
+                            ('taxableIncomeO', 9999999), # 'ER71398': 'taxableIncomeO', # Taxable Income of Other FU Members-2016
+                            ('transferIncomeRandS', 9999999),
+                            ('transferIncomeO', 999999)]:
+    FAMILY_RECODE_RULES += [
+        recodeRule('income', varName, naCodes = [0], toYear = 1993),
+        recodeRule('income', varName, naCodes = [0, naCode1994], fromYear = 1994, toYear = 1994), # Yes, all of these were recoded for 1994
+        recodeRule('income', varName, naCodes = [0], fromYear = 1995),
+    ]
+# Wage income - needed for interpreting retirement contribution rates
+FAMILY_RECODE_RULES += [
+    recodeRule('income', 'hasWageIncomeR', YES_NO, naCodes = [8, 9, 0], naValue = None),
+    recodeRule('income', 'wageIncomeR', naCodes = [0, -9999999] + DK_NA_7DIGIT),
+    recodeRule('income', 'wageIncomeS', naCodes = [0, -9999999] + DK_NA_7DIGIT, source = 'wageIncomeS_Post1993', fromYear = 1994),
+    recodeRule('income', 'wageIncomeS', naCodes = [0, -9999999] + DK_NA_7DIGIT, source = 'laborIncomeS_1993AndPre', toYear = 1993), # No 'wage only' income from pre 1994, only total labor
+    recodeRule('income', 'hasWageIncomeS', YES_NO, naCodes = [8, 9, 0], naValue = None, fromYear = 1994),
+]
+
+FAMILY_RECODE_RULES += [recodeRule('incomeTopCoded', varName, naCodes = [0, 999999]) for varName in
+                        ['RentIncomeR', 'RentIncomeS',
+                         'UnemploymentIncomeR', 'UnemploymentIncomeS',
+                         'VAPensionIncomeR', 'OtherRetirementIncomeR',
+                         'VAPensionIncomeS',  'AnnuityIncomeS', 'IRAIncomeR', 'IRAIncomeS','OtherRetirementIncomeS']]
+FAMILY_RECODE_RULES += [
+    # In other years, 999999 is an actual values
+    recodeRule('incomeTopCoded', 'FederalIncomeTaxesRS', naCodes = [0, 999999], fromYear = 1991, toYear = 1991),
+    recodeRule('incomeTopCoded', 'FederalIncomeTaxesO', naCodes = [0, 999999], fromYear = 1991, toYear = 1991),
+    # only used in certain years, but doesnt seem to harm other years
+    recodeRule('incomeTopCoded', 'PovertyThreshold', naCodes = [99999]),
+]
+
+############
+## Wealth
+############
+FAMILY_RECODE_RULES += [
+    recodeRule('wealth', 'hasBrokerageStocks', ZERO_ONE), # 'ER71443': 'hasStocks', #  "IMP WTR STOCKS (W15) 2017"  # Does anyone in HH have stocks beyond Ret plan
+    recodeRule('wealth', 'hasPrivateRetirePlan', ZERO_ONE), # 'ER71453': 'hasPrivateRetirePlan', #  "IMP WTR ANNUITY/IRA (W21) 2017" # Wherther have private annuities or IRAs
+    recodeRule('wealth', 'hasEmployerRetirePlanR', YES_NO, naCodes = [8, 9, 0], naValue = None, source = 'RetPlan_IsParticipatingR'),
+    recodeRule('wealth', 'valueOfEmployerRetirePlanR_Gross', naCodes = [0, 999998, 999999] + DK_NA_9DIGIT), # 'ER68010': 'valueOfEmployerRetirePlanR_Gross', #  "P20 AMT IN PENSION ACCT NOW - RP"
+    recodeRule('wealth', 'hasEmployerRetirePlanS', YES_NO, naCodes = [8, 9, 0], naValue = None, source = 'RetPlan_IsParticipatingS'),
+    recodeRule('wealth', 'valueOfEmployerRetirePlanS_Gross', naCodes = [0, 999998, 999999] + DK_NA_9DIGIT), # 'ER68227': 'valueOfEmployerRetirePlanS_Gross', #  "P20 AMT IN PENSION ACCT NOW - SP"
+    # For our purposes, someone who 'neither owns nor rents' isn't included in a home-based savings calc
+    recodeRule('wealth', 'hasHouse', YES_NO, naCodes = [8, 9], naValue = None, dtype = 'bool'), # 'ER66030': 'hasHouse', # "A19 OWN/RENT OR WHAT"
+    recodeRule('wealth', 'valueOfHouse_Gross', naCodes = [0] + DK_NA_7DIGIT), # 'ER66031': 'valueOfHouse_Gross' # ' ER66031 "A20 HOUSE VALUE" NUM(7.0)
+    recodeRule('wealth', 'valueOfVehicle_Net', naCodes = [0]), #     'ER71447': 'valueOfVehicle_Net',  # IMP VALUE VEHICLES (W6) 2017
+    recodeRule('wealth', 'hasOtherAssets', ZERO_ONE),
+    recodeRule('wealth', 'valueOfOtherAssets_Net', naCodes = [0]), #     'ER71451': 'valueOfOtherAssets_Net', # IMP VALUE OTH ASSETS (W34) 2017
+
+    recodeRule('wealth', 'hasCheckingAndSavings', ZERO_ONE, source = 'hasChecking_2019on_NoCDsOrGvtBonds', fromYear = 2019),
+    recodeRule('wealth', 'valueOfCheckingAndSavings_Net_2019on_NoCDsOrGvtBonds', naCodes = [0], fromYear = 2019), # 'ER71435':  "IMP VAL CHECKING/SAVING (W28) 2017"
+    recodeRule('wealth', 'valueOfCDsOrGvtBonds_2019on', naCodes = [0], fromYear = 2019),
+    recodeRule('wealth', 'hasCheckingAndSavings', ZERO_ONE, source = 'hasCheckingAndSavings_to2017', toYear = 2018),
+    recodeRule('wealth', 'valueOfCheckingAndSavings_Net', naCodes = [0], source = 'valueOfCheckingAndSavings_Net_to2017', toYear = 2018),
+
+    recodeRule('wealth', 'valueOfDebt_CreditCards_2011on', naCodes = [0] + DK_NA_7DIGIT), # "W39A AMOUNT OF CREDIT/STORE CARD DEBT"
+    recodeRule('wealth', 'valueOfDebt_StudentLoans_2011on', naCodes = [0] + DK_NA_7DIGIT), # "W39B1 AMOUNT OF STUDENT LOANS"
+    recodeRule('wealth', 'valueOfDebt_MedicalBills_2011on', naCodes = [0] + DK_NA_7DIGIT), # "W39B2 AMOUNT OF MEDICAL BILLS"
+    recodeRule('wealth', 'valueOfDebt_LegalBills_2011on', naCodes = [0] + DK_NA_7DIGIT), # "W39B3 AMOUNT OF LEGAL BILLS"
+    recodeRule('wealth', 'valueOfDebt_FamilyLoan_2011on', naCodes = [0] + DK_NA_7DIGIT), # "W39B4 AMOUNT OF LOANS FROM RELATIVES"
+    recodeRule('wealth', 'valueOfDebt_Other_2013on', naCodes = [0] + DK_NA_7DIGIT),
+    recodeRule('wealth', 'valueOfAllOtherDebts_Net', naCodes = [0], source = 'valueOfAllOtherDebts_pre2011', toYear = 2010),
+    recodeRule('wealth', 'hasAllOtherDebts', ZERO_ONE, source = 'hasOtherDebt_pre2011', toYear = 2010),
+
+    # Handle the change from NET to GROSS+DEBT tracking on Other Real Estate and Business
+    recodeRule('wealth', 'hasOtherRealEstate', ZERO_ONE),
+    recodeRule('wealth', 'hasBusiness', ZERO_ONE),
+    recodeRule('wealth', 'valueOfOtherRealEstate_Gross_2013on', naCodes = [0], fromYear = 2013), # 'ER71439': 'valueOfOtherRealEstate_Gross_2013on', # "IMP VAL OTH REAL ESTATE ASSET (W2A) 2017"
+    recodeRule('wealth', 'valueOfOtherRealEstate_Debt_2013on', naCodes = [0], fromYear = 2013), # 'ER71441': 'valueOfOtherRealEstate_Debt_2013on', # 'ER71441 "IMP VAL OTH REAL ESTATE DEBT (W2B) 2017"
+    recodeRule('wealth', 'valueOfBusiness_Gross_2013on', naCodes = [0], fromYear = 2013), # 'ER71429': 'valueOfBusiness_Gross_2013on', # ER71429 "IMP VALUE FARM/BUS ASSET (W11A) 2017" NUM(9.0)
+    recodeRule('wealth', 'valueOfBusiness_Debt_2013on', naCodes = [0], fromYear = 2013), # 'ER71431': 'valueOfBusiness_Debt_2013on', # ER71431 "IMP VALUE FARM/BUS DEBT (W11B) 2017"
+    # WARNING -- these fields are mapped in the Crosswalk to Wealth File variables (S209, for example) but the data itself conforms
+    # To the rules in the Family Data file.   -  Ie different codes for "Max value".
+    recodeRule('wealth', 'valueOfOtherRealEstate_Net', naCodes = [0], source = 'valueOfOtherRealEstate_Net_pre2013', toYear = 2012), # 'ER52354': 'valueOfOtherRealEstate_Net_pre2013',  # S309 "IMP VAL OTH REAL ESTATE (G116) 94" NUM(9.0)
+    recodeRule('wealth', 'valueOfBusiness_Net', naCodes = [0], source = 'valueOfBusiness_Net_pre2013', toYear = 2012), # 'ER52346': 'valueOfBusiness_Net_pre2013',  # S303 "IMP VALUE FARM/BUS (G125) 94" NUM(9.0)
+
+    # The PSID calculates its own 'Active Savings' amount -- but only for one year.
+    recodeRule('wealth', 'ActiveSavings_PSID1989', naCodes = [99999999]), # V17610 "ACTIVE SAVING 1984-89"
+]
+
+############
+## Asset flows, and Large Gifts and Inheritance
+############
+FAMILY_RECODE_RULES += [
+    recodeRule('assetFlow', 'LargeGift_1_AmountHH', naCodes = [0, 9999997] + DK_NA_7DIGIT, toYear = 1988), # ER67967 VALUE 1ST INHERT
+    recodeRule('assetFlow', 'LargeGift_AllBut1_AmountHH_1989AndBefore', naCodes = [0, 9999997] + DK_NA_7DIGIT, toYear = 1988),
+    recodeRule('assetFlow', 'LargeGift_1_AmountHH', naCodes = [0], fromYear = 1989, toYear = 1989),
+    recodeRule('assetFlow', 'LargeGift_AllBut1_AmountHH_1989AndBefore', naCodes = [0], fromYear = 1989, toYear = 1989),
+]
+# Note for 1984-1994, these are 5 year values (since last Wealth supplement). They aren't available before 1989
+for varName in ['PersonMovedOut_SinceLastQYr_AssetsMovedOut', # 'ER67942': 'PersonMovedOut_2Yr_AssetsMovedOut', # "W103 VALUE ASSETS MOVED OUT"
+                'PersonMovedOut_SinceLastQYr_DebtsMovedOut', # 'ER67947': 'PersonMovedOut_2Yr_DebtsMovedOut', # "W108 VALUE DEBTS MOVED OUT"
+                'PersonMovedIn_SinceLastQYr_AssetsMovedIn', # 'ER67953': 'PersonMovedIn_2Yr_AssetsMovedIn', # "W114 VALUE ASSETS MOVED IN"
+                'PersonMovedIn_SinceLastQYr_DebtsMovedIn', # 'ER67958': 'PersonMovedIn_2Yr_DebtsMovedIn', # "W119 VALUE DEBTS MOVE IN"
+                'PrivateRetirePlan_SinceLastQYr_AmountMovedIn', 'PrivateRetirePlan_SinceLastQYr_AmountMovedOut',
+                'OtherRealEstate_SinceLastQYr_AmountBought', 'OtherRealEstate_SinceLastQYr_AmountSold',
+                'Business_SinceLastQYr_AmountBought', 'Business_SinceLastQYr_AmountSold',
+                'BrokerageStocks_SinceLastQYr_AmountBought', 'BrokerageStocks_SinceLastQYr_AmountSold']:
+    FAMILY_RECODE_RULES += [
+        recodeRule('assetFlow', varName, naCodes = [0] + DK_NA_7DIGIT, fromYear = 1989, toYear = 1989),
+        recodeRule('assetFlow', varName, naCodes = [0, -99999999] + DK_NA_9DIGIT, fromYear = 1990, toYear = 1993),
+        recodeRule('assetFlow', varName, naCodes = [0] + DK_NA_7DIGIT, fromYear = 1994, toYear = 1994),
+        recodeRule('assetFlow', varName, naCodes = [0, -99999999] + DK_NA_9DIGIT, fromYear = 1995),
+    ]
+# A mess -- this var's DK value is 9.9 million for some years, then 999 million, then back down to 9 million
+FAMILY_RECODE_RULES += [recodeRule('assetFlow', varName, naCodes = [0] + DK_NA_7DIGIT + DK_NA_9DIGIT) for varName in
+                        ['LargeGift_1_AmountHH', 'LargeGift_2_AmountHH_1994AndAfter', 'LargeGift_3_AmountHH_1994AndAfter']]
+# Help From Family and Friends; overlaps with Large Gift. 1994-2003 are given as an amount per unit of time; see FamilyDataRecoder
+for varName, source in [('helpFromFamilyRP', 'helpFromFamilyRP_1975to1993andAfter2003'), ('helpFromOthersRP', 'helpFromOthersRP_1993andAfter2003'),
+                        ('helpFromFamilySP', 'helpFromFamilySP_1985to1993andAfter2003'), ('helpFromOthersSP', 'helpFromOthersSP_1993andAfter2003')]:
+    FAMILY_RECODE_RULES += [
+        recodeRule('assetFlow', varName, naCodes = [0], source = source, toYear = 1993),
+        recodeRule('assetFlow', varName, naCodes = [0], source = source, fromYear = 2004),
+    ]
+
+############
+## Other Expenses, Moving, Home Renovations
+############
+FAMILY_RECODE_RULES += [
+    recodeRule('miscExpenses', 'FarmIncomeRandS', naCodes = [999999, -999999], fromYear = 1994, toYear = 1994), # no recoding needed in other years 'ER71272':
+
+    recodeRule('movingAndRenting', 'MovedR', {1: True, 2: False, 5: False}, naCodes = [8, 9], naValue = None, dtype = 'bool'),
+    recodeRule('movingAndRenting', 'hasHouse', YES_NO, naCodes = [8, 9], naValue = None, dtype = 'bool'), # 'ER66030': 'hasHouse', # "A19 OWN/RENT OR WHAT"
+
+    # 'ER67915': 'CostOfMajorHomeRenovations', # "W70 COST OF ADDITION/REPAIRS"
+    recodeRule('homeRenovations', 'CostOfMajorHomeRenovations', naCodes = [0], source = 'CostOfMajorHomeRenovations_to1999', toYear = 1993),
+    recodeRule('homeRenovations', 'CostOfMajorHomeRenovations', naCodes = [0] + DK_NA_7DIGIT, source = 'CostOfMajorHomeRenovations_to1999', fromYear = 1994, toYear = 1998),
+    recodeRule('homeRenovations', 'CostOfMajorHomeRenovations', naCodes = [0] + DK_NA_9DIGIT, source = 'CostOfMajorHomeRenovations_to1999', fromYear = 1999, toYear = 1999),
+    recodeRule('homeRenovations', 'CostOfMajorHomeRenovations', naCodes = [0] + DK_NA_7DIGIT, source = 'CostOfMajorHomeRenovations_to1999', fromYear = 2000, toYear = 2000),
+    recodeRule('homeRenovations', 'CostOfMajorHomeRenovations', naCodes = [0] + DK_NA_9DIGIT, source = 'CostOfMajorHomeRenovations_2001to2017', fromYear = 2001),
+    recodeRule('homeRenovations', 'Home_SinceLastQYr_SoldPrice', naCodes = DK_NA_7DIGIT + DK_NA_9DIGIT),
+]
+
+############
+## Immigration: only available in 2017 and 2019, and ONLY for people in the immigrant subsample
+############
+FAMILY_RECODE_RULES += [
+    recodeRule('immigration', 'firstYearInUS_R', naCodes = [9997, 9999, 0], naValue = None),
+    recodeRule('immigration', 'firstYearInUS_S', naCodes = [9997, 9999, 0], naValue = None),
+    recodeRule('immigration', 'englishSpokenMostOftenR', naCodes = [8, 9, 0], naValue = None), # "IMM8 WTR ENGLISH/OTR LANG MOST OFTEN-RP"
+    recodeRule('immigration', 'understandEnglishR', naCodes = [8, 9, 0], naValue = None), # "IMM9 HOW WELL UNDERSTAND ENGLISH-RP"
+    recodeRule('immigration', 'speakEnglishR', naCodes = [8, 9, 0], naValue = None), # "IMM10 HOW WELL SPEAK ENGLISH-RP"
+    recodeRule('immigration', 'readEnglishR', naCodes = [8, 9, 0], naValue = None), # "IMM11 HOW WELL READ ENGLISH-RP""
+    recodeRule('immigration', 'writeEnglishR', naCodes = [8, 9, 0], naValue = None), # "IMM12 HOW WELL WRITE ENGLISH-RP"
+    recodeRule('immigration', 'immigrantStatusIn2016_HH', naCodes = [0], naValue = None), # "IMM 2016 SCREENING STATUS FOR THIS FU";
+]
+
+##################
+# Support for others
+##################
+FAMILY_RECODE_RULES += [
+    recodeRule('helpToOthers', 'helpsOthersFinancially', YES_NO, naCodes = [8, 9], naValue = None), # All years  "G103 WTR HELP OTRS"
+    recodeRule('helpToOthers', 'numberOtherHelpedFinancially', naCodes = [98, 99, 0], naValue = None), # All years "G104 # OTRS SUPPORTED"
+    recodeRule('helpToOthers', 'amountOtherHelpedFinancially', naCodes = DK_NA_7DIGIT + [0], naValue = None), # All years "G106 TOTAL SUPP OF OTRS"
+    recodeRule('helpToOthers', 'providesChildSupport', YES_NO, naCodes = [8, 9, 0], naValue = None), # Since 1985 "G107 ANY CHILD SUPPORT"
+    recodeRule('helpToOthers', 'amountChildSupport', naCodes = DK_NA_7DIGIT + [0], naValue = None), # Since 1985 "AMT OF CHLD SUPPRT GIVEN"
+    recodeRule('helpToOthers', 'providesAlimony', YES_NO, naCodes = [8, 9, 0], naValue = None), # "G109 ANY ALIMONY"
+    recodeRule('helpToOthers', 'amountAlimony', naCodes = DK_NA_7DIGIT + [0], naValue = None), # "AMT OF ALIMONY GIVEN"
+]
@@ -1,4 +1,5 @@
 import DataQuality.CrossSectionalTester as DataQualityTester
+import PSIDProcessing.DtypePolicy as DtypePolicy
 
 DEBUG_EDA = False
 
@@ -124,7 +125,7 @@ class IndividualDataRecoder:
         self.createWeightVars()
         
         if save:
-            self.dta.to_csv(fileNameWithPathNoExtension + ".csv", index=False)
+            DtypePolicy.saveCsv(self.dta, fileNameWithPathNoExtension)
 
         self.dta['dummyWeight'] = 1
         tester = DataQualityTester.CrossSectionalTester(dta = self.dta,
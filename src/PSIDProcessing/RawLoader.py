@@ -1,13 +1,14 @@
 import pandas as pd
 import os
 import copy
+import concurrent.futures
 import ThirdPartyCode.SASReader as SASReader
 import PSIDProcessing.CrosswalkHelper as CrosswalkHelper
 
 CONSUMPTION_CROSSWALK_FILE = "ConsExpCrosswalk_AsOf2021.xlsx"
 
 '''
-This class reads in the raw PSID data from disk (SAS format) and converts them to CSV files, 
+This class reads in the raw PSID data from disk (SAS format) and converts them to typed Parquet files (CSV if pyarrow isn't installed), 
 optionally extracting only those variables of interest
 '''
 class RawLoader:
@@ -30,100 +31,180 @@ class RawLoader:
     # This data in these files have the Wealth and Family data cominbed
     yearsCombinedNewDownloadCollected = [1984, 1989, 1994, 1999, 2001, 2003, 2005, 2007, 2009, 2011, 2013, 2015, 2017, 2019]
         
-    def __init__(self, rootDir, yearsToInclude = [2015, 2017, 2019]):
+    def __init__(self, rootDir, yearsToInclude = [2015, 2017, 2019], chunkSize = None, numWorkers = None):
         self.rootDataDir = rootDir
         self.yearsToInclude= yearsToInclude
+        # If set, raw SAS files are decoded in blocks of this many records, so memory is bounded by the block size
+        self.chunkSize = chunkSize
+        # If more than 1, each year's files are read in a separate process
+        self.numWorkers = numWorkers
         # self.startYear = startYear 
         # self.endYear = endYear 
         # print('psid_raw class: use .load() to import raw data')    
 
-    def readRawDataFile(self, fileFullPathNoExtension, forceReload = False):
-        if (not forceReload) and os.path.exists(fileFullPathNoExtension + ".csv"):
+    '''
+    Reads one raw PSID file. If fieldsToKeep is given, only those columns (that exist in the file) are returned.
+    The first read converts the whole fixed-width file to our typed Parquet copy (whatever columns were asked for);
+    after that, just the columns we need are read from the copy. A copy older than the raw file or its dictionary (a new download) is made again.
+    Like the CSV copies, the Parquet copy holds the values as they are in the raw file, before any implied decimals are applied,
+    and the first read returns the same values as the later ones.
+    Without pyarrow, the requested columns are sliced straight out of the fixed-width file instead.
+    CSV copies from older runs are only read if we can't make a Parquet copy.
+    '''
+    def readRawDataFile(self, fileFullPathNoExtension, forceReload = False, fieldsToKeep = None):
+        hasRawFiles = os.path.exists(fileFullPathNoExtension + ".sas") and os.path.exists(fileFullPathNoExtension + ".txt")
+        canUseParquet = (SASReader.pa is not None)
+        hasParquet = os.path.exists(fileFullPathNoExtension + ".parquet") and ((not hasRawFiles) or
+            (os.path.getmtime(fileFullPathNoExtension + ".parquet") >=
+             max(os.path.getmtime(fileFullPathNoExtension + ".txt"), os.path.getmtime(fileFullPathNoExtension + ".sas"))))
+        if (fieldsToKeep is not None):
+            fieldsToKeep = set([x for x in fieldsToKeep if isinstance(x, str)])
+
+        if canUseParquet and (not forceReload) and hasParquet:
+            return SASReader.read_parquet(fileFullPathNoExtension + ".parquet", fieldsToKeep)
+        elif hasRawFiles and canUseParquet:
+            SASReader.write_sas_parquet(
+                data_file = fileFullPathNoExtension + ".txt",
+                dict_file = fileFullPathNoExtension + ".sas",
+                outputParquet = fileFullPathNoExtension + ".parquet",
+                outputMeta = fileFullPathNoExtension + "_meta.csv",
+                chunksize = (self.chunkSize if self.chunkSize is not None else 50000),
+                skip_decimal_division = True
+                )
+            return SASReader.read_parquet(fileFullPathNoExtension + ".parquet", fieldsToKeep)
+        elif (fieldsToKeep is not None) and hasRawFiles:
+            return SASReader.read_sas_columns(
+                data_file = fileFullPathNoExtension + ".txt",
+                dict_file = fileFullPathNoExtension + ".sas",
+                columns = fieldsToKeep,
+                skip_decimal_division = True
+                )
+        elif (not forceReload) and os.path.exists(fileFullPathNoExtension + ".csv"):
+            if (fieldsToKeep is not None):
+                return pd.read_csv(fileFullPathNoExtension + ".csv", usecols = lambda x: x in fieldsToKeep)
             return pd.read_csv(fileFullPathNoExtension + ".csv")
-        elif os.path.exists(fileFullPathNoExtension + ".sas") and os.path.exists(fileFullPathNoExtension + ".txt"):
+        elif hasRawFiles:
+            if (self.chunkSize is not None):
+                return SASReader.read_sas_chunked(
+                    data_file = fileFullPathNoExtension + ".txt",
+                    dict_file = fileFullPathNoExtension + ".sas",
+                    outputCSV = fileFullPathNoExtension + ".csv",
+                    outputMeta = fileFullPathNoExtension + "_meta.csv",
+                    chunksize = self.chunkSize,
+                    skip_decimal_division = True
+                    )
             return SASReader.read_sas(
                 data_file = fileFullPathNoExtension + ".txt",
                 dict_file = fileFullPathNoExtension + ".sas",
                 outputCSV = fileFullPathNoExtension + ".csv",
-                outputMeta = fileFullPathNoExtension + "_meta.csv"
+                outputMeta = fileFullPathNoExtension + "_meta.csv",
+                skip_decimal_division = True
                 )
         else:
             raise Exception("What file am I supposed to load? What am I, a mind reader?")
+
+    '''
+    Reads each raw PSID file in filesByYear ({year: fileFullPathNoExtension}; any key will do), in a pool of numWorkers processes if set.
+    Returns {year: DataFrame}, with the same keys
+    '''
+    def readRawDataFiles(self, filesByYear, forceReload = False, fieldsToKeep = None):
+        if (self.numWorkers is None) or (self.numWorkers <= 1) or (len(filesByYear) <= 1):
+            return {year: self.readRawDataFile(filesByYear[year], forceReload, fieldsToKeep) for year in filesByYear}
+
+        with concurrent.futures.ProcessPoolExecutor(max_workers = self.numWorkers) as executor:
+            futures = {year: executor.submit(self.readRawDataFile, filesByYear[year], forceReload, fieldsToKeep) for year in filesByYear}
+            return {year: futures[year].result() for year in filesByYear}
     
-    def readCombinedNewDownload(self, fieldsToKeep = None, forceReload = False):
-        d = {}
-        # Read in combined family + wealth data
-        yearsToGet = [num for num in self.yearsCombinedNewDownloadCollected if num in self.yearsToInclude]
+    def getCombinedNewDownloadFiles(self, years = None):
+        '''
+        :return: {year: fileFullPathNoExtension} for the combined family + wealth files of these years (default yearsToInclude)
+        :rtype: dict
+        '''
+        if years is None:
+            years = self.yearsToInclude
+        yearsToGet = [num for num in self.yearsCombinedNewDownloadCollected if num in years]
+        filesByYear = {}
         for year in yearsToGet:
             # coreName = 'Fam' + str(year) + '_Newdownload'
             coreName = 'fam' + str(year) 
-            tmp = self.readRawDataFile(os.path.join(self.rootDataDir, self.combinedDir, coreName, coreName.upper()), forceReload)
-            if (fieldsToKeep is not None):
-                colsToKeepInDF = (set(fieldsToKeep) & set(tmp.columns))    
-                tmp = tmp[list(colsToKeepInDF)]
-            d[year] = tmp
+            filesByYear[year] = os.path.join(self.rootDataDir, self.combinedDir, coreName, coreName.upper())
+        return filesByYear
+
+    def readCombinedNewDownload(self, fieldsToKeep = None, forceReload = False, years = None):
+        # Read in combined family + wealth data
+        filesByYear = self.getCombinedNewDownloadFiles(years)
+        d = self.readRawDataFiles(filesByYear, forceReload, fieldsToKeep)
                                     
         # self.theData = d  
         return d
         
-    def readFamilyAndWealthData(self, excludeCombinedYears = True, fieldsToKeep = None, forceReload = False):
-        d = {}
+    def getFamilyAndWealthFiles(self, excludeCombinedYears = True, years = None):
+        '''
+        :return: {(file type, year): fileFullPathNoExtension} for the separate family and wealth files of these years (default yearsToInclude)
+        :rtype: dict
+        '''
+        if years is None:
+            years = self.yearsToInclude
         # Read in family data
         if (excludeCombinedYears):
-            yearsToGet = [num for num in self.yearsFamilyDataCollected if ((num in self.yearsToInclude) and (num not in self.yearsCombinedNewDownloadCollected))]
+            yearsToGet = [num for num in self.yearsFamilyDataCollected if ((num in years) and (num not in self.yearsCombinedNewDownloadCollected))]
         else:
-            yearsToGet = [num for num in self.yearsFamilyDataCollected if num in self.yearsToInclude]
-            
+            yearsToGet = [num for num in self.yearsFamilyDataCollected if num in years]
+
+        # Family and wealth files are read in the same batch; keys are (file type, year)
+        filesToRead = {}
         for year in yearsToGet:
             coreName = 'fam' + str(year) + ('er' if year >= 1994 else '')
-            tmp = self.readRawDataFile(os.path.join(self.rootDataDir, self.familyDir, coreName, coreName.upper()), forceReload)
-            if (fieldsToKeep is not None):
-                colsToKeepInDF = (set(fieldsToKeep) & set(tmp.columns))    
-                tmp = tmp[list(colsToKeepInDF)]
-            d[year] = tmp
+            filesToRead[('family', year)] = os.path.join(self.rootDataDir, self.familyDir, coreName, coreName.upper())
                                     
         # read in wealth data
         if (excludeCombinedYears):
-            yearsToGet = [num for num in self.yearsWealthDataCollected if ((num in self.yearsToInclude) and (num not in self.yearsCombinedNewDownloadCollected))]
+            yearsToGet = [num for num in self.yearsWealthDataCollected if ((num in years) and (num not in self.yearsCombinedNewDownloadCollected))]
         else:
-            yearsToGet = [num for num in self.yearsWealthDataCollected if num in self.yearsToInclude]
+            yearsToGet = [num for num in self.yearsWealthDataCollected if num in years]
             
         for year in yearsToGet:
             coreName = 'wlth' + str(year)
-            wealth = self.readRawDataFile(os.path.join(self.rootDataDir, self.wealthDir, coreName, coreName.upper()), forceReload)
-            if (fieldsToKeep is not None):
-                colsToKeepInDF = (set(fieldsToKeep) & set(wealth.columns))
-                wealth = wealth[list(colsToKeepInDF)]
-            
-            if (len(wealth.columns) > 0):
-                d[year] = d[year].join(wealth) # Left Join in Wealth.  Careful - is the index set correctly for both?
+            filesToRead[('wealth', year)] = os.path.join(self.rootDataDir, self.wealthDir, coreName, coreName.upper())
+        return filesToRead
+
+    def readFamilyAndWealthData(self, excludeCombinedYears = True, fieldsToKeep = None, forceReload = False, years = None):
+        filesToRead = self.getFamilyAndWealthFiles(excludeCombinedYears, years)
+        loaded = self.readRawDataFiles(filesToRead, forceReload, fieldsToKeep)
+
+        d = {}
+        for (fileType, year) in filesToRead:
+            if fileType == 'family':
+                d[year] = loaded[(fileType, year)]
+
+        for (fileType, year) in filesToRead:
+            if fileType == 'wealth':
+                wealth = loaded[(fileType, year)]
+                if (len(wealth.columns) > 0):
+                    d[year] = d[year].join(wealth) # Left Join in Wealth.  Careful - is the index set correctly for both?
         # self.theData = d  
         return d
 
     def readActiveSavingData(self, fieldsToKeep = None, forceReload = False):
-        d = {}
         # Read in family data
         yearsToGet = [num for num in self.yearsActiveSavingCollected if num in self.yearsToInclude]
-
+        filesByYear = {}
         for year in yearsToGet:
             coreName = 'ACT' + str(year)[2:4] 
-            tmp = self.readRawDataFile(os.path.join(self.rootDataDir, self.savingDir, coreName.upper()), forceReload)
-            if (fieldsToKeep is not None):
-                colsToKeepInDF = (set(fieldsToKeep) & set(tmp.columns))    
-                tmp = tmp[list(colsToKeepInDF)]
-            d[year] = tmp
+            filesByYear[year] = os.path.join(self.rootDataDir, self.savingDir, coreName.upper())
+        d = self.readRawDataFiles(filesByYear, forceReload, fieldsToKeep)
                                     
         # read in wealth data
         return d
 
-    def readIndividualData(self, fieldsToKeep = None, forceReload = False):
+    def getIndividualFile(self):
         # Individual data
         # coreName = "ind2017er"
         coreName = "ind2019er"
-        dta = self.readRawDataFile(os.path.join(self.rootDataDir, self.individualDir, coreName, coreName.upper()))
-        if (fieldsToKeep is not None):
-            colsToKeepInDF = (set(fieldsToKeep) & set(dta.columns))    
-            dta = dta[list(colsToKeepInDF)]
+        return os.path.join(self.rootDataDir, self.individualDir, coreName, coreName.upper())
+
+    def readIndividualData(self, fieldsToKeep = None, forceReload = False):
+        dta = self.readRawDataFile(self.getIndividualFile(), forceReload, fieldsToKeep)
         return dta 
     
     def readConsumptionCrossWalk(self):
@@ -132,9 +213,41 @@ class RawLoader:
         concw = copy.deepcopy(concw.loc[2:])
         return concw
            
-    def loadRawPSID_FamilyOnly(self, fieldsToKeep = None, forceReload = False):
-        dict1 = self.readCombinedNewDownload(fieldsToKeep= fieldsToKeep, forceReload=forceReload)
-        dict2 = self.readFamilyAndWealthData(excludeCombinedYears=True, fieldsToKeep= fieldsToKeep, forceReload=forceReload)
+    def getFamilyYears(self):
+        '''
+        The years loadRawPSID_FamilyOnly returns data for
+        '''
+        yearsCombined = [num for num in self.yearsCombinedNewDownloadCollected if num in self.yearsToInclude]
+        yearsFamily = [num for num in self.yearsFamilyDataCollected if ((num in self.yearsToInclude) and (num not in self.yearsCombinedNewDownloadCollected))]
+        return sorted(yearsFamily + yearsCombined)
+
+    def getFamilyFiles(self, years = None):
+        '''
+        :return: {year: [fileFullPathNoExtension, ...]} -- the raw files loadRawPSID_FamilyOnly reads for each year
+        :rtype: dict
+        '''
+        filesByYear = {}
+        for (fileType, year), fileName in self.getFamilyAndWealthFiles(excludeCombinedYears=True, years=years).items():
+            filesByYear.setdefault(year, []).append(fileName)
+        for year, fileName in self.getCombinedNewDownloadFiles(years).items():
+            filesByYear.setdefault(year, []).append(fileName)
+        return filesByYear
+
+    def getRawFileStamp(self, fileFullPathNoExtension):
+        '''
+        Size and modification time of what readRawDataFile reads this file from: the raw .txt and .sas files if we have them,
+        otherwise our Parquet or CSV copy. A new PSID release changes the stamp.
+        :rtype: str
+        '''
+        for extensions in [[".txt", ".sas"], [".parquet"], [".csv"]]:
+            if all([os.path.exists(fileFullPathNoExtension + extension) for extension in extensions]):
+                stats = [os.stat(fileFullPathNoExtension + extension) for extension in extensions]
+                return ";".join([extension + ":" + str(x.st_size) + ":" + str(x.st_mtime_ns) for extension, x in zip(extensions, stats)])
+        return None
+
+    def loadRawPSID_FamilyOnly(self, fieldsToKeep = None, forceReload = False, years = None):
+        dict1 = self.readCombinedNewDownload(fieldsToKeep= fieldsToKeep, forceReload=forceReload, years=years)
+        dict2 = self.readFamilyAndWealthData(excludeCombinedYears=True, fieldsToKeep= fieldsToKeep, forceReload=forceReload, years=years)
         dict2.update(dict1)
         self.rawFam = dict2
         return self.rawFam
@@ -0,0 +1,193 @@
+import numpy as np
+import pandas as pd
+
+'''
+Table-driven recoding of PSID variables.
+
+Instead of one Series.replace call after another, the recodes are written down as rules (see FamilyRecodeSpec):
+which variable, from which source variable (by default, itself), for which years, the map from PSID codes to new values
+(e.g. 1 -> True, 5 -> False), and the sentinel codes (DK, NA, 0 = Inap.) that become missing.
+
+Each rule's map is compiled once, into sorted numpy arrays, so applying it is a single vectorized pass over the column
+instead of Series.replace's object-dtype dict lookups.  The values are the same as Series.replace gives, but the dtype is more predictable:
+a numeric column recoded to numbers or missing stays numeric (with NaN, not None), whatever order the map is in.
+Because the rules are just data, they can be filtered by year, compared across versions etc - see RecodeSpec.toDataFrame
+'''
+
+def isNumber(value):
+    return isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, (bool, np.bool_))
+
+def isNaN(value):
+    return isinstance(value, (float, np.floating)) and np.isnan(value)
+
+
+class CompiledValueMap:
+
+    def __init__(self, valueMap):
+        '''
+        :param valueMap: {PSID code: new value}, as you'd pass to Series.replace. The codes must be numbers
+        :type valueMap: dict
+        '''
+        self.valueMap = valueMap
+
+        keys = []
+        values = []
+        self.nanValue = None
+        self.hasNanKey = False
+        for key, value in valueMap.items():
+            if not isNumber(key):
+                raise Exception("Can only compile numeric codes, not " + str(key))
+            if isNaN(key):
+                # replace treats NaN as a code like any other; NaN -> NaN does nothing though
+                if not isNaN(value):
+                    self.hasNanKey = True
+                    self.nanValue = value
+            else:
+                keys.append(key)
+                values.append(value)
+
+        order = np.argsort(np.array(keys, dtype=float), kind='stable')
+        self.keys = np.array(keys, dtype=float)[order]
+        self.values = np.empty(len(keys) + 1, dtype=object)  # The last slot holds the value for NaN, if any
+        self.values[:len(keys)] = [values[i] for i in order]
+        self.values[len(keys)] = self.nanValue
+
+    def findMatches(self, asFloat):
+        '''
+        :return: (which rows have a code in the map, and the position of that code's value in self.values)
+        '''
+        if len(self.keys) > 0:
+            positions = np.searchsorted(self.keys, asFloat)
+            positions[positions == len(self.keys)] = 0
+            matched = (self.keys[positions] == asFloat)
+        else:
+            positions = np.zeros(len(asFloat), dtype=int)
+            matched = np.zeros(len(asFloat), dtype=bool)
+        if self.hasNanKey:
+            isMissing = np.isnan(asFloat)
+            positions[isMissing] = len(self.keys)
+            matched = matched | isMissing
+        return matched, positions
+
+    def apply(self, series):
+        '''
+        Recode the series; equivalent to series.replace(self.valueMap)
+        :rtype: Series
+        '''
+        if (not isinstance(series.dtype, np.dtype)) or (series.dtype.kind not in 'iuf'):
+            # Strings, bools, all-None columns etc: these are rare, so let pandas handle them
+            return series.replace(self.valueMap)
+
+        values = series.to_numpy()
+        matched, positions = self.findMatches(values.astype(float, copy=False))
+        if not matched.any():
+            return series
+        matchedPositions = positions[matched]
+        usedValues = self.values[np.unique(matchedPositions)]
+
+        if all([isNumber(x) or (x is None) for x in usedValues]):
+            # Stay numeric, with None as NaN. Like replace, ints only become floats if a new value needs it
+            if (values.dtype.kind in 'iu') and all([isNumber(x) and (not isNaN(x)) and float(x).is_integer() and
+                                                     np.iinfo(values.dtype).min <= x <= np.iinfo(values.dtype).max for x in usedValues]):
+                resultType = values.dtype
+            elif values.dtype.kind == 'f':
+                resultType = values.dtype
+            else:
+                resultType = np.float64
+            result = values.astype(resultType, copy=True)
+            newValues = self.values[matchedPositions]
+            newValues[np.equal(newValues, None)] = np.NaN
+            result[matched] = newValues.astype(resultType)
+        else:
+            result = values.astype(object)
+            result[matched] = self.values[matchedPositions]
+            if matched.all() and all([isinstance(x, (bool, np.bool_)) for x in usedValues]):
+                result = result.astype(bool)
+
+        return pd.Series(result, index=series.index, name=series.name)
+
+
+def compileValueMap(valueMap = {}, naCodes = [], naValue = np.NaN):
+    '''
+    :param valueMap: {PSID code: new value}
+    :type valueMap: dict
+    :param naCodes: codes that mean the value is missing (DK, NA etc)
+    :type naCodes: list
+    :param naValue: what missing codes become: NaN for amounts, None for labels and flags
+    :rtype: CompiledValueMap
+    '''
+    fullMap = {code: naValue for code in naCodes}
+    fullMap.update(valueMap)
+    return CompiledValueMap(fullMap)
+
+def recode(series, valueMap = {}, naCodes = [], naValue = np.NaN):
+    ''' One-off recode, for maps that depend on arguments (e.g. DK codes passed in); equivalent to Series.replace '''
+    return compileValueMap(valueMap, naCodes, naValue).apply(series)
+
+
+def recodeRule(step, variable, valueMap = {}, naCodes = [], naValue = np.NaN, source = None, fromYear = None, toYear = None, dtype = None, optional = False):
+    '''
+    One line of a recode spec
+    :param step: the point in the recoding process where this is applied; rules are applied a step at a time, in the order given
+    :type step: str
+    :param variable: the variable to write the recoded values to
+    :type variable: str
+    :param valueMap: {PSID code: new value}
+    :type valueMap: dict
+    :param naCodes: codes that mean the value is missing (DK, NA, Inap. etc)
+    :type naCodes: list
+    :param naValue: what missing codes become: NaN for amounts, None for labels and flags
+    :param source: the variable to read the codes from, if not variable itself
+    :type source: str
+    :param fromYear: first year the rule applies to (None for no limit)
+    :type fromYear: int
+    :param toYear: last year the rule applies to (None for no limit)
+    :type toYear: int
+    :param dtype: convert the result to this type (e.g. 'bool') after recoding
+    :type dtype: str
+    :param optional: if True, skip the rule when the source variable isn't there; otherwise, that's an error
+    :type optional: bool
+    :rtype: dict
+    '''
+    return {'step': step, 'variable': variable, 'source': variable if source is None else source,
+            'fromYear': fromYear, 'toYear': toYear,
+            'valueMap': valueMap, 'naCodes': naCodes, 'naValue': naValue,
+            'dtype': dtype, 'optional': optional}
+
+
+class RecodeSpec:
+
+    def __init__(self, rules):
+        '''
+        :param rules: the rules, made with recodeRule
+        :type rules: list
+        '''
+        self.rules = rules
+        self.compiledMaps = [compileValueMap(rule['valueMap'], rule['naCodes'], rule['naValue']) for rule in rules]
+
+    def getRuleIndices(self, step, year):
+        return [i for i, rule in enumerate(self.rules) if (rule['step'] == step) and
+                ((rule['fromYear'] is None) or (year >= rule['fromYear'])) and
+                ((rule['toYear'] is None) or (year <= rule['toYear']))]
+
+    def apply(self, dta, step, year):
+        '''
+        Apply the rules for this step and year to dta, in place
+        '''
+        for i in self.getRuleIndices(step, year):
+            rule = self.rules[i]
+            if rule['source'] not in dta.columns:
+                if rule['optional']:
+                    continue
+                raise Exception("Can't recode " + rule['variable'] + ": " + rule['source'] + " isn't in the " + str(year) + " data")
+            result = self.compiledMaps[i].apply(dta[rule['source']])
+            if rule['dtype'] is not None:
+                result = result.astype(rule['dtype'])
+            dta[rule['variable']] = result
+
+    def toDataFrame(self):
+        '''
+        :return: the rules as a table, one row per rule
+        :rtype: DataFrame
+        '''
+        return pd.DataFrame(self.rules, columns = ['step', 'variable', 'source', 'fromYear', 'toYear', 'valueMap', 'naCodes', 'naValue', 'dtype', 'optional'])
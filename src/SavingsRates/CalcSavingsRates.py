@@ -1,4 +1,5 @@
 import os
+import concurrent.futures
 from Survey.SurveyFunctions import *
 import Inflation.CPI_InflationReader as CPI_InflationReader
 import MStarReport.InequalityAnalysisBase as InequalityAnalysisBase
@@ -26,6 +27,114 @@ def calcNominalRoRfromChange_Series(dta, startValueField_Uninflated, changeField
 def calcNominalRoRfromChange_Value(startValue_Uninflated, change_Inflated, duration, inflationFactorForEnd):
     return (((change_Inflated / (startValue_Uninflated*inflationFactorForEnd)) + 1)**(1/duration) - 1)
 
+''' Asset classes where the flow (amount bought & sold) is known.
+Each household falls into one of these categories for each asset class, based on the status of its data '''
+FLOW_CATEGORIES = ["Verified Non-Saver (Doesn't have account)", 'New Account', 'Closed Account', 'Both Balances + Flow',
+                   'No Flow, Zero Balances', 'No Flow, One Balance', 'No Flow, Two Balances',
+                   'Flow, Zero Balances', 'Flow, One Balance']
+# The first nine line up with the categories; the last two are the alternates for 'No Flow, Two Balances' and 'Flow, One Balance'
+FLOW_STATUSES = ['Verified Non-Saver', 'New Account', 'Closed Account', 'Both Balances + Flow',
+                 'No Flow, Zero Balances', 'No Flow, One Balance', 'No Flow, Two Balances: ImpliedCapGains, NoSavings',
+                 'Flow, No Balance', 'Flow, One Balance {FilledBalance from DefaultCapGains}',
+                 'No Flow, Two Balances: NoSavingsNoCapGains', 'Flow, One Balance {No DefaultCapGains}']
+
+def calcFlowBasedSavingsAndGains(startValues, endValues, flowsIn, flowsOut, hasStart, hasEnd, duration,
+                                 inflationForStock_StartOfPeriod, inflationForStock_EndOfPeriod, inflationForStock_BetweenStartAndEnd,
+                                 inflationForFlow, defaultNominalCapGainsRates, acceptableImpliedAnnualNominalCapGains):
+    '''
+    Savings, capital gains, open/close transfers and total change for every household and asset class at once.
+    All of the matrices are households x asset classes, with NaN for missing data.
+    :param hasStart: 1 if the household reported having the asset at the start, 0 if not, NaN if unknown
+    :type hasStart: ndarray
+    :param inflationForFlow: one per asset class
+    :type inflationForFlow: ndarray
+    :param defaultNominalCapGainsRates: one per asset class; NaN if there is no reasonable default
+    :type defaultNominalCapGainsRates: ndarray
+    :return: a households x asset classes matrix for each result, including the start & end values with missing balances filled in
+    :rtype: dict
+    '''
+    hasStartValue = ~np.isnan(startValues)
+    hasEndValue = ~np.isnan(endValues)
+    hasFlow = ~(np.isnan(flowsIn) & np.isnan(flowsOut))
+    hasDefaultRate = np.broadcast_to(~np.isnan(defaultNominalCapGainsRates), startValues.shape)
+
+    hasZeroBalances = (~hasStartValue & ~hasEndValue) | ((hasStart == 0) & (hasEnd == 0))
+    hasBothBalances = ~hasZeroBalances & hasStartValue & hasEndValue
+    hasOneBalance = ~hasZeroBalances & ~hasBothBalances
+
+    # We can reasonably assume that if someone put in a value for IN and not OUT, that's because there was no OUT. And vice versa.
+    isKnownNonSaver = (startValues == 0) & (endValues == 0) & \
+                      (np.isnan(flowsIn) | (flowsIn == 0)) & (np.isnan(flowsOut) | (flowsOut == 0))
+    # Perhaps some accounts are labeled as not existing, but there is a balance...
+    isNewAccount = (hasStart == 0) & (startValues == 0) & (hasEnd == 1) & (endValues != 0)
+    isClosedAccount = (hasStart == 1) & (startValues != 0) & (hasEnd == 0) & (endValues == 0)
+
+    # The first matching condition wins, so the categories are mutually exclusive and comprehensive by construction
+    category = np.select([isKnownNonSaver, isNewAccount, isClosedAccount,
+                          hasBothBalances & hasFlow, hasZeroBalances & ~hasFlow, hasOneBalance & ~hasFlow,
+                          hasBothBalances & ~hasFlow, hasZeroBalances & hasFlow], np.arange(8), 8)
+    isNoFlowOneBalance = (category == 5)
+    isNoFlowTwoBalances = (category == 6)
+    isFlowOneBalance = (category == 8)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        flowSavings = (np.where(np.isnan(flowsIn), 0, flowsIn) - np.where(np.isnan(flowsOut), 0, flowsOut)) * inflationForFlow
+
+        # Fill in the missing balance, so net wealth (aggregated by accounts) doesn't jump around
+        # No Flow: the balance hasn't changed in REAL terms. No savings, no cap gains.
+        # Flow: the balance has grown by the default cap gains rate, if there is one, plus savings
+        growth = (1.0 + defaultNominalCapGainsRates) ** duration
+        shrink = (1.0 - defaultNominalCapGainsRates) ** duration
+        savingsAtEnd = flowSavings / inflationForStock_EndOfPeriod
+        filledEndValues = np.select([isNoFlowOneBalance, isFlowOneBalance & hasDefaultRate, isFlowOneBalance],
+                                    [startValues * inflationForStock_BetweenStartAndEnd, startValues * growth + savingsAtEnd, startValues + savingsAtEnd], np.NaN)
+        filledStartValues = np.select([isNoFlowOneBalance, isFlowOneBalance & hasDefaultRate, isFlowOneBalance],
+                                      [endValues / inflationForStock_BetweenStartAndEnd, (endValues - savingsAtEnd) * shrink, endValues - savingsAtEnd], np.NaN)
+        fillsBalance = isNoFlowOneBalance | isFlowOneBalance
+        startValues = np.where(fillsBalance & ~hasStartValue, filledStartValues, startValues)
+        endValues = np.where(fillsBalance & ~hasEndValue, filledEndValues, endValues)
+
+        # New accounts count the whole balance as saving (a likely rollover), and closed accounts count it as dissaving.
+        # This will mess up Asset-Level savings rates, but will wash out in Household-level rates
+        changeInValue = endValues * inflationForStock_EndOfPeriod - startValues * inflationForStock_StartOfPeriod
+        totalChange = np.where(np.isin(category, [4, 5, 7]), np.NaN, changeInValue)
+        openCloseTransfers = np.where(np.isin(category, [1, 2]), changeInValue, np.NaN)
+
+        # No Flow, Two Balances: calculate capital gains AS IF Flow were zero.  If it's "reasonable", keep it.
+        impliedRate = np.where(isNoFlowTwoBalances, ((totalChange / (startValues * inflationForStock_EndOfPeriod)) + 1.0) ** (1.0 / duration) - 1.0, np.NaN)
+        approxImpliedRate = np.where(isNoFlowTwoBalances, (totalChange / duration) / (startValues * inflationForStock_EndOfPeriod), np.NaN)
+        hasOkImpliedCapGains = isNoFlowTwoBalances & (startValues != endValues) & (np.abs(impliedRate) < acceptableImpliedAnnualNominalCapGains)
+
+        savings = np.select([category <= 2, np.isin(category, [3, 7, 8]), hasOkImpliedCapGains], [0.0, flowSavings, 0.0], np.NaN)
+        capitalGains = np.select([category <= 2, (category == 3) | (isFlowOneBalance & hasDefaultRate), hasOkImpliedCapGains],
+                                 [0.0, totalChange - savings, totalChange], np.NaN)
+        capitalGainsDoubleCheck = np.where(isFlowOneBalance & hasDefaultRate, startValues * (growth - 1) * inflationForStock_EndOfPeriod, np.NaN)
+
+        status = category.copy()
+        status[isNoFlowTwoBalances & ~hasOkImpliedCapGains] = 9
+        status[isFlowOneBalance & ~hasDefaultRate] = 10
+
+        # And finally, some rates of change.  Generally these will be noisy, but useful for medians
+        isAccountChange = ((hasStart == 0) & (startValues == 0) & (hasEnd == 1) & (endValues != 0)) | \
+                          ((hasStart == 1) & (startValues != 0) & (hasEnd == 0) & (endValues == 0))
+        enoughDataForRates = ~isAccountChange & ~np.isnan(startValues)
+        calcRate = lambda change: ((change / (startValues * inflationForStock_EndOfPeriod)) + 1.0) ** (1.0 / duration) - 1.0
+
+        return {'category': category,
+                'Status': np.array(FLOW_STATUSES, dtype=object)[status],
+                'TotalChangeInWealth': totalChange,
+                'CapitalGains': capitalGains,
+                'Savings': savings,
+                'OpenCloseTransfers': openCloseTransfers,
+                'AN_CapitalGainsRate': np.where(enoughDataForRates & ~np.isnan(capitalGains), calcRate(capitalGains), np.NaN),
+                'AN_SavingsRate': np.where(enoughDataForRates & ~np.isnan(capitalGains), calcRate(savings), np.NaN),
+                'AN_TotalGrowthRate': np.where(enoughDataForRates & ~np.isnan(totalChange), calcRate(totalChange), np.NaN),
+                'CapitalGainsRate_Implied': impliedRate,
+                'CapitalGainsRate_ApproxImplied': approxImpliedRate,
+                'CapitalGains_DoubleCheck': capitalGainsDoubleCheck,
+                'startValues': startValues,
+                'endValues': endValues}
+
 class CalcSavingsRates(InequalityAnalysisBase.InequalityAnalysisBase):
     '''
     Calculate Household-Asset-level savings & cap gains, then calculate HH-level savings rates.
@@ -47,6 +156,7 @@ class CalcSavingsRates(InequalityAnalysisBase.InequalityAnalysisBase):
 
     CLASS_acceptable_implied_annual_nominal_capgains = 0.2 # 20%
     CLASS_assumed_investment_fees = 0.005 # 50 Bps
+    CLASS_investment_return_fields = {'Stock': 'Stock', 'Bond': 'Bond', 'Blended': '70-30'}
     # CLASS_assumed_annual_nominal_vehicle_appreciation = -0.05 # Loses 5% of value each year
     CLASS_assumed_annual_nominal_vehicle_appreciation = 0.00 # Loses 5% of value each year
 
@@ -55,34 +165,82 @@ class CalcSavingsRates(InequalityAnalysisBase.InequalityAnalysisBase):
         self.inflator = CPI_InflationReader.CPIInflationReader()
         self.investmentReturns = pd.read_csv(os.path.join(self.baseDir, "otherInput", "annualReturns_Mstar.csv"))
         self.investmentReturns.Date = pd.to_datetime(self.investmentReturns.Date)
+        self.cumulativeReturns = None  # Built the first time we need them
+        self.investmentReturnsBySpan = {}  # Looked up ahead of time, for batch mode
         self.excludeRetirementSavings = None
 
+    def buildCumulativeReturns(self):
+        '''
+        Index the annual returns by year, as running products (net of fees), so the return over any span is one division
+        :return: the first year, the number of years with data up to each year, and the running products for each type
+        :rtype: tuple
+        '''
+        yearEnds = self.investmentReturns.loc[(self.investmentReturns.Date.dt.month == 12) & (self.investmentReturns.Date.dt.day == 31)]
+        years = yearEnds.Date.dt.year.to_numpy()
+        firstYear = int(years.min())
+
+        # A year with no row, or more than one, can't be used
+        rowsPerYear = np.bincount(years - firstYear)
+        hasYear = (rowsPerYear == 1)
+        numYearsKnown = np.concatenate([[0], np.cumsum(hasYear)])
+
+        cumulativeReturns = {}
+        for type, field in self.CLASS_investment_return_fields.items():
+            returns_1Coded = np.ones(len(hasYear))
+            returns_1Coded[years[hasYear[years - firstYear]] - firstYear] = \
+                1 + yearEnds.loc[hasYear[years - firstYear], field].to_numpy(dtype=float) - self.CLASS_assumed_investment_fees
+            cumulativeReturns[type] = np.concatenate([[1.0], np.cumprod(returns_1Coded)])
+        return firstYear, numYearsKnown, cumulativeReturns
+
+    def getNominalInvestmentReturns_ZeroCoded(self, type, startYears, endYears):
+        '''
+        The compound return for each span, as in getNominalInvestmentReturn_ZeroCoded
+        :param type: Stock, Bond or Blended
+        :type type: str
+        :param startYears: the first year of each span
+        :type startYears: array-like
+        :param endYears: the last year of each span (or a single year, for all of them)
+        :type endYears: array-like or int
+        :rtype: ndarray
+        '''
+        if type not in self.CLASS_investment_return_fields:
+            raise Exception("Cant find appropriate investment data type")
+        if self.cumulativeReturns is None:
+            self.cumulativeReturns = self.buildCumulativeReturns()
+        firstYear, numYearsKnown, cumulativeReturns = self.cumulativeReturns
+
+        startYears = np.asarray(startYears, dtype=np.int64)
+        endYears = np.maximum(np.broadcast_to(np.asarray(endYears, dtype=np.int64), startYears.shape), startYears)  # An empty span has no return
+        startIndexes = np.clip(startYears - firstYear, 0, len(numYearsKnown) - 1)
+        endIndexes = np.clip(endYears - firstYear, 0, len(numYearsKnown) - 1)
+        isKnown = (startYears >= firstYear) & (numYearsKnown[endIndexes] - numYearsKnown[startIndexes] == (endYears - startYears))
+        if not isKnown.all():
+            raise Exception("Cant find appropriate investment data for " + str(np.unique(startYears[~isKnown]).tolist()) + " onwards")
+
+        return cumulativeReturns[type][endIndexes] / cumulativeReturns[type][startIndexes] - 1
+
     def getNominalInvestmentReturn_ZeroCoded(self, type):
 
         # Let's say you're analyzing the period from 1984 to 1989.
         # What is the stock return for that time?
         # Assume you have returns up to the prior year: you'd experience the returns for 1984, 1985, 1986, 1987, 1988
         # The next period would get the returns for 1989+
+        if (type, self.startYear, self.endYear) in self.investmentReturnsBySpan:
+            return self.investmentReturnsBySpan[(type, self.startYear, self.endYear)]
+        return float(self.getNominalInvestmentReturns_ZeroCoded(type, self.startYear, self.endYear))
 
-        returnsThusFar_1Coded = 1
-        for yr in range(self.startYear, self.endYear, 1): # include left boundary, don't include right
-            targetDate = pd.to_datetime("12/31/" + str(yr))
-            row = self.investmentReturns.loc[self.investmentReturns.Date.eq(targetDate),]
-            if len(row) != 1:
-                raise Exception("Cant find appropriate investment data year " + targetDate)
-
-            if (type == "Stock"):
-                preFeeReturn_ZeroCoded = row.Stock.tolist()[0]
-            elif (type == "Bond"):
-                preFeeReturn_ZeroCoded = row.Bond.tolist()[0]
-            elif (type == "Blended"):
-                preFeeReturn_ZeroCoded = row['70-30'].tolist()[0]
-            else:
-                raise Exception("Cant find appropriate investment data type")
-
-            returnsThusFar_1Coded = returnsThusFar_1Coded * (1 + preFeeReturn_ZeroCoded - self.CLASS_assumed_investment_fees)
-
-        return (returnsThusFar_1Coded - 1)
+    def lookupInvestmentReturnsForTimespans(self, timespans):
+        '''
+        Get the returns of every type for all of the timespans in one go, so a gap in the returns shows up before any timespan is calculated
+        :param timespans: (startYear, endYear) for each timespan
+        :type timespans: list
+        '''
+        startYears = [startYear for (startYear, endYear) in timespans]
+        endYears = [endYear for (startYear, endYear) in timespans]
+        for type in self.CLASS_investment_return_fields:
+            returns = self.getNominalInvestmentReturns_ZeroCoded(type, startYears, endYears)
+            for (startYear, endYear), spanReturn in zip(timespans, returns):
+                self.investmentReturnsBySpan[(type, startYear, endYear)] = float(spanReturn)
 
 
     def recalculateTotalWealth(self):
@@ -208,35 +366,29 @@ class CalcSavingsRates(InequalityAnalysisBase.InequalityAnalysisBase):
         self.dta['House_OpenCloseTransfers_' + self.inflatedTimespan] = 0
 
 
+        # The asset classes where we know the flow are calculated together, below
+        flowAssetClasses = []
+
         # 2.    Other real estate – Saving is the amount of money invested in real estate other than main home. Capital gains is the change in the net value of the asset minus saving in this asset.
-        statusCountsPerVar += self.calcSavingsAndGains(valueField='valueOfOtherRealEstate_Net',
+        flowAssetClasses.append(dict(valueField='valueOfOtherRealEstate_Net',
                                  flowFieldIn='OtherRealEstate_SinceLastQYr_AmountBought',
                                  flowFieldOut='OtherRealEstate_SinceLastQYr_AmountSold',
                                  newBaseName='OtherRealEstate',
-                                 inflationForStock_StartOfPeriod=inflationForStock_StartOfPeriod,
-                                 inflationForStock_EndOfPeriod=inflationForStock_EndOfPeriod,
-                                 inflationForStock_BetweenStartAndEnd=totalInflationStartToEndYear,
-                                 inflationForFlow=inflationForFlow)
+                                 inflationForFlow=inflationForFlow))
 
         # 3.    Net equity in farm or business – Saving is the difference between the amount of money invested in farm or business and the amount realized from the sale of such assets. Capital gains is the change in the net value of the asset minus active saving in this asset.
-        statusCountsPerVar += self.calcSavingsAndGains(valueField='valueOfBusiness_Net', flowFieldIn='Business_SinceLastQYr_AmountBought',
+        flowAssetClasses.append(dict(valueField='valueOfBusiness_Net', flowFieldIn='Business_SinceLastQYr_AmountBought',
                                  flowFieldOut='Business_SinceLastQYr_AmountSold',
                                  newBaseName='Business',
-                                 inflationForStock_StartOfPeriod=inflationForStock_StartOfPeriod,
-                                 inflationForStock_EndOfPeriod=inflationForStock_EndOfPeriod,
-                                 inflationForStock_BetweenStartAndEnd=totalInflationStartToEndYear,
-                                 inflationForFlow=inflationForFlow)
+                                 inflationForFlow=inflationForFlow))
 
         # 4.    Stock – Saving is the net value of stock bought or sold. Capital gains is the change in the net value of the asset minus saving in this asset.
-        statusCountsPerVar += self.calcSavingsAndGains(valueField='valueOfBrokerageStocks_Net',
+        flowAssetClasses.append(dict(valueField='valueOfBrokerageStocks_Net',
                                  flowFieldIn='BrokerageStocks_SinceLastQYr_AmountBought',
                                  flowFieldOut='BrokerageStocks_SinceLastQYr_AmountSold',
                                  newBaseName='BrokerageStocks',
-                                 inflationForStock_StartOfPeriod=inflationForStock_StartOfPeriod,
-                                 inflationForStock_EndOfPeriod=inflationForStock_EndOfPeriod,
-                                 inflationForStock_BetweenStartAndEnd=totalInflationStartToEndYear,
                                  inflationForFlow=inflationForFlow,
-                                 defaultNominalCapGainsRate=self.getNominalInvestmentReturn_ZeroCoded("Stock"))
+                                 defaultNominalCapGainsRate=self.getNominalInvestmentReturn_ZeroCoded("Stock")))
 
         # 5.    Checking and savings – A 0 percent annual real rate of return is assumed, so saving equals the change in the net value of the asset.
         statusCountsPerVar += self.calcSavingsAndGains_FixedROR(valueField='valueOfCheckingAndSavings_Net',
@@ -270,15 +422,12 @@ class CalcSavingsRates(InequalityAnalysisBase.InequalityAnalysisBase):
 
         # 9. Add Private IRAs/Annuities here as a distinct Component
         if self.startYear >= 1999:  # the year in which we started getting Value of Private Retirement Plans
-            statusCountsPerVar += self.calcSavingsAndGains(valueField='valueOfPrivateRetirePlan_Gross',
+            flowAssetClasses.append(dict(valueField='valueOfPrivateRetirePlan_Gross',
                                      flowFieldIn='PrivateRetirePlan_SinceLastQYr_AmountMovedIn',
                                      flowFieldOut='PrivateRetirePlan_SinceLastQYr_AmountMovedOut',
                                      newBaseName='PrivateRetirePlan',
-                                     inflationForStock_StartOfPeriod=inflationForStock_StartOfPeriod,
-                                     inflationForStock_EndOfPeriod=inflationForStock_EndOfPeriod,
-                                     inflationForStock_BetweenStartAndEnd=totalInflationStartToEndYear,
                                      inflationForFlow=inflationForFlow,
-                                     defaultNominalCapGainsRate=self.getNominalInvestmentReturn_ZeroCoded("Blended"))
+                                     defaultNominalCapGainsRate=self.getNominalInvestmentReturn_ZeroCoded("Blended")))
         elif self.endYear >= 1989:
             # If we have either IN or OUT we can calc savings
             self.dta['PrivateRetirePlan_Savings_' + self.inflatedTimespan] = (
@@ -315,15 +464,12 @@ class CalcSavingsRates(InequalityAnalysisBase.InequalityAnalysisBase):
             self.dta['retirement_Withdrawal_' + self.eyStr] = None
             # TODO -- see if there is a withdrawl field, for loans etc?
 
-            statusCountsPerVar += self.calcSavingsAndGains(valueField='valueOfEmployerRetirePlan_Gross',
+            flowAssetClasses.append(dict(valueField='valueOfEmployerRetirePlan_Gross',
                                      flowFieldIn='retirementContribHH_TotalForPeriod', flowFieldOut='retirement_Withdrawal',
                                      newBaseName='EmployerRetirePlan',
-                                     inflationForStock_StartOfPeriod=inflationForStock_StartOfPeriod,
-                                     inflationForStock_EndOfPeriod=inflationForStock_EndOfPeriod,
-                                     inflationForStock_BetweenStartAndEnd=totalInflationStartToEndYear,
                                      inflationForFlow=inflationForStock_EndOfPeriod, # Special case since we've already adjusted above
                                      defaultNominalCapGainsRate=self.getNominalInvestmentReturn_ZeroCoded("Blended")
-                                    )
+                                    ))
 
         else:
             self.dta['EmployerRetirePlan_TotalChangeInWealth_' + self.inflatedTimespan] = None
@@ -334,6 +480,12 @@ class CalcSavingsRates(InequalityAnalysisBase.InequalityAnalysisBase):
             self.dta['EmployerRetirePlan_AN_SavingsRate_' + self.inflatedTimespan] = None
             self.dta['EmployerRetirePlan_AN_TotalGrowthRate_' + self.inflatedTimespan] = None
 
+        # All of the classes with known flow, in one pass
+        statusCountsPerVar += self.calcSavingsAndGains(flowAssetClasses,
+                                 inflationForStock_StartOfPeriod=inflationForStock_StartOfPeriod,
+                                 inflationForStock_EndOfPeriod=inflationForStock_EndOfPeriod,
+                                 inflationForStock_BetweenStartAndEnd=totalInflationStartToEndYear)
+
         # Not used in Savings Calc Directly, but useful for comparison to Net Wealth Calc
         self.dta['MortgagePrincipal_TotalChangeInWealth_' + self.inflatedTimespan] = (
                     self.dta['valueOfHouse_Debt_' + self.eyStr].fillna(0) * inflationForStock_EndOfPeriod).sub(
@@ -343,296 +495,73 @@ class CalcSavingsRates(InequalityAnalysisBase.InequalityAnalysisBase):
 
         return statusCountsPerVar
 
-    def calcSavingsAndGains(self, valueField, flowFieldIn, flowFieldOut, newBaseName, inflationForStock_StartOfPeriod,
-                            inflationForStock_EndOfPeriod,
-                            inflationForStock_BetweenStartAndEnd,
-                            inflationForFlow,
-                            defaultNominalCapGainsRate = None):
+    def calcSavingsAndGains(self, assetClasses, inflationForStock_StartOfPeriod, inflationForStock_EndOfPeriod,
+                            inflationForStock_BetweenStartAndEnd):
         '''
-        A helper function to calculate Asset-class level Savings & Capital Gains when the flow is knowns
-        :param valueField:
-        :type valueField:
-        :param flowFieldIn:
-        :type flowFieldIn:
-        :param flowFieldOut:
-        :type flowFieldOut:
-        :param newBaseName:
-        :type newBaseName:
+        A helper function to calculate Asset-class level Savings & Capital Gains when the flow is knowns.
+        All of the asset classes are handled together, as households x asset classes matrices: see calcFlowBasedSavingsAndGains
+        :param assetClasses: for each class: valueField, flowFieldIn, flowFieldOut, newBaseName, inflationForFlow, and optionally defaultNominalCapGainsRate
+        :type assetClasses: list of dict
         :param inflationForStock_StartOfPeriod:
         :type inflationForStock_StartOfPeriod:
         :param inflationForStock_EndOfPeriod:
         :type inflationForStock_EndOfPeriod:
-        :param inflationForFlow:
-        :type inflationForFlow:
-        :return:
-        :rtype:
+        :param inflationForStock_BetweenStartAndEnd:
+        :type inflationForStock_BetweenStartAndEnd:
+        :return: the number of households in each category, for each asset class
+        :rtype: list
         '''
-
-        # Raw Material for figuring out where to place people
-        # For Balances we need answers for BOTH start and finish
-
-        maskForHasZeroBalances = ((self.dta[valueField + '_' + self.syStr].isna()) & (self.dta[valueField + '_' + self.eyStr].isna())) | \
-                                 ((self.dta["has" + newBaseName + "_" + self.syStr] == False) & (self.dta["has" + newBaseName + "_" + self.eyStr] == False))
-        maskForHasBothBalances = (~maskForHasZeroBalances) & (~self.dta[valueField + '_' + self.syStr].isna()) & (~self.dta[valueField + '_' + self.eyStr].isna())
-        maskForHasOneBalance = ((~maskForHasZeroBalances) & ((self.dta[valueField + '_' + self.eyStr].isna()) | (self.dta[valueField + '_' + self.syStr].isna())))
-
-        maskForBalancesAreSame = (self.dta[valueField + '_' + self.syStr].eq(self.dta[valueField + '_' + self.eyStr]))
-
-        # Flow Flow, we can reasonably assume that if someone put in a value for IN and not OUT, that's because there was no OUT
-        # And vice versa.  So, missing flow = when BOTH are  missing
-        maskForBadFlow = ((self.dta[flowFieldIn + '_' + self.eyStr].isna()) & (self.dta[flowFieldOut + '_' + self.eyStr].isna()))
-        maskForGoodFlow = ~maskForBadFlow
-
-        # We place people into one of nine categories based on the status of their data
-        # Category1
-        maskForKnownNonSavers = ( \
-            # Stock P1
-            ((self.dta[valueField + '_' + self.syStr].eq(0))) &
-            # Stock P2
-            ((self.dta[valueField + '_' + self.eyStr].eq(0))) &
-            # Flow In
-            ((self.dta[flowFieldIn + '_' + self.eyStr].isna()) | (self.dta[flowFieldIn + '_' + self.eyStr].eq(0))) &
-            # Flow Out
-            ((self.dta[flowFieldOut + '_' + self.eyStr].isna()) | (self.dta[flowFieldOut + '_' + self.eyStr].eq(0)))
-            )
-
-        # Category2
-        maskForNewAccount =(~maskForKnownNonSavers) & (
-                # Perhaps some accounts are labeled as not existing, but there is a balance...
-                (self.dta["has" + newBaseName + "_" + self.syStr] == False) & (self.dta[valueField + '_' + self.syStr].eq(0)) & \
-                 (self.dta["has" + newBaseName + "_" + self.eyStr] == True) & (self.dta[valueField + '_' + self.eyStr].ne(0))
-                )
-
-        # Category3
-        maskForClosedAccount =(~maskForKnownNonSavers) & (
-                # Perhaps some accounts are labeled as not existing, but there is a balance...
-                (self.dta["has" + newBaseName + "_" + self.syStr] == True) & (self.dta[valueField + '_' + self.syStr].ne(0)) & \
-                 (self.dta["has" + newBaseName + "_" + self.eyStr] == False) & (self.dta[valueField + '_' + self.eyStr].eq(0))
-                )
-
-        allCapturedThusFar = (maskForNewAccount | maskForClosedAccount | maskForKnownNonSavers)
-
-        # Category4
-        maskForAllGood = ((maskForHasBothBalances) & (maskForGoodFlow) & (~allCapturedThusFar))
-
-        # Category5
-        maskForAllBad = ((maskForHasZeroBalances) & (maskForBadFlow) & (~allCapturedThusFar))
-
-        # Category6-9
-        maskForOneBalanceNoFlow = ((maskForHasOneBalance) & (maskForBadFlow) & (~allCapturedThusFar))
-        maskForTwoBalancesNoFlow = ((maskForHasBothBalances) & (maskForBadFlow) & (~allCapturedThusFar))
-        maskForFlowNoBalances = ((maskForHasZeroBalances) & (maskForGoodFlow) & (~allCapturedThusFar))
-        maskForFlowOneBalance = ((maskForHasOneBalance) & (maskForGoodFlow) & (~allCapturedThusFar))
-
-        # Sanity Checks. This is complex logic. Our 7 categories should be mutually exclusive and comprehensive
-        maskMissing = ((~maskForNewAccount) & (~maskForClosedAccount) &
-                        (~maskForAllGood) & (~maskForKnownNonSavers) & (~maskForAllBad) &
-                       (~maskForOneBalanceNoFlow)  & (~maskForTwoBalancesNoFlow) &
-                       (~maskForFlowNoBalances) & (~maskForFlowOneBalance))
-        if sum(maskMissing) > 0:
-            raise Exception("Problem in savings logic - people not covered")
-
-        totalMasked = (sum(maskForAllGood) + sum(maskForKnownNonSavers) + sum(maskForNewAccount) + sum(maskForClosedAccount) +
-                       sum(maskForAllBad) + sum(maskForOneBalanceNoFlow) + sum(maskForTwoBalancesNoFlow) +
-                       sum(maskForFlowNoBalances) + sum(maskForFlowOneBalance))
-        if totalMasked != len(self.dta):
-            raise Exception("Problem in savings logic - people covered more than once")
-
-
-        if newBaseName == "EmployerRetirePlan":
-            print("debug here")
-
-        # Handle the good ones
-        countsPerGroup={"Period": self.inflatedTimespan, "Field": newBaseName,
-                        "Verified Non-Saver (Doesn't have account)": sum(maskForKnownNonSavers),
-                        "New Account": sum(maskForNewAccount),
-                        "Closed Account": sum(maskForClosedAccount),
-                        "Both Balances + Flow": sum(maskForAllGood),
-                        "No Flow, Zero Balances": sum(maskForAllBad),
-                        "No Flow, One Balance": sum(maskForOneBalanceNoFlow),
-                        "No Flow, Two Balances": sum(maskForTwoBalancesNoFlow),
-                        "Flow, Zero Balances": sum(maskForFlowNoBalances),
-                        "Flow, One Balance": sum(maskForFlowOneBalance),
-                        }
-        
-        # Setup a new var for everyone that handles new accounts/closed accounts.
-        self.dta[newBaseName + '_OpenCloseTransfers_' + self.inflatedTimespan] = None
-
-        # Category 1: Handle KNOWN and verified Non-Savers -- these are often unbanked
-        print(valueField + '{Verified Non-Saver}:' + str(len(self.dta.loc[maskForKnownNonSavers])) + ". All set to 0")
-        self.dta.loc[maskForKnownNonSavers, newBaseName + '_Status_' + self.inflatedTimespan] = 'Verified Non-Saver'
-        self.dta.loc[maskForKnownNonSavers, newBaseName + '_TotalChangeInWealth_' + self.inflatedTimespan] = 0
-        self.dta.loc[maskForKnownNonSavers, newBaseName + '_CapitalGains_' + self.inflatedTimespan] = 0
-        self.dta.loc[maskForKnownNonSavers, newBaseName + '_Savings_' + self.inflatedTimespan] = 0
-
-        # Category 2: New Account
-        # So, with new accounts, there's a challenge -- if it is big dollar figure, the person probably transfered from another account.
-        # For retirement for example, that's a rollover, and won't be captured in contribution rates
-        # But, it will be shown as DISSAVING from somewhere else (at the same time, or different time)
-        # To capture that, we should count all of the new balance as saving -- even if some of it is likely cap gains
-        # This will mess up Asset-Level savings rates (so we exclude them below in the per-asset numbers), but  will wash out in Household-level rates
-        print(valueField + '{New Account}:' + str(len(self.dta.loc[maskForNewAccount])) + ". Everything is saving")
-        self.dta.loc[maskForNewAccount, newBaseName + '_Status_' + self.inflatedTimespan] = 'New Account'
-        self.dta.loc[maskForNewAccount, newBaseName + '_TotalChangeInWealth_' + self.inflatedTimespan] = self.dta.loc[maskForNewAccount, valueField + '_' + self.eyStr]* inflationForStock_EndOfPeriod
-        self.dta.loc[maskForNewAccount, newBaseName + '_CapitalGains_' + self.inflatedTimespan] = 0
-        self.dta.loc[maskForNewAccount, newBaseName + '_Savings_' + self.inflatedTimespan] = 0
-        self.dta.loc[maskForNewAccount, newBaseName + '_OpenCloseTransfers_' + self.inflatedTimespan] = self.dta.loc[maskForNewAccount, valueField + '_' + self.eyStr]* inflationForStock_EndOfPeriod
-
-        # Category 3: Closed Account
-        # With closed accounts, there's a similar challenge -- if it is big dollar figure, the person probably transfered from another account.
-        # For retirement for example, that's a rollover, and won't be captured in contribution rates
-        # But, it will be shown as SAVING from somewhere else (at the same time, or different time)
-        # To capture that, we should count all of the old balance DISSAVING -- even if some of it is likely cap gains
-        # This will mess up Asset-Level savings rates, but  will wash out in Household-level rates
-        # Note that we AREN'T including any contributions during the period (net flow).
-        # If, after money is taken out of this account, and moved to another, that will show up as saving there (and be an increased above the dissaving here).
-        print(valueField + '{Closed Account}:' + str(len(self.dta.loc[maskForClosedAccount])) + ". Everything is dissaving")
-        self.dta.loc[maskForClosedAccount, newBaseName + '_Status_' + self.inflatedTimespan] = 'Closed Account'
-        self.dta.loc[maskForClosedAccount, newBaseName + '_TotalChangeInWealth_' + self.inflatedTimespan] = -self.dta.loc[maskForClosedAccount, valueField + '_' + self.syStr] * inflationForStock_StartOfPeriod
-        self.dta.loc[maskForClosedAccount, newBaseName + '_CapitalGains_' + self.inflatedTimespan] = 0
-        self.dta.loc[maskForClosedAccount, newBaseName + '_Savings_' + self.inflatedTimespan] = 0
-        self.dta.loc[maskForClosedAccount, newBaseName + '_OpenCloseTransfers_' + self.inflatedTimespan] = -self.dta.loc[maskForClosedAccount, valueField + '_' + self.syStr] * inflationForStock_StartOfPeriod
-
-        # Category 4: All Good
-        print(valueField + '{Both Balances + Flow}:' + str(len(self.dta.loc[maskForAllGood])) + ". All calculated")
-        self.dta.loc[maskForAllGood, newBaseName + '_Status_' + self.inflatedTimespan] = 'Both Balances + Flow'
-        self.dta.loc[maskForAllGood, newBaseName + '_TotalChangeInWealth_' + self.inflatedTimespan] = (
-            self.dta.loc[maskForAllGood, valueField + '_' + self.eyStr].fillna(0) * inflationForStock_EndOfPeriod).sub(
-            self.dta.loc[maskForAllGood, valueField + '_' + self.syStr].fillna(0) * inflationForStock_StartOfPeriod)
-        self.dta.loc[maskForAllGood, newBaseName + '_Savings_' + self.inflatedTimespan] = self.dta.loc[
-            maskForAllGood, flowFieldIn + '_' + self.eyStr].fillna(0).sub(
-            self.dta.loc[maskForAllGood, flowFieldOut + '_' + self.eyStr].fillna(0)) * inflationForFlow
-        self.dta.loc[maskForAllGood, newBaseName + '_CapitalGains_' + self.inflatedTimespan] = self.dta.loc[
-            maskForAllGood, newBaseName + '_TotalChangeInWealth_' + self.inflatedTimespan].fillna(0).sub(
-            self.dta.loc[maskForAllGood, newBaseName + '_Savings_' + self.inflatedTimespan].fillna(0))
-
-        # Category 5: Handle the KNOWN bad data -- nothing we can do with these
-        if len(self.dta.loc[maskForAllBad]) > 0:
-            print(valueField + '{No Flow, Zero Balances}:' + str(len(self.dta.loc[maskForAllBad])) + ". All set to None")
-            self.dta.loc[maskForAllBad, newBaseName + '_Status_' + self.inflatedTimespan] = 'No Flow, Zero Balances'
-            self.dta.loc[maskForAllBad, newBaseName + '_TotalChangeInWealth_' + self.inflatedTimespan] = None
-            self.dta.loc[maskForAllBad, newBaseName + '_CapitalGains_' + self.inflatedTimespan] = None
-            self.dta.loc[maskForAllBad, newBaseName + '_Savings_' + self.inflatedTimespan] = None
-
-        # Category 6 Handle the ones with only one Balance (no flow)
-        if len(self.dta.loc[maskForOneBalanceNoFlow]) > 0:
-            print(valueField + '{No Flow, One Balance}:' + str(len(self.dta.loc[maskForOneBalanceNoFlow])) + ". All set to None; Filled in Missing Balance")
-            self.dta.loc[maskForOneBalanceNoFlow, newBaseName + '_Status_' + self.inflatedTimespan] = 'No Flow, One Balance'
-            self.dta.loc[maskForOneBalanceNoFlow, newBaseName + '_TotalChangeInWealth_' + self.inflatedTimespan] = None
-            self.dta.loc[maskForOneBalanceNoFlow, newBaseName + '_Savings_' + self.inflatedTimespan] = None
-            self.dta.loc[maskForOneBalanceNoFlow, newBaseName + '_CapitalGains_' + self.inflatedTimespan] = None
-
-            # The missing balance in this case will show a difference in net wealth (aggregated by accounts).
-            # That is in fact an EXISTING problem with the PSID data's net wealth calcs.
-            # To fix that, the best assumption here is that the balance hasn't changed. No savings, no cap gains.
-            # That change is in REAL terms. Total Change in Wealth in REAL terms needs to line up with the change in values below so, we need to apply inflation here.
-            maskForHasStart = maskForOneBalanceNoFlow & (~self.dta[valueField + '_' + self.syStr].isna())
-            maskForHasEnd = maskForOneBalanceNoFlow & (~self.dta[valueField + '_' + self.eyStr].isna())
-            self.dta.loc[maskForHasStart, valueField + '_' + self.eyStr] = self.dta.loc[maskForHasStart, valueField + '_' + self.syStr]*inflationForStock_BetweenStartAndEnd
-            self.dta.loc[maskForHasEnd, valueField + '_' + self.syStr] = self.dta.loc[maskForHasEnd, valueField + '_' + self.eyStr]/inflationForStock_BetweenStartAndEnd
-
-        # Category 7 Handle the ones with both Balances (no flow)
-        if len(self.dta.loc[maskForTwoBalancesNoFlow]) > 0:
-
-            # Total Balances are good -- use them
-            self.dta.loc[maskForTwoBalancesNoFlow, newBaseName + '_TotalChangeInWealth_' + self.inflatedTimespan] = (
-                self.dta.loc[maskForTwoBalancesNoFlow, valueField + '_' + self.eyStr] * inflationForStock_EndOfPeriod).fillna(0).sub(
-                self.dta.loc[maskForTwoBalancesNoFlow, valueField + '_' + self.syStr].fillna(0) * inflationForStock_StartOfPeriod)
-
-            # Calculate capital gains AS IF Flow were zero.  if it's "reasonable", keep it.
-            # This can give an inflated capital gains value. But the alternative is an implied rate of 0
-            # It actually doesn't affect active savings calcs: since the alternative is implied 0 anyway.
-            remainingMask = maskForTwoBalancesNoFlow
-            self.dta.loc[remainingMask, newBaseName + '_CapitalGainsRate_Implied_' + self.inflatedTimespan] = \
-                calcNominalRoRfromChange_Series(dta = self.dta.loc[remainingMask], startValueField_Uninflated = valueField + '_' + self.syStr,
-                                         changeField_Inflated = newBaseName + '_TotalChangeInWealth_' + self.inflatedTimespan, duration = self.duration,
-                                         inflationFactorForEnd = inflationForStock_EndOfPeriod)
-            # Approximation for debugging purpooses:
-            self.dta.loc[remainingMask, newBaseName + '_CapitalGainsRate_ApproxImplied_' + self.inflatedTimespan] = (self.dta.loc[remainingMask, newBaseName + '_TotalChangeInWealth_' + self.inflatedTimespan]/self.duration).div(self.dta.loc[remainingMask, valueField + '_' + self.syStr]*inflationForStock_EndOfPeriod)
-
-            okCapGains = ~maskForBalancesAreSame & maskForTwoBalancesNoFlow & \
-                ((self.dta.loc[remainingMask, newBaseName + '_CapitalGainsRate_Implied_' + self.inflatedTimespan].abs()) < self.CLASS_acceptable_implied_annual_nominal_capgains)
-
-            print(valueField + '{No Flow, Two Balances [IMPLIED CAP GAINS]}:' + str(len(self.dta.loc[okCapGains & maskForTwoBalancesNoFlow])) + ". Cap Gains Implied and Savings are Zero")
-            print(valueField + '{No Flow, Two Balances [IMPLIED CAP GAINS -- subset with SAME BALANCE]}:' + str(len(self.dta.loc[okCapGains & maskForBalancesAreSame & maskForTwoBalancesNoFlow])) + ". Cap Gains and Savings are Zero")
-            self.dta.loc[okCapGains & maskForTwoBalancesNoFlow, newBaseName + '_Status_' + self.inflatedTimespan] = 'No Flow, Two Balances: ImpliedCapGains, NoSavings'
-            self.dta.loc[okCapGains & maskForTwoBalancesNoFlow, newBaseName + '_CapitalGains_' + self.inflatedTimespan] = self.dta.loc[okCapGains & maskForTwoBalancesNoFlow, newBaseName + '_TotalChangeInWealth_' + self.inflatedTimespan]
-            self.dta.loc[okCapGains & maskForTwoBalancesNoFlow, newBaseName + '_Savings_' + self.inflatedTimespan] = 0
-
-            print(valueField + '{No Flow, Two Balances [Cant Calc Capgains & Savings]}:' + str(len(self.dta.loc[~okCapGains & ~maskForBalancesAreSame & maskForTwoBalancesNoFlow])) + ". Cap Gains and Savings are Zero")
-            self.dta.loc[~okCapGains & maskForTwoBalancesNoFlow, newBaseName + '_Status_' + self.inflatedTimespan] = 'No Flow, Two Balances: NoSavingsNoCapGains'
-            self.dta.loc[~okCapGains & maskForTwoBalancesNoFlow, newBaseName + '_CapitalGains_' + self.inflatedTimespan] = None
-            self.dta.loc[~okCapGains & maskForTwoBalancesNoFlow, newBaseName + '_Savings_' + self.inflatedTimespan] = None
-
-        # Category 8 Handle the ones with only Flow (zero balances)
-        if len(self.dta.loc[maskForFlowNoBalances]) > 0:
-            print(valueField + '{Flow, Zero Balances}:' + str(len(self.dta.loc[maskForFlowNoBalances])) + ". Cap Gains and Total are None")
-            self.dta.loc[maskForFlowNoBalances, newBaseName + '_Status_' + self.inflatedTimespan] = 'Flow, Zero Balances'
-            self.dta.loc[maskForFlowNoBalances, newBaseName + '_Savings_' + self.inflatedTimespan] = self.dta.loc[
-                maskForFlowNoBalances, flowFieldIn + '_' + self.eyStr].fillna(0).sub(
-                self.dta.loc[maskForFlowNoBalances, flowFieldOut + '_' + self.eyStr].fillna(0)) * inflationForFlow
-
-            # For employer retirement plans especially, there are many accounts with FLow but no account balance.
-            # Employer retirement plans are almost always invested, and we can model 'reasonable' returns from M* data on these plans.
-            # If we don't their cap gains, we will significantly underestimate total HH cap gains - since this is the prime driver for many familes with accounts
-            # Ideally, we'd keep track of the balance over time from when it started, and fill it in.
-            # But, at this data isn't available here.  So, the best we can do is set to none.
-            self.dta.loc[maskForFlowNoBalances, newBaseName + '_Status_' + self.inflatedTimespan] = 'Flow, No Balance'
-            self.dta.loc[maskForFlowNoBalances, newBaseName + '_CapitalGains_' + self.inflatedTimespan] = None
-            self.dta.loc[maskForFlowNoBalances, newBaseName + '_TotalChangeInWealth_' + self.inflatedTimespan] = None
-
-        # Category 9 Handle the ones with Flow & One balance
-        if len(self.dta.loc[maskForFlowOneBalance]) > 0:
-
-            self.dta.loc[maskForFlowOneBalance, newBaseName + '_Savings_' + self.inflatedTimespan] = self.dta.loc[
-                maskForFlowOneBalance, flowFieldIn + '_' + self.eyStr].fillna(0).sub(
-                self.dta.loc[maskForFlowOneBalance, flowFieldOut + '_' + self.eyStr].fillna(0)) * inflationForFlow
-
-            maskForHasStart = maskForFlowOneBalance & (~self.dta[valueField + '_' + self.syStr].isna())
-            maskForHasEnd = maskForFlowOneBalance & (~self.dta[valueField + '_' + self.eyStr].isna())
-
-            # For employer retirement plans especially, there are many accounts with FLow but no account balance.
-            # Employer retirement plans are almost always invested, and we can model 'reasonable' returns from M* data on these plans.
-            # If we don't their cap gains, we will significantly underestimate total HH cap gains - since this is the prime driver for many familes with accounts
-            if defaultNominalCapGainsRate is not None:
-                print(valueField + '{Flow, One Balance}:' + str(len(self.dta.loc[maskForFlowOneBalance])) + ". Using Default Cap Gains to get Total")
-                self.dta.loc[maskForFlowOneBalance, newBaseName + '_Status_' + self.inflatedTimespan] = 'Flow, One Balance {FilledBalance from DefaultCapGains}'
-
-                # Fill in missing balances -- useful here, AND for subsequent net worth calculations
-                if sum(maskForHasStart) > 0:
-                    self.dta.loc[maskForHasStart, valueField + '_' + self.eyStr] = (self.dta.loc[maskForHasStart, valueField + '_' + self.syStr] * ((1.0 + defaultNominalCapGainsRate)**self.duration)).add(self.dta.loc[maskForHasStart, newBaseName + '_Savings_' + self.inflatedTimespan]/inflationForStock_EndOfPeriod)
-                if sum(maskForHasEnd) > 0:
-                    self.dta.loc[maskForHasEnd, valueField + '_' + self.syStr] = self.dta.loc[maskForHasEnd, valueField + '_' + self.eyStr].sub(self.dta.loc[maskForHasEnd, newBaseName + '_Savings_' + self.inflatedTimespan]/inflationForStock_EndOfPeriod) * ((1.0 - defaultNominalCapGainsRate)**self.duration)
-
-                self.dta.loc[maskForFlowOneBalance, newBaseName + '_TotalChangeInWealth_' + self.inflatedTimespan] = (
-                    self.dta.loc[maskForFlowOneBalance, valueField + '_' + self.eyStr] * inflationForStock_EndOfPeriod).fillna(0).sub(
-                    self.dta.loc[maskForFlowOneBalance, valueField + '_' + self.syStr].fillna(0) * inflationForStock_StartOfPeriod)
-
-                self.dta.loc[maskForFlowOneBalance, newBaseName + '_CapitalGains_' + self.inflatedTimespan] = self.dta.loc[
-                    maskForFlowOneBalance, newBaseName + '_TotalChangeInWealth_' + self.inflatedTimespan].fillna(0).sub(
-                    self.dta.loc[maskForFlowOneBalance, newBaseName + '_Savings_' + self.inflatedTimespan].fillna(0))
-
-                # For debugging purposes
-                self.dta.loc[maskForFlowOneBalance, newBaseName + '_CapitalGains_DoubleCheck_' + self.inflatedTimespan] = self.dta.loc[maskForFlowOneBalance, valueField + '_' + self.syStr] * (((1 + defaultNominalCapGainsRate)**self.duration)-1) * inflationForStock_EndOfPeriod
-            else:
-                print(valueField + '{Flow, One Balance}:' + str(len(self.dta.loc[maskForFlowOneBalance])) + ". Cap Gains and Total are null")
-                self.dta.loc[maskForFlowOneBalance, newBaseName + '_Status_' + self.inflatedTimespan] = 'Flow, One Balance {No DefaultCapGains}'
-                # self.dta.loc[maskForFlowOneBalance, newBaseName + '_TotalChangeInWealth_' + self.inflatedTimespan] = None
-                self.dta.loc[maskForFlowOneBalance, newBaseName + '_CapitalGains_' + self.inflatedTimespan] = None
-
-                # The missing balance in this case will show a difference in net wealth (aggregated by accounts) -- sometimes a massive one, if this is a big account
-                # That is in fact an EXISTING problem with the PSID data's net wealth calcs.
-                # To fix that, the best assumption here is that there is no cap gains & that balance hasn't changed BEYOND SAVINGS
-                self.dta.loc[maskForHasStart, valueField + '_' + self.eyStr] = self.dta.loc[maskForHasStart, valueField + '_' + self.syStr].add(self.dta.loc[maskForHasStart, newBaseName + '_Savings_' + self.inflatedTimespan].fillna(0)/inflationForStock_EndOfPeriod)
-                self.dta.loc[maskForHasEnd, valueField + '_' + self.syStr] = self.dta.loc[maskForHasEnd, valueField + '_' + self.eyStr].sub(self.dta.loc[maskForHasEnd, newBaseName + '_Savings_' + self.inflatedTimespan].fillna(0)/inflationForStock_EndOfPeriod)
-
-                # To make everything balance out, let's keep track of changes in the values of accounts that we don't have complete data for
-                self.dta.loc[maskForFlowOneBalance, newBaseName + '_TotalChangeInWealth_' + self.inflatedTimespan] = (self.dta.loc[maskForFlowOneBalance, valueField + '_' + self.eyStr]*inflationForStock_EndOfPeriod).sub((self.dta.loc[maskForFlowOneBalance, valueField + '_' + self.syStr]*inflationForStock_StartOfPeriod))
-
-        # And finally, calculate some rates of change
-        self.calcAssetLevelGrowthRates(valueField, newBaseName, inflationForStock_EndOfPeriod)
-
-        return [countsPerGroup]
+        if len(assetClasses) == 0:
+            return []
+
+        def getValues(fields, yearStr):
+            return self.dta[[field + '_' + yearStr for field in fields]].to_numpy(dtype=float, na_value=np.NaN)
+
+        def getFlags(yearStr):
+            flags = self.dta[['has' + assetClass['newBaseName'] + '_' + yearStr for assetClass in assetClasses]]
+            return np.where(flags.eq(True), 1.0, np.where(flags.eq(False), 0.0, np.NaN))
+
+        valueFields = [assetClass['valueField'] for assetClass in assetClasses]
+        results = calcFlowBasedSavingsAndGains(
+            startValues=getValues(valueFields, self.syStr),
+            endValues=getValues(valueFields, self.eyStr),
+            flowsIn=getValues([assetClass['flowFieldIn'] for assetClass in assetClasses], self.eyStr),
+            flowsOut=getValues([assetClass['flowFieldOut'] for assetClass in assetClasses], self.eyStr),
+            hasStart=getFlags(self.syStr), hasEnd=getFlags(self.eyStr), duration=self.duration,
+            inflationForStock_StartOfPeriod=inflationForStock_StartOfPeriod,
+            inflationForStock_EndOfPeriod=inflationForStock_EndOfPeriod,
+            inflationForStock_BetweenStartAndEnd=inflationForStock_BetweenStartAndEnd,
+            inflationForFlow=np.array([assetClass['inflationForFlow'] for assetClass in assetClasses]),
+            defaultNominalCapGainsRates=np.array([assetClass.get('defaultNominalCapGainsRate', None) for assetClass in assetClasses], dtype=float),
+            acceptableImpliedAnnualNominalCapGains=self.CLASS_acceptable_implied_annual_nominal_capgains)
+
+        resultFields = ['Status', 'TotalChangeInWealth', 'CapitalGains', 'Savings', 'OpenCloseTransfers',
+                        'AN_CapitalGainsRate', 'AN_SavingsRate', 'AN_TotalGrowthRate']
+        newColumns = {}
+        countsPerGroup = []
+        for i, assetClass in enumerate(assetClasses):
+            newBaseName = assetClass['newBaseName']
+            categoryCounts = np.bincount(results['category'][:, i], minlength=len(FLOW_CATEGORIES))
+            for category, count in zip(FLOW_CATEGORIES, categoryCounts):
+                print(assetClass['valueField'] + '{' + category + '}:' + str(count))
+            countsPerGroup.append(dict({"Period": self.inflatedTimespan, "Field": newBaseName}, **dict(zip(FLOW_CATEGORIES, categoryCounts.tolist()))))
+
+            # For debugging purposes, only where they apply
+            fieldsForClass = list(resultFields)
+            if categoryCounts[FLOW_CATEGORIES.index('No Flow, Two Balances')] > 0:
+                fieldsForClass += ['CapitalGainsRate_Implied', 'CapitalGainsRate_ApproxImplied']
+            if (categoryCounts[FLOW_CATEGORIES.index('Flow, One Balance')] > 0) and (assetClass.get('defaultNominalCapGainsRate', None) is not None):
+                fieldsForClass += ['CapitalGains_DoubleCheck']
+            for field in fieldsForClass:
+                newColumns[newBaseName + '_' + field + '_' + self.inflatedTimespan] = results[field][:, i]
+
+        # Missing balances are filled in -- useful here, AND for subsequent net worth calculations
+        self.dta[[field + '_' + self.syStr for field in valueFields]] = results['startValues']
+        self.dta[[field + '_' + self.eyStr for field in valueFields]] = results['endValues']
+        self.dta = pd.concat([self.dta.drop(columns=list(newColumns.keys()), errors='ignore'),
+                              pd.DataFrame(newColumns, index=self.dta.index)], axis=1)
+
+        return countsPerGroup
 
     def calcSavingsAndGains_FixedROR(self, valueField, newBaseName, nominalAnnualRoR_ZeroCoded, inflationForStock_StartOfPeriod,
                                      inflationForStock_EndOfPeriod):
@@ -947,6 +876,55 @@ class CalcSavingsRates(InequalityAnalysisBase.InequalityAnalysisBase):
         self.clearData()
         self.setPeriod(startYear, endYear, toYear)
         self.readLongitudinalData()
+        statusCounts = self.calcForTimespan()
+
+        # Save all of the data we might need
+        # Note -- The full dataset can be overwhelming....
+        self.saveLongitudinalData()
+
+        return statusCounts
+
+    def executeForAllTimespans(self, timespans, toYear):
+        '''
+        Batch mode: calc all of the timespans in one pass, into a single dataset partitioned by timespan.
+        The next timespan's data is read, and the last one's results written, while the current one is calculated.
+        :param timespans: (startYear, endYear) for each timespan
+        :type timespans: list
+        :param toYear:
+        :type toYear:
+        :return: status counts for all of the timespans
+        :rtype: list
+        '''
+        totalStatusCounts = []
+        if len(timespans) == 0:
+            return totalStatusCounts
+        self.lookupInvestmentReturnsForTimespans(timespans)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+            nextInput = pool.submit(self.loadLongitudinalData, InequalityAnalysisBase.formatInflatedTimeSpanSuffix(timespans[0][0], timespans[0][1], toYear))
+            writes = []
+            for i, (startYear, endYear) in enumerate(timespans):
+                self.clearData()
+                self.setPeriod(startYear, endYear, toYear)
+                self.readLongitudinalData(nextInput.result())
+                if i + 1 < len(timespans):
+                    nextInput = pool.submit(self.loadLongitudinalData, InequalityAnalysisBase.formatInflatedTimeSpanSuffix(timespans[i + 1][0], timespans[i + 1][1], toYear))
+
+                totalStatusCounts += self.calcForTimespan()
+                writes.append(pool.submit(self.saveLongitudinalDataToDataset, self.dta, self.inflatedTimespan))
+
+            # Surface any problems writing
+            for write in writes:
+                write.result()
+
+        return totalStatusCounts
+
+    def calcForTimespan(self):
+        '''
+        Calc asset-class level values, then total family values, for the data loaded for the current period
+        :return: status counts for the period
+        :rtype: list
+        '''
         self.fillNoAccountStockValues()
 
         # self.calcDetermineAssetLevelCapitalGains_GittlemanStyle()
@@ -972,26 +950,27 @@ class CalcSavingsRates(InequalityAnalysisBase.InequalityAnalysisBase):
                                                             'Total_GrossSavings_' + self.inflatedTimespan,
                                                             ], alphabetizeTheOthers=True)
 
-        # Save all of the data we might need
-        # Note -- The full dataset can be overwhelming....
-        self.saveLongitudinalData()
-
         return statusCounts
 
-    def doIt(self, useCleanedDataOnly = True, excludeRetirementSavings = False):
+    def doIt(self, useCleanedDataOnly = True, excludeRetirementSavings = False, batchMode = False):
+        '''
+        :param batchMode: write all of the timespans to one dataset (see executeForAllTimespans) instead of a CSV each
+        :type batchMode: bool
+        '''
         self.useCleanedDataOnly = useCleanedDataOnly
         self.excludeRetirementSavings = excludeRetirementSavings
         toYear = 2019
 
         # self.yearsWealthDataCollected = [2017, 2019]
-        startYear = self.yearsWealthDataCollected[0]
+        timespans = list(zip(self.yearsWealthDataCollected[:-1], self.yearsWealthDataCollected[1:]))
 
-        totalStatusCounts = []
-        for endYear in self.yearsWealthDataCollected[1:]:
-            # Do the core analysis: change in wealth and savings rates over time
-            totalStatusCounts += self.executeForTimespan(startYear, endYear, toYear)
-            # Get ready for next year
-            startYear = endYear
+        if batchMode:
+            totalStatusCounts = self.executeForAllTimespans(timespans, toYear)
+        else:
+            totalStatusCounts = []
+            for (startYear, endYear) in timespans:
+                # Do the core analysis: change in wealth and savings rates over time
+                totalStatusCounts += self.executeForTimespan(startYear, endYear, toYear)
 
         pd.DataFrame(totalStatusCounts).to_csv(os.path.join(self.baseDir,
             self.outputSubDir, self.outputBaseName + "_VarStatusCounts.csv"), index=False)
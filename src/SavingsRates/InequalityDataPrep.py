@@ -1,9 +1,11 @@
 import pandas as pd
 import numpy as np
 import os
+import collections
 from Survey.SurveyFunctions import *
 import Inflation.CPI_InflationReader as CPI_InflationReader
 import MStarReport.InequalityAnalysisBase as InequalityAnalysisBase
+import PSIDProcessing.DtypePolicy as DtypePolicy
 
 
 ''' Key Descriptions
@@ -92,6 +94,9 @@ class InequalityDataPrep(InequalityAnalysisBase.InequalityAnalysisBase):
                             ]
 
 
+    # Processed years are kept for the next timespan (each wealth year ends one timespan and starts the next); at most this many at once
+    maxCachedYears = 4
+
     def __init__(self, baseDir, familyInputSubDir, familyBaseName, individualInputSubDir, individualBaseName, outputSubDir,
                  inputBaseName, outputBaseName,  useOriginalSampleOnly):
         
@@ -105,6 +110,10 @@ class InequalityDataPrep(InequalityAnalysisBase.InequalityAnalysisBase):
 
         self.inflator = CPI_InflationReader.CPIInflationReader()
 
+        # Shared by all timespans: the individual file as read, and the most recently used processed years
+        self.individualDataRaw = None
+        self.processedYears = collections.OrderedDict()
+
 
     def readRawData(self):
         '''
@@ -113,7 +122,10 @@ class InequalityDataPrep(InequalityAnalysisBase.InequalityAnalysisBase):
         :rtype:
         '''
 
-        individualData = pd.read_csv((self.indPath + ".csv"),low_memory=False)
+        if self.individualDataRaw is None:
+            # Kept for every timespan, so read it in the compact types IndividualDataRecoder saved it with
+            self.individualDataRaw = DtypePolicy.readCsv(self.indPath)
+        individualData = self.individualDataRaw
         
         finalWaveAgeVar = "ageI_" + self.eyStr
         
@@ -141,8 +153,10 @@ class InequalityDataPrep(InequalityAnalysisBase.InequalityAnalysisBase):
         for year in (self.yearsWithFamilyData.copy()):
             inidvidualVars = inidvidualVars + ['interviewId_' + str(year)]
             
-        dta = individualData[inidvidualVars].copy() 
+        dta = DtypePolicy.compactFrame(individualData[inidvidualVars].copy()).reset_index(drop=True)
 
+        # Each year is lined up with the individuals' rows as it's processed, and they're all put side by side once at the end
+        yearFrames = [dta]
         familyInterviewVars = []
         
         for year in (self.yearsWithFamilyData.copy()):
@@ -151,37 +165,85 @@ class InequalityDataPrep(InequalityAnalysisBase.InequalityAnalysisBase):
             if ((year == self.startYear) | (year == self.endYear) ):
                 theVars= self.familyFieldsWeNeedStartEnd
         
-            # Bring in a year of family data -- to see observed outcomes 
-            familyDataForYear = pd.read_csv((self.famPath  + str(year) + ".csv"),low_memory=False)
-            self.yearData = familyDataForYear[theVars].copy()
-            self.yearDataYear= year
-
-            self.yearData.columns = [(x + '_' + str(year)) for x in self.yearData.columns]
-            
-            # Clean it, Inflate it, save it.
-            self.processCrossSectionalData()
-
-            self.yearData = InequalityAnalysisBase.selectiveReorder(self.yearData,
-                                                                    ['familyInterviewId_' + str(self.yearDataYear),
-                                                                'familyId1968_' + str(self.yearDataYear),
-                                                                'ChangeInCompositionFU_' + str(self.yearDataYear),
-                                                                'cleaningStatus_' + str(self.yearDataYear),
-                                                                 'modificationStatus_' + str(self.yearDataYear),
-                                                                 ],
-                                                                    alphabetizeTheOthers = True)
-            self.saveCrossSectionalData(self.yearData, self.yearDataYear)
+            # Shared with the other timespans, so it's only read from here: alignYearToIndividuals makes this timespan's copy
+            yearData = self.getProcessedYear(year, theVars)
             
             indInterviewVar = "interviewId_" + str(year)
-            dta = pd.merge(dta, self.yearData, right_on = 'familyInterviewId_'+ str(year), 
-                                left_on = indInterviewVar, 
-                                how = 'left')
+            yearFrames.append(self.alignYearToIndividuals(yearData, 'familyInterviewId_'+ str(year), dta[indInterviewVar]))
 
             familyInterviewVars = familyInterviewVars + ['familyInterviewId_'+ str(year)]
 
+        dta = pd.concat(yearFrames, axis=1)
+
         # TODO -- Drop any all blank-ones
         self.dta = dta.loc[~(dta[familyInterviewVars].isnull().all(axis=1))].copy()
 
 
+    def getProcessedYear(self, year, theVars):
+        '''
+        A year of family data, cleaned, inflated and saved -- from the cache if an earlier timespan already processed it.
+        The frame is the cached one, not a copy: don't change it
+        :rtype: DataFrame
+        '''
+        cacheKey = (year, tuple(theVars), self.toYear, self.useOriginalSampleOnly)
+        if cacheKey in self.processedYears:
+            self.processedYears.move_to_end(cacheKey)
+            return self.processedYears[cacheKey]
+
+        yearData = self.processYear(year, theVars)
+        self.processedYears[cacheKey] = yearData
+        if len(self.processedYears) > self.maxCachedYears:
+            self.processedYears.popitem(last = False)
+        return yearData
+
+    def processYear(self, year, theVars):
+        '''
+        Read a year of family data, clean it, inflate it, and save it
+        :rtype: DataFrame
+        '''
+        # Bring in a year of family data -- to see observed outcomes 
+        # Cleaning adds new values to the label columns, so this is read in the usual types and only compacted once it's clean
+        familyDataForYear = pd.read_csv((self.famPath  + str(year) + ".csv"),low_memory=False)
+        self.yearData = familyDataForYear[theVars].copy()
+        self.yearDataYear= year
+
+        self.yearData.columns = [(x + '_' + str(year)) for x in self.yearData.columns]
+        
+        # Clean it, Inflate it, save it.
+        self.processCrossSectionalData()
+
+        self.yearData = InequalityAnalysisBase.selectiveReorder(self.yearData,
+                                                                ['familyInterviewId_' + str(self.yearDataYear),
+                                                            'familyId1968_' + str(self.yearDataYear),
+                                                            'ChangeInCompositionFU_' + str(self.yearDataYear),
+                                                            'cleaningStatus_' + str(self.yearDataYear),
+                                                             'modificationStatus_' + str(self.yearDataYear),
+                                                             ],
+                                                                alphabetizeTheOthers = True)
+        self.saveCrossSectionalData(self.yearData, self.yearDataYear)
+
+        # The wide frame holds every year side by side, so keep it in compact types (categories, nullable flags etc)
+        return DtypePolicy.compactFrame(self.yearData)
+
+    def alignYearToIndividuals(self, yearData, familyInterviewVar, individualInterviewIds):
+        '''
+        Line up a year of family data with the individuals -- the same as a left merge of the individuals onto it, without copying
+        the individuals' data.  Individuals who weren't in a family that year (id 0 or missing) get empty rows.
+        :param yearData: a year of family data
+        :type yearData: DataFrame
+        :param familyInterviewVar: the family interview id in yearData
+        :type familyInterviewVar: str
+        :param individualInterviewIds: each individual's family interview id that year
+        :type individualInterviewIds: Series
+        :return: yearData, one row per individual, in their order
+        :rtype: DataFrame
+        '''
+        familyIds = pd.Index(yearData[familyInterviewVar].astype(float))
+        if familyIds.has_duplicates:
+            raise Exception("Family interview ids aren't unique in " + familyInterviewVar)
+        aligned = yearData.set_index(familyIds).reindex(individualInterviewIds.astype(float).to_numpy())
+        return aligned.set_index(individualInterviewIds.index)
+
     def processCrossSectionalData(self):
         '''
         Handles all of the cleaning and procesing we need for a year of PSID family+individual data
@@ -434,83 +496,63 @@ class InequalityDataPrep(InequalityAnalysisBase.InequalityAnalysisBase):
 
 
     def calcIfValueOnMoveAndChangedHeadAtAnyPoint(self):    
-
+        '''
+        Over the timespan, add up the (inflated) changes in house value and mortgage debt -- separately for the years the household
+        moved and the years it didn't -- and flag households whose head changed at any point.
+        Works on (households x years) arrays: one column per year from startYear + timeStep, each compared with the year before it.
+        '''
         modificationVar = 'modificationStatus_' + self.timespan
-        self.dta[modificationVar] = ''
-
-        self.dta['ChangeInHeadFU_' + self.timespan] = False
-        
-        # Changes on Move
-        self.dta['House_ValueIncrease_WhenMoving_' + self.inflatedTimespan] = None
-        self.dta['House_TotalChangeInMortgageDebt_WhenMoving_' + self.inflatedTimespan] = None
-
-        # Changes without Move
-        self.dta['House_TotalChangeInMortgageDebt_WhenNotMoving_' + self.inflatedTimespan] = None
-        self.dta['House_ValueIncrease_WhenNotMoving_' + self.inflatedTimespan] = None
-        priorOwnRentStatus = None
-
-        for year in (self.yearsWithFamilyData.copy()):
-            inflationPriorYear =  self.inflator.getInflationFactorBetweenTwoYears(year-self.timeStep, self.toYear)
-            inflationGivenYear =  self.inflator.getInflationFactorBetweenTwoYears(year, self.toYear)
-            movedVar = 'MovedR_' + str(year)
-            housingStatusVar = 'hasHouse_' + str(year)
-            
-            if (year >= (self.startYear + self.timeStep)):
-                
-                # Following Dynan, flag people who moved but didn't report it
-                mask = (self.dta[movedVar] == False) & (~(self.dta[housingStatusVar].isna())) & \
-                       (~(priorOwnRentStatus.isna())) & \
-                       (self.dta[housingStatusVar].ne(priorOwnRentStatus))
-
-                numToUpdate = len(self.dta.loc[mask])
-                print ("fixing " + str(numToUpdate) + " move statuses")
-                if (numToUpdate > 400):
-                    warnings.warn("something ain't right here")
-
-                '''
-                tmp1 = self.dta.loc[mask, ['MovedR_1992', movedVar, 'MovedR_1994', 'hasHouse_1992', housingStatusVar, 'hasHouse_1994', 'valueOfHouse_Gross_1992', 'valueOfHouse_Gross_1993', 'valueOfHouse_Gross_1994', 'familyInterviewId_1992', 'familyInterviewId_1993', 'familyInterviewId_1994',
-                                           'constantFamilyId', 'constantIndividualID']]
-                tmp1.to_csv(os.path.join(self.baseDir, "tmpTest.csv"))
-
-                tmp2 = self.dta[['MovedR_1992', movedVar, 'MovedR_1994', 'hasHouse_1992', housingStatusVar, 'hasHouse_1994', 'valueOfHouse_Gross_1992', 'valueOfHouse_Gross_1993', 'valueOfHouse_Gross_1994', 'familyInterviewId_1992', 'familyInterviewId_1993', 'familyInterviewId_1994',
-                                           'constantFamilyId', 'constantIndividualID']]
-                tmp2.to_csv(os.path.join(self.baseDir, "tmpTestFull.csv"))
-
-                '''
-                # tmp2 = priorOwnRentStatus[mask]
-                # tmp1 = tmp1.join(tmp2)
-
-                self.dta.loc[mask, modificationVar] = self.dta.loc[mask, modificationVar] + "Move Status Changed to True;"
-                self.dta.loc[mask, movedVar]= True
-
-                # if the person moved, add any changes in house value from the move
-                if (self.dta[movedVar].sum() >= 1): # ie not all nones
-                    self.dta.loc[self.dta[movedVar] == True, 'House_ValueIncrease_WhenMoving_' + self.inflatedTimespan] = self.dta.loc[self.dta[movedVar] == True, 'House_ValueIncrease_WhenMoving_' + self.inflatedTimespan].fillna(0) \
-                        .add(self.dta.loc[self.dta[movedVar] == True, 'valueOfHouse_Gross_' + str(year)] * inflationGivenYear, fill_value=0) \
-                        .sub(self.dta.loc[self.dta[movedVar] == True, 'valueOfHouse_Gross_' + str(year-self.timeStep)] * inflationPriorYear, fill_value=0)
-                        
-                    self.dta.loc[ (self.dta[movedVar] == True), 'House_TotalChangeInMortgageDebt_WhenMoving_' + self.inflatedTimespan] = self.dta.loc[ (self.dta[movedVar] == True), 'House_TotalChangeInMortgageDebt_WhenMoving_' + self.inflatedTimespan].fillna(0) \
-                        .add(self.dta.loc[ (self.dta[movedVar] == True), 'valueOfHouse_Debt_' + str(year)] * inflationGivenYear, fill_value=0) \
-                        .sub(self.dta.loc[ (self.dta[movedVar] == True), 'valueOfHouse_Debt_' + str(year-self.timeStep)] * inflationPriorYear, fill_value=0)
-
-                else:
-                    raise Warning("Hmm... Missing moving data")
-                
-                # if the person DIDN'T MOVE, add up the cumulative changes in principal and house value
-                self.dta.loc[ ~(self.dta[movedVar] == True), 'House_ValueIncrease_WhenNotMoving_' + self.inflatedTimespan] = self.dta.loc[ ~(self.dta[movedVar] == True), 'House_ValueIncrease_WhenNotMoving_' + self.inflatedTimespan].fillna(0) \
-                    .add(self.dta.loc[ ~(self.dta[movedVar] == True), 'valueOfHouse_Gross_' + str(year)] * inflationGivenYear, fill_value=0) \
-                    .sub(self.dta.loc[ ~(self.dta[movedVar] == True), 'valueOfHouse_Gross_' + str(year-self.timeStep)] * inflationPriorYear, fill_value=0)
-                self.dta.loc[ ~(self.dta[movedVar] == True), 'House_TotalChangeInMortgageDebt_WhenNotMoving_' + self.inflatedTimespan] = self.dta.loc[ ~(self.dta[movedVar] == True), 'House_TotalChangeInMortgageDebt_WhenNotMoving_' + self.inflatedTimespan].fillna(0) \
-                    .add(self.dta.loc[ ~(self.dta[movedVar] == True), 'valueOfHouse_Debt_' + str(year)] * inflationGivenYear, fill_value=0) \
-                    .sub(self.dta.loc[ ~(self.dta[movedVar] == True), 'valueOfHouse_Debt_' + str(year-self.timeStep)] * inflationPriorYear, fill_value=0)
-
-            priorOwnRentStatus = self.dta[housingStatusVar].copy()
-
-            if (year > self.startYear): # Look at changes in composition SINCE start, not from start to year prior
-                changeVar = 'ChangeInCompositionFU_' + str(year)
-                if (self.dta[changeVar].sum() > 1): # ie not all nones
-                    self.dta.loc[~(self.dta['ChangeInHeadFU_' + self.timespan]) & ~(self.dta[changeVar].isin([0, 1, 2])), 'ChangeInHeadFU_' + self.timespan] = True
-
+        numHouseholds = len(self.dta)
+
+        years = [year for year in self.yearsWithFamilyData if year >= (self.startYear + self.timeStep)]
+        priorYears = [self.yearsWithFamilyData[self.yearsWithFamilyData.index(year) - 1] for year in years]
+
+        def toArray(varBase, theYears):
+            # Missing (None / NA) becomes NaN; flags become 1.0 / 0.0
+            return np.column_stack([self.dta[varBase + str(year)].to_numpy(dtype=float, na_value=np.nan) for year in theYears]) \
+                if len(theYears) > 0 else np.empty((numHouseholds, 0))
+
+        inflation = self.inflator.getInflationFactors(years, self.toYear)
+        inflationPrior = self.inflator.getInflationFactors([year - self.timeStep for year in years], self.toYear)
+
+        # Following Dynan, flag people who moved but didn't report it: they went from owning to renting, or back
+        moved = toArray('MovedR_', years)
+        hasHouse = toArray('hasHouse_', years)
+        hadHouse = toArray('hasHouse_', priorYears)
+        unreportedMove = (moved == 0) & (~np.isnan(hasHouse)) & (~np.isnan(hadHouse)) & (hasHouse != hadHouse)
+
+        for i, year in enumerate(years):
+            numToUpdate = int(unreportedMove[:, i].sum())
+            print ("fixing " + str(numToUpdate) + " move statuses")
+            if (numToUpdate > 400):
+                warnings.warn("something ain't right here")
+            if numToUpdate > 0:
+                self.dta.loc[unreportedMove[:, i], 'MovedR_' + str(year)] = True
+
+        isMoved = (moved == 1) | unreportedMove
+        if (len(years) > 0) and (isMoved.sum(axis=0) < 1).any(): # ie all nones
+            raise Warning("Hmm... Missing moving data")
+
+        self.dta[modificationVar] = np.char.multiply("Move Status Changed to True;", unreportedMove.sum(axis=1)) if len(years) > 0 else ''
+
+        # The inflated change in each year, with missing values counting as 0
+        valueChange = np.nan_to_num(toArray('valueOfHouse_Gross_', years) * inflation) - \
+                      np.nan_to_num(toArray('valueOfHouse_Gross_', [year - self.timeStep for year in years]) * inflationPrior)
+        debtChange = np.nan_to_num(toArray('valueOfHouse_Debt_', years) * inflation) - \
+                     np.nan_to_num(toArray('valueOfHouse_Debt_', [year - self.timeStep for year in years]) * inflationPrior)
+
+        # Households with no year of a kind (moving or not) are left empty for it
+        hasMoveYear = isMoved.any(axis=1)
+        hasStayYear = (~isMoved).any(axis=1)
+        self.dta['House_ValueIncrease_WhenMoving_' + self.inflatedTimespan] = np.where(hasMoveYear, (valueChange * isMoved).sum(axis=1), np.NaN)
+        self.dta['House_TotalChangeInMortgageDebt_WhenMoving_' + self.inflatedTimespan] = np.where(hasMoveYear, (debtChange * isMoved).sum(axis=1), np.NaN)
+        self.dta['House_TotalChangeInMortgageDebt_WhenNotMoving_' + self.inflatedTimespan] = np.where(hasStayYear, (debtChange * ~isMoved).sum(axis=1), np.NaN)
+        self.dta['House_ValueIncrease_WhenNotMoving_' + self.inflatedTimespan] = np.where(hasStayYear, (valueChange * ~isMoved).sum(axis=1), np.NaN)
+
+        # Look at changes in composition SINCE start, not from start to year prior
+        changeVars = ['ChangeInCompositionFU_' + str(year) for year in self.yearsWithFamilyData if year > self.startYear]
+        changeVars = [x for x in changeVars if self.dta[x].sum() > 1] # ie not all nones
+        self.dta['ChangeInHeadFU_' + self.timespan] = (~self.dta[changeVars].isin([0, 1, 2])).any(axis=1).to_numpy()
 
 
 
@@ -0,0 +1,240 @@
+import pandas as pd
+import numpy as np
+import ftplib
+import time
+import io
+import array
+import random
+import string
+import subprocess
+import threading
+
+'''
+    The ways we can get TaxSim to calculate taxes for us.  Each backend takes the input frame from TaxSimFormatter.extractData
+    and returns the frame readTaxSimOutput reads back in:  taxsim_id, year, state, fiitax, siitax, fica, frate, srate, ficar
+
+    FtpBackend:   NBER's FTP interface -- upload the file, wait, download the results. Needs the internet, and NBER's server is slow
+    LocalBackend: a locally installed TaxSim (the NBER's taxsim executable, a WASM build run through node, or any stand-in that reads
+                  TaxSim's CSV format on stdin and writes it to stdout), run as a subprocess
+    FakeBackend:  a stand-in server for testing offline: a flat tax, which can be told to fail or cut its output short
+
+    Backends take whatever they're given in one go; TaxSimSubmitter splits a year into batches and checks what comes back.
+
+    See http://users.nber.org/~taxsim/taxsim35/ for the local executables and their CSV format.
+'''
+
+# Taxsim's output files have a serious problem - no real line delimitor.  So, we create our own.
+ID_START_SINCE_TAXIM_HAS_NO_LINE_DELIMITOR = '9876789'  # A very unlikely sequence to occur on its own
+
+OUTPUT_COLUMNS = ['taxsim_id', 'year', 'state', 'fiitax', 'siitax', 'fica', 'frate', 'srate', 'ficar']
+
+def getPlainId(taxsimid):
+    ''' The id TaxSim gives back for one of our input ids '''
+    return int(str(taxsimid)[len(ID_START_SINCE_TAXIM_HAS_NO_LINE_DELIMITOR):])
+
+def get_random_string(length):
+    letters = string.ascii_lowercase + string.ascii_uppercase
+    result_str = ''.join(random.choice(letters) for i in range(length))
+    return result_str
+
+
+class TaxSimOutputParser:
+    '''
+    Reads TaxSim's text output as it downloads, a line at a time, straight into numeric columns.
+
+    The output is a header row of variable names, then the records -- separated by whitespace, but not always by line breaks.
+    Each record starts with its id, and our ids all start with ID_START_SINCE_TAXIM_HAS_NO_LINE_DELIMITOR, so that's
+    how we find where records start.  Every record must have one value per header name.
+    Only the values (as floats) and where each record starts are kept, not the text.
+    '''
+
+    def __init__(self):
+        self.header = []
+        self.values = array.array('d')
+        self.starts = array.array('q')
+
+    def feed(self, line):
+        for token in line.split():
+            if token.startswith(ID_START_SINCE_TAXIM_HAS_NO_LINE_DELIMITOR):
+                self.starts.append(len(self.values))
+                token = token[len(ID_START_SINCE_TAXIM_HAS_NO_LINE_DELIMITOR):]
+            elif len(self.starts) == 0:
+                self.header.append(token)
+                continue
+            self.values.append(float(token))
+
+    def getData(self, expectedIds = None):
+        '''
+        :param expectedIds: the plain ids we sent; if given, the output must have exactly these
+        :type expectedIds: list
+        :return: the output, with plain ids
+        :rtype: DataFrame
+        '''
+        if len(self.starts) == 0:
+            raise Exception("No records in TaxSim's output")
+
+        header = self.header
+        numFields = len(header)
+        numRecords = len(self.starts)
+        starts = np.array(self.starts, dtype=np.int64)
+        if (numFields == 0) or (len(self.values) != numFields * numRecords) or \
+                (not np.array_equal(starts, numFields * np.arange(numRecords))):
+            raise Exception("TaxSim's output doesn't split into records of " + str(numFields) + " values")
+
+        values = np.array(self.values, dtype=np.float64).reshape(numRecords, numFields)
+        dta = pd.DataFrame({header[0]: values[:, 0].astype(np.int64)})
+        for i in range(1, numFields):
+            dta[header[i]] = values[:, i]
+
+        if (expectedIds is not None) and (not np.array_equal(np.sort(dta[header[0]].to_numpy()), np.sort(np.asarray(expectedIds, dtype=np.int64)))):
+            raise Exception("TaxSim's output ids don't match the ids sent: " + str(numRecords) + " records for " + str(len(expectedIds)) + " ids")
+        return dta
+
+
+class FtpBackend:
+    '''
+    Call TaxSim, which has an unusual interface...
+    Deposit the input data file onto Taxsim's FTP site, wait a while, then pick up the output file from the same site.
+    '''
+
+    def __init__(self, host = 'taxsimftp.nber.org', waitSeconds = 5):
+        self.host = host
+        self.waitSeconds = waitSeconds
+        self.version = 'taxsim27-ftp'  # The results come from the .txm27 file
+
+    def calcTaxes(self, inputDta, workDir):
+        '''
+        :param inputDta: TaxSim input, in TaxSim's column order
+        :type inputDta: DataFrame
+        :param workDir: not needed -- the input is uploaded, and the output parsed, straight from memory
+        :type workDir: str
+        :rtype: DataFrame
+        '''
+        try:
+            # Open up FTP to Taxsim
+            with ftplib.FTP(self.host) as ftp:
+                ftp.login(user='taxsim', passwd='02138')  # user anonymous, passwd anonymous@
+                ftp.cwd('/tmp')
+
+                inputFileName = "PSID_" + get_random_string(10)
+                # outputFileName = inputFileName + '.taxsim'  # File format is different - dont Use
+                outputFileName = inputFileName + '.txm27'
+
+                # Upload
+                res = ftp.storlines("STOR " + inputFileName, io.BytesIO(inputDta.to_csv(header=False, index=False).encode('ascii')))
+                if not res.startswith('226 Transfer complete'):
+                    print('Upload failed')
+                    print(res)
+
+                time.sleep(self.waitSeconds)
+
+                # Download, parsing as it comes in
+                parser = TaxSimOutputParser()
+                res = ftp.retrlines('RETR ' + outputFileName, parser.feed)
+                if not '226 Transfer complete' in res:
+                    print('Check download - Taxsim gives errors no matter what here...')
+                    print(res)
+
+                return parser.getData(expectedIds = inputDta.taxsimid.map(getPlainId).tolist())
+
+        except ftplib.all_errors as e:
+            print('FTP error:', e)
+            raise e
+
+
+class LocalBackend:
+    '''
+    Run a local TaxSim as a subprocess: CSV with a header row in on stdin, CSV with a header row out on stdout.
+    '''
+
+    def __init__(self, command, timeoutSeconds = 600):
+        '''
+        :param command: the command line to run, e.g. ['taxsim35'] or ['node', 'taxsim.js']
+        :type command: list
+        :param timeoutSeconds: give up on a call after this long
+        :type timeoutSeconds: int
+        '''
+        if isinstance(command, str):
+            command = command.split()
+        self.command = command
+        self.version = ' '.join(command)  # The executable's name says which TaxSim it is
+        self.timeoutSeconds = timeoutSeconds
+
+    def formatInput(self, inputDta):
+        '''
+        The local versions want TaxSim's own variable names in a header row, and plain numeric ids
+        '''
+        dta = inputDta.rename(columns={'yearTax': 'year'})
+        dta['taxsimid'] = dta.taxsimid.astype(str).str.replace('^' + ID_START_SINCE_TAXIM_HAS_NO_LINE_DELIMITOR, '', regex=True)
+        return dta
+
+    def calcTaxes(self, inputDta, workDir):
+        result = subprocess.run(self.command, input = self.formatInput(inputDta).to_csv(index=False), capture_output = True,
+                                text = True, timeout = self.timeoutSeconds)
+        if result.returncode != 0:
+            raise Exception("Local TaxSim (" + ' '.join(self.command) + ") failed: " + result.stderr)
+        outputDta = pd.read_csv(io.StringIO(result.stdout), skipinitialspace = True)
+        outputDta.rename(columns={'taxsimid': 'taxsim_id'}, inplace=True)
+        return outputDta[OUTPUT_COLUMNS]
+
+
+class FakeBackend:
+    '''
+    A stand-in for TaxSim, for exercising everything around it offline: federal tax is a flat rate on wages, and nothing else is taxed.
+    It can be set up to misbehave like the real server does: the first few calls raise, and the next few lose the end of their output.
+    '''
+
+    def __init__(self, taxRate = 0.1, failCalls = 0, truncateCalls = 0, delaySeconds = 0):
+        '''
+        :param taxRate: federal tax, as a share of pwages + swages
+        :type taxRate: float
+        :param failCalls: number of calls, starting from the first, that raise
+        :type failCalls: int
+        :param truncateCalls: number of calls after those that return only the first half of their records
+        :type truncateCalls: int
+        :param delaySeconds: how long each call takes
+        :type delaySeconds: float
+        '''
+        self.taxRate = taxRate
+        self.failCalls = failCalls
+        self.truncateCalls = truncateCalls
+        self.delaySeconds = delaySeconds
+        self.version = 'fake-' + str(taxRate)
+        self.numCalls = 0
+        self.lock = threading.Lock()
+
+    def calcTaxes(self, inputDta, workDir):
+        with self.lock:
+            self.numCalls += 1
+            callNumber = self.numCalls
+        time.sleep(self.delaySeconds)
+
+        if callNumber <= self.failCalls:
+            raise Exception("Fake TaxSim failure on call " + str(callNumber))
+
+        wages = inputDta.reindex(columns=['pwages', 'swages']).apply(pd.to_numeric, errors='coerce').fillna(0).sum(axis=1)
+        outputDta = pd.DataFrame({'taxsim_id': inputDta.taxsimid.map(getPlainId).to_numpy(),
+                                  'year': pd.to_numeric(inputDta.yearTax).to_numpy(),
+                                  'state': pd.to_numeric(inputDta.state).to_numpy() if 'state' in inputDta.columns else 0,
+                                  'fiitax': (wages * self.taxRate).round(2).to_numpy(),
+                                  'siitax': 0.0, 'fica': 0.0, 'frate': self.taxRate * 100, 'srate': 0.0, 'ficar': 0.0})
+
+        if callNumber <= self.failCalls + self.truncateCalls:
+            outputDta = outputDta.iloc[:(len(outputDta) // 2)]
+        return outputDta[OUTPUT_COLUMNS]
+
+
+def getBackend(params):
+    '''
+    The backend selected in the params: 'ftp' (the default), 'local', which runs params.taxSimCommand, or 'fake', a flat-tax stand-in
+    '''
+    if (params.taxSimBackend is None) or (params.taxSimBackend == 'ftp'):
+        return FtpBackend()
+    elif params.taxSimBackend == 'local':
+        if params.taxSimCommand is None:
+            raise Exception("The local TaxSim backend needs taxSimCommand in the params")
+        return LocalBackend(params.taxSimCommand)
+    elif params.taxSimBackend == 'fake':
+        return FakeBackend()
+    else:
+        raise Exception("Unknown TaxSim backend: " + str(params.taxSimBackend))
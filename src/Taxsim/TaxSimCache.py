@@ -0,0 +1,116 @@
+import pandas as pd
+import numpy as np
+import os
+import hashlib
+import sqlite3
+import contextlib
+
+import Taxsim.TaxSimBackends as TaxSimBackends
+
+'''
+    A local cache of TaxSim results, so reruns only send TaxSim the households whose tax inputs changed.
+
+    Each result is stored under a hash of its input row (every TaxSim input field except the id, rounded to cents)
+    and the TaxSim version that calculated it.  It's a single SQLite file, so it survives between runs,
+    and can be shared by the years being calculated side by side.
+'''
+
+RESULT_COLUMNS = [x for x in TaxSimBackends.OUTPUT_COLUMNS if x != 'taxsim_id']
+MAX_KEYS_PER_QUERY = 500  # SQLite limits the number of parameters in a statement
+
+
+class TaxSimCache:
+
+    def __init__(self, cacheFile, version):
+        '''
+        :param cacheFile: the SQLite file to keep results in (created if needed)
+        :type cacheFile: str
+        :param version: the TaxSim version the results come from; results from other versions aren't used
+        :type version: str
+        '''
+        self.cacheFile = cacheFile
+        self.version = version
+        if not os.path.exists(os.path.dirname(os.path.abspath(cacheFile))):
+            os.makedirs(os.path.dirname(os.path.abspath(cacheFile)))
+        with self.connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, " +
+                               ", ".join([x + " REAL" for x in RESULT_COLUMNS]) + ")")
+
+    @contextlib.contextmanager
+    def connect(self):
+        # One connection per call, so several threads can use the cache at once. Commits if all went well
+        connection = sqlite3.connect(self.cacheFile, timeout = 60)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def getKeys(self, inputDta):
+        '''
+        :param inputDta: TaxSim input, as from TaxSimFormatter.extractData
+        :type inputDta: DataFrame
+        :return: the cache key for each row
+        :rtype: Series
+        '''
+        values = inputDta.drop(columns=['taxsimid']).apply(pd.to_numeric, errors='coerce').astype(float).round(2)
+        rows = values.astype(str).agg(','.join, axis=1)
+        return rows.map(lambda row: hashlib.sha1((self.version + '|' + row).encode('utf-8')).hexdigest())
+
+    def lookup(self, keys):
+        '''
+        :return: the cached results for the keys we have, indexed by key
+        :rtype: DataFrame
+        '''
+        uniqueKeys = list(pd.unique(keys))
+        found = []
+        with self.connect() as connection:
+            for start in range(0, len(uniqueKeys), MAX_KEYS_PER_QUERY):
+                chunk = uniqueKeys[start:(start + MAX_KEYS_PER_QUERY)]
+                found.append(pd.read_sql_query("SELECT key, " + ", ".join(RESULT_COLUMNS) + " FROM results WHERE key IN (" +
+                                               ",".join(["?"] * len(chunk)) + ")", connection, params = chunk))
+        if len(found) == 0:
+            return pd.DataFrame(columns = RESULT_COLUMNS, index = pd.Index([], name='key'))
+        return pd.concat(found, ignore_index=True).set_index('key')
+
+    def store(self, keys, outputDta):
+        '''
+        :param keys: the cache key of each row of outputDta
+        :type keys: Series
+        :param outputDta: TaxSim results, in the same order
+        :type outputDta: DataFrame
+        '''
+        rows = outputDta[RESULT_COLUMNS].astype(float)
+        rows = rows.where(rows.notna(), None)
+        with self.connect() as connection:
+            connection.executemany("INSERT OR REPLACE INTO results (key, " + ", ".join(RESULT_COLUMNS) + ") VALUES (" +
+                                   ",".join(["?"] * (len(RESULT_COLUMNS) + 1)) + ")",
+                                   [(key,) + tuple(row) for key, row in zip(keys, rows.itertuples(index=False))])
+
+    def calcTaxes(self, inputDta, backend, workDir):
+        '''
+        Results for every input row -- from the cache where we have them, and from the backend for the rest
+        :rtype: DataFrame
+        '''
+        keys = self.getKeys(inputDta)
+        cached = self.lookup(keys)
+        isMiss = ~keys.isin(cached.index)
+        print("TaxSim cache: " + str(int((~isMiss).sum())) + " found, " + str(int(isMiss.sum())) + " to calculate")
+
+        if isMiss.any():
+            missDta = inputDta.loc[isMiss]
+            newResults = backend.calcTaxes(missDta, workDir)
+            if len(newResults) != len(missDta):
+                return newResults  # Let the caller report it; don't cache a partial answer
+
+            # Line the results up with the rows we sent, by id
+            newResults = newResults.set_index(newResults.taxsim_id.astype(float).astype(np.int64))
+            newResults = newResults.loc[missDta.taxsimid.map(TaxSimBackends.getPlainId)]
+            self.store(keys[isMiss], newResults)
+            cached = pd.concat([cached, newResults[RESULT_COLUMNS].set_index(keys[isMiss].to_numpy())])
+            cached = cached[~cached.index.duplicated()]
+
+        outputDta = cached.loc[keys.to_numpy(), RESULT_COLUMNS].astype(float).reset_index(drop=True)
+        outputDta.insert(0, 'taxsim_id', inputDta.taxsimid.map(TaxSimBackends.getPlainId).to_numpy())
+        return outputDta
@@ -1,12 +1,11 @@
 import pandas as pd
-import ftplib 
-import time
 import os
-import random
-import string
-import re
+import concurrent.futures
 
 from PSIDProcessing import Extractor
+import Taxsim.TaxSimBackends as TaxSimBackends
+import Taxsim.TaxSimCache as TaxSimCache
+import Taxsim.TaxSimSubmitter as TaxSimSubmitter
 
 '''
     This class takes PSID data, formats the relevant fields in Taxsim Format, 
@@ -39,31 +38,43 @@ from PSIDProcessing import Extractor
 '''
 
 
-# Taxsim's output files have a serious problem - no real line delimitor.  So, we create our own.
-ID_START_SINCE_TAXIM_HAS_NO_LINE_DELIMITOR = '9876789'  # A very unlikely sequence to occur on its own
+# Taxsim's output files have a serious problem - no real line delimitor.  So, we create our own.  See TaxSimBackends
+ID_START_SINCE_TAXIM_HAS_NO_LINE_DELIMITOR = TaxSimBackends.ID_START_SINCE_TAXIM_HAS_NO_LINE_DELIMITOR
 
-def get_random_string(length):
-    letters = string.ascii_lowercase + string.ascii_uppercase
-    result_str = ''.join(random.choice(letters) for i in range(length))
-    return result_str
-    # print("Random string of length", length, "is:", result_str)
-
-def calcAgeCounts(dta, year):
+def countIndividualsPerFamily(familyIds, familyIdOfIndividual, individualMasks):
+    '''
+    Count, for each family, the individuals that meet each condition -- one grouped sum over all of the conditions at once
+    :param familyIds: the families we want counts for (families with no matching individuals get 0s)
+    :type familyIds: Series
+    :param familyIdOfIndividual: for each individual, the id of the family they're in
+    :type familyIdOfIndividual: Series
+    :param individualMasks: {count name: boolean mask over the individuals}
+    :type individualMasks: dict
+    :return: one row per family: the familyId and a column for each count
+    :rtype: DataFrame
+    '''
+    flags = pd.DataFrame({name: mask.to_numpy(dtype=bool) for name, mask in individualMasks.items()},
+                         columns = list(individualMasks.keys()), dtype=int)
+    counts = flags.groupby(familyIdOfIndividual.to_numpy()).sum()
+    counts = counts.reindex(sorted(familyIds.dropna().unique()), fill_value=0)
+    counts.index.name = familyIds.name
+    return counts.reset_index()
+
+def getDependentMasks(individualDta, year):
+    '''
+    TaxSim's dependent counts, as masks over the individuals (all assumed to be children of the Reference Person)
+    '''
     ageVar = "ageI_" + str(year)
     employmentVar = "employmentStatusI_" + str(year)
     relationshipVar = "relationshipToR_" + str(year)
-    relationshipMask = dta[relationshipVar].isin(["Child"])
-    
-    dep18 = len(dta.loc[
-            relationshipMask & (
-                    (dta[ageVar] < 19) | 
-                    ((dta[ageVar] < 24) & (dta[employmentVar] == 'Student'))
-                    )
-                    ]) # Should be under 19 or under 24 and full time student
-    depx =  dep18 # Should be number of people who are not working but are dependent 
-    dep13 = len(dta.loc[dta[ageVar] < 13])
-    dep17 = len(dta.loc[dta[ageVar] < 17])
-    return pd.Series({'depx':depx, 'dep13': dep13, 'dep17': dep17, 'dep18': dep18}).to_frame().T
+    relationshipMask = individualDta[relationshipVar].isin(["Child"])
+
+    # Should be under 19 or under 24 and full time student
+    dep18 = relationshipMask & ((individualDta[ageVar] < 19) | ((individualDta[ageVar] < 24) & (individualDta[employmentVar] == 'Student')))
+    depx = dep18 # Should be number of people who are not working but are dependent
+    dep13 = individualDta[ageVar] < 13
+    dep17 = individualDta[ageVar] < 17
+    return {'depx': depx, 'dep13': dep13, 'dep17': dep17, 'dep18': dep18}
 
 class TaxSimFormatter:
     
@@ -89,12 +100,8 @@ class TaxSimFormatter:
         individualData_NonHead = self.psidIndividualDta.loc[self.psidIndividualDta[sequenceVar] != 1, inidvidualVars].copy()
         individualData_NonHead = individualData_NonHead.loc[(~(individualData_NonHead[ageVar].isna())) & (individualData_NonHead[relationshipVar].isin(['Child']))].copy()
 
-        temp = pd.merge(dta[['familyInterviewId']], 
-                       individualData_NonHead, left_on = 'familyInterviewId', 
-                            right_on = indInterviewVar, 
-                            how = 'left')
-                
-        results = temp.groupby(['familyInterviewId']).apply(calcAgeCounts, self.year).reset_index()
+        results = countIndividualsPerFamily(dta['familyInterviewId'], individualData_NonHead[indInterviewVar],
+                                            getDependentMasks(individualData_NonHead, self.year))
         return results
             
 
@@ -336,99 +343,38 @@ class TaxSimFormatter:
         v9 = ficar = FICA rate
         '''
         
-    def callTaxSim(self):
+    def callTaxSim(self, backend = None, cache = None):
         '''
-        Call TaxSim, which has an unusual interface...
-        Deposit the input data file onto Taxsim's FTP site, wait a while, then pick up the output file from the same site.
+        Have TaxSim calculate the taxes for our input, and save the results where readTaxSimOutput looks for them
+        :param backend: how to reach TaxSim -- one of the TaxSimBackends, usually in a TaxSimSubmitter (by default, NBER's FTP interface)
+        :type backend: TaxSimSubmitter.BatchSubmitter or TaxSimBackends.FtpBackend, LocalBackend or FakeBackend
+        :param cache: if given, only households whose tax inputs aren't in the cache are sent to TaxSim
+        :type cache: TaxSimCache.TaxSimCache
+        :rtype: DataFrame
         '''
-        
+        if backend is None:
+            backend = TaxSimBackends.FtpBackend()
+
         # get file in memory
         inputDta = self.extractData()
+        if not os.path.exists(self.outputDir):
+            os.makedirs(self.outputDir)
 
-        try:          
-            # Open up FTP to Taxsim
-            with ftplib.FTP('taxsimftp.nber.org') as ftp: 
-                ftp.login(user='taxsim', passwd='02138')  # user anonymous, passwd anonymous@
-                ftp.cwd('/tmp')
-        
-                inputFileName = "PSID_" + get_random_string(10)
-                
-                mappingFile = inputFileName + "_mapping.csv"
+        if cache is None:
+            outputDta = backend.calcTaxes(inputDta, self.outputDir)
+        else:
+            outputDta = cache.calcTaxes(inputDta, backend, self.outputDir)
 
-                inputFileNameLocal = os.path.join(self.outputDir, inputFileName)
-                inputDta.to_csv(inputFileNameLocal, header=False, index=False)
-    
-                # outputFileName = inputFileName + '.taxsim'  # File format is different - dont Use
-                outputFileName = inputFileName + '.txm27'
-                # outputFileName = inputFileName + '.txm32'
-                
-                
-                outputFileNameLocal = os.path.join(self.outputDir, outputFileName)
-                    
-                # Upload
-                with open(inputFileNameLocal, 'rb') as fp:
-                    
-                    res = ftp.storlines("STOR " + inputFileName, fp)
-                    
-                    if not res.startswith('226 Transfer complete'):
-                        print('Upload failed')
-                        print(res)
-                    
-                time.sleep(5)
-                                
-                # Download
-                if os.path.isfile(outputFileNameLocal):
-                    os.remove(outputFileNameLocal)          
-
-                with open(outputFileNameLocal, 'w') as fp:
-                    
-                    res = ftp.retrlines('RETR ' + outputFileName, fp.write)
-                    
-                    if not '226 Transfer complete' in res:
-                        print('Check download - Taxsim gives errors no matter what here...')
-                        print(res)
-
-                # Get the message, if any
-                '''
-                if os.path.isfile(msgOutputFileNameLocal):
-                    os.remove(msgOutputFileNameLocal)          
-
-                with open(msgOutputFileNameLocal, 'w') as fp:
-                    
-                    res = ftp.retrlines('RETR ' + msgOutputFileName, fp.write)
-                    
-                    if not '226 Transfer complete' in res:
-                        print('Download failed: ' + msgOutputFileNameLocal)
-                        print(res)
-                '''
-
-                # If we got this far, the file is there!
-                if os.path.exists(outputFileNameLocal):
-                    with open(outputFileNameLocal, "r") as myfile:
-                        data = myfile.read()
-                    data=data.replace(ID_START_SINCE_TAXIM_HAS_NO_LINE_DELIMITOR, "\n")
-                    data=re.sub("[^\S\r\n]+", ",", data)
-                        
-                    with open(os.path.join(self.outputDir, "taxsim_" + str(self.year) + ".csv"), 'w') as f:
-                        f.write(data)
-                                                    
-                    outputDta = pd.read_csv(os.path.join(self.outputDir, "taxsim_" + str(self.year) + ".csv"))
-                    
-                    # Sometimes, Taxsim just doesn't return all of the rows.  Only a few hundred. Catch that.
-                    if (len(outputDta) != len(inputDta)):
-                        raise Exception("Received invalid data from Taxsim " + str(self.year) + " Length of Output is " + str(len(outputDta)) + " and input is " + str(len(inputDta)) + "." )
-                            
-                    return outputDta
-                else:
-                    raise Exception('Huh, didnt get the data at: ' + outputFileNameLocal)
+        # Sometimes, Taxsim just doesn't return all of the rows.  Only a few hundred. Catch that.
+        if (len(outputDta) != len(inputDta)):
+            raise Exception("Received invalid data from Taxsim " + str(self.year) + " Length of Output is " + str(len(outputDta)) + " and input is " + str(len(inputDta)) + "." )
 
-        except ftplib.all_errors as e:
-            print('FTP error:', e) 
-            raise e
+        outputDta.to_csv(os.path.join(self.outputDir, "taxsim_" + str(self.year) + ".csv"), index=False)
+        return outputDta
 
 
 '''
-Two helper functions for the most common use case -- do it all 
+Helper functions for the most common use case -- do it all 
 '''
 def calcTaxAndSave(params, famExtractor, indExtractor):
     if famExtractor is None:
@@ -439,14 +385,34 @@ def calcTaxAndSave(params, famExtractor, indExtractor):
         indExtractor = Extractor.Extractor(params.PSID_DATA_DIR, params.yearsToInclude, params.individualVarsWeNeed2019, params.individualVars_LoadRegardlessOfYear,source='individual')
     indExtractor.readExtractedData(params.yearsToInclude, filePath = os.path.join(params.BASE_OUTPUT_DIR, params.MAPPED_OUTPUT_SUBDIR), fileNameBase= "extractedPSID_Individual_Mapped_Recoded")
 
-    for year in famExtractor.dataDict:
-        yearData = famExtractor.dataDict[year]
-        individualData = indExtractor.dataDict[0]
-        tsFormatter = TaxSimFormatter(params.PSID_DATA_DIR, (params.BASE_OUTPUT_DIR + '/' + params.TAXSIM_OUTPUT_SUBDIR))
-        tsFormatter.convertToTaxSim(yearData, individualData, year)
-        tsDta = tsFormatter.extractData()
-        tsFormatter.saveTaxSimInput()
-        tsResults = tsFormatter.callTaxSim()
+    # Each year goes to TaxSim in batches, several at a time; batches that fail or come back short are resent.
+    # The years run in parallel too, all through this one submitter, so taxSimMaxConnections caps the calls to TaxSim in total
+    maxConnections = params.taxSimMaxConnections if 'taxSimMaxConnections' in params else 2
+    backend = TaxSimSubmitter.BatchSubmitter(TaxSimBackends.getBackend(params), batchSize = params.taxSimBatchSize,
+                                             numWorkers = maxConnections, maxRetries = params.taxSimMaxRetries,
+                                             maxConcurrentCalls = maxConnections)
+    cache = None
+    if params.taxSimCacheFile is not None:
+        cache = TaxSimCache.TaxSimCache(params.taxSimCacheFile, backend.version)
+    individualData = indExtractor.dataDict[0]
+    years = list(famExtractor.dataDict.keys())
+
+    if (params.numWorkers is None) or (params.numWorkers <= 1) or (len(years) <= 1):
+        for year in years:
+            calcTaxForYear(params, backend, cache, famExtractor.dataDict[year], individualData, year)
+    else:
+        # Each year waits on TaxSim (a server or a subprocess), so threads let the years overlap
+        with concurrent.futures.ThreadPoolExecutor(max_workers = params.numWorkers) as executor:
+            futures = [executor.submit(calcTaxForYear, params, backend, cache, famExtractor.dataDict[year], individualData, year) for year in years]
+            for future in concurrent.futures.as_completed(futures):
+                future.result()
+
+def calcTaxForYear(params, backend, cache, yearData, individualData, year):
+    tsFormatter = TaxSimFormatter(params.PSID_DATA_DIR, (params.BASE_OUTPUT_DIR + '/' + params.TAXSIM_OUTPUT_SUBDIR))
+    tsFormatter.convertToTaxSim(yearData, individualData, year)
+    tsFormatter.saveTaxSimInput()
+    tsFormatter.callTaxSim(backend, cache)
+    print("Calculated taxes for " + str(year))
 
 
 def combineFiles(params, famExtractor):
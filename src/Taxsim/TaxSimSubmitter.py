@@ -0,0 +1,101 @@
+import pandas as pd
+import time
+import threading
+import concurrent.futures
+
+import Taxsim.TaxSimBackends as TaxSimBackends
+
+'''
+    Sends a year of TaxSim input to a backend in batches, several at a time, and puts the results back together.
+
+    TaxSim (the FTP server especially) sometimes fails outright, and sometimes returns only part of a file -- a few hundred
+    records out of thousands.  Each batch is checked: it must come back with one record for every id we sent.  Batches that
+    fail the check, or raise, are sent again after a pause that doubles each time.  Only a batch that keeps failing stops the run.
+'''
+
+
+class BatchSubmitter:
+
+    def __init__(self, backend, batchSize = 2000, numWorkers = None, maxRetries = 3, backoffSeconds = 5, maxConcurrentCalls = None):
+        '''
+        :param backend: one of the TaxSimBackends, which does the actual calculation
+        :type backend: TaxSimBackends.FtpBackend, TaxSimBackends.LocalBackend or TaxSimBackends.FakeBackend
+        :param batchSize: most records to send in one batch
+        :type batchSize: int
+        :param numWorkers: number of batches to send at once (None sends them one at a time)
+        :type numWorkers: int
+        :param maxRetries: number of times to resend a batch before giving up
+        :type maxRetries: int
+        :param backoffSeconds: pause before the first resend; doubled for each one after that
+        :type backoffSeconds: float
+        :param maxConcurrentCalls: most calls to the backend at once, across every thread using this submitter (None for no limit).
+            Years can be submitted in parallel too, so this is what keeps the load on NBER's server down
+        :type maxConcurrentCalls: int
+        '''
+        self.backend = backend
+        self.version = backend.version  # Batching doesn't change the answers, so results can be cached under the backend's version
+        self.batchSize = batchSize
+        self.numWorkers = numWorkers
+        self.maxRetries = maxRetries
+        self.backoffSeconds = backoffSeconds
+        self.callSlots = None if maxConcurrentCalls is None else threading.BoundedSemaphore(maxConcurrentCalls)
+
+    def checkBatch(self, batchDta, outputDta):
+        '''
+        :return: what's wrong with the output for this batch, or None if it's complete
+        :rtype: str
+        '''
+        if len(outputDta) != len(batchDta):
+            return "returned " + str(len(outputDta)) + " records for a batch of " + str(len(batchDta))
+        sentIds = set(batchDta.taxsimid.map(TaxSimBackends.getPlainId))
+        receivedIds = set(pd.to_numeric(outputDta.taxsim_id, errors='coerce').dropna().astype('int64'))
+        if sentIds != receivedIds:
+            return "returned " + str(len(sentIds - receivedIds)) + " of the batch's ids missing"
+        return None
+
+    def submitBatch(self, batchDta, workDir):
+        '''
+        Send one batch, resending it until it comes back complete
+        :rtype: DataFrame
+        '''
+        for attempt in range(self.maxRetries + 1):
+            try:
+                if self.callSlots is None:
+                    outputDta = self.backend.calcTaxes(batchDta, workDir)
+                else:
+                    with self.callSlots:
+                        outputDta = self.backend.calcTaxes(batchDta, workDir)
+                problem = self.checkBatch(batchDta, outputDta)
+            except Exception as e:
+                problem = "failed: " + str(e)
+
+            if problem is None:
+                return outputDta
+            if attempt < self.maxRetries:
+                waitSeconds = self.backoffSeconds * (2 ** attempt)
+                print("TaxSim " + problem + ". Trying again in " + str(waitSeconds) + " seconds")
+                time.sleep(waitSeconds)
+
+        raise Exception("TaxSim " + problem + ", after " + str(self.maxRetries + 1) + " tries")
+
+    def calcTaxes(self, inputDta, workDir):
+        '''
+        :param inputDta: TaxSim input, in TaxSim's column order
+        :type inputDta: DataFrame
+        :param workDir: where the backend can keep its files
+        :type workDir: str
+        :return: the results, in the order of inputDta
+        :rtype: DataFrame
+        '''
+        batches = [inputDta.iloc[start:(start + self.batchSize)] for start in range(0, len(inputDta), self.batchSize)]
+
+        if (self.numWorkers is None) or (self.numWorkers <= 1) or (len(batches) <= 1):
+            results = [self.submitBatch(batch, workDir) for batch in batches]
+        else:
+            # The work is at TaxSim's end (a server or a subprocess), so threads are enough here
+            with concurrent.futures.ThreadPoolExecutor(max_workers = self.numWorkers) as executor:
+                results = list(executor.map(lambda batch: self.submitBatch(batch, workDir), batches))
+
+        if len(results) == 0:
+            return pd.DataFrame(columns = TaxSimBackends.OUTPUT_COLUMNS)
+        return pd.concat(results, ignore_index=True)
@@ -10,6 +10,13 @@ import tempfile
 import zipfile
 import pandas as pd
 import numpy as np
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    # Only needed for the Parquet cache (write_sas_parquet)
+    pa = None
+    pq = None
 
 
 def first_clean_up(lines):
@@ -445,3 +452,436 @@ def read_sas(data_file, dict_file, outputCSV, outputMeta, beginline=1, buffersiz
 
     return sas_file
     
+
+
+def get_colspecs(DF, columns=None):
+    """
+    A function to convert the output of parse_sas into the byte positions of
+    each variable within a record.  Filler rows (no varname, negative width)
+    are not returned but still advance the position.
+    Parameters
+    ----------
+    DF          :   DataFrame; the output of parse_sas
+    columns     :   list of strings; optional subset of variable names to
+                    keep.  Names not in the dictionary are ignored.  The
+                    dictionary order is preserved.
+    """
+    widths = DF['width'].abs().astype(int).values
+    ends = np.cumsum(widths)
+    specs = pd.DataFrame({'varname': DF['varname'].values,
+                          'start': ends - widths,
+                          'end': ends,
+                          'char': DF['char'].values,
+                          'divisor': DF['divisor'].values})
+    specs = specs.dropna(subset=['varname'])
+
+    if columns is not None:
+        wanted = set([x for x in columns if isinstance(x, str)])
+        specs = specs.loc[specs['varname'].isin(wanted)]
+
+    specs.index = range(0, specs.shape[0])
+    return specs
+
+
+def apply_divisors(block, specs):
+    """
+    A function to scale numeric columns that have an implied decimal in the
+    dictionary (e.g. 'VAR 1 - 6 .2').  As in SAS, a value that already
+    contains an explicit decimal point is not scaled.
+    Parameters
+    ----------
+    block       :   DataFrame; the data, with these columns still as text.
+                    Modified in place.
+    specs       :   DataFrame; the rows of get_colspecs to scale
+    """
+    for varname, divisor in zip(specs['varname'], specs['divisor']):
+        text = block[varname]
+        values = pd.to_numeric(text, errors='coerce').astype(float)
+        implied = ~(text.str.contains('.', regex=False).fillna(True).astype(bool))
+        values[implied] = values[implied] * divisor
+        block[varname] = values
+
+
+def read_sas_chunked(data_file, dict_file, outputCSV=None, outputMeta=None, columns=None,
+                     chunksize=10000, beginline=1, lrecl=None, skip_decimal_division=None):
+    """
+    A streaming version of read_sas.  The dictionary is parsed once and the
+    ASCII file is then read in blocks of chunksize records, so memory use is
+    bounded by the block size rather than the file size.
+    Parameters
+    ----------
+    data_file       :   string; .txt data file
+    dict_file       :   string; must be a .sas dictionary file
+    outputCSV       :   string; optional CSV file.  If given, every variable
+                        is decoded and appended to it block by block, with
+                        the same values as the returned frame, so reading
+                        the CSV back gives the same data.  Pass
+                        skip_decimal_division=True for the unscaled copy
+                        read_sas writes.
+    outputMeta      :   string; optional CSV file for the parsed dictionary
+    columns         :   list of strings; the variables to return.  If None,
+                        all variables are returned.  Without an outputCSV
+                        only these variables are decoded at all.
+    chunksize       :   integer; number of records per block
+    beginline       :   integer;
+    skip_decimal_division : boolean; if True, implied decimals are not
+                        applied
+    """
+    DF = parse_sas(dict_file, beginline, lrecl)
+
+    allSpecs = get_colspecs(DF)
+    if outputCSV is None:
+        readSpecs = get_colspecs(DF, columns)
+    else:
+        readSpecs = allSpecs
+    if columns is None:
+        keepNames = list(readSpecs['varname'])
+    else:
+        keepNames = list(get_colspecs(DF, columns)['varname'])
+
+    if outputMeta is not None:
+        DF_cleaned = DF.dropna(subset=['varname'])
+        DF_cleaned['width'] = DF_cleaned['width'].astype(int)
+        DF_cleaned.to_csv(outputMeta, index=False)
+
+    # Text is kept for char columns, and for numeric columns with an implied decimal
+    divisorSpecs = readSpecs.loc[(~readSpecs['char'].fillna(False).astype(bool)) &
+                                 ~(readSpecs['divisor'].isin([1, np.NaN]))]
+    if skip_decimal_division:
+        divisorSpecs = divisorSpecs.iloc[0:0]
+    dtypes = {}
+    for varname in list(readSpecs.loc[readSpecs['char'].fillna(False).astype(bool), 'varname']) + \
+            list(divisorSpecs['varname']):
+        dtypes[varname] = str
+
+    print('Reading in ASCII file in blocks of ' + str(chunksize) + ' records.')
+    reader = pd.read_fwf(data_file,
+                         colspecs=list(zip(readSpecs['start'], readSpecs['end'])),
+                         names=list(readSpecs['varname']),
+                         dtype=dtypes,
+                         header=None,
+                         chunksize=chunksize)
+
+    kept = []
+    firstBlock = True
+    for block in reader:
+        apply_divisors(block, divisorSpecs)
+
+        if outputCSV is not None:
+            block.to_csv(outputCSV, index=False, header=firstBlock, mode=('w' if firstBlock else 'a'))
+        firstBlock = False
+
+        kept.append(block[keepNames])
+
+    print("Finished reading in data.\n")
+
+    if len(kept) == 0:
+        return pd.DataFrame(columns=keepNames)
+    return pd.concat(kept, ignore_index=True)
+
+
+def map_records(data_file):
+    """
+    A function to memory-map a fixed-width ASCII file as a 2-D array of bytes,
+    one row per record (including the line delimiter).  If the final record
+    has no line delimiter it is returned separately, padded with blanks.
+    If the records are not all the same length (trailing blanks trimmed,
+    or a mix of CRLF and LF delimiters), the file is read into memory
+    instead and each record is padded with blanks to the longest one.
+    Parameters
+    ----------
+    data_file   :   string; .txt data file
+    """
+    mapped = np.memmap(data_file, dtype=np.uint8, mode='r')
+    if mapped.size == 0:
+        return np.zeros((0, 0), dtype=np.uint8), None
+
+    newlines = np.flatnonzero(mapped[:min(mapped.size, 1 << 20)] == 10)
+    if len(newlines) == 0:
+        stride = mapped.size
+    else:
+        stride = int(newlines[0]) + 1
+
+    numFull = mapped.size // stride
+    records = mapped[:numFull * stride].reshape(numFull, stride)
+    if (len(newlines) > 0) and ((not (records[:, stride - 1] == 10).all()) or
+                                (mapped[numFull * stride:] == 10).any() or
+                                ((records[:, stride - 2] == 13).any() != (records[:, stride - 2] == 13).all())):
+        return pad_records(data_file), None
+
+    lastRecord = None
+    remainder = mapped.size - numFull * stride
+    if remainder > 0:
+        lastRecord = np.full((1, stride), 32, dtype=np.uint8)
+        lastRecord[0, :remainder] = mapped[numFull * stride:]
+    return records, lastRecord
+
+
+def pad_records(data_file):
+    """
+    A function to read a ragged fixed-width ASCII file as a 2-D array of
+    bytes, one row per record.  Line delimiters (LF or CRLF) are dropped,
+    each record is padded with blanks to the longest one, and a single LF is
+    put back at the end of every row, as map_records would return it.
+    Parameters
+    ----------
+    data_file   :   string; .txt data file
+    """
+    with open(data_file, 'rb') as f:
+        lines = f.read().split(b'\n')
+    if lines[-1] == b'':
+        lines = lines[:-1]
+    lines = [line[:-1] if line.endswith(b'\r') else line for line in lines]
+
+    width = max(len(line) for line in lines) + 1
+    padded = b''.join(line.ljust(width - 1) + b'\n' for line in lines)
+    return np.frombuffer(padded, dtype=np.uint8).reshape(len(lines), width)
+
+
+def decode_text(field):
+    """
+    A function to decode a 2-D byte array (records x width) into stripped
+    strings.  Blank fields become NaN.
+    Parameters
+    ----------
+    field       :   2-D uint8 array; the bytes of one variable
+    """
+    width = field.shape[1]
+    values = np.ascontiguousarray(field).view('S' + str(width)).ravel()
+    values = np.char.strip(np.char.decode(values, 'latin-1'))
+    values = values.astype(object)
+    values[values == ''] = np.NaN
+    return values
+
+
+def decode_numeric(field, divisor=1):
+    """
+    A function to decode a 2-D byte array (records x width) of right-justified
+    numbers.  Integer fields are decoded with array arithmetic on the digits;
+    the (rare) fields with an explicit decimal point or exponent are parsed as
+    text.  Returns int64 if there are no blanks and no scaling, float64
+    otherwise.
+    Parameters
+    ----------
+    field       :   2-D uint8 array; the bytes of one variable
+    divisor     :   float; implied decimal scaling (1 for none)
+    """
+    isDigit = (field >= 48) & (field <= 57)
+    digits = field.astype(np.int64) - 48
+
+    value = np.zeros(field.shape[0], dtype=np.int64)
+    for j in range(0, field.shape[1]):
+        value = np.where(isDigit[:, j], value * 10 + digits[:, j], value)
+    value[(field == 45).any(axis=1)] *= -1
+
+    blank = ~isDigit.any(axis=1)
+    hasPoint = (field == 46).any(axis=1)
+    isOther = ~(isDigit | (field == 32) | (field == 45) | (field == 43) | (field == 46))
+    isText = hasPoint | isOther.any(axis=1)
+
+    if (not blank.any()) and (not isText.any()) and (divisor in [1, None] or pd.isnull(divisor)):
+        return value
+
+    result = value.astype(float)
+    result[blank] = np.NaN
+    if not (divisor in [1, None] or pd.isnull(divisor)):
+        result[~hasPoint] = result[~hasPoint] * divisor
+    if isText.any():
+        result[isText] = pd.to_numeric(pd.Series(decode_text(field[isText])), errors='coerce').values
+        if not (divisor in [1, None] or pd.isnull(divisor)):
+            noPoint = isText & ~hasPoint
+            result[noPoint] = result[noPoint] * divisor
+    return result
+
+
+def read_sas_columns(data_file, dict_file, columns, beginline=1, lrecl=None, skip_decimal_division=None):
+    """
+    A function to read only the requested variables from a fixed-width SAS
+    data file.  The byte positions of each variable are taken from the
+    dictionary, the data file is memory-mapped, and only those byte slices
+    are decoded.  Nothing is written to disk.
+    Parameters
+    ----------
+    data_file       :   string; .txt data file
+    dict_file       :   string; must be a .sas dictionary file
+    columns         :   list of strings; the variables to return.  Names not
+                        in the dictionary are ignored.
+    beginline       :   integer;
+    """
+    DF = parse_sas(dict_file, beginline, lrecl)
+    specs = get_colspecs(DF, columns)
+
+    blocks = [decode_records(block, specs, skip_decimal_division) for block in iter_record_blocks(data_file, specs)]
+    if len(blocks) == 1:
+        return blocks[0]
+    return pd.concat(blocks, ignore_index=True)
+
+
+def iter_record_blocks(data_file, specs, blocksize=None):
+    """
+    A generator over a memory-mapped fixed-width file, yielding 2-D byte
+    arrays (records x bytes) of up to blocksize records each.
+    Parameters
+    ----------
+    data_file       :   string; .txt data file
+    specs           :   DataFrame; the output of get_colspecs.  Records
+                        shorter than the dictionary are padded with blanks.
+    blocksize       :   integer; records per block.  If None, one block.
+    """
+    records, lastRecord = map_records(data_file)
+    if (len(specs) > 0) and (records.shape[0] > 0) and (specs['end'].max() > records.shape[1] - 1):
+        # Every record has had its trailing blanks trimmed; put them back
+        width = int(specs['end'].max()) + 1
+        padded = np.full((records.shape[0], width), 32, dtype=np.uint8)
+        padded[:, :records.shape[1] - 1] = records[:, :-1]
+        padded[:, -1] = 10
+        if lastRecord is not None:
+            paddedLast = np.full((1, width), 32, dtype=np.uint8)
+            paddedLast[0, :lastRecord.shape[1]] = lastRecord[0]
+            lastRecord = paddedLast
+        records = padded
+
+    if blocksize is None:
+        blocksize = max(records.shape[0], 1)
+    for i in range(0, records.shape[0], blocksize):
+        yield records[i:i + blocksize]
+    if (lastRecord is not None) or (records.shape[0] == 0):
+        yield (lastRecord if lastRecord is not None else records)
+
+
+def decode_records(records, specs, skip_decimal_division=None):
+    """
+    A function to decode the variables in specs from a 2-D byte array of
+    records.
+    Parameters
+    ----------
+    records         :   2-D uint8 array; one row per record
+    specs           :   DataFrame; the output of get_colspecs
+    """
+    decoded = {}
+    for varname, start, end, char, divisor in zip(specs['varname'], specs['start'], specs['end'],
+                                                  specs['char'], specs['divisor']):
+        field = records[:, start:end]
+        if char == True:
+            decoded[varname] = decode_text(field)
+        elif skip_decimal_division:
+            decoded[varname] = decode_numeric(field)
+        else:
+            decoded[varname] = decode_numeric(field, divisor)
+
+    return pd.DataFrame(decoded, columns=list(specs['varname']))
+
+
+def get_arrow_schema(specs, promoteToFloat=[]):
+    """
+    A function to build the Parquet schema for a SAS dictionary: strings for
+    char variables, floats for variables with an implied decimal, and the
+    smallest integer type that holds a field of that width otherwise.
+    Parameters
+    ----------
+    specs           :   DataFrame; the output of get_colspecs
+    promoteToFloat  :   list of strings; integer variables that turned out
+                        to hold decimals, to be stored as floats instead
+    """
+    fields = []
+    for varname, start, end, char, divisor in zip(specs['varname'], specs['start'], specs['end'],
+                                                  specs['char'], specs['divisor']):
+        width = end - start
+        if char == True:
+            theType = pa.string()
+        elif (varname in promoteToFloat) or not (divisor in [1, None] or pd.isnull(divisor)):
+            theType = pa.float64()
+        elif width <= 2:
+            theType = pa.int8()
+        elif width <= 4:
+            theType = pa.int16()
+        elif width <= 9:
+            theType = pa.int32()
+        else:
+            theType = pa.int64()
+        fields.append(pa.field(varname, theType))
+    return pa.schema(fields)
+
+
+def write_sas_parquet(data_file, dict_file, outputParquet, outputMeta=None, chunksize=50000,
+                      beginline=1, lrecl=None, skip_decimal_division=None):
+    """
+    A function to convert a SAS data file into a typed Parquet file, with the
+    schema taken from the dictionary (see get_arrow_schema).  The file is
+    decoded and written chunksize records (one row group) at a time.
+    Parameters
+    ----------
+    data_file       :   string; .txt data file
+    dict_file       :   string; must be a .sas dictionary file
+    outputParquet   :   string; the Parquet file to write
+    outputMeta      :   string; optional CSV file for the parsed dictionary
+    chunksize       :   integer; number of records per row group
+    beginline       :   integer;
+    skip_decimal_division : boolean; if True, the values are stored as they
+                        are in the ASCII file, as in the CSV copy read_sas
+                        writes, and implied decimal variables keep an
+                        integer type
+    """
+    if pa is None:
+        raise Exception("pyarrow is needed to write Parquet files.")
+
+    DF = parse_sas(dict_file, beginline, lrecl)
+    specs = get_colspecs(DF)
+    if outputMeta is not None:
+        DF_cleaned = DF.dropna(subset=['varname'])
+        DF_cleaned['width'] = DF_cleaned['width'].astype(int)
+        DF_cleaned.to_csv(outputMeta, index=False)
+    if skip_decimal_division:
+        specs['divisor'] = 1
+
+    # A numeric field without an implied decimal can still hold an explicit one; if so, store it as a float and start over.
+    # The file is only put in place once it's complete, so an interrupted conversion doesn't leave a partial copy to be read later
+    promoteToFloat = []
+    tempParquet = outputParquet + '.' + str(os.getpid()) + '.tmp'
+    while True:
+        schema = get_arrow_schema(specs, promoteToFloat)
+        badColumns = []
+        writer = pq.ParquetWriter(tempParquet, schema)
+        try:
+            for block in iter_record_blocks(data_file, specs, chunksize):
+                decoded = decode_records(block, specs, skip_decimal_division)
+                arrays = []
+                for field in schema:
+                    try:
+                        arrays.append(pa.array(decoded[field.name].values, type=field.type, from_pandas=True))
+                    except pa.ArrowInvalid:
+                        badColumns.append(field.name)
+                if len(badColumns) > 0:
+                    break
+                writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        finally:
+            writer.close()
+
+        if len(badColumns) == 0:
+            os.replace(tempParquet, outputParquet)
+            return
+        print("Storing " + str(badColumns) + " as floats and starting over.")
+        promoteToFloat = promoteToFloat + badColumns
+
+
+def read_parquet(parquet_file, columns=None):
+    """
+    A function to read a Parquet file written by write_sas_parquet.  The
+    integer columns are stored as small as they fit, but read back as int64
+    (float64 if they have blanks), the same types read_sas gives, so nothing
+    downstream does arithmetic in int8/int16.
+    Parameters
+    ----------
+    parquet_file    :   string; the Parquet file
+    columns         :   list of strings; optional subset of variables to
+                        read.  Names not in the file are ignored.
+    """
+    if columns is None:
+        table = pq.read_table(parquet_file)
+    else:
+        wanted = set(columns)
+        columns = [x for x in pq.read_schema(parquet_file).names if x in wanted]
+        table = pq.read_table(parquet_file, columns=columns)
+    widened = pa.schema([pa.field(field.name, pa.int64()) if pa.types.is_integer(field.type) else field
+                         for field in table.schema])
+    return table.cast(widened).to_pandas()
@@ -1,7 +1,11 @@
 import SavingsRates.CalcSavingsRates as CalcSavingsRates
 import unittest
 import math
+import os
+import shutil
+import tempfile
 import pandas as pd
+import numpy as np
 import numpy.testing as npt
 import Inflation.CPI_InflationReader as CPI_InflationReader
 from mock import patch, MagicMock
@@ -29,6 +33,7 @@ class CalcSavingsRates_Test(unittest.TestCase):
         self.addCleanup(self.patcher.stop)
         self.inflationMocker = self.patcher.start()
         self.inflationMocker().getInflationFactorBetweenTwoYears.return_value = 1
+        self.inflationMocker().getInflationFactors.side_effect = lambda startYears, endYears: np.ones(len(startYears))
 
         self.csr = CalcSavingsRates.CalcSavingsRates(baseDir=LOCATION_OF_OUTPUT_DATA,
                                                       familyInputSubDir="B",
@@ -431,6 +436,174 @@ class CalcSavingsRates_Test(unittest.TestCase):
         self.assertTrue(closeEnough(savings2 - 150 + 10, self.csr.dta.loc[self.csr.dta[self.idVar] =='2', 'Total_NetActiveSavings_' + self.csr.inflatedTimespan].iloc[0]))
 
 
+class CalcFlowBasedSavingsAndGains_Test(unittest.TestCase):
+
+    def test_categories(self):
+        # Two asset classes (columns) for four households (rows): only the second class has a default cap gains rate
+        nan = float('nan')
+        results = CalcSavingsRates.calcFlowBasedSavingsAndGains(
+            startValues=np.array([[0, 100], [1000, 1000], [nan, 500], [1000, 1000]], dtype=float),
+            endValues=np.array([[5000, 200], [1500, nan], [600, 500], [1100, 1100]], dtype=float),
+            flowsIn=np.array([[nan, nan], [200, 100], [nan, nan], [nan, nan]], dtype=float),
+            flowsOut=np.array([[nan, 50], [nan, nan], [nan, nan], [nan, nan]], dtype=float),
+            hasStart=np.array([[0, 1], [1, 1], [1, 1], [1, 1]], dtype=float),
+            hasEnd=np.ones((4, 2)), duration=2,
+            inflationForStock_StartOfPeriod=1, inflationForStock_EndOfPeriod=1, inflationForStock_BetweenStartAndEnd=1,
+            inflationForFlow=np.array([1, 1]), defaultNominalCapGainsRates=np.array([nan, 0.1]),
+            acceptableImpliedAnnualNominalCapGains=0.2)
+
+        self.assertEqual(list(results['Status'][:, 0]), ['New Account', 'Both Balances + Flow', 'No Flow, One Balance', 'No Flow, Two Balances: ImpliedCapGains, NoSavings'])
+        self.assertEqual(results['OpenCloseTransfers'][0, 0], 5000)
+        self.assertEqual(results['CapitalGains'][1, 0], 300)
+        self.assertEqual(results['startValues'][2, 0], 600)  # Missing balance filled in; no change
+        self.assertEqual(results['CapitalGains'][3, 0], 100)
+
+        # The missing balance is filled in with the default cap gains, plus savings
+        self.assertEqual(results['Status'][1, 1], 'Flow, One Balance {FilledBalance from DefaultCapGains}')
+        self.assertTrue(closeEnough(results['endValues'][1, 1], 1000 * 1.1 ** 2 + 100))
+        self.assertTrue(closeEnough(results['CapitalGains'][1, 1], 1000 * (1.1 ** 2 - 1)))
+        self.assertEqual(results['Savings'][0, 1], -50)
+
+
+class InvestmentReturns_Test(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.tempDir, "otherInput"))
+        # No returns for 2003
+        pd.DataFrame({'Date': ['12/31/' + str(year) for year in [2000, 2001, 2002, 2004]],
+                      'Stock': [0.1, -0.2, 0.3, 0.05], 'Bond': [0.02, 0.03, 0.04, 0.05], '70-30': [0.08, -0.1, 0.2, 0.05]}).\
+            to_csv(os.path.join(self.tempDir, "otherInput", "annualReturns_Mstar.csv"), index=False)
+
+        self.patcher = patch('Inflation.CPI_InflationReader.CPIInflationReader')
+        self.addCleanup(self.patcher.stop)
+        self.patcher.start()
+        self.csr = CalcSavingsRates.CalcSavingsRates(baseDir=self.tempDir, familyInputSubDir="B", inputBaseName="D", outputBaseName="E", outputSubDir="F")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def test_getNominalInvestmentReturn(self):
+        fees = self.csr.CLASS_assumed_investment_fees
+        self.csr.setPeriod(2000, 2002, 2019)
+        self.assertTrue(closeEnough((1.1 - fees) * (0.8 - fees) - 1, self.csr.getNominalInvestmentReturn_ZeroCoded("Stock")))
+
+        returns = self.csr.getNominalInvestmentReturns_ZeroCoded("Bond", [2000, 2001, 2002, 2004], [2003, 2003, 2003, 2004])
+        npt.assert_allclose(returns, [(1.02 - fees) * (1.03 - fees) * (1.04 - fees) - 1, (1.03 - fees) * (1.04 - fees) - 1, 0.04 - fees, 0])
+
+        with self.assertRaises(Exception):
+            self.csr.getNominalInvestmentReturns_ZeroCoded("Blended", [2002], [2004])
+        with self.assertRaises(Exception):
+            self.csr.getNominalInvestmentReturns_ZeroCoded("Cash", [2000], [2001])
+
+    def writeReturnsForAllYears(self):
+        pd.DataFrame({'Date': ['12/31/' + str(year) for year in range(1984, 2005)], 'Stock': 0.05, 'Bond': 0.02, '70-30': 0.04}).\
+            to_csv(os.path.join(self.tempDir, "otherInput", "annualReturns_Mstar.csv"), index=False)
+        self.csr = CalcSavingsRates.CalcSavingsRates(baseDir=self.tempDir, familyInputSubDir="B", inputBaseName="D", outputBaseName="E", outputSubDir="F")
+
+    def test_batchMode(self):
+        self.writeReturnsForAllYears()
+        os.makedirs(os.path.join(self.tempDir, "B"))
+        for (startYear, endYear) in [(1999, 2001), (2001, 2003)]:
+            pd.DataFrame({'familyInterviewId_' + str(startYear): [1, 2, 3], 'value_' + str(endYear): [10.0, 20.0, 30.0]}).\
+                to_csv(os.path.join(self.tempDir, "B", 'TwoPeriod_D' + str(startYear) + '_' + str(endYear) + '_as_2019.csv'), index=False)
+
+        # Stand in for the savings calc itself, which needs the full set of PSID variables
+        def calcForTimespan():
+            self.csr.dta['doubled_' + self.csr.inflatedTimespan] = self.csr.dta['value_' + self.csr.eyStr] * 2
+            return [{"Period": self.csr.inflatedTimespan}]
+        self.csr.calcForTimespan = calcForTimespan
+
+        statusCounts = self.csr.executeForAllTimespans([(1999, 2001), (2001, 2003)], 2019)
+        self.assertEqual([x["Period"] for x in statusCounts], ['1999_2001_as_2019', '2001_2003_as_2019'])
+
+        # Each timespan is a partition of one dataset, and is read back as if it were its own file
+        self.assertFalse(os.path.exists(os.path.join(self.tempDir, "F", 'TwoPeriod_E2001_2003_as_2019.csv')))
+        reader = CalcSavingsRates.CalcSavingsRates(baseDir=self.tempDir, familyInputSubDir="F", inputBaseName="E", outputBaseName="G", outputSubDir="H")
+        dta = reader.loadLongitudinalData('2001_2003_as_2019')
+        self.assertEqual(list(dta.columns), ['familyInterviewId_2001', 'value_2003', 'doubled_2001_2003_as_2019'])
+        self.assertEqual(list(dta['doubled_2001_2003_as_2019']), [20.0, 40.0, 60.0])
+
+    def test_batchModeReturns(self):
+        # The returns for all of the timespans are looked up together, and each timespan's calc uses its own
+        self.csr.calcForTimespan = MagicMock(side_effect=lambda: [{"Period": self.csr.inflatedTimespan, "Stock": self.csr.getNominalInvestmentReturn_ZeroCoded("Stock")}])
+        self.csr.loadLongitudinalData = MagicMock(return_value=pd.DataFrame({'x': [1]}))
+        self.csr.saveLongitudinalDataToDataset = MagicMock()
+        fees = self.csr.CLASS_assumed_investment_fees
+        with patch.object(self.csr, 'getNominalInvestmentReturns_ZeroCoded', wraps=self.csr.getNominalInvestmentReturns_ZeroCoded) as lookup:
+            statusCounts = self.csr.executeForAllTimespans([(2000, 2001), (2001, 2002)], 2019)
+        self.assertEqual(lookup.call_count, len(self.csr.CLASS_investment_return_fields))
+        npt.assert_allclose([x["Stock"] for x in statusCounts], [0.1 - fees, -0.2 - fees])
+
+        # A timespan without returns fails before any of them is calculated
+        self.csr.calcForTimespan.reset_mock()
+        with self.assertRaises(Exception):
+            self.csr.executeForAllTimespans([(2000, 2002), (2002, 2004)], 2019)
+        self.csr.calcForTimespan.assert_not_called()
+
+    def test_batchModeWithSavingsCalc(self):
+        self.writeReturnsForAllYears()
+        timespans = [(1989, 1994), (1999, 2001)]
+        self.csr.inflator.getInflationFactorBetweenTwoYears.return_value = 1
+        self.csr.inflator.getInflationFactors.side_effect = lambda startYears, endYears: np.ones(len(startYears))
+
+        # The full set of inputs the savings calc uses, through a CSV as InequalityDataPrep writes them, with a few missing values
+        os.makedirs(os.path.join(self.tempDir, "B"))
+        for (startYear, endYear) in timespans:
+            self.csr.setPeriod(startYear, endYear, 2019)
+            data = CalcSavingsRates_Test.createDummyData(self, includeMovingVars = True, includeValueVars = True, includeChangeInValueVars = True)
+            for var in ['cleaningStatus_' + self.csr.timespan, 'modificationStatus_' + self.csr.timespan]:
+                data[var] = 'Keep'
+            for var in ['familyInterviewId_' + self.csr.syStr, 'familyInterviewId_' + self.csr.eyStr]:
+                data[var] = [1, 2]
+            for var in ['inflatedNetWorthWithHome_' + self.csr.inflatedStart, 'changeInRealNetWorth_' + self.csr.inflatedTimespan,
+                        'changeInRealNetWorthWithHomeAnd401k_AfterBalanceFillin_' + self.csr.inflatedTimespan, 'inflatedAfterTaxIncome_' + self.csr.inflatedStart,
+                        'retirementContribHH_' + self.csr.syStr, 'retirementContribHH_' + self.csr.eyStr]:
+                data[var] = [1000.0, None]
+            data['valueOfBrokerageStocks_Net_' + self.csr.eyStr] = [None, 500.0]
+            data['hasBrokerageStocks_' + self.csr.eyStr] = [True, None]
+            data.to_csv(os.path.join(self.tempDir, "B", 'TwoPeriod_D' + self.csr.inflatedTimespan + '.csv'), index=False)
+
+        # An older CSV for one of the timespans
+        os.makedirs(os.path.join(self.tempDir, "F"))
+        oldFile = os.path.join(self.tempDir, "F", 'TwoPeriod_E1999_2001_as_2019.csv')
+        pd.DataFrame({'old': [1]}).to_csv(oldFile, index=False)
+
+        # If the write fails, the older CSV stays, and no partition is left behind
+        with patch.object(pd.DataFrame, 'to_parquet', side_effect=Exception("Disk full")):
+            with self.assertRaises(Exception):
+                self.csr.executeForAllTimespans(timespans[1:], 2019)
+        self.assertTrue(os.path.exists(oldFile))
+        reader = CalcSavingsRates.CalcSavingsRates(baseDir=self.tempDir, familyInputSubDir="F", inputBaseName="E", outputBaseName="G", outputSubDir="H")
+        self.assertEqual(list(reader.loadLongitudinalData('1999_2001_as_2019').columns), ['old'])
+
+        self.csr.executeForAllTimespans(timespans, 2019)
+        self.assertFalse(os.path.exists(oldFile))
+        for (startYear, endYear) in timespans:
+            self.csr.setPeriod(startYear, endYear, 2019)
+            dta = reader.loadLongitudinalData(self.csr.inflatedTimespan)
+            self.assertEqual(len(dta), 2)
+            self.assertTrue((dta.dtypes != object).sum() > 0)
+            for col in dta.columns[dta.dtypes == object]:
+                self.assertTrue(dta[col].dropna().map(lambda x: isinstance(x, str)).all(), col)
+
+        # Columns that are all missing before 1999 are still numbers, and flags with gaps are still flags
+        self.assertEqual(dta['hasBrokerageStocks_2001'].dtype, 'boolean')
+        self.assertTrue(pd.isna(dta['hasBrokerageStocks_2001'].iloc[1]))
+        dta = reader.loadLongitudinalData('1989_1994_as_2019')
+        self.assertEqual(dta['PrivateRetirePlan_AN_SavingsRate_1989_1994_as_2019'].dtype, float)
+
+        # Flags and numbers in one column, which pyarrow won't take as they are
+        self.csr.saveLongitudinalDataToDataset(pd.DataFrame({'mixed': [True, 1.5, None], 'text': ['a', None, 3]}), '2001_2003_as_2019')
+        dta = reader.loadLongitudinalData('2001_2003_as_2019')
+        npt.assert_array_equal(dta.mixed.values, [1.0, 1.5, np.NaN])
+        self.assertEqual(list(dta.text.fillna('-')), ['a', '-', '3'])
+
+        # The partition is read ahead of a leftover CSV
+        pd.DataFrame({'old': [1]}).to_csv(os.path.join(self.tempDir, "F", 'TwoPeriod_E1989_1994_as_2019.csv'), index=False)
+        self.assertEqual(len(reader.loadLongitudinalData('1989_1994_as_2019')), 2)
+
+
 if __name__ == '__main__':
     unittest.main()
 
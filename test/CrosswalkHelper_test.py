@@ -0,0 +1,58 @@
+import PSIDProcessing.CrosswalkHelper as CrosswalkHelper
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+
+class CrosswalkHelperTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        pd.DataFrame({
+            'TYPE': ['Individual', 'Family', 'Family'],
+            'C0': ['Individual', 'Family', 'Family'],
+            'C1': ['Demographic', 'Wealth', 'Wealth'],
+            'C2': ['Age', 'House', 'Debt'],
+            'Y1999': ['ER33504', 'ER15002', np.NaN],
+            'Y2001': ['ER33604', 'ER19198', 'ER19199'],
+        }).to_csv(os.path.join(self.tempDir, CrosswalkHelper.CROSSWALK_FILE_PROCESSED))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def test_lookups(self):
+        helper = CrosswalkHelper.PSIDCrosswalkHelper(self.tempDir)
+        self.assertTrue(os.path.exists(os.path.join(self.tempDir, CrosswalkHelper.CROSSWALK_FILE_INDEX)))
+
+        self.assertEqual(list(helper.getDetailsForVar('ER19198').C2), ['House'])
+        self.assertEqual(helper.getVariablesInSameSeries('ER33604'), [{'1999': 'ER33504', '2001': 'ER33604'}])
+        self.assertEqual(list(helper.findCategoryDetailsForVariable('ER19199').C2), ['Debt'])
+        self.assertEqual(len(helper.findCategoryDetailsForVariable('NOTAVAR')), 0)
+        self.assertEqual(list(helper.getCategoriesMatchingCriteria(['family', 'wea']).C2), ['House', 'Debt'])
+
+        series = helper.getVariableSeriesesGivenSample({'ER15002': 'valueOfHouse', 'ER33504': 'age'}, [1999, 2001])
+        self.assertEqual(list(series.label), ['valueOfHouse', 'age'])
+        self.assertEqual(list(series['2001']), ['ER19198', 'ER33604'])
+        with self.assertRaises(Exception):
+            helper.getVariableSeriesesGivenSample(['NOTAVAR'], [1999])
+
+        # Second time around, the saved index is used
+        self.assertEqual(CrosswalkHelper.PSIDCrosswalkHelper(self.tempDir).varIndex, helper.varIndex)
+
+    def test_variableStatusLongForm(self):
+        helper = CrosswalkHelper.PSIDCrosswalkHelper(self.tempDir)
+        status = helper.getVariableStatusLongForm({'ER33504': 'age'}, [2001], alwaysLoadTheseVars = {'ER33604': 'age2001', 'ER19199': 'debt'})
+
+        self.assertEqual(list(status.columns), ['sourcefile', 'category', 'subcategory', 'label', 'count', 'year', 'varName'])
+        self.assertEqual(list(status.varName), ['ER33604', 'ER19199'])  # ER33604 is already there, as our 2001 age
+        self.assertEqual(list(status.year), ['2001', '2001'])
+        self.assertEqual(list(status.label), ['age', 'debt'])
+        self.assertEqual(list(status.subcategory), ['Age', 'Debt'])
+        self.assertIsNone(status['count'].iloc[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import PSIDProcessing.DtypePolicy as DtypePolicy
+import unittest
+import os
+import shutil
+import tempfile
+import pandas as pd
+import numpy as np
+
+
+class DtypePolicyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.dta = pd.DataFrame({
+            'raceR': ['White', 'Black', None, 'White'] * 10,
+            'hasHouse': [True, False, None, True] * 10,
+            'isWorking': [True, False, True, True] * 10,
+            'ChangeInCompositionFU': [0, 1, 8, np.NaN] * 10,
+            'familyInterviewId': range(1000, 1040),
+            'interviewId_1999': [1.0, 2.0, 3.0, np.NaN] * 10,
+            'familyId1968_1999': [1.0, 2.0] * 20,
+            'numChildren': [100, 1, 2, 3] * 10,
+            'valueOfHouse_Gross': [float(x * 1000) for x in range(39)] + [np.NaN],
+            'inflatedIncome': [x * 1.1 for x in range(40)],
+            'modificationStatus': [''] * 40,
+            'allMissing': [None] * 40,
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def test_compactFrame(self):
+        original = self.dta.copy()
+        DtypePolicy.compactFrame(self.dta)
+        self.assertEqual(self.dta.raceR.dtype, 'category')
+        self.assertEqual(self.dta.hasHouse.dtype, 'boolean')
+        self.assertEqual(self.dta.isWorking.dtype, bool)  # Already compact
+        self.assertEqual(self.dta.familyInterviewId.dtype, np.int32)
+        self.assertEqual(self.dta.interviewId_1999.dtype, 'Int32')
+        self.assertEqual(self.dta.familyId1968_1999.dtype, np.int32)
+        self.assertEqual(self.dta.allMissing.dtype, object)
+
+        # Codes and amounts may be added up later, so they keep their types: no overflow, no float32 rounding
+        self.assertEqual(self.dta.ChangeInCompositionFU.dtype, np.float64)
+        self.assertEqual(self.dta.numChildren.dtype, np.int64)
+        self.assertEqual((self.dta.numChildren + self.dta.numChildren).max(), 200)
+        self.assertEqual(self.dta.valueOfHouse_Gross.dtype, np.float64)
+        self.assertEqual(self.dta.inflatedIncome.dtype, np.float64)
+
+        # Same values, less memory
+        for column in original.columns:
+            self.assertTrue(original[column].astype(object).where(original[column].notna(), None).equals(
+                self.dta[column].astype(object).where(self.dta[column].notna(), None)), column)
+        self.assertLess(self.dta.memory_usage(deep=True).sum(), original.memory_usage(deep=True).sum() / 2)
+
+    def test_saveAndRead(self):
+        fileName = os.path.join(self.tempDir, 'data')
+        DtypePolicy.saveCsv(self.dta, fileName)
+        self.assertEqual(self.dta.raceR.dtype, object)  # Saving doesn't change the data in memory
+
+        reread = DtypePolicy.readCsv(fileName)
+        expected = DtypePolicy.compactFrame(self.dta.copy())
+        for column in expected.columns.drop('allMissing'):
+            self.assertEqual(str(reread[column].dtype), str(expected[column].dtype), column)  # Categories can differ: CSV reads '' as missing
+        self.assertEqual(reread.interviewId_1999.isna().sum(), 10)
+
+        # Without the types file, we compact after reading
+        os.remove(fileName + DtypePolicy.DTYPES_FILE_SUFFIX + ".csv")
+        self.assertEqual(DtypePolicy.readCsv(fileName).hasHouse.dtype, 'boolean')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import PSIDProcessing.Extractor as Extractor
+import PSIDProcessing.CrosswalkHelper as CrosswalkHelper
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+
+class ExtractorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.outputDir = os.path.join(self.tempDir, 'extracted')
+        pd.DataFrame({
+            'TYPE': ['INDIVIDUAL'] * 6,
+            'C0': ['INDIVIDUAL'] * 6,
+            'C1': ['Demographic', 'Demographic', 'Weights', 'Survey Information', 'Employment', 'Survey Information'],
+            'C2': ['Age', 'Relation', 'Weight', 'Interview Number', 'Hours', 'Person Number'],
+            'Y1968': [np.NaN, np.NaN, np.NaN, 'ER30001', np.NaN, 'ER30002'],
+            'Y1999': ['ER33504', 'ER33503', 'ER33546', np.NaN, np.NaN, np.NaN],
+            'Y2001': ['ER33604', 'ER33603', 'ER33637', np.NaN, 'ER33650', np.NaN],
+        }).to_csv(os.path.join(self.tempDir, CrosswalkHelper.CROSSWALK_FILE_PROCESSED))
+
+        # A pre-converted copy of the raw individual file
+        self.individualFile = os.path.join(self.tempDir, 'PSIDIndividualData', 'ind2019er', 'IND2019ER.parquet')
+        os.makedirs(os.path.dirname(self.individualFile))
+        self.writeIndividualFile(np.arange(5))
+
+    def writeIndividualFile(self, rows):
+        pd.DataFrame({x: rows + i for i, x in enumerate(['ER30001', 'ER30002', 'ER33504', 'ER33503', 'ER33546', 'ER33604', 'ER33603', 'ER33637'])}). \
+            to_parquet(self.individualFile)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def extract(self, varsWeWant):
+        extractor = Extractor.Extractor(self.tempDir, [1999, 2001], varsWeWant, {'ER30001': 'interviewId1968', 'ER30002': 'personId'}, source='individual')
+        loaded = []
+        readIndividualData = extractor.loader.readIndividualData
+        extractor.loader.readIndividualData = lambda fieldsToKeep, forceReload = False: loaded.append(sorted(fieldsToKeep)) or readIndividualData(fieldsToKeep, forceReload)
+        extractor.getDataForSelectedVars(saveIt = True, filePath = self.outputDir, fileNameBase = 'extractedPSID_Individual')
+        return extractor, loaded
+
+    def test_incrementalExtraction(self):
+        extractor, loaded = self.extract({'ER33504': 'age'})
+        self.assertEqual(loaded, [['ER30001', 'ER30002', 'ER33504', 'ER33604']])
+
+        # Only the new series (and the ids, to line the rows up) is loaded from the raw data; the series we dropped is dropped from the file
+        extractor, loaded = self.extract({'ER33604': 'age', 'ER33603': 'relation'})
+        self.assertEqual(loaded, [['ER30001', 'ER30002', 'ER33503', 'ER33603']])
+        self.assertEqual(sorted(extractor.dataDict[0].columns), ['ER30001', 'ER30002', 'ER33503', 'ER33504', 'ER33603', 'ER33604'])
+
+        extractor.readExtractedData([1999, 2001], self.outputDir, 'extractedPSID_Individual')
+        self.assertEqual(list(extractor.dataDict[0].ER33603), list(np.arange(5) + 6))
+        self.assertEqual(list(extractor.dataDict[0].ER33504), list(np.arange(5) + 2))
+
+        # Nothing new, nothing loaded
+        extractor, loaded = self.extract({'ER33604': 'age'})
+        self.assertEqual(loaded, [])
+        self.assertEqual(sorted(extractor.dataDict[0].columns), ['ER30001', 'ER30002', 'ER33504', 'ER33604'])
+
+    def test_newRawRelease(self):
+        self.extract({'ER33504': 'age'})
+
+        # A new release of the raw file (different rows): everything is extracted again, not just new variables
+        self.writeIndividualFile(np.arange(10, 16))
+        extractor, loaded = self.extract({'ER33504': 'age', 'ER33503': 'relation'})
+        self.assertEqual(loaded, [['ER30001', 'ER30002', 'ER33503', 'ER33504', 'ER33603', 'ER33604']])
+        self.assertEqual(list(extractor.dataDict[0].ER33504), list(np.arange(10, 16) + 2))
+
+    def test_addNewColumns(self):
+        extractor = Extractor.Extractor(self.tempDir, [1999, 2001], {}, None, source='individual')
+        dta = pd.DataFrame({'ER30001': [1, 1, 2], 'ER30002': [1, 2, 1], 'ER33504': [30, 40, 50]})
+
+        # Rows are matched on the ids, not their position
+        newDta = pd.DataFrame({'ER30001': [2, 1, 1], 'ER30002': [1, 2, 1], 'ER33503': [3, 2, 1]})
+        combined = extractor.addNewColumns(dta, newDta, Extractor.INDIVIDUAL_ID_VARS)
+        self.assertEqual(list(combined.columns), ['ER30001', 'ER30002', 'ER33504', 'ER33503'])
+        self.assertEqual(list(combined.ER33503), [1, 2, 3])
+
+        # Same number of rows, but not the same people
+        newDta.loc[0, 'ER30002'] = 3
+        self.assertIsNone(extractor.addNewColumns(dta, newDta, Extractor.INDIVIDUAL_ID_VARS))
+        self.assertIsNone(extractor.addNewColumns(dta, newDta[['ER30001', 'ER33503']], Extractor.INDIVIDUAL_ID_VARS))
+
+    def test_fillMissingVarsWithNones(self):
+        extractor = Extractor.Extractor(self.tempDir, [1999, 2001], {}, None, source='individual')
+        # Already mapped to our names
+        extractor.dataDict = {1999: pd.DataFrame({'age': np.array([30, 40], dtype=np.int8), 'wealth': [1.5, 2.5]}, index=[5, 6]),
+                              2001: pd.DataFrame({'age': np.array([32, 42], dtype=np.int8), 'hours': np.array([2000, 1500], dtype=np.int16)}, index=[7, 8])}
+        # The real status table, with the years as the crosswalk has them (strings)
+        extractor.variableStatusLongForm = CrosswalkHelper.PSIDCrosswalkHelper(self.tempDir).getVariableStatusLongForm(
+            {'ER33504': 'age', 'ER33650': 'hours'}, [1999, 2001])
+        extractor.fillMissingVarsWithNones()
+
+        self.assertEqual(list(extractor.dataDict[1999].columns), ['age', 'wealth', 'hours'])
+        self.assertEqual(list(extractor.dataDict[1999].index), [5, 6])
+        self.assertEqual(extractor.dataDict[1999].wealth.dtype, np.float64)
+        self.assertEqual(extractor.dataDict[1999].hours.dtype, 'Int16')  # Typed like the years that have it
+        self.assertTrue(extractor.dataDict[1999].hours.isna().all())
+        self.assertEqual(list(extractor.dataDict[2001].columns), ['age', 'hours'])  # Nothing missing in 2001
+
+
+if __name__ == '__main__':
+    unittest.main()
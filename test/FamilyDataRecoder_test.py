@@ -0,0 +1,65 @@
+import PSIDProcessing.FamilyDataRecoder as FamilyDataRecoder
+import Controller.varsForInequalityAnalysis as varsForInequalityAnalysis
+import unittest
+import os
+import shutil
+import tempfile
+import pandas as pd
+import numpy as np
+from mock import patch, MagicMock
+from pandas.testing import assert_frame_equal
+from Controller.params_AllInequalityAnalyses_EnrichedPop import dotdict
+
+
+class FamilyDataRecoderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.params = dotdict({'PSID_DATA_DIR': os.path.join(self.tempDir, 'psid'),
+                               'BASE_OUTPUT_DIR': self.tempDir,
+                               'MAPPED_OUTPUT_SUBDIR': 'mapped',
+                               'yearsToInclude': [2017, 2019],
+                               'familyWealthVarsWeNeed2019': None,
+                               'individualVarsWeNeed2019': None,
+                               'individualVars_LoadRegardlessOfYear': None,
+                               'numWorkers': None})
+        self.mappedDir = os.path.join(self.tempDir, 'mapped')
+        os.makedirs(self.params.PSID_DATA_DIR)
+        os.makedirs(self.mappedDir)
+
+        pd.DataFrame({'PSID': range(0, 60), 'SOI': range(100, 160), 'FIPS': range(200, 260)}). \
+            to_csv(os.path.join(self.params.PSID_DATA_DIR, "StateCodes_PSID_To_SOI.csv"), index=False)
+
+        # Two small years of extracted family data: every variable we extract, with small made-up codes
+        status = []
+        for year in self.params.yearsToInclude:
+            randomCodes = np.random.default_rng(year)
+            yearData = pd.DataFrame({label: randomCodes.integers(0, 6, 8) for label in sorted(set(varsForInequalityAnalysis.familyWealthVars.values()))})
+            yearData.to_csv(os.path.join(self.mappedDir, "extractedPSID_Mapped_" + str(year) + ".csv"), index=False)
+            status = status + [{'year': year, 'label': label, 'varName': varName} for varName, label in varsForInequalityAnalysis.familyWealthVars.items()]
+        pd.DataFrame(status).to_csv(os.path.join(self.mappedDir, "extractedPSID_Mapped_VariableStatus.csv"), index=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def recodeAndRead(self, numWorkers):
+        self.params.numWorkers = numWorkers
+        # Only the family years are compared; the individual file is recoded the same way either way
+        with patch('PSIDProcessing.CrosswalkHelper.PSIDCrosswalkHelper'), patch('PSIDProcessing.IndividualDataRecoder.IndividualDataRecoder'):
+            FamilyDataRecoder.recodeAndSave(self.params, None, MagicMock())
+        return {year: pd.read_csv(os.path.join(self.mappedDir, "extractedPSID_Mapped_Recoded_" + str(year) + ".csv"))
+                for year in self.params.yearsToInclude}
+
+    def test_recodeYearsInParallel(self):
+        serial = self.recodeAndRead(None)
+        for year in self.params.yearsToInclude:
+            os.remove(os.path.join(self.mappedDir, "extractedPSID_Mapped_Recoded_" + str(year) + ".csv"))
+        parallel = self.recodeAndRead(2)
+
+        for year in self.params.yearsToInclude:
+            self.assertEqual(len(parallel[year]), 8)
+            assert_frame_equal(serial[year], parallel[year])
+
+
+if __name__ == '__main__':
+    unittest.main()
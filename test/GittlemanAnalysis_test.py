@@ -1,6 +1,7 @@
 import Replication.GittlemanAnalysis as GittlemanAnalysis
 import unittest
 import pandas as pd
+import numpy as np
 import numpy.testing as npt
 import Inflation.CPI_InflationReader as CPI_InflationReader
 from mock import patch, MagicMock
@@ -39,6 +40,7 @@ class GittlemanAnalysisTest(unittest.TestCase):
         # self.inflationMocker.getInflationFactorBetweenTwoYears = MagicMock(return_value=1)
         # self.inflationMocker.getInflationFactorBetweenTwoYears.return_value = 1
         self.inflationMocker().getInflationFactorBetweenTwoYears.return_value = 1
+        self.inflationMocker().getInflationFactors.side_effect = lambda startYears, endYears: np.ones(len(startYears))
 
         self.ga = GittlemanAnalysis.GittlemanAnalysis(baseDir="A",
                                                       familyInputSubDir="B",
@@ -1,6 +1,11 @@
 import SavingsRates.InequalityDataPrep as InequalityDataPrep
+import PSIDProcessing.DtypePolicy as DtypePolicy
 import unittest
+import os
+import shutil
+import tempfile
 import pandas as pd
+import numpy as np
 import numpy.testing as npt
 import Inflation.CPI_InflationReader as CPI_InflationReader
 from mock import patch, MagicMock
@@ -42,6 +47,7 @@ class InequalityDataPrep_Test(unittest.TestCase):
         # self.inflationMocker.getInflationFactorBetweenTwoYears = MagicMock(return_value=1)
         # self.inflationMocker.getInflationFactorBetweenTwoYears.return_value = 1
         self.inflationMocker().getInflationFactorBetweenTwoYears.return_value = 1
+        self.inflationMocker().getInflationFactors.side_effect = lambda startYears, endYears: np.ones(len(startYears))
 
         self.ie = InequalityDataPrep.InequalityDataPrep(baseDir="A",
                                                       familyInputSubDir="B",
@@ -237,3 +243,167 @@ class InequalityDataPrep_Test(unittest.TestCase):
     if __name__ == '__main__':
         unittest.main()
 
+
+
+class InequalityDataPrep_ReadRawData_Test(unittest.TestCase):
+    '''
+    Builds the longitudinal frame from a small individual file and made-up processed family years
+    '''
+
+    def setUp(self):
+        self.patcher = patch('Inflation.CPI_InflationReader.CPIInflationReader')
+        self.addCleanup(self.patcher.stop)
+        self.inflationMocker = self.patcher.start()
+        self.inflationMocker().getInflationFactorBetweenTwoYears.return_value = 1
+        self.inflationMocker().getInflationFactors.side_effect = lambda startYears, endYears: np.ones(len(startYears))
+
+        self.tempDir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempDir)
+
+        # Individual 1 and 2 are in a family every year; 3 wasn't interviewed in 1999 (id 0); 4's 2001 family is missing from
+        # that year's file; 5 is in no family at all, and 6 isn't a head
+        individualData = pd.DataFrame({'constantIndividualID': [1, 2, 3, 4, 5, 6],
+                                       'interviewId_1999': [10, 20, 0, 40, 0, 10],
+                                       'interviewId_2001': [11, 21, 31, 41, 0, 11],
+                                       'interviewId_2003': [12, 22, 32, 0, 0, 12],
+                                       'sequenceNoI_2001': [1, 1, 1, 1, 1, 2],
+                                       'sequenceNoI_2003': [1, 1, 1, 1, 1, 2]})
+        for year in ['1997', '1999', '2001', '2003']:
+            individualData['ageI_' + year] = 30
+            individualData['longitudinalWeightI_' + year] = [1.5, 2.5, 3.5, 4.5, 5.5, 6.5]
+            for var in ['stateBornI_', 'countryBornI_', 'livedInUSIn68I_']:
+                individualData[var + year] = 1
+        individualData.to_csv(os.path.join(self.tempDir, 'ind.csv'), index=False)
+
+        self.familyData = {}
+        for year, ids in [(1999, [20, 10, 40]), (2001, [31, 11, 21]), (2003, [12, 22, 32])]:
+            yr = str(year)
+            self.familyData[year] = pd.DataFrame({'familyInterviewId_' + yr: ids,
+                                                  'totalIncomeHH_' + yr: [x * 100.0 for x in ids],
+                                                  'raceR_' + yr: ['White', 'Black', 'Other'],
+                                                  'hasHouse_' + yr: [True, False, True]})
+
+        self.ie = InequalityDataPrep.InequalityDataPrep(baseDir = self.tempDir,
+                                                        familyInputSubDir = '', familyBaseName = 'fam',
+                                                        individualInputSubDir = '', individualBaseName = 'ind',
+                                                        outputSubDir = 'out', inputBaseName = '', outputBaseName = '',
+                                                        useOriginalSampleOnly = False)
+        self.processYear = patch.object(self.ie, 'processYear', side_effect = self.fakeProcessYear).start()
+        self.addCleanup(patch.stopall)
+
+    def fakeProcessYear(self, year, theVars):
+        return DtypePolicy.compactFrame(self.familyData[year].copy())
+
+    def readTimespan(self, startYear, endYear):
+        self.ie.clearData()
+        self.ie.setPeriod(startYear, endYear, 2019)
+        self.ie.readRawData()
+        return self.ie.dta
+
+    def mergeTimespan(self, startYear, endYear):
+        # How readRawData used to do it: a left merge of each year onto the individuals
+        individualData = DtypePolicy.readCsv(os.path.join(self.tempDir, 'ind'))
+        individualData = individualData.loc[individualData['sequenceNoI_' + str(endYear)] == 1].copy()
+        individualData['constantFamilyId'] = range(1, (len(individualData) + 1), 1)
+        years = [startYear, endYear]
+        inidvidualVars = ['ageI_' + str(endYear), 'constantFamilyId', 'constantIndividualID', 'longitudinalWeightI_' + str(endYear)] + \
+                         ['stateBornI_1997', 'stateBornI_1999', 'countryBornI_1997', 'countryBornI_1999', 'livedInUSIn68I_1997', 'livedInUSIn68I_1999'] + \
+                         ['interviewId_' + str(year) for year in years]
+        dta = DtypePolicy.compactFrame(individualData[inidvidualVars].copy())
+        for year in years:
+            dta = pd.merge(dta, self.fakeProcessYear(year, None), right_on = 'familyInterviewId_' + str(year),
+                           left_on = 'interviewId_' + str(year), how = 'left')
+        return dta.loc[~(dta[['familyInterviewId_' + str(year) for year in years]].isnull().all(axis=1))].copy()
+
+    def test_readRawDataMatchesMerge(self):
+        dta = self.readTimespan(1999, 2001)
+        expected = self.mergeTimespan(1999, 2001)
+
+        self.assertEqual(list(dta.constantIndividualID), [1, 2, 3, 4])
+        self.assertEqual(list(dta.columns), list(expected.columns))
+        for column in expected.columns:
+            assert_series_equal(dta[column], expected[column], check_index=False)
+        self.assertTrue(dta.loc[dta.constantIndividualID == 4, 'totalIncomeHH_2001'].isnull().all())
+        self.assertTrue(dta.loc[dta.constantIndividualID == 3, 'raceR_1999'].isnull().all())
+
+    def test_duplicateFamilyIds(self):
+        self.familyData[2001]['familyInterviewId_2001'] = [31, 11, 11]
+        with self.assertRaises(Exception):
+            self.readTimespan(1999, 2001)
+
+    def test_sharedYearProcessedOnce(self):
+        first = self.readTimespan(1999, 2001)
+        # The later steps of a timespan write to its wide frame; none of that may reach the cached year
+        first.loc[:, 'totalIncomeHH_2001'] = -1.0
+        first.loc[first.index[0], 'raceR_2001'] = 'Changed'
+
+        second = self.readTimespan(2001, 2003)
+        self.assertEqual([x.args[0] for x in self.processYear.call_args_list], [1999, 2001, 2003])
+        assert_frame_equal(second[['familyInterviewId_2001', 'totalIncomeHH_2001', 'raceR_2001']].reset_index(drop=True),
+                           self.mergeTimespan(2001, 2003)[['familyInterviewId_2001', 'totalIncomeHH_2001', 'raceR_2001']].reset_index(drop=True))
+        self.assertEqual(list(second.totalIncomeHH_2001), [1100.0, 2100.0, 3100.0])
+        cached = [yearData for (year, theVars, toYear, useOriginalSampleOnly), yearData in self.ie.processedYears.items() if year == 2001]
+        assert_frame_equal(cached[0], self.fakeProcessYear(2001, None))
+
+
+class InequalityDataPrep_HousingChanges_Test(unittest.TestCase):
+    '''
+    calcIfValueOnMoveAndChangedHeadAtAnyPoint over 1999-2003 (2001 and 2003 each compared with two years before), on three households:
+    1) owns, then sells in 2003 without reporting a move; 2) reports a move in 2001, and its 2003 move status is missing;
+    3) owns the same house throughout, and never moves
+    '''
+
+    # Each year's values are inflated by a different factor, so a value from the wrong year shows up
+    inflationFactors = {1999: 1.2, 2001: 1.1, 2003: 1.0}
+
+    def setUp(self):
+        self.patcher = patch('Inflation.CPI_InflationReader.CPIInflationReader')
+        self.addCleanup(self.patcher.stop)
+        self.inflationMocker = self.patcher.start()
+        self.inflationMocker().getInflationFactors.side_effect = \
+            lambda startYears, endYears: np.array([self.inflationFactors[year] for year in startYears])
+
+        self.ie = InequalityDataPrep.InequalityDataPrep(baseDir = "A", familyInputSubDir = "B", familyBaseName = "C",
+                                                        individualInputSubDir = "D", individualBaseName = "E", outputSubDir = "F",
+                                                        inputBaseName = "", outputBaseName = "", useOriginalSampleOnly = False)
+        self.ie.clearData()
+        self.ie.setPeriod(1999, 2003, 2019)
+
+        self.ie.dta = pd.DataFrame({
+            'MovedR_1999': pd.array([False, False, False], dtype='boolean'),
+            'MovedR_2001': pd.array([False, True, False], dtype='boolean'),
+            'MovedR_2003': pd.array([False, None, False], dtype='boolean'),
+            'hasHouse_1999': pd.array([True, True, True], dtype='boolean'),
+            'hasHouse_2001': pd.array([True, True, True], dtype='boolean'),
+            'hasHouse_2003': pd.array([False, True, True], dtype='boolean'),
+            'valueOfHouse_Gross_1999': [100.0, 100.0, 100.0],
+            'valueOfHouse_Gross_2001': [200.0, 300.0, 100.0],
+            'valueOfHouse_Gross_2003': [0.0, 400.0, 100.0],
+            'valueOfHouse_Debt_1999': [50.0, 0.0, 0.0],
+            'valueOfHouse_Debt_2001': [40.0, 100.0, 0.0],
+            'valueOfHouse_Debt_2003': [0.0, 90.0, 0.0],
+            # A change of head in the start year doesn't count
+            'ChangeInCompositionFU_1999': [0, 0, 8],
+            'ChangeInCompositionFU_2001': [1, 1, 0],
+            'ChangeInCompositionFU_2003': [0, 5, 2],
+        })
+
+    def test_housingChanges(self):
+        self.ie.calcIfValueOnMoveAndChangedHeadAtAnyPoint()
+        dta = self.ie.dta
+        span = self.ie.inflatedTimespan
+
+        # Going from owning to renting is a move, even if it wasn't reported; a missing move status is no move
+        self.assertEqual(list(dta.MovedR_2003[[0, 2]]), [True, False])
+        self.assertTrue(pd.isna(dta.MovedR_2003[1]))
+        self.assertEqual(list(dta['modificationStatus_' + self.ie.timespan]), ["Move Status Changed to True;", "", ""])
+
+        # 1) 2001 stays: 200*1.1 - 100*1.2, 40*1.1 - 50*1.2; 2003 moves: 0 - 200*1.1, 0 - 40*1.1
+        # 2) 2001 moves: 300*1.1 - 100*1.2, 100*1.1 - 0; 2003 stays: 400 - 300*1.1, 90 - 100*1.1
+        # 3) Stays both years: 100*1.1 - 100*1.2 + 100 - 100*1.1; no year of moving
+        npt.assert_allclose(dta['House_ValueIncrease_WhenMoving_' + span].astype(float), [-220.0, 210.0, np.NaN])
+        npt.assert_allclose(dta['House_TotalChangeInMortgageDebt_WhenMoving_' + span].astype(float), [-44.0, 110.0, np.NaN])
+        npt.assert_allclose(dta['House_ValueIncrease_WhenNotMoving_' + span].astype(float), [100.0, 70.0, -20.0])
+        npt.assert_allclose(dta['House_TotalChangeInMortgageDebt_WhenNotMoving_' + span].astype(float), [-16.0, -20.0, 0.0])
+
+        self.assertEqual(list(dta['ChangeInHeadFU_' + self.ie.timespan]), [False, True, False])
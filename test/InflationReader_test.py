@@ -0,0 +1,65 @@
+import Inflation.CPI_InflationReader as CPI_InflationReader
+import Inflation.NIPA_InflationReader as NIPA_InflationReader
+import Inflation.InflationReaderBase as InflationReaderBase
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+import numpy.testing as npt
+import pandas as pd
+
+
+class InflationReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        pd.DataFrame({'YEAR': [1984, 1985, 1986, 1988], 'AVE': [100.0, 104.0, 106.0, 120.0]}). \
+            to_csv(os.path.join(self.tempDir, 'CPI.csv'), index=False)
+        pd.DataFrame({'DATE': ['1984-01-01', '1985-01-01'], 'DPCERD3A086NBEA': [50.0, 55.0], 'DPCERD3A086NBEA_PCH': [3.0, 10.0]}). \
+            to_csv(os.path.join(self.tempDir, 'Price_Deflation.csv'), index=False)
+
+    def tearDown(self):
+        InflationReaderBase.InflationReaderBase.sharedTables.clear()
+        shutil.rmtree(self.tempDir)
+
+    def test_factors(self):
+        cpi = CPI_InflationReader.CPIInflationReader(self.tempDir)
+        self.assertAlmostEqual(cpi.getInflationFactorBetweenTwoYears(1984, 1988), 1.2)
+        self.assertAlmostEqual(cpi.getInflationFactorBetweenTwoYears(1988, 1985), 104.0 / 120.0)
+        self.assertEqual(cpi.getInflationFactorBetweenTwoYears(1986, 1986), 1.0)
+        npt.assert_allclose(cpi.getInflationFactors([1984, 1985, 1988], 1988), [1.2, 120.0 / 104.0, 1.0])
+        npt.assert_allclose(cpi.getInflationFactors(np.array([1984, 1986]), np.array([1985, 1984])), [1.04, 100.0 / 106.0])
+        with self.assertRaises(Exception):
+            cpi.getInflationFactorBetweenTwoYears(1987, 1988)  # A gap in the data
+        with self.assertRaises(Exception):
+            cpi.getInflationFactors([1984, 1990], 1988)
+
+        nipa = NIPA_InflationReader.NIPAInflationReader(self.tempDir)
+        self.assertAlmostEqual(nipa.getInflationFactorBetweenTwoYears(1984, 1985), 1.1)
+
+    def test_readOnce(self):
+        first = CPI_InflationReader.CPIInflationReader(self.tempDir)
+        os.remove(os.path.join(self.tempDir, 'CPI.csv'))
+        second = CPI_InflationReader.CPIInflationReader(self.tempDir)  # No need for the file again
+        self.assertIs(first.factors, second.factors)
+        self.assertEqual(list(second.getInflationDF().year), [1984, 1985, 1986, 1988])
+
+    def test_duplicateYears(self):
+        pd.DataFrame({'YEAR': [1984, 1985, 1985, 1986], 'AVE': [100.0, 104.0, 105.0, 106.0]}). \
+            to_csv(os.path.join(self.tempDir, 'CPI.csv'), index=False)
+        cpi = CPI_InflationReader.CPIInflationReader(self.tempDir)
+        # Only looking up the duplicated year fails
+        self.assertAlmostEqual(cpi.getInflationFactorBetweenTwoYears(1984, 1986), 1.06)
+        with self.assertRaises(Exception):
+            cpi.getInflationFactorBetweenTwoYears(1984, 1985)
+        with self.assertRaises(Exception):
+            cpi.getInflationFactors([1984, 1985], 1986)
+
+    def test_abstractBase(self):
+        with self.assertRaises(TypeError):
+            InflationReaderBase.InflationReaderBase()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import PSIDProcessing.RawLoader as RawLoader
+import ThirdPartyCode.SASReader as SASReader
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from mock import patch
+from pandas.testing import assert_frame_equal
+
+
+@unittest.skipIf(SASReader.pa is None, "pyarrow is not installed")
+class RawLoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.fileNoExtension = os.path.join(self.tempDir, 'TEST')
+
+        # A small dictionary in the PSID 'VARNAME #START - #END' layout
+        with open(self.fileNoExtension + '.sas', 'w') as f:
+            f.write("DATA PSID;\n")
+            f.write("   INFILE 'TEST.txt' LRECL = 12;\n")
+            f.write("   INPUT\n")
+            f.write("      ER1       1 - 1       ER2       2 - 6\n")
+            f.write("      ER3       7 - 12\n")
+            f.write("      ;\n")
+            f.write("run;\n")
+        self.writeData(0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def writeData(self, offset):
+        with open(self.fileNoExtension + '.txt', 'w') as f:
+            for i in range(0, 20):
+                f.write('%1d%5d%6d\n' % (i % 10, i * 7 + offset, i * 389))
+
+    def test_parquetCopyForColumnSubset(self):
+        loader = RawLoader.RawLoader(self.tempDir)
+
+        # Asking for some columns still converts the whole file, once
+        dta = loader.readRawDataFile(self.fileNoExtension, fieldsToKeep = ['ER2', 'NOTAVAR'])
+        self.assertEqual(list(dta.columns), ['ER2'])
+        self.assertTrue(os.path.exists(self.fileNoExtension + '.parquet'))
+        self.assertEqual(list(SASReader.read_parquet(self.fileNoExtension + '.parquet').columns), ['ER1', 'ER2', 'ER3'])
+
+        # Read back in the types the fixed-width reader gives, not the small ones the file is stored in
+        dta = loader.readRawDataFile(self.fileNoExtension, fieldsToKeep = ['ER1', 'ER3'])
+        self.assertEqual(list(dta.dtypes), [np.int64, np.int64])
+        self.assertEqual(list(dta.ER1), [i % 10 for i in range(0, 20)])
+
+        # A newer raw file replaces the copy
+        self.writeData(1)
+        os.utime(self.fileNoExtension + '.txt', ns = (os.stat(self.fileNoExtension + '.parquet').st_mtime_ns + 10**9,) * 2)
+        dta = loader.readRawDataFile(self.fileNoExtension, fieldsToKeep = ['ER2'])
+        self.assertEqual(list(dta.ER2), [i * 7 + 1 for i in range(0, 20)])
+
+        # So does a newer dictionary, with the raw file itself older than the copy
+        os.utime(self.fileNoExtension + '.txt', ns = (os.stat(self.fileNoExtension + '.parquet').st_mtime_ns - 10**9,) * 2)
+        self.assertEqual(list(loader.readRawDataFile(self.fileNoExtension).columns), ['ER1', 'ER2', 'ER3'])
+        with open(self.fileNoExtension + '.sas') as f:
+            dictionary = f.read()
+        with open(self.fileNoExtension + '.sas', 'w') as f:
+            f.write(dictionary.replace('ER3', 'ER4'))
+        os.utime(self.fileNoExtension + '.sas', ns = (os.stat(self.fileNoExtension + '.parquet').st_mtime_ns + 10**9,) * 2)
+        dta = loader.readRawDataFile(self.fileNoExtension)
+        self.assertEqual(list(dta.columns), ['ER1', 'ER2', 'ER4'])
+
+    def test_parquetCopyKeepsImpliedDecimals(self):
+        # ER2 has an implied decimal ('ER2 2 - 6 .2'); the copy holds what the CSV copy read_sas writes: the unscaled values
+        parse_sas = SASReader.parse_sas
+        def parseWithDivisor(*args):
+            DF = parse_sas(*args)
+            DF.loc[DF.varname == 'ER2', 'divisor'] = 0.01
+            return DF
+
+        loader = RawLoader.RawLoader(self.tempDir)
+        with patch.object(SASReader, 'parse_sas', side_effect=parseWithDivisor):
+            SASReader.read_sas(self.fileNoExtension + '.txt', self.fileNoExtension + '.sas',
+                               os.path.join(self.tempDir, 'baseline.csv'), os.path.join(self.tempDir, 'baseline_meta.csv'))
+            dta = loader.readRawDataFile(self.fileNoExtension)
+        assert_frame_equal(pd.read_csv(os.path.join(self.tempDir, 'baseline.csv')), dta)
+        assert_frame_equal(pd.read_csv(os.path.join(self.tempDir, 'baseline.csv'))[['ER2']],
+                           loader.readRawDataFile(self.fileNoExtension, fieldsToKeep = ['ER2']))
+
+    def test_csvCopyWithoutPyarrow(self):
+        # Without pyarrow, the first (chunked) read writes a CSV copy; later reads of the copy give the same data
+        parse_sas = SASReader.parse_sas
+        def parseWithDivisor(*args):
+            DF = parse_sas(*args)
+            DF.loc[DF.varname == 'ER2', 'divisor'] = 0.01
+            return DF
+
+        loader = RawLoader.RawLoader(self.tempDir, chunkSize = 7)
+        with patch.object(SASReader, 'pa', None), patch.object(SASReader, 'parse_sas', side_effect=parseWithDivisor):
+            cold = loader.readRawDataFile(self.fileNoExtension)
+            self.assertTrue(os.path.exists(self.fileNoExtension + '.csv'))
+            warm = loader.readRawDataFile(self.fileNoExtension)
+            columns = loader.readRawDataFile(self.fileNoExtension, fieldsToKeep = ['ER2'])
+        assert_frame_equal(cold, warm)
+        assert_frame_equal(cold[['ER2']], columns)
+        self.assertEqual(list(cold.ER2), [i * 7 for i in range(0, 20)])
+
+    def test_readFilesInParallel(self):
+        # Two small years, each in its own folder, read serially and then in a pool of two processes
+        filesByYear = {}
+        for year in [2017, 2019]:
+            os.makedirs(os.path.join(self.tempDir, str(year)))
+            filesByYear[year] = os.path.join(self.tempDir, str(year), 'TEST')
+            shutil.copy(self.fileNoExtension + '.sas', filesByYear[year] + '.sas')
+            with open(filesByYear[year] + '.txt', 'w') as f:
+                for i in range(0, 20):
+                    f.write('%1d%5d%6d\n' % (i % 10, i * 7 + year, i * 389))
+
+        serial = RawLoader.RawLoader(self.tempDir).readRawDataFiles(filesByYear, fieldsToKeep = ['ER1', 'ER2'])
+        for year in filesByYear:
+            os.remove(filesByYear[year] + '.parquet')
+        parallel = RawLoader.RawLoader(self.tempDir, numWorkers = 2).readRawDataFiles(filesByYear, fieldsToKeep = ['ER1', 'ER2'])
+
+        self.assertEqual(list(parallel.keys()), [2017, 2019])
+        for year in filesByYear:
+            assert_frame_equal(serial[year], parallel[year])
+        self.assertEqual(list(parallel[2019].ER2), [i * 7 + 2019 for i in range(0, 20)])
+
+
+if __name__ == '__main__':
+    unittest.main()
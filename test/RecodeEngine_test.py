@@ -0,0 +1,70 @@
+import PSIDProcessing.RecodeEngine as RecodeEngine
+import PSIDProcessing.FamilyRecodeSpec as FamilyRecodeSpec
+import unittest
+import pandas as pd
+import numpy as np
+
+
+class RecodeEngineTest(unittest.TestCase):
+
+    def checkSameAsReplace(self, series, valueMap):
+        expected = series.replace(valueMap)
+        actual = RecodeEngine.CompiledValueMap(valueMap).apply(series)
+        # Same values, with None and NaN both counting as missing; and numeric if replace's result is
+        pd.testing.assert_series_equal(actual.astype(object).where(actual.notna(), None), expected.astype(object).where(expected.notna(), None))
+        if expected.dtype != object:
+            self.assertEqual(actual.dtype, expected.dtype)
+
+    def test_sameAsReplace(self):
+        # Every map in our spec, on ints & floats, with and without codes that aren't in the map
+        spec = RecodeEngine.RecodeSpec(FamilyRecodeSpec.FAMILY_RECODE_RULES)
+        for compiled in spec.compiledMaps:
+            codes = [int(x) for x in compiled.keys]
+            for values in [codes, codes + [12345], [12345]]:
+                self.checkSameAsReplace(pd.Series(values, name='x'), compiled.valueMap)
+                self.checkSameAsReplace(pd.Series(values + [np.NaN], name='x'), compiled.valueMap)
+
+        self.checkSameAsReplace(pd.Series([1, 5, 5]), {1: True, 5: False})
+        self.checkSameAsReplace(pd.Series([1, 5, 7]), {1: np.NaN, 7: None})
+        self.checkSameAsReplace(pd.Series([1.0, np.NaN]), {np.NaN: 0})
+        self.checkSameAsReplace(pd.Series([None, None]), {0: np.NaN})
+        self.checkSameAsReplace(pd.Series(['a', 'b']), {1: 'x'})
+
+    def test_spec(self):
+        dta = pd.DataFrame({'a': [1, 5, 8], 'b_old': [0, 1, 2]})
+        spec = RecodeEngine.RecodeSpec([
+            RecodeEngine.recodeRule('first', 'a', {1: True, 5: False}, naCodes = [8], naValue = None, toYear = 2000),
+            RecodeEngine.recodeRule('first', 'a', {1: 'One'}, fromYear = 2001),
+            RecodeEngine.recodeRule('first', 'b', {1: 10}, naCodes = [0], source = 'b_old'),
+            RecodeEngine.recodeRule('first', 'c', {1: 10}, optional = True),
+            RecodeEngine.recodeRule('second', 'a', dtype = 'bool'),
+        ])
+
+        spec.apply(dta, 'first', 1999)
+        self.assertEqual(list(dta.a), [True, False, None])
+        self.assertEqual(list(dta.b.fillna(-1)), [-1, 10, 2])
+        spec.apply(dta, 'second', 1999)
+        self.assertEqual(dta.a.dtype, bool)
+
+        self.assertEqual(len(spec.toDataFrame()), 5)
+        with self.assertRaises(Exception):
+            RecodeEngine.RecodeSpec([RecodeEngine.recodeRule('first', 'missing', {1: 2})]).apply(dta, 'first', 1999)
+
+    def test_educationYears(self):
+        # Same as the old FamilyDataRecoder: 99 -> NaN for Head and Spouse outside 1985-1990, midpoints of the ranges within it
+        educationRules = [rule for rule in FamilyRecodeSpec.FAMILY_RECODE_RULES if rule['variable'].startswith('educationYears')]
+        spec = RecodeEngine.RecodeSpec(educationRules)
+        raw = pd.DataFrame({'educationYearsR': [12, 99, 0, 17], 'educationYearsS': [99, 16, 0, 99]})
+        for year in [1984, 1991, 1999]:
+            dta = raw.copy()
+            spec.apply(dta, 'demographics', year)
+            pd.testing.assert_frame_equal(dta, raw.replace({99: np.NaN}))
+
+        dta = pd.DataFrame({'educationYearsR_85to90': [1, 4, 9, 8], 'educationYearsS_85to90': [9, 7, 0, 2]})
+        spec.apply(dta, 'demographics', 1987)
+        self.assertEqual(list(dta.educationYearsR.fillna(-1)), [2.5, 12, -1, 20])
+        self.assertEqual(list(dta.educationYearsS.fillna(-1)), [-1, 16, 0, 7])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import ThirdPartyCode.SASReader as SASReader
+import unittest
+import os
+import shutil
+import tempfile
+import pandas as pd
+import numpy.testing as npt
+from mock import patch
+from pandas.testing import assert_frame_equal
+
+
+class SASReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.dictFile = os.path.join(self.tempDir, 'TEST.sas')
+        self.dataFile = os.path.join(self.tempDir, 'TEST.txt')
+
+        # A small dictionary in the PSID 'VARNAME #START - #END' layout
+        with open(self.dictFile, 'w') as f:
+            f.write("DATA PSID;\n")
+            f.write("   INFILE 'TEST.txt' LRECL = 20;\n")
+            f.write("   INPUT\n")
+            f.write("      ER1       1 - 1       ER2       2 - 6\n")
+            f.write("      ER3       7 - 12      ER4      13 - 20\n")
+            f.write("      ;\n")
+            f.write("run;\n")
+
+        with open(self.dataFile, 'w') as f:
+            for i in range(0, 250):
+                f.write('%1d%5d%6d%8d\n' % (i % 10, i * 7, (i * 389) % 200000 - 99999, i * 12345))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def test_colspecs(self):
+        specs = SASReader.get_colspecs(SASReader.parse_sas(self.dictFile, 1))
+        self.assertEqual(specs.varname.tolist(), ['ER1', 'ER2', 'ER3', 'ER4'])
+        npt.assert_array_equal(specs.start.values, [0, 1, 6, 12])
+        npt.assert_array_equal(specs.end.values, [1, 6, 12, 20])
+
+        specs = SASReader.get_colspecs(SASReader.parse_sas(self.dictFile, 1), ['ER3', 'ER1', 'NOTAVAR', None])
+        self.assertEqual(specs.varname.tolist(), ['ER1', 'ER3'])
+
+    def test_readChunked(self):
+        fullCSV = os.path.join(self.tempDir, 'full.csv')
+        chunkedCSV = os.path.join(self.tempDir, 'chunked.csv')
+        full = SASReader.read_sas(self.dataFile, self.dictFile, fullCSV, os.path.join(self.tempDir, 'full_meta.csv'))
+
+        # The file written block by block is the same as the one written in one go
+        subset = SASReader.read_sas_chunked(self.dataFile, self.dictFile, chunkedCSV, os.path.join(self.tempDir, 'chunked_meta.csv'),
+                                            columns=['ER3', 'ER1'], chunksize=60)
+        assert_frame_equal(pd.read_csv(fullCSV), pd.read_csv(chunkedCSV))
+        assert_frame_equal(full[['ER1', 'ER3']], subset)
+
+        # Without an output file, only the requested columns are decoded
+        subset = SASReader.read_sas_chunked(self.dataFile, self.dictFile, columns=['ER4'], chunksize=100)
+        assert_frame_equal(full[['ER4']], subset)
+
+    def test_readChunkedWithDivisor(self):
+        # ER2 has an implied decimal ('ER2 2 - 6 .2'); the CSV copy always holds what the first call returned
+        parse_sas = SASReader.parse_sas
+        def parseWithDivisor(*args):
+            DF = parse_sas(*args)
+            DF.loc[DF.varname == 'ER2', 'divisor'] = 0.01
+            return DF
+
+        scaledCSV = os.path.join(self.tempDir, 'scaled.csv')
+        unscaledCSV = os.path.join(self.tempDir, 'unscaled.csv')
+        with patch.object(SASReader, 'parse_sas', side_effect=parseWithDivisor):
+            scaled = SASReader.read_sas_chunked(self.dataFile, self.dictFile, scaledCSV, chunksize=60)
+            unscaled = SASReader.read_sas_chunked(self.dataFile, self.dictFile, unscaledCSV, chunksize=60, skip_decimal_division=True)
+        raw = SASReader.read_sas_chunked(self.dataFile, self.dictFile, chunksize=60)
+
+        npt.assert_array_almost_equal(scaled.ER2.values, raw.ER2.values * 0.01)
+        assert_frame_equal(raw, unscaled)
+        assert_frame_equal(pd.read_csv(scaledCSV), scaled)
+        assert_frame_equal(pd.read_csv(unscaledCSV), unscaled)
+
+    def test_readColumns(self):
+        full = SASReader.read_sas(self.dataFile, self.dictFile, os.path.join(self.tempDir, 'full.csv'), os.path.join(self.tempDir, 'full_meta.csv'))
+        subset = SASReader.read_sas_columns(self.dataFile, self.dictFile, ['ER4', 'ER2', 'NOTAVAR'])
+        assert_frame_equal(full[['ER2', 'ER4']], subset)
+
+    def test_readRaggedColumns(self):
+        full = SASReader.read_sas(self.dataFile, self.dictFile, os.path.join(self.tempDir, 'full.csv'), os.path.join(self.tempDir, 'full_meta.csv'))
+
+        # The same records with trailing blanks trimmed, a mix of CRLF and LF, and no final delimiter
+        raggedFile = os.path.join(self.tempDir, 'RAGGED.txt')
+        with open(self.dataFile, 'rb') as f:
+            lines = f.read().split(b'\n')[:-1]
+        with open(raggedFile, 'wb') as f:
+            for i, line in enumerate(lines):
+                f.write(line.rstrip(b' ') + (b'\r\n' if i % 3 == 0 else b'\n'))
+            f.write(b'7')
+
+        subset = SASReader.read_sas_columns(raggedFile, self.dictFile, ['ER4', 'ER1'])
+        self.assertEqual(len(subset), len(full) + 1)
+        assert_frame_equal(full[['ER1', 'ER4']], subset.iloc[:-1], check_dtype=False)
+        self.assertEqual(subset.ER1.iloc[-1], 7)
+        self.assertTrue(pd.isnull(subset.ER4.iloc[-1]))
+
+        # Trimmed records of the same length are padded out to the dictionary
+        trimmedFile = os.path.join(self.tempDir, 'TRIMMED.txt')
+        with open(trimmedFile, 'w') as f:
+            f.write('1    2\n3    4\n')
+        subset = SASReader.read_sas_columns(trimmedFile, self.dictFile, ['ER2', 'ER4'])
+        npt.assert_array_equal(subset.ER2.values, [2, 4])
+        self.assertTrue(subset.ER4.isnull().all())
+
+    def test_decodeNumeric(self):
+        field = pd.Series([b'  1234', b'  -567', b'      ', b'  12.5']).values.astype('S6').view('uint8').reshape(4, 6)
+        npt.assert_array_almost_equal(SASReader.decode_numeric(field), [1234, -567, float('nan'), 12.5])
+        npt.assert_array_almost_equal(SASReader.decode_numeric(field, 0.01), [12.34, -5.67, float('nan'), 12.5])
+        self.assertEqual(SASReader.decode_numeric(field[0:2]).dtype, 'int64')
+
+    @unittest.skipIf(SASReader.pa is None, "pyarrow is not installed")
+    def test_writeParquet(self):
+        full = SASReader.read_sas(self.dataFile, self.dictFile, os.path.join(self.tempDir, 'full.csv'), os.path.join(self.tempDir, 'full_meta.csv'))
+        parquetFile = os.path.join(self.tempDir, 'TEST.parquet')
+        SASReader.write_sas_parquet(self.dataFile, self.dictFile, parquetFile, chunksize=60)
+
+        schema = SASReader.pq.read_schema(parquetFile)
+        self.assertEqual([str(x) for x in schema.types], ['int8', 'int32', 'int32', 'int32'])
+        assert_frame_equal(full[['ER2', 'ER3']], SASReader.read_parquet(parquetFile, ['ER3', 'ER2', 'NOTAVAR']), check_dtype=False)
+        assert_frame_equal(full, SASReader.read_parquet(parquetFile), check_dtype=False)
+
+    def test_applyDivisors(self):
+        block = pd.DataFrame({'A': ['1234', '12.5', None]})
+        specs = pd.DataFrame({'varname': ['A'], 'divisor': [0.01]})
+        SASReader.apply_divisors(block, specs)
+        npt.assert_array_almost_equal(block.A.values, [12.34, 12.5, float('nan')])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import Controller.StageCache as StageCache
+import MStarReport.InequalityAnalysisBase as InequalityAnalysisBase
+import unittest
+import os
+import shutil
+import tempfile
+from Controller.params_AllInequalityAnalyses_EnrichedPop import dotdict
+
+
+class StageCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.yearsRun = []
+        for year in [2017, 2019]:
+            self.writeFile('input_' + str(year) + '.csv', 'a,b\n1,' + str(year) + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def writeFile(self, name, contents):
+        with open(os.path.join(self.tempDir, name), 'w') as f:
+            f.write(contents)
+
+    def copyYears(self, params):
+        # A pretend stage: copies each year's input to its output
+        for year in params.yearsToInclude:
+            self.yearsRun.append(year)
+            shutil.copy(os.path.join(self.tempDir, 'input_' + str(year) + '.csv'), os.path.join(self.tempDir, 'output_' + str(year) + '.csv'))
+
+    def runYearly(self, cache, params):
+        return cache.runYearlyStage('copy', self.copyYears, params,
+                                    inputsForYear = [os.path.join(self.tempDir, 'input_{year}.csv')],
+                                    sharedInputs = [],
+                                    paramKeys = ['multiplier'],
+                                    codeModules = [StageCache],
+                                    outputsForYear = [os.path.join(self.tempDir, 'output_{year}.csv')])
+
+    def runWhole(self, cache, params):
+        return cache.runStage('copy', self.copyYears, params,
+                              inputs = [os.path.join(self.tempDir, 'input_*.csv')],
+                              paramKeys = ['multiplier'],
+                              codeModules = [StageCache],
+                              outputs = [os.path.join(self.tempDir, 'output_*.csv')])
+
+    def test_runStage(self):
+        cache = StageCache.StageCache(os.path.join(self.tempDir, 'cache'))
+        params = dotdict({'yearsToInclude': [2017, 2019], 'multiplier': 1})
+
+        self.assertTrue(self.runWhole(cache, params))
+        self.assertFalse(self.runWhole(cache, params))
+
+        # Changed params, inputs or outputs all mean a rerun
+        params.multiplier = 2
+        self.assertTrue(self.runWhole(cache, params))
+        self.writeFile('input_2017.csv', 'a,b\n2,2017\n')
+        self.assertTrue(self.runWhole(cache, params))
+        os.remove(os.path.join(self.tempDir, 'output_2019.csv'))
+        self.assertTrue(self.runWhole(cache, params))
+        self.assertFalse(self.runWhole(cache, params))
+
+        # Going back to an earlier version of the inputs is recognized, once the outputs match again
+        params.multiplier = 1
+        self.writeFile('input_2017.csv', 'a,b\n1,2017\n')
+        self.assertTrue(self.runWhole(cache, params))
+        self.assertFalse(self.runWhole(StageCache.StageCache(os.path.join(self.tempDir, 'cache')), params))
+
+    def test_runYearlyStage(self):
+        cache = StageCache.StageCache(os.path.join(self.tempDir, 'cache'))
+        params = dotdict({'yearsToInclude': [2015, 2017, 2019], 'multiplier': 1})
+
+        # There's no input for 2015, so it's skipped
+        self.assertEqual(self.runYearly(cache, params), [2017, 2019])
+        self.assertEqual(self.runYearly(cache, params), [])
+
+        self.writeFile('input_2019.csv', 'a,b\n3,2019\n')
+        self.assertEqual(self.runYearly(cache, params), [2019])
+        self.assertEqual(self.yearsRun, [2017, 2019, 2019])
+
+        params.multiplier = 3
+        self.assertEqual(self.runYearly(cache, params), [2017, 2019])
+
+    def writeAnalysisFiles(self, params):
+        # A pretend per-period analysis: one file like each of those the real one writes
+        for pattern in InequalityAnalysisBase.PER_PERIOD_ANALYSIS_FILES:
+            self.writeFile(pattern.replace('*', '2017_2019_as_2019'), str(params.multiplier))
+
+    def test_perPeriodAnalysisOutputs(self):
+        cache = StageCache.StageCache(os.path.join(self.tempDir, 'cache'))
+        params = dotdict({'yearsToInclude': [2017, 2019], 'multiplier': 1})
+        runAnalysis = lambda: cache.runStage('analysis', self.writeAnalysisFiles, params,
+                                             inputs = [os.path.join(self.tempDir, 'input_*.csv')], paramKeys = [], codeModules = [],
+                                             outputs = [os.path.join(self.tempDir, x) for x in InequalityAnalysisBase.PER_PERIOD_ANALYSIS_FILES])
+        self.assertTrue(runAnalysis())
+        self.assertFalse(runAnalysis())
+
+        # Losing any one of the files the analysis writes means a rerun
+        for name in ['AssetLevelResults_Weighted_2017_2019_as_2019.csv', 'F6_WealthChange_Median_2017_2019_as_2019.png']:
+            os.remove(os.path.join(self.tempDir, name))
+            self.assertTrue(runAnalysis())
+            self.assertTrue(os.path.exists(os.path.join(self.tempDir, name)))
+            self.assertFalse(runAnalysis())
+
+    def test_disabled(self):
+        cache = StageCache.StageCache(os.path.join(self.tempDir, 'cache'), enabled=False)
+        params = dotdict({'yearsToInclude': [2017, 2019], 'multiplier': 1})
+        self.assertTrue(self.runWhole(cache, params))
+        self.assertTrue(self.runWhole(cache, params))
+        self.assertFalse(os.path.exists(os.path.join(self.tempDir, 'cache')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import Controller.StageRunner as StageRunner
+import unittest
+import os
+import shutil
+import tempfile
+from Controller.params_AllInequalityAnalyses_EnrichedPop import dotdict
+
+
+# Pretend stages; they're at module level so they can be run in other processes
+def writeStart(params):
+    with open(os.path.join(params.dir, 'out', 'start.txt'), 'w') as f:
+        f.write(str(params.value))
+
+def copyStart(params):
+    with open(os.path.join(params.dir, 'out', 'start.txt')) as f:
+        value = f.read()
+    with open(os.path.join(params.dir, 'out', 'copy_' + str(os.getpid()) + '.txt'), 'w') as f:
+        f.write(value)
+
+def joinCopies(params):
+    copies = [x for x in os.listdir(os.path.join(params.dir, 'out')) if x.startswith('copy_')]
+    with open(os.path.join(params.dir, 'out', 'join.txt'), 'w') as f:
+        f.write(str(len(copies)))
+
+def fail(params):
+    raise Exception("Failing on purpose")
+
+def die(params):
+    os._exit(3)  # As if the process were killed: no exception, and nothing reported back
+
+
+class StageRunnerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.params = dotdict({'dir': self.tempDir, 'value': 1})
+        self.pollSeconds = StageRunner.POLL_SECONDS
+        StageRunner.POLL_SECONDS = 0.1
+
+    def tearDown(self):
+        StageRunner.POLL_SECONDS = self.pollSeconds
+        shutil.rmtree(self.tempDir)
+
+    def buildRunner(self):
+        runner = StageRunner.StageRunner(os.path.join(self.tempDir, 'cache'))
+        for name in ['copyA', 'copyB']:
+            # Added before the stage they depend on, to check the ordering
+            runner.addStage(name, copyStart, dependsOn = ['start', 'notInThisRun'],
+                            inputs = [os.path.join(self.tempDir, 'out', 'start.txt')], paramKeys = [], codeModules = [],
+                            outputs = [os.path.join(self.tempDir, 'out', 'copy_*.txt')])
+        runner.addStage('join', joinCopies, dependsOn = ['copyA', 'copyB'],
+                        inputs = [os.path.join(self.tempDir, 'out', 'copy_*.txt')], paramKeys = [], codeModules = [],
+                        outputs = [os.path.join(self.tempDir, 'out', 'join.txt')])
+        runner.addStage('start', writeStart, inputs = [], paramKeys = ['value'], codeModules = [],
+                        outputs = [os.path.join(self.tempDir, 'out', 'start.txt')])
+        return runner
+
+    def test_runInParallel(self):
+        report = self.buildRunner().run(self.params, numWorkers = 2)
+        # The copies run at the same time, so either may finish first; only the dependencies fix the order
+        self.assertEqual(report.stage.iloc[0], 'start')
+        self.assertEqual(set(report.stage.iloc[1:3]), {'copyA', 'copyB'})
+        self.assertEqual(report.stage.iloc[3], 'join')
+        self.assertTrue(report.ran.all())
+        self.assertEqual(len([x for x in os.listdir(os.path.join(self.tempDir, 'out')) if x.startswith('copy_')]), 2)
+        with open(os.path.join(self.tempDir, 'out', 'join.txt')) as f:
+            self.assertEqual(f.read(), '2')
+
+        # Nothing changed, so nothing reruns
+        report = self.buildRunner().run(self.params, numWorkers = 2)
+        self.assertFalse(report.ran.any())
+
+    def test_runSerially(self):
+        report = self.buildRunner().run(self.params)
+        self.assertEqual(list(report.stage), ['start', 'copyA', 'copyB', 'join'])
+        self.assertTrue(report.ran.all())
+        self.assertFalse(self.buildRunner().run(self.params).ran.any())
+
+        # A changed param reruns the stage using it, and the ones after it
+        self.params.value = 2
+        self.assertTrue(self.buildRunner().run(self.params).ran.all())
+
+    def test_failure(self):
+        runner = self.buildRunner()
+        runner.addStage('fail', fail, inputs = [], paramKeys = [], codeModules = [], outputs = [])
+        with self.assertRaises(Exception) as context:
+            runner.run(self.params, numWorkers = 2)
+        self.assertIn('Failing on purpose', str(context.exception))
+
+    def test_processDies(self):
+        runner = self.buildRunner()
+        runner.addStage('die', die, inputs = [], paramKeys = [], codeModules = [], outputs = [])
+        with self.assertRaises(Exception) as context:
+            runner.run(self.params, numWorkers = 2)
+        self.assertIn('The process for die ended (exit code 3)', str(context.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
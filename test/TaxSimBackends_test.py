@@ -0,0 +1,89 @@
+import Taxsim.TaxSimBackends as TaxSimBackends
+import Taxsim.TaxSimCache as TaxSimCache
+import Taxsim.TaxSimSubmitter as TaxSimSubmitter
+import os
+import unittest
+import sys
+import tempfile
+import shutil
+import pandas as pd
+
+
+# A stand-in for a local TaxSim: reads TaxSim CSV on stdin, and writes a flat 10% federal tax on wages to stdout
+FAKE_TAXSIM = '''
+import sys, pandas as pd
+dta = pd.read_csv(sys.stdin)
+out = pd.DataFrame({'taxsimid': dta.taxsimid, 'year': dta.year, 'state': dta.state, 'fiitax': dta.pwages * 0.1,
+                    'siitax': 0.0, 'fica': 0.0, 'frate': 10.0, 'srate': 0.0, 'ficar': 0.0, 'tfica': 0.0})
+out.to_csv(sys.stdout, index=False)
+'''
+
+
+class TaxSimBackendsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def test_localBackend(self):
+        inputDta = pd.DataFrame({'taxsimid': [TaxSimBackends.ID_START_SINCE_TAXIM_HAS_NO_LINE_DELIMITOR + str(x) for x in range(1, 8)],
+                                 'yearTax': 1999, 'state': 5, 'pwages': [1000 * x for x in range(1, 8)]})
+        backend = TaxSimBackends.LocalBackend([sys.executable, '-c', FAKE_TAXSIM])
+        result = TaxSimSubmitter.BatchSubmitter(backend, batchSize = 3, numWorkers = 2).calcTaxes(inputDta, self.tempDir)
+
+        self.assertEqual(list(result.columns), TaxSimBackends.OUTPUT_COLUMNS)
+        self.assertEqual(list(result.taxsim_id), list(range(1, 8)))  # Batches come back in order, with plain ids
+        self.assertEqual(list(result.fiitax), [100.0 * x for x in range(1, 8)])
+
+    def test_cache(self):
+        backend = TaxSimBackends.LocalBackend([sys.executable, '-c', FAKE_TAXSIM])
+        sent = []
+        calcTaxes = backend.calcTaxes
+        backend.calcTaxes = lambda dta, workDir: sent.append(len(dta)) or calcTaxes(dta, workDir)
+
+        inputDta = pd.DataFrame({'taxsimid': [TaxSimBackends.ID_START_SINCE_TAXIM_HAS_NO_LINE_DELIMITOR + str(x) for x in range(1, 5)],
+                                 'yearTax': 1999, 'state': 5, 'pwages': [1000, 2000, 2000, 3000]})
+        cache = TaxSimCache.TaxSimCache(os.path.join(self.tempDir, 'cache.sqlite'), backend.version)
+        first = cache.calcTaxes(inputDta, backend, self.tempDir)
+
+        # Only the changed household is sent again, and the results come back in the input's order
+        inputDta.loc[3, 'pwages'] = 5000
+        second = cache.calcTaxes(inputDta, backend, self.tempDir)
+        self.assertEqual(sent, [4, 1])
+        self.assertEqual(list(second.taxsim_id), [1, 2, 3, 4])
+        self.assertEqual(list(second.fiitax), [100.0, 200.0, 200.0, 500.0])
+        pd.testing.assert_frame_equal(first.iloc[:3], second.iloc[:3])
+
+        # Results from another version of TaxSim aren't used
+        TaxSimCache.TaxSimCache(os.path.join(self.tempDir, 'cache.sqlite'), 'taxsimOther').calcTaxes(inputDta, backend, self.tempDir)
+        self.assertEqual(sent, [4, 1, 4])
+
+    def test_outputParser(self):
+        parser = TaxSimBackends.TaxSimOutputParser()
+        # As it comes from the FTP server: records don't always get a line of their own
+        parser.feed('taxsim_id year state fiitax siitax fica frate srate ficar')
+        parser.feed('  98767891. 2000 0 13025.00 .00 .00 20.00 .00 15.30 98767892. 2000 5 ')
+        parser.feed('-512.25 210.00 1530.00 15.00 3.00 15.30')
+        result = parser.getData(expectedIds = [1, 2])
+
+        self.assertEqual(list(result.columns), TaxSimBackends.OUTPUT_COLUMNS)
+        self.assertEqual(list(result.taxsim_id), [1, 2])
+        self.assertEqual(list(result.fiitax), [13025.0, -512.25])
+        self.assertEqual(list(result.ficar), [15.3, 15.3])
+
+        with self.assertRaises(Exception):
+            parser.getData(expectedIds = [1, 2, 3])  # A record went missing
+        parser.feed('98767893. 2000')
+        with self.assertRaises(Exception):
+            parser.getData()  # The last record was cut short
+
+    def test_localBackendFailure(self):
+        backend = TaxSimBackends.LocalBackend([sys.executable, '-c', 'import sys; sys.exit("no data")'])
+        with self.assertRaises(Exception):
+            backend.calcTaxes(pd.DataFrame({'taxsimid': ['1'], 'yearTax': [1999]}), self.tempDir)
+
+
+if __name__ == '__main__':
+    unittest.main()
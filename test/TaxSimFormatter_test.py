@@ -1,4 +1,5 @@
 from Taxsim.TaxSimFormatter import TaxSimFormatter
+import Taxsim.TaxSimFormatter as TaxSimModule
 import unittest
 import pandas as pd
 import numpy.testing as npt
@@ -93,6 +94,16 @@ class TaxSimFormatterTest(unittest.TestCase):
         self.assertTrue(2 == kids.loc[kids.familyInterviewId =='3', 'dep18'].iloc[0]) # This is any dependent, including students < 24 in house
 
 
+    def test_countIndividualsPerFamily(self):
+        # Doesn't need the state codes, so runs without the input data
+        individuals = pd.DataFrame({'interviewId': ['3', '3', '2', '3', '9'],
+                                    'age': [6, 23, 15, 40, 1]})
+        counts = TaxSimModule.countIndividualsPerFamily(pd.Series(['1', '2', '3', '3'], name='familyInterviewId'), individuals.interviewId,
+                                                           {'under13': individuals.age < 13, 'under24': individuals.age < 24})
+        self.assertEqual(list(counts.familyInterviewId), ['1', '2', '3'])  # No row for the family we didn't ask about
+        self.assertEqual(list(counts.under13), [0, 0, 1])
+        self.assertEqual(list(counts.under24), [0, 1, 2])
+
     def test_convertToTaxSim(self):
         self.initAnalyzer()
         self.createDummyData(1999)
@@ -0,0 +1,79 @@
+import Taxsim.TaxSimBackends as TaxSimBackends
+import Taxsim.TaxSimSubmitter as TaxSimSubmitter
+import unittest
+import tempfile
+import shutil
+import concurrent.futures
+import pandas as pd
+
+
+class TaxSimSubmitterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.inputDta = pd.DataFrame({'taxsimid': [TaxSimBackends.ID_START_SINCE_TAXIM_HAS_NO_LINE_DELIMITOR + str(x) for x in range(1, 11)],
+                                      'yearTax': 1999, 'state': 5, 'pwages': [1000 * x for x in range(1, 11)]})
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+
+    def test_batches(self):
+        backend = TaxSimBackends.FakeBackend(delaySeconds = 0.05)
+        result = TaxSimSubmitter.BatchSubmitter(backend, batchSize = 3, numWorkers = 4).calcTaxes(self.inputDta, self.tempDir)
+
+        self.assertEqual(backend.numCalls, 4)
+        self.assertEqual(list(result.taxsim_id), list(range(1, 11)))  # Back in the input's order
+        self.assertEqual(list(result.fiitax), [100.0 * x for x in range(1, 11)])
+
+    def test_maxConcurrentCalls(self):
+        # Several years share one submitter, each with its own batches in parallel; the cap holds across all of them
+        backend = TaxSimBackends.FakeBackend(delaySeconds = 0.05)
+        callsNow = [0, 0]  # current, most seen
+        calcTaxes = backend.calcTaxes
+        def countingCalcTaxes(inputDta, workDir):
+            with backend.lock:
+                callsNow[0] += 1
+                callsNow[1] = max(callsNow)
+            try:
+                return calcTaxes(inputDta, workDir)
+            finally:
+                with backend.lock:
+                    callsNow[0] -= 1
+        backend.calcTaxes = countingCalcTaxes
+
+        submitter = TaxSimSubmitter.BatchSubmitter(backend, batchSize = 2, numWorkers = 4, maxConcurrentCalls = 2)
+        with concurrent.futures.ThreadPoolExecutor(max_workers = 4) as executor:
+            results = list(executor.map(lambda x: submitter.calcTaxes(self.inputDta, self.tempDir), range(4)))
+
+        self.assertEqual(callsNow[1], 2)
+        self.assertEqual(list(results[3].taxsim_id), list(range(1, 11)))
+
+    def test_retries(self):
+        # Two calls fail, and two more come back short; each bad batch is sent again until it's complete
+        backend = TaxSimBackends.FakeBackend(failCalls = 2, truncateCalls = 2)
+        submitter = TaxSimSubmitter.BatchSubmitter(backend, batchSize = 4, numWorkers = 3, maxRetries = 4, backoffSeconds = 0)
+        result = submitter.calcTaxes(self.inputDta, self.tempDir)
+
+        self.assertEqual(backend.numCalls, 3 + 4)
+        self.assertEqual(list(result.taxsim_id), list(range(1, 11)))
+        self.assertEqual(list(result.fiitax), [100.0 * x for x in range(1, 11)])
+
+    def test_givesUp(self):
+        backend = TaxSimBackends.FakeBackend(truncateCalls = 10)
+        submitter = TaxSimSubmitter.BatchSubmitter(backend, batchSize = 20, maxRetries = 2, backoffSeconds = 0)
+        with self.assertRaises(Exception):
+            submitter.calcTaxes(self.inputDta, self.tempDir)
+        self.assertEqual(backend.numCalls, 3)
+
+    def test_checkBatch(self):
+        submitter = TaxSimSubmitter.BatchSubmitter(TaxSimBackends.FakeBackend())
+        outputDta = TaxSimBackends.FakeBackend().calcTaxes(self.inputDta, self.tempDir)
+        self.assertIsNone(submitter.checkBatch(self.inputDta, outputDta))
+
+        # The right number of records, but not the right ones
+        outputDta.loc[0, 'taxsim_id'] = 99
+        self.assertIsNotNone(submitter.checkBatch(self.inputDta, outputDta))
+
+
+if __name__ == '__main__':
+    unittest.main()